@@ -0,0 +1,268 @@
+#!python37
+
+## This script benchmarks the cleaning process on synthetic stations from
+## synthetic_data.py, so that performance changes in station / data_cleaner
+## can be measured without the real raw files.
+##
+## For each # stations (1, 10, and 60 by default), synthetic raw files are
+## generated once into <work_path>/n<# stations>_<begin>_<end>/ and re-used by
+## later runs. data_cleaner.clean_stations() is then run with stage tracing on.
+## Each run adds rows to the results csv (benchmark_results.csv by default):
+## one per cleaning stage from the trace summary, and one for the full
+## clean_stations run (stage = 'clean_stations'). Every row is keyed by the
+## git commit (with a '+dirty' suffix for uncommitted changes), so results
+## accumulate across commits. --compare prints the median wall time per stage
+## of the last two commits in the results csv and their ratio.
+##
+## To run a benchmark:
+## > python benchmark_cleaning.py --work_path <where synthetic data live>
+##                                (--n_stations 1 10 60)
+##                                (--begin_date 2016-07-01 --end_date 2019-06-30)
+##                                (--repeats <# runs per # stations>)
+##                                (--results_file <csv to append results>)
+##                                (--compare)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import benchmark_cleaning
+## results = benchmark_cleaning.run_benchmark ('C:/to/benchmark/', 10)
+## benchmark_cleaning.append_results (results, 'C:/to/benchmark_results.csv')
+## print (benchmark_cleaning.compare_commits ('C:/to/benchmark_results.csv'))
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import pandas, logging, argparse, subprocess, datetime, time, os, shutil
+import data_cleaner, stage_tracer, synthetic_data
+
+###############################################
+## Define constants
+###############################################
+# Default # stations per benchmark
+N_STATIONS = [1, 10, 60]
+
+# Default time range of synthetic data; it covers train / validation / test
+BEGIN_DATE, END_DATE = '2016-07-01', '2019-06-30'
+
+# Default location of synthetic data and results
+work_path = 'C:/Users/lindsay.abrams/Documents/noaa-wl-ai/benchmark/'
+RESULTS_FILE = 'benchmark_results.csv'
+
+# Stage name for the full clean_stations run
+TOTAL_STAGE = 'clean_stations'
+
+# Columns in results csv
+RESULT_KEYS = ['commit', 'run_time', 'n_stations', 'begin_date', 'end_date',
+               'stage', 'n_spans', 'wall_s', 'cpu_s', 'rows_in', 'rows_out',
+               'rss_mb_max']
+
+###############################################
+## Define functions
+###############################################
+def get_commit ():
+
+    ''' A function to get the short git commit of this package, with a
+        '+dirty' suffix if there are uncommitted changes.
+
+        return params
+        -------------
+        commit (str): git commit; 'unknown' if git is not available
+    '''
+
+    here = os.path.dirname (os.path.abspath (__file__))
+    try:
+        commit = subprocess.check_output (['git', 'rev-parse', '--short', 'HEAD'],
+                                          cwd=here, stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output (['git', 'status', '--porcelain', '--untracked-files=no'],
+                                          cwd=here, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '+dirty' if len (status) > 0 else commit
+
+def prepare_data (work_path, n_stations, begin_date=BEGIN_DATE, end_date=END_DATE):
+
+    ''' A function to generate synthetic data for n stations, if not already.
+
+        input params
+        ------------
+        work_path (str): folder of all benchmark data
+        n_stations (int): # stations
+        begin_date (str): first day of synthetic data
+        end_date (str): last day of synthetic data
+
+        return params
+        -------------
+        data_path (str): folder with raw/ and station info csv
+    '''
+
+    data_path = '{0}/n{1}_{2}_{3}'.format (work_path, n_stations, begin_date, end_date)
+    if not os.path.exists (data_path + '/' + synthetic_data.STATION_INFO_FILE):
+        synthetic_data.make_stations (data_path, n_stations=n_stations,
+                                      begin_date=begin_date, end_date=end_date)
+    return data_path
+
+def run_benchmark (work_path, n_stations, begin_date=BEGIN_DATE, end_date=END_DATE):
+
+    ''' A function to time one clean_stations run on n synthetic stations.
+
+        input params
+        ------------
+        work_path (str): folder of all benchmark data
+        n_stations (int): # stations
+        begin_date (str): first day of synthetic data
+        end_date (str): last day of synthetic data
+
+        return params
+        -------------
+        results (pandas.DataFrame): RESULT_KEYS per stage and for the full run
+    '''
+
+    data_path = prepare_data (work_path, n_stations, begin_date=begin_date, end_date=end_date)
+
+    ## Start from an empty processed folder
+    proc_path = data_path + '/processed'
+    if os.path.exists (proc_path): shutil.rmtree (proc_path)
+    os.mkdir (proc_path)
+
+    ## Clean all stations with tracing on
+    cleaner = data_cleaner.data_cleaner()
+    cleaner.raw_path = data_path + '/raw'
+    cleaner.proc_path = proc_path
+    cleaner.station_info_csv = data_path + '/' + synthetic_data.STATION_INFO_FILE
+    cleaner.trace_file = proc_path + '/trace.jsonl'
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    cleaner.clean_stations()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    ## Per-stage summary plus the full run
+    results = stage_tracer.summarize_trace (stage_tracer.load_trace (cleaner.trace_file))
+    results = results.rename_axis ('stage').reset_index()
+    total = {'stage':TOTAL_STAGE, 'n_spans':1, 'wall_s':wall, 'cpu_s':cpu,
+             'rss_mb_max':stage_tracer.get_peak_rss ()}
+    results = pandas.concat ([pandas.DataFrame ([total]), results], ignore_index=True)
+
+    results['commit'] = get_commit ()
+    results['run_time'] = datetime.datetime.now().strftime ('%Y-%m-%d %H:%M:%S')
+    results['n_stations'] = n_stations
+    results['begin_date'], results['end_date'] = begin_date, end_date
+    return results[RESULT_KEYS]
+
+def append_results (results, filename):
+
+    ''' A function to append results to a csv file.
+
+        input params
+        ------------
+        results (pandas.DataFrame): RESULT_KEYS per stage
+        filename (str): results csv file
+    '''
+
+    has_header = not os.path.exists (filename)
+    results.to_csv (filename, mode='a', header=has_header, index=False)
+
+def compare_commits (filename, commits=None):
+
+    ''' A function to compare the median wall time per stage and # stations
+        between two commits.
+
+        input params
+        ------------
+        filename (str): results csv file
+        commits (list): [old commit, new commit]; None for the last two
+                        commits in the results file
+
+        return params
+        -------------
+        comparison (pandas.DataFrame): median wall_s per commit and their ratio
+                                       (new / old), per # stations and stage
+    '''
+
+    results = pandas.read_csv (filename)
+    if commits is None:
+        ## Commits in the order they were first benchmarked
+        commits = list (results.drop_duplicates ('commit').commit.values[-2:])
+    if len (commits) < 2:
+        raise IOError ('Need results of 2 commits to compare; found {0}.'.format (commits))
+
+    results = results[results.commit.isin (commits)]
+    comparison = results.pivot_table (index=['n_stations', 'stage'], columns='commit',
+                                      values='wall_s', aggfunc='median')[commits]
+    comparison['ratio'] = comparison[commits[1]] / comparison[commits[0]]
+    return comparison
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        work_path (str): folder of all benchmark data
+        n_stations (list): # stations per benchmark
+        begin_date (str): first day of synthetic data
+        end_date (str): last day of synthetic data
+        repeats (int): # runs per # stations
+        results_file (str): csv file to append results
+        compare (bool): If true, compare the last two commits at the end
+        log_level (str): either info, debug, warn, or error
+    '''
+
+    parser = argparse.ArgumentParser (description='Benchmark cleaning on synthetic stations')
+    parser.add_argument('-w', '--work_path', default=work_path, type=str,
+                        help='Folder of synthetic data and processed files')
+    parser.add_argument('-n', '--n_stations', default=N_STATIONS, type=int, nargs='+',
+                        help='# stations per benchmark')
+    parser.add_argument('-b', '--begin_date', default=BEGIN_DATE, type=str,
+                        help='First day of synthetic data')
+    parser.add_argument('-e', '--end_date', default=END_DATE, type=str,
+                        help='Last day of synthetic data')
+    parser.add_argument('-r', '--repeats', default=1, type=int,
+                        help='# runs per # stations')
+    parser.add_argument('-f', '--results_file', default=None, type=str,
+                        help='csv file to append results; default in work_path')
+    parser.add_argument('-c', '--compare', default=False, action='store_true',
+                        help='If turned on, compare the last two commits in results file.')
+    parser.add_argument('-l', '--log_level', default='warn', type=str,
+                        help='Log level: info, debug, warn, error')
+    args = parser.parse_args()
+
+    ## Check if work path exists. If not, create it now.
+    if not os.path.exists (args.work_path):
+        os.makedirs (args.work_path)
+
+    ## Check if log level is one of info / debug / warn / error
+    if not args.log_level.lower() in ['debug', 'info', 'warn', 'error']:
+        message = 'Log level must be either debug, info, warn, or error.'
+        raise IOError (message)
+
+    results_file = args.work_path + '/' + RESULTS_FILE if args.results_file is None else \
+                   args.results_file
+    return args.work_path, args.n_stations, args.begin_date, args.end_date, \
+           args.repeats, results_file, args.compare, args.log_level.upper()
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    work_path, n_stations, begin_date, end_date, repeats, results_file, \
+        compare, log_level = get_parser ()
+
+    ## Set log level
+    logging.basicConfig (level=getattr (logging, log_level))
+
+    ## Run each benchmark and append its results right away
+    for n in n_stations:
+        for repeat in range (repeats):
+            results = run_benchmark (work_path, n, begin_date=begin_date, end_date=end_date)
+            append_results (results, results_file)
+            total = results[results.stage == TOTAL_STAGE].wall_s.values[0]
+            print ('{0} stations (run {1}): {2:.1f} s'.format (n, repeat + 1, total))
+
+    ## Compare with the previous commit
+    if compare:
+        print (compare_commits (results_file).to_string (float_format='{0:.3f}'.format))
@@ -20,6 +20,20 @@
 ##                        --station_info_csv <location of station info csv>
 ##                        --log_level <debug/info/warn/error>
 ##                        (--do_midstep_files)
+##                        (--add_gap_features)
+##                        (--regular_grid)
+##                        (--plot_workers <# processes to render mid-step plots>)
+##                        (--png_thumbnails)
+##                        (--trace)
+##                        (--warehouse <SQLite file to keep stats of all runs>)
+##                        (--serial_io)
+##                        (--station_workers <# processes to clean stations>)
+##                        (--constituents_path <harmonic constituents to compute
+##                                              missing predictions>)
+##                        (--baseline_window <e.g. 30D; rolling baseline for
+##                                            stations without predictions>)
+##                        (--baseline_quantile <quantile of the baseline>)
+##                        (--neighbor_table <neighbor table from select_neighbors.py>)
 ###############################################################################
 
 ###############################################
@@ -46,6 +60,42 @@ station_info_csv = 'C:/Users/lindsay.abrams/Documents/noaa-wl-ai/WLAIStationList
 # Ask cleaner to create mid-step files & plots
 do_midstep_files = False
 
+# Ask cleaner to add gap-distance features to processed files
+add_gap_features = False
+
+# Ask cleaner to put records on a regular 6-minute grid instead of as is
+regular_grid = False
+
+# Number of background processes to render mid-step plots; 0 to plot in place
+plot_workers = 2
+
+# Ask cleaner to render mid-step plots as PNG thumbnails instead of PDFs
+png_thumbnails = False
+
+# Ask cleaner to time each cleaning stage into proc_path/trace.jsonl
+trace = False
+TRACE_FILE = 'trace.jsonl'
+
+# SQLite run warehouse to insert cleaning stats into; None for no warehouse
+warehouse = None
+
+# Ask cleaner to read / write files in line with cleaning instead of
+# prefetching raw files and writing processed files in the background
+serial_io = False
+
+# Number of processes to clean stations; 0 to clean them in this process
+station_workers = 0
+# Folder of harmonic constituents to compute predictions that raw files do not
+# have; None to use raw predictions only
+constituents_path = None
+# Window of a rolling quantile of PRIMARY that stands in for predictions at
+# stations without any (e.g. Great Lakes); None to disable
+baseline_window = None
+baseline_quantile = 0.5
+# Neighbor table from select_neighbors.py to replace the neighbors in station
+# info sheet; None to use the sheet
+neighbor_table = None
+
 ###############################################
 ## Define functions
 ###############################################
@@ -63,6 +113,20 @@ def get_parser ():
         station_info_csv (str): Location of station info sheet
         log_level (str): either info, debug, warn, or error
         create_midstep_files (bool): If true, create all mid-step files / plots
+        add_gap_features (bool): If true, add gap-distance feature columns
+        regular_grid (bool): If true, drop off-grid records and insert missing
+                             6-minute slots
+        plot_workers (int): # background processes to render mid-step plots
+        png_thumbnails (bool): If true, render mid-step plots as PNG thumbnails
+        trace (bool): If true, time each cleaning stage
+        warehouse (str): SQLite run warehouse file; None for no warehouse
+        serial_io (bool): If true, do not overlap file I/O with cleaning
+        station_workers (int): # processes to clean stations
+        constituents_path (str): folder of harmonic constituents; None for
+                                 raw predictions only
+        baseline_window (str): window of the rolling baseline; None to disable
+        baseline_quantile (float): quantile of the rolling baseline
+        neighbor_table (str): neighbor table csv; None for station info sheet
     '''
 
     ## Define parser to get arguments
@@ -78,6 +142,33 @@ def get_parser ():
     parser.add_argument('-m', '--do_midstep_files', default=do_midstep_files,
                         action='store_true',
                         help='If turned on, create all mid-step files.')
+    parser.add_argument('-g', '--add_gap_features', default=add_gap_features,
+                        action='store_true',
+                        help='If turned on, add gap-distance features to processed files.')
+    parser.add_argument('-G', '--regular_grid', default=regular_grid,
+                        action='store_true',
+                        help='If turned on, put records on a regular 6-minute grid: off-grid records are dropped and missing slots are added as rows, so n_total counts them.')
+    parser.add_argument('-w', '--plot_workers', default=plot_workers, type=int,
+                        help='# background processes to render mid-step plots; 0 to plot in place')
+    parser.add_argument('-t', '--png_thumbnails', default=png_thumbnails,
+                        action='store_true',
+                        help='If turned on, render mid-step plots as PNG thumbnails.')
+    parser.add_argument('-T', '--trace', default=trace, action='store_true',
+                        help='If turned on, time each cleaning stage into {0}.'.format (TRACE_FILE))
+    parser.add_argument('-d', '--warehouse', default=warehouse, type=str,
+                        help='SQLite file to insert cleaning stats of this run into')
+    parser.add_argument('-S', '--serial_io', default=serial_io, action='store_true',
+                        help='If turned on, read / write files in line with cleaning.')
+    parser.add_argument('-W', '--station_workers', default=station_workers, type=int,
+                        help='# processes to clean stations; 0 to clean in this process')
+    parser.add_argument('-c', '--constituents_path', default=constituents_path, type=str,
+                        help='Folder of harmonic constituents to compute missing predictions')
+    parser.add_argument('-b', '--baseline_window', default=baseline_window, type=str,
+                        help='Window (e.g. 30D, 72H) of a rolling baseline for stations without predictions')
+    parser.add_argument('-q', '--baseline_quantile', default=baseline_quantile, type=float,
+                        help='Quantile of the rolling baseline; 0.5 for median')
+    parser.add_argument('-n', '--neighbor_table', default=neighbor_table, type=str,
+                        help='Neighbor table from select_neighbors.py to replace the neighbors in station info sheet')
     args = parser.parse_args()
 
     ## 1. Check if raw path exists. If not, raise exception.
@@ -99,8 +190,37 @@ def get_parser ():
         message = 'Log level must be either debug, info, warn, or error.'
         raise IOError (message)
 
+    ## 5. Check if # plot workers is not negative
+    if args.plot_workers < 0:
+        message = 'Number of plot workers cannot be negative.'
+        raise IOError (message)
+
+    ## 6. Check if # station workers is not negative
+    if args.station_workers < 0:
+        message = 'Number of station workers cannot be negative.'
+        raise IOError (message)
+
+    ## 7. Check if constituents folder exists
+    if args.constituents_path is not None and not os.path.exists (args.constituents_path):
+        message = 'Constituents folder, {0}, does not exist!'.format (args.constituents_path)
+        raise FileNotFoundError (message)
+
+    ## 8. Check if baseline quantile is between 0 and 1
+    if not 0 <= args.baseline_quantile <= 1:
+        message = 'Baseline quantile must be between 0 and 1.'
+        raise IOError (message)
+
+    ## 9. Check if neighbor table exists
+    if args.neighbor_table is not None and not os.path.exists (args.neighbor_table):
+        message = 'Neighbor table, {0}, does not exist!'.format (args.neighbor_table)
+        raise FileNotFoundError (message)
+
     return args.raw_path, args.proc_path, args.station_info_csv, \
-           args.log_level.upper(), args.do_midstep_files
+           args.log_level.upper(), args.do_midstep_files, args.add_gap_features, \
+           args.regular_grid, args.plot_workers, args.png_thumbnails, \
+           args.trace, args.warehouse, args.serial_io, args.station_workers, \
+           args.constituents_path, args.baseline_window, args.baseline_quantile, \
+           args.neighbor_table
 
 def print_summary_stats (train, valid, test):
 
@@ -144,7 +264,10 @@ def print_summary_stats (train, valid, test):
 if __name__ == '__main__':
 
     ## Get user arguments
-    raw_path, proc_path, station_info_csv, log_level, do_midstep_files = get_parser ()
+    raw_path, proc_path, station_info_csv, log_level, do_midstep_files, \
+        add_gap_features, regular_grid, plot_workers, png_thumbnails, \
+        trace, warehouse, serial_io, station_workers, constituents_path, \
+        baseline_window, baseline_quantile, neighbor_table = get_parser ()
 
     ## Set log level
     level = getattr (logging, log_level)
@@ -158,6 +281,18 @@ if __name__ == '__main__':
     cleaner.proc_path = proc_path
     cleaner.station_info_csv = station_info_csv
     cleaner.create_midstep_files = do_midstep_files
+    cleaner.add_gap_features = add_gap_features
+    cleaner.regular_grid = regular_grid
+    cleaner.plot_workers = plot_workers
+    cleaner.plot_format = 'png' if png_thumbnails else 'pdf'
+    if trace: cleaner.trace_file = proc_path + '/' + TRACE_FILE
+    cleaner.warehouse_file = warehouse
+    cleaner.pipeline_io = not serial_io
+    cleaner.station_workers = station_workers
+    cleaner.constituents_path = constituents_path
+    cleaner.baseline_window = baseline_window
+    cleaner.baseline_quantile = baseline_quantile
+    cleaner.neighbor_table = neighbor_table
 
     ## Load station info
     cleaner.load_station_info()
@@ -11,13 +11,19 @@
 ##                          --set1_path <Path to processed data of set 1>
 ##                         (--set2_path <Path to processed data of set 2>)
 ##                         (--set3_path <Path to processed data of set 3>)
+##
+## Instead of processed folders, up to 3 runs can be read from a run warehouse
+## (see run_warehouse.py). Without run IDs, the last 3 runs are compared.
+## > python compare_sets.py --out_path <Path to store output plots>
+##                          --warehouse <SQLite warehouse file>
+##                         (--run_ids <run ID 1> <run ID 2> <run ID 3>)
 ###############################################################################
 
 ###############################################
 ## Import libraries
 ###############################################
 import logging, pandas, numpy, argparse, os
-import data_cleaner
+import data_cleaner, run_warehouse
 
 import matplotlib
 matplotlib.use ('Agg')
@@ -40,6 +46,9 @@ set1_path = 'C:/Users/lindsay.abrams/Documents/noaa-wl-ai/processed/'
 colors  = ['black', 'blue', 'red']
 markers = ['x', '^', 'o']
 
+# Dataset type in warehouse of each stats csv file
+WAREHOUSE_DTYPES = {'train':'train', 'valid':'validation', 'test':'test'}
+
 # Percetage threshold - 10%
 PCT_THRESH = 0.1
 
@@ -97,6 +106,8 @@ def get_parser ():
         set1_path (str): Path to processed data from set 1
         set2_path (str): Path to processed data from set 2
         set3_path (str): Path to processed data from set 3
+        warehouse (str): SQLite run warehouse file; None to read stats csv files
+        run_ids (list): runs in warehouse to compare; None for the last 3 runs
     '''
 
     ## Define parser to get arguments
@@ -109,11 +120,22 @@ def get_parser ():
                         help='Path where set 1 cleaned data are stored')
     parser.add_argument('-c', '--set3_path', default=None, type=str,
                         help='Path where set 1 cleaned data are stored')                                                
+    parser.add_argument('-w', '--warehouse', default=None, type=str,
+                        help='SQLite run warehouse to read stats from instead of sets')
+    parser.add_argument('-i', '--run_ids', default=None, type=str, nargs='+',
+                        help='Up to 3 run IDs in warehouse; default the last 3 runs')
     args = parser.parse_args()
 
     ## 1. output path must exist
     check_if_path_exists (args.out_path)
 
+    ## If reading from a warehouse, it must exist and at most 3 runs are compared
+    if args.warehouse is not None:
+        check_if_path_exists (args.warehouse)
+        if args.run_ids is not None and len (args.run_ids) > 3:
+            raise IOError ('At most 3 runs can be compared.')
+        return args.out_path, None, None, None, args.warehouse, args.run_ids
+
     ## 2. Set1 must exist (at least 1 set of data to plot)
     check_complete_set (args.set1_path)
 
@@ -123,7 +145,7 @@ def get_parser ():
     ## 4. If set 3 is available, check it too!
     if args.set3_path is not None: check_complete_set (args.set3_path)
 
-    return args.out_path, args.set1_path, args.set2_path, args.set3_path
+    return args.out_path, args.set1_path, args.set2_path, args.set3_path, None, None
 
 def get_a_stats (dtype, set_path):
     
@@ -189,6 +211,40 @@ def get_stats (dtype, set1_path, set2_path=None, set3_path=None):
 
     return stats
 
+def get_stats_from_warehouse (dtype, warehouse_file, run_ids=None):
+
+    ''' A function to read a specific dataset stats of up to 3 runs from a run
+        warehouse. Like get_stats(), each column is suffixed by the run label.
+
+        input params
+        ------------
+        dtype (str): either train, valid, or test
+        warehouse_file (str): SQLite run warehouse file
+        run_ids (list): runs to compare; None for the last 3 runs
+
+        return params
+        -------------
+        stats (pandas.DataFrame): combined stats dataframe from warehouse
+    '''
+
+    warehouse = run_warehouse.run_warehouse (warehouse_file)
+    runs = warehouse.get_runs ()
+    runs = runs.iloc[-3:] if run_ids is None else runs[runs.run_id.isin (run_ids)]
+
+    stats = None
+    for run in runs.itertuples():
+        ## Same layout as stats csv files with station ID as index
+        df = warehouse.get_stats (run.run_id, WAREHOUSE_DTYPES[dtype])
+        df.index = df.station_id
+        df = df.drop (axis=1, columns='station_id').sort_index()
+        ## Rename columns based on run label
+        df.columns = [col + '_' + run.label for col in df.columns]
+        stats = df if stats is None else \
+                pandas.merge (stats, df, how='outer', right_index=True, left_index=True)
+    warehouse.close ()
+
+    return stats
+
 def plot_bad_percentage (train_stats, valid_stats, test_stats):
 
     ''' A function to plot bad percentages.
@@ -303,12 +359,17 @@ def plot_bad_percentage (train_stats, valid_stats, test_stats):
 ###############################################
 if __name__ == '__main__':
 
-    out_path, set1_path, set2_path, set3_path = get_parser ()
+    out_path, set1_path, set2_path, set3_path, warehouse, run_ids = get_parser ()
 
     ## Gather all stats dataframe
-    train_stats = get_stats ('train', set1_path, set2_path=set2_path, set3_path=set3_path)
-    valid_stats = get_stats ('valid', set1_path, set2_path=set2_path, set3_path=set3_path)
-    test_stats  = get_stats ('test' , set1_path, set2_path=set2_path, set3_path=set3_path)
+    if warehouse is not None:
+        train_stats = get_stats_from_warehouse ('train', warehouse, run_ids=run_ids)
+        valid_stats = get_stats_from_warehouse ('valid', warehouse, run_ids=run_ids)
+        test_stats  = get_stats_from_warehouse ('test' , warehouse, run_ids=run_ids)
+    else:
+        train_stats = get_stats ('train', set1_path, set2_path=set2_path, set3_path=set3_path)
+        valid_stats = get_stats ('valid', set1_path, set2_path=set2_path, set3_path=set3_path)
+        test_stats  = get_stats ('test' , set1_path, set2_path=set2_path, set3_path=set3_path)
 
     ## Plot bad percentage
     plot_bad_percentage (train_stats, valid_stats, test_stats)
@@ -48,20 +48,12 @@
 ## Import libraries
 ###############################################
 import numpy, pandas, datetime, os, logging
-from scipy.interpolate import interp1d
 import _pickle as pickle
-from glob import glob
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
-import station
-
-import matplotlib
-matplotlib.use ('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-from matplotlib.offsetbox import AnchoredText
-plt.rc ('text', usetex=False)
-plt.rc ('font', family='sans-serif')
-plt.rc ('font', serif='Computer Modern Roman')
+import station, station_registry, gap_features, scaler_registry, plot_pool, stage_tracer
+import run_warehouse, io_pipeline, shared_frames, harmonic_tides, rolling_baseline
+import select_neighbors
 
 ###############################################
 ## Define constants
@@ -73,9 +65,9 @@ NEIGHBOR_COLUMNS = ['NEIGHBOR_PRIMARY', 'NEIGHBOR_PREDICTION',
                     'NEIGHBOR_PRIMARY_RESIDUAL', 'NEIGHBOR_TARGET']
 
 # File name pattern of Armin's raw files
-FILE_PATTERN_RAW_CSV = '_raw_ver_merged_wl.csv'
-FILE_PATTERN_PRIMARY_OFFSETS = '_offsets.csv'
-FILE_PATTERN_B1_GAIN_OFFSETS = '_B1_gain_offsets.csv'
+FILE_PATTERN_RAW_CSV = station_registry.FILE_PATTERNS['raw']
+FILE_PATTERN_PRIMARY_OFFSETS = station_registry.FILE_PATTERNS['primary_offsets']
+FILE_PATTERN_B1_GAIN_OFFSETS = station_registry.FILE_PATTERNS['B1_gain_offsets']
 
 # Extract all three dataset types if their time periods are available
 DATASET_TYPES = station.DATASET_TYPES
@@ -99,6 +91,219 @@ TARGET_THRESH = station.TARGET_THRESH
 GIANT_HIST_NBINS = station.GIANT_HIST_NBINS
 GIANT_HIST_RANGE = station.GIANT_HIST_RANGE
 
+# Registry file of normalization scalers in proc_path
+SCALER_FILE = 'scalers.csv'
+
+# Per-stage timing summary in proc_path when tracing is on
+TRACE_SUMMARY_FILE = 'trace_summary.csv'
+
+###############################################
+## Define functions
+###############################################
+def new_station (station_id, meta, files, settings, plot_pool=None, tracer=None):
+
+    ''' A function to set up a station instance with its metadata, settings,
+        offsets, and raw file location. It is a module function so that a
+        station worker process can run it.
+
+        input params
+        ------------
+        station_id (int): station ID from which a station instance is created
+        meta (dict): station metadata from the station registry
+        files (dict): raw file names from the station registry; None if the
+                      station does not have a complete set
+        settings (dict): proc_path, create_midstep_files, regular_grid,
+                         constituents_path, baseline_window, baseline_quantile
+        plot_pool (plot_pool): pool to render mid-step plots; None to render
+                               them right away
+        tracer (stage_tracer): tracer of the cleaning stages
+
+        return params
+        -------------
+        astation (station): a station instance with all info set up
+    '''
+
+    ## Define new station instance
+    astation = station.station (station_id)
+
+    ## Tell it to create mid-step files as the cleaning process goes
+    astation.create_midstep_files = settings['create_midstep_files']
+    astation.proc_path = settings['proc_path']
+    astation.regular_grid = settings['regular_grid']
+    astation.plot_pool = plot_pool
+    if tracer is not None: astation.tracer = tracer
+
+    ## Parse station metadata
+    astation.set_station_meta (meta)
+
+    #  If incomplete raw files, return station object without loading data
+    if files is None: return astation
+
+    ## Predict missing PRED_WL_VALUE_MSL if the station has constituents
+    if settings['constituents_path'] is not None:
+        astation.predictor = harmonic_tides.load_predictor (settings['constituents_path'], station_id)
+
+    ## Stand in a rolling baseline if the station has no prediction at all
+    astation.baseline_window = settings['baseline_window']
+    astation.baseline_quantile = settings['baseline_quantile']
+
+    ## Load offset data: offsets, and B1_gain_offsets
+    astation.load_primary_offsets (files['primary_offsets'])
+    astation.load_backup_B1_gain_offsets (files['B1_gain_offsets'])
+
+    ## For raw file, only load it as needed to avoid intense memory usage at one
+    ## point of time. For now, just let the station know the raw file location.
+    astation.raw_file = files['raw']
+    return astation
+
+def get_station_results (astation):
+
+    ''' A function to collect what data_cleaner keeps from a cleaned station.
+
+        input params
+        ------------
+        astation (station): a cleaned station instance
+
+        return params
+        -------------
+        results (dict): neighbor_id, stats per set, diff_stats, diff_hist,
+                        and scalers
+    '''
+
+    return {'neighbor_id':astation.neighbor_id,
+            'stats':{dtype:getattr (astation, dtype + '_stats') for dtype in DATASET_TYPES},
+            'diff_stats':astation.diff_stats, 'diff_hist':astation.diff_hist,
+            'scalers':astation.scalers}
+
+def add_neighbor_columns (dataframe, neighbor, add_gap_features=False,
+                          gap_feature_cap=gap_features.MAX_DISTANCE, lag_minutes=0):
+
+    ''' A function to add NEIGHBOR_COLUMNS from a neighbor station by time, and
+        gap-distance features if asked. With a lag, the neighbor record at
+        t + lag is added to the record at t.
+
+        input params
+        ------------
+        dataframe (pandas.DataFrame): cleaned data of this station
+        neighbor (pandas.DataFrame or shared_frames.shared_frame): cleaned
+                 data of the neighbor station; it can be the same station
+        add_gap_features (bool): If true, add gap-distance features
+        gap_feature_cap (int): cap of gap distances in # points
+        lag_minutes (int): minutes by which the neighbor lags this station
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): cleaned data with neighbor columns
+    '''
+
+    ## Merge the new column as 'NEIGHTBOR_xxx'
+    columns = list (dataframe.columns)
+    for key in NEIGHBOR_COLUMNS:
+        column = neighbor['_'.join (key.split ('_')[1:])]
+        if lag_minutes != 0:
+            column = pandas.Series (column.values, name=column.name,
+                                    index=column.index - pandas.Timedelta (minutes=lag_minutes))
+        dataframe = pandas.merge (dataframe, column, left_index=True, right_index=True, how='left')
+    ## Rename the station columns and redefine the
+    dataframe.columns = columns + NEIGHBOR_COLUMNS
+    ## Add gap-distance features if asked
+    if add_gap_features:
+        dataframe = gap_features.add_gap_features (dataframe, max_distance=gap_feature_cap)
+    return dataframe
+
+def write_processed_station (proc_path, station_id, dataframe, writer=None):
+
+    ''' A function to write a dataframe into 3 files based on dataset type.
+        The file name is based on station ID and the dataset type.
+
+        input params
+        ------------
+        proc_path (str): processed folder
+        station_id (int): Station ID of this dataframe
+        dataframe (pandas.DataFrame): cleaned data at input station ID
+        writer (io_pipeline.csv_writer): writer to queue files; None to write
+                                         them right away
+    '''
+
+    logger = logging.getLogger ('data_cleaner')
+
+    ## Determine the output csv processed file
+    outfilebase = '{0}/{1}_processed_ver_merged_wl'.format (proc_path, station_id)
+
+    ## Loop through available train, validation, and test set
+    for dtype in dataframe.setType.unique ():
+        # Determine the actual file name
+        outfile = outfilebase + '_' + dtype + '.csv'
+        # Extract the set & drop the setType column
+        subframe = dataframe[dataframe.setType == dtype].drop (axis=1, columns=['setType'])
+        # Write the dataframe out! If there is a writer, it is queued
+        if writer is None:
+            io_pipeline.write_csv (subframe, outfile)
+        else:
+            writer.submit (subframe, outfile)
+        logger.info ('{0} processed file at {1}.'.format (dtype, outfile))
+
+def _clean_station_in_worker (station_id, meta, files, settings):
+
+    ''' A private function run by a station worker process to clean 1 station
+        and publish its cleaned dataframe in shared memory.
+
+        input params
+        ------------
+        station_id (int): station ID
+        meta (dict): station metadata from the station registry
+        files (dict): raw file names from the station registry
+        settings (dict): settings from data_cleaner._get_station_settings()
+
+        return params
+        -------------
+        results (dict): get_station_results() plus the shared frame handle,
+                        # rows, and span records if traced
+    '''
+
+    tracer = stage_tracer.stage_tracer (enabled=settings['trace'])
+    with tracer.span ('clean_station', station_id=station_id) as span:
+        astation = new_station (station_id, meta, files, settings, tracer=tracer)
+        dataframe = astation.clean_raw_data (exclude_nan_verified=settings['exclude_nan_verified'])
+        span.rows_out = len (dataframe)
+    with tracer.span ('publish_frame', station_id=station_id, rows_in=len (dataframe)):
+        handle = shared_frames.publish_frame (dataframe)
+
+    results = get_station_results (astation)
+    results.update ({'handle':handle, 'nrows':len (dataframe), 'records':tracer.pop_records()})
+    return results
+
+def _write_station_in_worker (station_id, handle, neighbor_handle, settings):
+
+    ''' A private function run by a station worker process to add neighbor
+        columns to 1 cleaned station and write its processed files. Both
+        cleaned dataframes are attached from shared memory; the neighbor
+        columns are read without copies.
+
+        input params
+        ------------
+        station_id (int): station ID
+        handle (dict): shared frame handle of this station
+        neighbor_handle (dict): shared frame handle of its neighbor station
+        settings (dict): settings from data_cleaner._get_station_settings()
+
+        return params
+        -------------
+        records (list): span records if traced
+    '''
+
+    tracer = stage_tracer.stage_tracer (enabled=settings['trace'])
+    with shared_frames.attach_frame (handle) as frame, \
+         shared_frames.attach_frame (neighbor_handle) as neighbor:
+        with tracer.span ('add_neighbor_columns', station_id=station_id, rows_in=len (frame)):
+            dataframe = add_neighbor_columns (frame.to_dataframe(), neighbor,
+                                              add_gap_features=settings['add_gap_features'],
+                                              gap_feature_cap=settings['gap_feature_cap'],
+                                              lag_minutes=settings['neighbor_lags'].get (station_id, 0))
+    with tracer.span ('write_processed', station_id=station_id, rows_in=len (dataframe)):
+        write_processed_station (settings['proc_path'], station_id, dataframe)
+    return tracer.pop_records()
+
 ###############################################
 ## Define data_cleaner class
 ###############################################
@@ -118,19 +323,71 @@ class data_cleaner (object):
         ## Station data
         self._station_groups = None
         self._station_info = None
+        self._station_registry = None
 
-        ## Dump mid-step files to processed folder?
+        ## Dump mid-step files to processed folder? If so, plots are rendered
+        ## by a pool of plot_workers processes as PDF or PNG thumbnails
         self._create_midstep_files = False
+        self._plot_workers = plot_pool.DEFAULT_WORKERS
+        self._plot_format = 'pdf'
+        self._plot_pool = None
+
+        ## Add gap-distance features to processed files?
+        self._add_gap_features = False
+        self._gap_feature_cap = gap_features.MAX_DISTANCE
+
+        ## Put records on a regular 6-minute grid? Off by default; records are
+        ## kept as is, as the grid adds rows for missing slots
+        self._regular_grid = False
+
+        ## Folder of harmonic constituents to compute PRED_WL_VALUE_MSL that
+        ## raw files do not have; None to use the raw predictions only
+        self._constituents_path = None
+
+        ## Window (e.g. '30D') of a rolling quantile of PRIMARY that stands in
+        ## for PRED_WL_VALUE_MSL at stations without any prediction (e.g.
+        ## Great Lakes); None to disable
+        self._baseline_window = None
+        self._baseline_quantile = rolling_baseline.QUANTILE
+
+        ## Neighbor table from select_neighbors.py to replace the neighbors in
+        ## station info sheet; None to use the sheet. Lags (in minutes) of the
+        ## top-ranked neighbors are kept by station ID.
+        self._neighbor_table = None
+        self._neighbor_lags = {}
+
+        ## Time each cleaning stage? If trace_file is set, spans are appended
+        ## to it as JSON lines and a summary is written to proc_path
+        self._trace_file = None
+        self._tracer = stage_tracer.stage_tracer (enabled=False)
+
+        ## Overlap I/O with cleaning? If so, raw files are prefetched on an I/O
+        ## thread and processed files are written by a writer thread
+        self._pipeline_io = True
+        self._prefetcher = None
+        self._writer = None
+
+        ## Clean stations in worker processes? If station_workers > 0, cleaned
+        ## dataframes are handed to neighbor workers via shared memory
+        self._station_workers = 0
+
+        ## Insert cleaning stats of each station into a run warehouse? If
+        ## warehouse_file is set, each clean_stations() call is one run
+        self._warehouse_file = None
+        self._warehouse = None
 
         ## Cleaning stats from all stations
         self._train_stats_df = None
         self._validation_stats_df = None
         self._test_stats_df = None
+        # Stats of groups added by add_group_results() and not yet merged
+        self._group_stats = {key:[] for key in DATASET_TYPES + ['diff']}
 
         ## Information related to differences between primary and verified
         self._diff_hist_settings = {'nbins':GIANT_HIST_NBINS,
                                     'range':GIANT_HIST_RANGE}
         self._diff_stats_df = None
+        self._scaler_registry = scaler_registry.scaler_registry()
         self._diff_hist = {'edges':None, 'all':None, 'bad_only_by_thresh':None,
                            'bad_only_by_sensor_id':None}        
 
@@ -147,21 +404,35 @@ class data_cleaner (object):
     @property
     def station_groups (self): return self._station_groups
 
+    @property
+    def station_registry (self): return self._station_registry
+
     @property
     def station_ids (self):
         return numpy.array ([sid for slist in self.station_groups for sid in slist])
 
     @property
-    def train_stats (self): return self._train_stats_df
+    def train_stats (self):
+        self._merge_group_stats()
+        return self._train_stats_df
+
+    @property
+    def validation_stats (self):
+        self._merge_group_stats()
+        return self._validation_stats_df
 
     @property
-    def validation_stats (self): return self._validation_stats_df
+    def test_stats (self):
+        self._merge_group_stats()
+        return self._test_stats_df
 
     @property
-    def test_stats (self): return self._test_stats_df
+    def diff_stats (self):
+        self._merge_group_stats()
+        return self._diff_stats_df
 
     @property
-    def diff_stats (self): return self._diff_stats_df
+    def scaler_registry (self): return self._scaler_registry
 
     @property
     def raw_path (self): return self._raw_path
@@ -171,6 +442,9 @@ class data_cleaner (object):
         self._check_file_path_existence (apath)
         self._logger.info ('Raw data folder is set to {0}.'.format (apath))
         self._raw_path = apath
+        ## Re-resolve raw files if station info is already loaded
+        if self._station_registry is not None:
+            self._station_registry.scan_raw_path (apath)
 
     @property
     def proc_path (self): return self._proc_path
@@ -200,6 +474,140 @@ class data_cleaner (object):
             raise IOError (message)
         self._create_midstep_files = aBoolean
 
+    @property
+    def add_gap_features (self): return self._add_gap_features
+    @add_gap_features.setter
+    def add_gap_features (self, aBoolean):
+        if not isinstance (aBoolean, bool):
+            message = 'Cannot accept a non-boolean, {0}, for add_gap_features.'.format (aBoolean)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._add_gap_features = aBoolean
+
+    @property
+    def plot_workers (self): return self._plot_workers
+    @plot_workers.setter
+    def plot_workers (self, nworkers):
+        if not isinstance (nworkers, int) or nworkers < 0:
+            message = 'Cannot accept a non-integer or negative, {0}, for plot_workers.'.format (nworkers)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._plot_workers = nworkers
+
+    @property
+    def plot_format (self): return self._plot_format
+    @plot_format.setter
+    def plot_format (self, aformat):
+        if not aformat in plot_pool.IMAGE_FORMATS:
+            message = 'Plot format, {0}, is not one of {1}.'.format (aformat, plot_pool.IMAGE_FORMATS)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._plot_format = aformat
+
+    @property
+    def regular_grid (self): return self._regular_grid
+    @regular_grid.setter
+    def regular_grid (self, aBoolean):
+        if not isinstance (aBoolean, bool):
+            message = 'Cannot accept a non-boolean, {0}, for regular_grid.'.format (aBoolean)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._regular_grid = aBoolean
+
+    @property
+    def constituents_path (self): return self._constituents_path
+    @constituents_path.setter
+    def constituents_path (self, apath):
+        ## None means predictions are from raw files only
+        if apath is not None: self._check_file_path_existence (apath)
+        self._constituents_path = apath
+
+    @property
+    def baseline_window (self): return self._baseline_window
+    @baseline_window.setter
+    def baseline_window (self, window):
+        ## None means no baseline; otherwise a window in hours or days
+        if window is not None:
+            try:
+                rolling_baseline.parse_window (window)
+            except IOError as error:
+                self._logger.fatal (str (error))
+                raise
+        self._baseline_window = window
+
+    @property
+    def baseline_quantile (self): return self._baseline_quantile
+    @baseline_quantile.setter
+    def baseline_quantile (self, quantile):
+        if not isinstance (quantile, (int, float)) or not 0 <= quantile <= 1:
+            message = 'Cannot accept a quantile, {0}, outside of 0 and 1.'.format (quantile)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._baseline_quantile = float (quantile)
+
+    @property
+    def neighbor_table (self): return self._neighbor_table
+    @neighbor_table.setter
+    def neighbor_table (self, afile):
+        ## None means neighbors are from station info sheet only
+        if afile is not None: self._check_file_path_existence (afile)
+        self._neighbor_table = afile
+
+    @property
+    def trace_file (self): return self._trace_file
+    @trace_file.setter
+    def trace_file (self, filename):
+        if filename is not None and not isinstance (filename, str):
+            message = 'Cannot accept a non-string, {0}, for trace_file.'.format (filename)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._trace_file = filename
+
+    @property
+    def pipeline_io (self): return self._pipeline_io
+    @pipeline_io.setter
+    def pipeline_io (self, aBoolean):
+        if not isinstance (aBoolean, bool):
+            message = 'Cannot accept a non-boolean, {0}, for pipeline_io.'.format (aBoolean)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._pipeline_io = aBoolean
+
+    @property
+    def station_workers (self): return self._station_workers
+    @station_workers.setter
+    def station_workers (self, nworkers):
+        if not isinstance (nworkers, int) or nworkers < 0:
+            message = 'Station workers, {0}, must be a non-negative integer.'.format (nworkers)
+            self._logger.fatal (message)
+            raise IOError (message)
+        if nworkers > 0 and not shared_frames.HAS_SHARED_MEMORY:
+            message = 'Station workers require shared memory i.e. python 3.8 or later.'
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._station_workers = nworkers
+
+    @property
+    def warehouse_file (self): return self._warehouse_file
+    @warehouse_file.setter
+    def warehouse_file (self, filename):
+        if filename is not None and not isinstance (filename, str):
+            message = 'Cannot accept a non-string, {0}, for warehouse_file.'.format (filename)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._warehouse_file = filename
+
+    @property
+    def gap_feature_cap (self): return self._gap_feature_cap
+    @gap_feature_cap.setter
+    def gap_feature_cap (self, npoints):
+        ## None means no cap on gap distances
+        if npoints is not None and (not isinstance (npoints, int) or npoints < 1):
+            message = 'Gap feature cap, {0}, must be a positive integer or None.'.format (npoints)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._gap_feature_cap = npoints
+
     # +------------------------------------------------------------
     # | Misc functions
     # +------------------------------------------------------------
@@ -315,6 +723,7 @@ class data_cleaner (object):
         '''
 
         ## Get the stats df based on input dataset type
+        self._merge_group_stats()
         stats_df = getattr (self, '_' + dtype + '_stats_df')
 
         ## Extract the columns 'station_id' and 'n_total' in each stats
@@ -364,122 +773,9 @@ class data_cleaner (object):
                 # Bottom: % of train/valid/test per station
         '''
 
-        ## Gather dataframe with record counts per set
-        statsframe = self._extract_global_stats()
-
-        ## Start plotting!
-        h = plt.figure (figsize=(9, 5))
-        gs = gridspec.GridSpec (2, 1, wspace=0.1)
-        gs.update (bottom=0.15)
-
-        ## Top plot: # total records per station
-        axis = h.add_subplot (gs[0])
-        xvalues = numpy.arange (len (statsframe))
-        yvalues = statsframe['n_total'].values / 1000000 # counts in million
-        axis.scatter (xvalues, yvalues, marker='o', color='black', s=20, alpha=0.8)
-            
-        ##  Format x-axis
-        axis.set_xlim ([min(xvalues)-1, max(xvalues)+1])
-        axis.set_xticks (xvalues)
-        axis.get_xaxis ().set_ticklabels ([])
-        ##  Format y-axis
-        axis.set_ylim ([0.8, 1.2])
-        axis.tick_params (axis='y', labelsize=8)
-        axis.set_ylabel ('# total [million]', fontsize=8)       
-        ##  Plot grid lines
-        for ytick in axis.yaxis.get_majorticklocs():
-            axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        for xtick in axis.xaxis.get_majorticklocs():
-            axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-
-        ## Bottom plot: # total per set / # total records
-        axis = h.add_subplot (gs[1])
-        xvalues = numpy.arange (len (statsframe))
-        for dtype in DATASET_TYPES:
-            color = 'black' if dtype=='train' else 'blue' if dtype=='validation' else 'red'
-            marker = 'o' if dtype=='train' else 'x' if dtype=='validation' else '+'
-            yvalues = statsframe['n_total_' + dtype].values / statsframe['n_total'].values 
-            axis.scatter (xvalues, yvalues, marker=marker, color=color, s=20, alpha=0.8, label=dtype)
-            
-        ##  Format x-axis
-        axis.set_xlim ([min(xvalues)-1, max(xvalues)+1])
-        axis.set_xticks (xvalues)
-        axis.set_xticklabels (statsframe.index)
-        axis.tick_params (axis='x', labelsize=8, labelrotation=90)
-        ##  Format y-axis
-        axis.set_ylim ([0, 1])
-        axis.tick_params (axis='y', labelsize=8)
-        axis.set_ylabel ('# per set / # total', fontsize=8)       
-        ##  Plot grid lines
-        for ytick in axis.yaxis.get_majorticklocs():
-            axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        for xtick in axis.xaxis.get_majorticklocs():
-            axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        ##  Plot legend
-        axis.legend (loc=0, fontsize=8)        
-
-        ### Store plot as PDF
-        plt.suptitle ('Global statistics', fontsize=15)
-        h.savefig (self._proc_path + '/global_stats.pdf')
-        plt.close ('all')
-        return
-
-    def _plot_subplot_nan_capped_vs_n_spikes (self, axis, stats_groups, stats_df,
-                                              key, dtype, doLegend=False):
-
-        ''' A private function to plot sub-plot for nan / capped vs spikes %
-            correlation plot for a given dataset type. 
-
-            input params
-            ------------
-            axis (matplotlib.Axes): the axis object to be plotted
-            stats_groups (grouped DataFrame): stats_df grouped by 'has bad results'
-            stats_df (pandas.DataFrame): stats dataframe of a given dataset type
-            key (str): the column, nan/capped primary/backup, to be plotted
-            reference (int): denominator in calculating spike percentage
-            doLegend (bool): plot legend if true
-        '''
-
-        ## Plot scatter plot: x = log10 (n_spikes), y = % spikes
-        for isbad in stats_groups.groups.keys():
-            color = 'red' if isbad else 'green'
-            marker = 'x' if isbad else 'o' 
-            label = 'bad stations' if isbad else 'good stations'
-            # Define x and y values to be n_spikes and n_nan_primary
-            this_group = stats_groups.get_group (isbad)
-            yvalues = numpy.log10 (this_group[key])
-            xvalues = this_group.n_spikes_percent.values
-            axis.scatter (xvalues, yvalues, marker=marker, color=color,
-                          s=15, alpha=0.8, label=label)
-
-        ##  Format x-axis
-        xmin = 0
-        xmax = this_group.n_spikes_percent.max() + 0.05
-        xticks = numpy.linspace (xmin, xmax, 6)
-        axis.set_xlim ([xmin, xmax])
-        axis.set_xticks (xticks)
-        axis.tick_params (axis='x', labelsize=8)
-        axis.set_xlabel ('# spikes / # total {0}'.format (dtype), fontsize=10)
-        ##  Format y-axis
-        yvalues = numpy.log10 (stats_df[key])
-        yvalues [~numpy.isfinite (yvalues)] = 0
-        ymin = numpy.floor (max (0, min(yvalues)))
-        ymax = numpy.ceil (max(yvalues))
-        yticks = numpy.linspace (ymin, ymax, 6)        
-        axis.set_ylim ([ymin, ymax])
-        axis.set_yticks (yticks)
-        axis.tick_params (axis='y', labelsize=8)
-        ylabel = 'Log10 # of '
-        ylabel += 'nan ' if 'nan' in key else 'capped '
-        ylabel += 'primary' if 'primary' in key else 'backup'
-        axis.set_ylabel (ylabel, fontsize=10)
-        ##  Plot grid lines
-        for ytick in axis.yaxis.get_majorticklocs():
-            axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        for xtick in axis.xaxis.get_majorticklocs():
-            axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        ##  Plot legend
-        if doLegend: axis.legend (loc=0, fontsize=10)
+        payload = {'statsframe':self._extract_global_stats()}
+        plot_pool.submit_or_render (self._plot_pool, plot_pool.render_global_stats, payload,
+                                    self._proc_path + '/global_stats.pdf')
 
     def plot_nan_capped_vs_n_spikes (self, dtype):
 
@@ -498,53 +794,10 @@ class data_cleaner (object):
             dtype (str): name of dataset type to be plotted
         '''
 
-        ## Collect this stats df and group the stations by has_bad_results
-        stats_df = getattr (self, '_' + dtype + '_stats_df')
-        #  Move capped max / min into 1 capped column
-        stats_df['n_capped_primary'] = stats_df.n_capped_primary_min + \
-                                       stats_df.n_capped_primary_max         
-        stats_df['n_capped_backup']  = stats_df.n_capped_backup_min + \
-                                       stats_df.n_capped_backup_max 
-        #  Scale n_spikes w.r.t. # records in this set
-        reference = N_RANDOM_SAMPLES if dtype=='train' else stats_df.n_total
-        stats_df['n_spikes_percent'] = stats_df.n_spikes / reference
-        #  Group dataframe by bad / good stations
-        stats_groups = stats_df.groupby (by = 'has_bad_results')
-        
-        ## Start plotting!
-        h = plt.figure (figsize=(9, 9))
-        gs = gridspec.GridSpec (2, 2, wspace=0.2, hspace=0.2)
-
-        ## Top left plot: log10 (# nan primary) vs % spikes
-        axis = h.add_subplot (gs[0])
-        self._plot_subplot_nan_capped_vs_n_spikes (axis, stats_groups, stats_df,
-                                                   'n_nan_primary', dtype,
-                                                   doLegend=True)
-
-        ## Top right plot: log10 (# nan backup) vs % spikes
-        axis = h.add_subplot (gs[1])
-        self._plot_subplot_nan_capped_vs_n_spikes (axis, stats_groups, stats_df,
-                                                   'n_nan_backup', dtype,
-                                                   doLegend=False)
-
-        ## Bottom left plot: log10 (# capped primary) vs % spikes
-        axis = h.add_subplot (gs[2])
-        self._plot_subplot_nan_capped_vs_n_spikes (axis, stats_groups, stats_df,
-                                                   'n_capped_primary', dtype,
-                                                   doLegend=False)
-        
-        ## Bottom right plot: log10 (# capped backup) vs % spikes
-        axis = h.add_subplot (gs[3])
-        self._plot_subplot_nan_capped_vs_n_spikes (axis, stats_groups, stats_df,
-                                                   'n_capped_backup', dtype,
-                                                   doLegend=False)        
-
-        ### Store plot as PDF
-        title = 'Nan / capped vs spikes % correlation for {0} set'.format (dtype)
-        plt.suptitle (title, fontsize=15)
-        h.savefig (self._proc_path + '/nan_capped_vs_spikes_' + dtype + '.pdf')
-        plt.close ('all')
-        return        
+        self._merge_group_stats()
+        payload = {'dtype':dtype, 'stats_df':getattr (self, '_' + dtype + '_stats_df')}
+        plot_pool.submit_or_render (self._plot_pool, plot_pool.render_nan_capped_vs_n_spikes, payload,
+                                    self._proc_path + '/nan_capped_vs_spikes_' + dtype + '.pdf')
 
     def plot_stats (self, dtype):
     
@@ -573,136 +826,13 @@ class data_cleaner (object):
 
     def plot_diff_stats (self):
 
-        ## Start plotting!
-        h = plt.figure (figsize=(9, 3))
-        gs = gridspec.GridSpec (1, 1)
-        gs.update (bottom=0.23)
-        axis = h.add_subplot (gs[0])
-
-        ## Plot individual statistics
-        xvalues = numpy.arange (len (self.diff_stats)) + 1
-        yvalues = self.diff_stats['mean'].values
-        yerrors = numpy.array ([yvalues - self.diff_stats['lower'],
-                                self.diff_stats['upper'] - yvalues])
-        axis.errorbar (xvalues, yvalues, yerr=yerrors, marker='o', color='black',
-                       markersize=6, alpha=0.7, linestyle=None, linewidth=0.0,
-                       ecolor='blue', elinewidth=3, capsize=0.0, capthick=0.0)
-
-        ## Plot horizontal line
-        axis.axhline (y=TARGET_THRESH, color='red', alpha=0.7, linestyle='--', linewidth=1)
-        axis.axhline (y=-1*TARGET_THRESH, color='red', alpha=0.7, linestyle='--', linewidth=1)
-
-        ##  Format x-axis
-        axis.set_xlim ([min(xvalues) - 1, max(xvalues) + 1])
-        axis.set_xticks (xvalues)
-        axis.set_xticklabels (self.diff_stats.station_id)
-        axis.tick_params (axis='x', labelsize=8, labelrotation=90)
-        ##  Format y-axis
-        axis.set_ylim ([-0.1, 0.1])
-        axis.tick_params (axis='y', labelsize=8)
-        axis.set_ylabel ('Primary - Verified\n[meters]', fontsize=10)
-
-        ##  Add title
-        axis.set_title ('Distributions of primary - verified', fontsize=12)
-        ##  Plot grid lines
-        for ytick in axis.yaxis.get_majorticklocs():
-            axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        for xtick in axis.xaxis.get_majorticklocs():
-            axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-
-        ### Store plot as PDF
-        h.savefig (self.proc_path + '/diff_stats.pdf')
-        plt.close ('all')
-        return
-
-    def _get_diff_statistics (self, xvalues, yvalues):
-        
-        ''' A private function to obtain statistics from a histogram with
-            x and yvalues. It builds a cumulative histogram and flips (inverts)
-            it. The mean, min, max, top and bottom 5% are obtained to get a
-            rough shape of the histogram. 
-
-            lower: 5%
-            mean: 50%
-            upper: 95%
-
-            input params
-            ------------
-            xvalues (array): the xvalues for fitting a CDF
-            yvalues (array): the yvalues for fitting a CDF
-
-            return params
-            -------------
-            stats (dict): 5%, 50%, 95% from the histogram
+        ''' A public function to plot the 5, 50, 95% of primary - verified
+            per station.
         '''
-        
-        cdf = numpy.cumsum (yvalues) / sum (yvalues)
-        bins = xvalues[:-1] + (xvalues[1:] - xvalues[:-1])/2.
-        icdf = interp1d (cdf, bins)
-        lowP = max (0.025, min (icdf.x))
-        highP = min (0.975, max (icdf.x))
-        midP = 0.5
-        if highP < lowP:
-            highP = (max (icdf.x) - lowP)*0.975 + lowP
-            midP = (max (icdf.x) - lowP)*0.5 + lowP
-        lower, mean, upper = icdf(lowP), icdf(midP), icdf(highP)
-        return {'lower':float (lower), 'upper':float (upper), 'mean':float (mean)}
-
-    def _plot_subplot_giant_diff (self, axis, htype='all'):
-
-        ''' A private function to plot a sub plot for the summary histogram.
-            The histogram is indicated by the htype, which must be one of the
-            3 keys in self._hist_diff: 'all', 'bad_only_by_thresh', or
-            'bad_only_by_sensor_id'. By default this histogram covers quite
-            a wide range (+/- 20 or 30 meters) with fine binning. With the full
-            range, the 90% interval is extracted. This function then plots the
-            sub-section of the histogram between -0.1 and 0.1 meters.
 
-            input params
-            ------------
-            axis (matplotlib.Axes): axis on which plots are made
-            htype (str): key in self._hist_diff
-        '''
-
-        ## Determine the 5, 50, 95%
-        yvalues = self._diff_hist[htype]
-        xvalues = self._diff_hist['edges']     
-        stats = self._get_diff_statistics (xvalues, yvalues)
-
-        ## Plot the histogram
-        yvalues = numpy.log10 (yvalues)
-        yvalues = [yvalues[0]] + list (yvalues)
-        axis.plot (xvalues, yvalues, color='gray', alpha=0.7, linestyle='-',
-                   linewidth=1.5, drawstyle='steps-pre')
-
-        ## Plot vertical shaded area between 5 and 95%
-        axis.axvspan (stats['lower'], stats['upper'], color='blue', alpha=0.2)
-
-        #  Print 90% interval
-        text = '50% = {0:.3f} cm\n'.format (stats['mean']*100)
-        text += '90% = [{0:.3f}, {1:.3f}] cm'.format (stats['lower']*100, stats['upper']*100)
-        anchored_text = AnchoredText (text, loc=2, frameon=False)
-        axis.add_artist (anchored_text)
-
-        ##  Format x-axis
-        axis.set_xlim ([-0.1 ,0.1]) ## from -0.1 to 0.1 meters
-        axis.set_xticks (numpy.linspace (-0.1, 0.1, 21)) # 21 xticks
-        axis.tick_params (axis='x', labelsize=5)
-        axis.set_xlabel ('Primary - Verified [meters]', fontsize=10)
-
-        ##  Format y-axis
-        axis.set_ylim ([0, numpy.ceil (max(yvalues))])
-        axis.tick_params (axis='y', labelsize=8)
-        axis.set_ylabel ('log10 #', fontsize=10)
-
-        ##  Add title
-        title = 'All data points' if htype=='all' else htype.replace ('_', ' ')
-        axis.set_title (title, fontsize=12)
-        ##  Plot grid lines
-        for ytick in axis.yaxis.get_majorticklocs():
-            axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        for xtick in axis.xaxis.get_majorticklocs():
-            axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
+        payload = {'diff_stats':self.diff_stats}
+        plot_pool.submit_or_render (self._plot_pool, plot_pool.render_diff_stats, payload,
+                                    self.proc_path + '/diff_stats.pdf')
 
     def plot_giant_diff_hist (self):
 
@@ -714,27 +844,9 @@ class data_cleaner (object):
             Left: Histogram with only bad points defined by sensor ID
         '''
 
-        ## Start plotting!
-        h = plt.figure (figsize=(17, 5.5))
-        gs = gridspec.GridSpec (1, 3)
-
-        ## Plot the histogram with all data points (log y-axis)
-        axis = h.add_subplot (gs[0])
-        self._plot_subplot_giant_diff (axis, htype='all')
-
-        ## Plot the histogram with bad points  (log y-axis)
-        axis = h.add_subplot (gs[1])
-        self._plot_subplot_giant_diff (axis, htype='bad_only_by_thresh')
-
-        ## Plot the histogram with bad points  (log y-axis)
-        axis = h.add_subplot (gs[2])
-        self._plot_subplot_giant_diff (axis, htype='bad_only_by_sensor_id')
-
-        ### Store plot as PDF
-        plt.suptitle ('Distributions of primary - verified from all stations', fontsize=12)
-        h.savefig (self.proc_path + '/diff_hist_summary.pdf')
-        plt.close ('all')
-        return
+        payload = {'diff_hist':self._diff_hist}
+        plot_pool.submit_or_render (self._plot_pool, plot_pool.render_giant_diff_hist, payload,
+                                    self.proc_path + '/diff_hist_summary.pdf')
 
     def plot_all_stats (self):
 
@@ -845,6 +957,41 @@ class data_cleaner (object):
                             'testing' if dtype=='test' else 'Validation' 
             station_frame['Dates used for ' + column_suffix] = period
 
+        ## Replace neighbors by the top-ranked ones in neighbor table if any
+        if self._neighbor_table is not None:
+            station_frame = self._apply_neighbor_table (station_frame)
+
+        return station_frame
+
+    def _apply_neighbor_table (self, station_frame):
+
+        ''' A private function to replace the neighbor of each station in the
+            station info sheet by its top-ranked neighbor in neighbor table,
+            and to keep the lag of that neighbor. Stations not in the table,
+            or whose top-ranked neighbor is not in the sheet, keep the sheet.
+
+            input params
+            ------------
+            station_frame (pandas.DataFrame): station meta-data from info sheet
+
+            return params
+            -------------
+            station_frame (pandas.DataFrame): station meta-data with neighbors
+                                              from neighbor table
+        '''
+
+        best = select_neighbors.get_best_neighbors (select_neighbors.load_neighbor_table (self._neighbor_table))
+        station_ids = set (station_frame['Station ID'].astype (int))
+
+        neighbors = station_frame['Neighbor station number'].values.copy()
+        self._neighbor_lags = {}
+        for index, station_id in enumerate (station_frame['Station ID'].astype (int)):
+            if not station_id in best or not best[station_id][0] in station_ids: continue
+            neighbors[index], self._neighbor_lags[station_id] = best[station_id]
+        station_frame['Neighbor station number'] = neighbors
+
+        message = 'Neighbors of {0} stations are from neighbor table {1}.'
+        self._logger.info (message.format (len (self._neighbor_lags), self._neighbor_table))
         return station_frame
 
     def _group_stations_by_neighbor (self):
@@ -869,8 +1016,9 @@ class data_cleaner (object):
 
         ## Loop through each row in station info csv dataframe
         for index, row in station_df.iterrows():
-            # Collect the sorted list of station ID and neighbor ID
-            subarray = sorted (row.values)
+            # Collect the sorted list of station ID and neighbor ID. A station
+            # that is its own neighbor is a group of 1.
+            subarray = list (numpy.unique (row.values))
             # Loop through the sub ID lists in station_list holder 
             found = False
             for index, prevarray in enumerate (station_list):
@@ -892,14 +1040,21 @@ class data_cleaner (object):
     def load_station_info (self):
 
         ''' A public function to load station information from station info
-            sheet. This function sets 2 private variables
+            sheet. This function sets 3 private variables
                 * station_info: dataframe with all station meta-data
+                * station_registry: parsed meta-data & raw file locations
+                                    indexed by station ID
                 * station_groups: station IDs grouped by neighboring info
         '''
 
         ## Read stations from station csv file
         self._station_info = self._read_station_info()
 
+        ## Parse meta-data once and resolve all raw files in one scan
+        self._station_registry = station_registry.station_registry (self._station_info)
+        if self._raw_path is not None:
+            self._station_registry.scan_raw_path (self._raw_path)
+
         ## Group station ID by neigbors 
         self._station_groups = self._group_stations_by_neighbor()
 
@@ -913,7 +1068,8 @@ class data_cleaner (object):
     def _has_complete_set (self, station_id):
     
         ''' A private function to check if all raw files are available i.e. 
-            raw data, primary offsets, and backup gain and offset files.
+            raw data, primary offsets, and backup gain and offset files. Files
+            are looked up from the station registry.
 
             input params
             ------------
@@ -924,37 +1080,7 @@ class data_cleaner (object):
             Boolean: If true, this station has all files.
         '''
 
-        ## 1. Check if raw csv file exists
-        raw_files = numpy.array (glob (self._raw_path + '/' + station_id + FILE_PATTERN_RAW_CSV))
-        if len (raw_files) == 0:
-            message = 'Station {0} does not have {0}{1} file.'
-            self._logger.warn (message.format (station_id, FILE_PATTERN_RAW_CSV))
-            return False
-        if len (raw_files) > 1:
-            message = 'Station {0} has multiple {0}{1} files.'
-            self._logger.warn (message.format (station_id, FILE_PATTERN_RAW_CSV))        
-
-        ## 2. Check if primary offsets file exists
-        primary_offset_files = numpy.array (glob (self._raw_path + '/' + station_id + FILE_PATTERN_PRIMARY_OFFSETS))
-        if len (primary_offset_files) == 0:
-            message = 'Station {0} does not have {0}{1} file.'
-            self._logger.warn (message.format (station_id, FILE_PATTERN_PRIMARY_OFFSETS))
-            return False
-        if len (primary_offset_files) > 1:
-            message = 'Station {0} has multiple {0}{1} files.'
-            self._logger.warn (message.format (station_id, FILE_PATTERN_PRIMARY_OFFSETS))
-
-        ## 3. Check if backup B1 gain / offsets file exists
-        backup_gain_offset_files = numpy.array (glob (self._raw_path + '/' + station_id + FILE_PATTERN_B1_GAIN_OFFSETS))
-        if len (backup_gain_offset_files) == 0:
-            message = 'Station {0} does not have {0}{1} file.'
-            self._logger.warn (message.format (station_id, FILE_PATTERN_B1_GAIN_OFFSETS))
-            return False
-        if len (backup_gain_offset_files) > 1:
-            message = 'Station {0} has multiple {0}{1} files.'
-            self._logger.warn (message.format (station_id, FILE_PATTERN_B1_GAIN_OFFSETS))            
-
-        return True
+        return self._station_registry.has_complete_set (station_id)
 
     def _set_up_station (self, station_id):
 
@@ -974,40 +1100,63 @@ class data_cleaner (object):
             astation (station): a station instance with all info set up 
         '''
 
-        ## Define new station instance
-        astation = station.station (station_id)
+        ## Define new station instance with its metadata, offsets, and raw file
+        astation = new_station (station_id, self._station_registry.get_meta (station_id),
+                                self._get_station_files (station_id),
+                                self._get_station_settings(), plot_pool=self._plot_pool,
+                                tracer=self._tracer)
+
+        ## If raw files are prefetched, hand over the raw data of this station
+        if self._prefetcher is not None and astation.raw_file is not None:
+            astation.raw_dataframe = self._prefetcher.get (station_id)
+
+        return astation
 
-        ## Tell it to create mid-step files as the cleaning process goes
-        astation.create_midstep_files = self._create_midstep_files
-        astation.proc_path = self._proc_path
+    def _get_station_files (self, station_id):
 
-        ## Parse station metadata
-        metadata = self._station_info[self._station_info['Station ID'] == station_id]
-        astation.set_station_info (metadata)
+        ''' A private function to get the raw and offset file names of a
+            station if it has all raw files.
+
+            input params
+            ------------
+            station_id (int): station ID
+
+            return params
+            -------------
+            files (dict): raw file names; None if the set is incomplete
+        '''
 
         ## Check if this station has all raw files
-        station_id_str = str (station_id)
-        is_complete = self._has_complete_set (station_id_str)
+        is_complete = self._has_complete_set (station_id)
         message = 'Station {0} has all raw files :)' if is_complete else \
                   'Station {0} does not have a complete set. Skipping this station from cleaning.'
         self._logger.info (message.format (station_id))
-        #  If incomplete raw files, return empty station object without loading data
-        if not is_complete: return astation
+        if not is_complete: return None
+        return self._station_registry.get_files (station_id)
 
-        ## Define the raw and offset file names required for this station
-        raw_file = numpy.array (glob (self._raw_path + '/' + station_id_str + FILE_PATTERN_RAW_CSV))[0]
-        primary_offset_file = numpy.array (glob (self._raw_path + '/' + station_id_str + FILE_PATTERN_PRIMARY_OFFSETS))[0]
-        backup_gain_offset_file = numpy.array (glob (self._raw_path + '/' + station_id_str + FILE_PATTERN_B1_GAIN_OFFSETS))[0]
+    def _get_station_settings (self, exclude_nan_verified=False):
 
-        ## Load offset data: offsets, and B1_gain_offsets
-        astation.load_primary_offsets (primary_offset_file)
-        astation.load_backup_B1_gain_offsets (backup_gain_offset_file)
+        ''' A private function to collect the settings that a station (or a
+            station worker process) needs for cleaning and writing.
 
-        ## For raw file, only load it as needed to avoid intense memory usage at one
-        ## point of time. For now, just let the station know the raw file location.
-        astation.raw_file = raw_file
+            input params
+            ------------
+            exclude_nan_verified (bool): If true, exclude nan verified from 
+                                             spikes counting
 
-        return astation
+            return params
+            -------------
+            settings (dict): picklable settings
+        '''
+
+        return {'proc_path':self._proc_path, 'create_midstep_files':self._create_midstep_files,
+                'regular_grid':self._regular_grid, 'exclude_nan_verified':exclude_nan_verified,
+                'constituents_path':self._constituents_path,
+                'baseline_window':self._baseline_window,
+                'baseline_quantile':self._baseline_quantile,
+                'neighbor_lags':self._neighbor_lags,
+                'add_gap_features':self._add_gap_features,
+                'gap_feature_cap':self._gap_feature_cap, 'trace':self._tracer.enabled}
 
     def _write_processed_station (self, station_id, dataframe):
         
@@ -1020,18 +1169,7 @@ class data_cleaner (object):
             dataframe (pandas.DataFrame): cleaned data at input station ID
         '''
 
-        ## Determine the output csv processed file
-        outfilebase = '{0}/{1}_processed_ver_merged_wl'.format (self._proc_path, station_id)
-
-        ## Loop through available train, validation, and test set
-        for dtype in dataframe.setType.unique ():
-            # Determine the actual file name
-            outfile = outfilebase + '_' + dtype + '.csv'
-            # Extract the set & drop the setType column
-            subframe = dataframe[dataframe.setType == dtype].drop (axis=1, columns=['setType'])
-            # Write the dataframe out!
-            subframe.to_csv (outfile, index=False)
-            self._logger.info ('{0} processed file at {1}.'.format (dtype, outfile))
+        write_processed_station (self._proc_path, station_id, dataframe, writer=self._writer)
 
     def _append_giant_histograms (self, diff_hist_per_station):
 
@@ -1091,24 +1229,17 @@ class data_cleaner (object):
 
         ## Loop through each station in the group
         for station_id in station_group:
-            # Define a station instance 
-            astation = self._set_up_station (station_id)
-            # Collect neighbor id
-            neighbors.append (astation.neighbor_id)
-            # Cleaned data!
-            dataframes[station_id] = astation.clean_raw_data (exclude_nan_verified=exclude_nan_verified)
-            # Extract stats of primary - verified stats
-            diff_stats['station_id'].append (station_id)
-            for key in DIFF_STATS_KEYS:
-                diff_stats[key].append (astation.diff_stats[key])
-            # Extract the stats from this station
-            for dtype in DATASET_TYPES:
-                stats[dtype]['station_id'].append (station_id)
-                stats_dict = getattr (astation, dtype + '_stats')
-                for stats_key, stats_value in stats_dict.items():
-                    stats[dtype][stats_key].append (stats_value)
-            # Add the histograms to the giant histograms
-            self._append_giant_histograms (astation.diff_hist)
+            with self._tracer.span ('clean_station', station_id=station_id) as span:
+                # Define a station instance 
+                astation = self._set_up_station (station_id)
+                # Collect neighbor id
+                neighbors.append (astation.neighbor_id)
+                # Cleaned data!
+                dataframes[station_id] = astation.clean_raw_data (exclude_nan_verified=exclude_nan_verified)
+                span.rows_out = len (dataframes[station_id])
+            # Collect stats, histograms, and scalers of this station
+            self._collect_station_results (stats, diff_stats, station_id,
+                                           get_station_results (astation))
 
         ## Handle neighbor info. The stations in the same group are related by
         ## their neighbor info. Once all of their data are cleaned, we add new
@@ -1116,20 +1247,255 @@ class data_cleaner (object):
         for station_id, neighbor_id in zip (station_group, neighbors):
             # Get the dataframes
             this_df = dataframes[station_id]
-            neighbor_df = dataframes[neighbor_id]
-            # Merge the new column as 'NEIGHTBOR_xxx'
-            for key in NEIGHBOR_COLUMNS:
-                this_df= pandas.merge (this_df, neighbor_df['_'.join (key.split ('_')[1:])],
-                                       left_index=True, right_index=True, how='left')
-            # Rename the station columns and redefine the 
-            this_df.columns = CLEANED_COLUMNS + ['setType'] + NEIGHBOR_COLUMNS
+            with self._tracer.span ('add_neighbor_columns', station_id=station_id,
+                                    rows_in=len (this_df)):
+                this_df = add_neighbor_columns (this_df, dataframes[neighbor_id],
+                                                add_gap_features=self._add_gap_features,
+                                                gap_feature_cap=self._gap_feature_cap,
+                                                lag_minutes=self._neighbor_lags.get (station_id, 0))
             # Write this station out
-            self._write_processed_station (station_id, this_df)
+            with self._tracer.span ('write_processed', station_id=station_id, rows_in=len (this_df)):
+                self._write_processed_station (station_id, this_df)
 
         ## Return the stats as data frame for each set
         stats_df = {key:pandas.DataFrame (value) for key, value in stats.items()}
         return stats_df, pandas.DataFrame (diff_stats)
 
+    def clean_station_group (self, station_group, exclude_nan_verified=False):
+
+        ''' A public function to clean 1 station group on its own e.g. by a
+            work_queue worker, and return its results instead of adding them
+            to the stats of this cleaner. Processed files are written as in
+            clean_stations(); stats files are left to add_group_results() of
+            the cleaner that collects all groups.
+
+            input params
+            ------------
+            station_group (list): List of station IDs that are neighbors
+            exclude_nan_verified (bool): If true, exclude nan verified from 
+                                             spikes counting
+
+            return params
+            -------------
+            results (dict): stats {dtype: stats dataframe}, diff_stats
+                            dataframe, diff_hist of the group, and scalers
+                            {station ID: scalers}
+        '''
+
+        ## If station Info is not yet loaded, load it now.
+        if self._station_groups is None: self.load_station_info()
+
+        ## Keep the histograms of this group apart from the giant histograms
+        diff_hist = self._diff_hist
+        self._diff_hist = {key:None for key in diff_hist.keys()}
+        try:
+            stats, diff = self._clean_station_group (station_group,
+                                                     exclude_nan_verified=exclude_nan_verified)
+            group_hist = self._diff_hist
+        finally:
+            self._diff_hist = diff_hist
+
+        return {'stats':stats, 'diff_stats':diff, 'diff_hist':group_hist,
+                'scalers':{station_id:self._scaler_registry.get (station_id)
+                           for station_id in station_group}}
+
+    def add_group_results (self, results):
+
+        ''' A public function to add the results of a station group cleaned
+            elsewhere, in the same way clean_stations() adds each group: stats
+            are appended, histograms summed, and scalers collected. Call
+            save_stats_data() and write scalers once all groups are added.
+
+            input params
+            ------------
+            results (dict): from clean_station_group()
+        '''
+
+        ## Keep stats of this group; all groups are merged once when stats
+        ## are read or saved
+        for dtype in DATASET_TYPES:
+            self._group_stats[dtype].append (results['stats'][dtype])
+        self._group_stats['diff'].append (results['diff_stats'])
+
+        ## Add the histograms to the giant histograms
+        self._append_giant_histograms (results['diff_hist'])
+
+        ## Collect normalization scalers
+        for station_id, scalers in results['scalers'].items():
+            self._scaler_registry.update (station_id, **scalers)
+
+    def _merge_group_stats (self):
+
+        ''' A private function to append the stats of groups added since the
+            last merge in one concat, and make sure there are no duplicated
+            stations.
+        '''
+
+        if len (self._group_stats['diff']) == 0: return
+        self._train_stats_df = pandas.concat ([self._train_stats_df] + self._group_stats['train'],
+                                              ignore_index=True).drop_duplicates()
+        self._validation_stats_df = pandas.concat ([self._validation_stats_df] + self._group_stats['validation'],
+                                                   ignore_index=True).drop_duplicates()
+        self._test_stats_df = pandas.concat ([self._test_stats_df] + self._group_stats['test'],
+                                             ignore_index=True).drop_duplicates()
+        self._diff_stats_df = pandas.concat ([self._diff_stats_df] + self._group_stats['diff'],
+                                             ignore_index=True).drop_duplicates()
+        self._group_stats = {key:[] for key in DATASET_TYPES + ['diff']}
+
+    def _collect_station_results (self, stats, diff_stats, station_id, results):
+
+        ''' A private function to collect the results of a cleaned station:
+            its stats are appended to the group holders, inserted into the
+            run warehouse, and its histograms and scalers are added.
+
+            input params
+            ------------
+            stats (dict): {dtype: {stats key: list}} of the group
+            diff_stats (dict): {diff stats key: list} of the group
+            station_id (int): station ID
+            results (dict): from get_station_results()
+        '''
+
+        # Extract stats of primary - verified stats
+        diff_stats['station_id'].append (station_id)
+        for key in DIFF_STATS_KEYS:
+            diff_stats[key].append (results['diff_stats'][key])
+        # Extract the stats from this station
+        for dtype in DATASET_TYPES:
+            stats[dtype]['station_id'].append (station_id)
+            for stats_key, stats_value in results['stats'][dtype].items():
+                stats[dtype][stats_key].append (stats_value)
+        # Insert the stats into the run warehouse right away
+        if self._warehouse is not None:
+            self._warehouse.add_station (station_id, results['stats'], results['diff_stats'])
+        # Add the histograms to the giant histograms
+        self._append_giant_histograms (results['diff_hist'])
+        # Collect normalization scalers
+        self._scaler_registry.update (station_id, **results['scalers'])
+
+    def _add_worker_records (self, records, group):
+
+        ''' A private function to add span records sent back by a station
+            worker to the tracer of this run, under the station_workers span.
+
+            input params
+            ------------
+            records (list): span records from the worker
+            group (str): station group of the worker task
+        '''
+
+        for record in records:
+            record['group'] = group
+            if record['parent'] is None: record['parent'] = 'station_workers'
+        self._tracer.add_records (records)
+
+    def _clean_groups_in_workers (self, station_groups, exclude_nan_verified=False):
+
+        ''' A private function to clean station groups with a pool of station
+            worker processes. Each station is cleaned by a worker, which
+            publishes its cleaned dataframe in shared memory and sends back
+            only its stats and the shared frame handle. Once all stations in a
+            group are cleaned, a worker per station attaches its own frame and
+            its neighbor frame to add neighbor columns and write the processed
+            files. A frame is freed after its last consumer i.e. the write of
+            its own station and of stations that take it as neighbor.
+
+            Up to station_workers groups are in flight at a time. Stats are
+            returned in the order of the groups, as in the serial cleaning.
+
+            input params
+            ------------
+            station_groups (list): List of station groups to be cleaned
+            exclude_nan_verified (bool): If true, exclude nan verified from 
+                                             spikes counting
+
+            return params
+            -------------
+            stats_dfs (dict): {dtype: list of stats dataframe per group}
+            diff_dfs (list): diff stats dataframe per group
+        '''
+
+        settings = self._get_station_settings (exclude_nan_verified=exclude_nan_verified)
+        stats_dfs = {dtype:[None] * len (station_groups) for dtype in DATASET_TYPES}
+        diff_dfs = [None] * len (station_groups)
+
+        ## Groups in flight: {group index: {'results':{station ID: results},
+        ## 'n_writes':# writes left}}, and tasks: {future: (kind, index, ID)}
+        groups, tasks = {}, {}
+        next_index = 0
+
+        ## The store is created before the pool so that workers share its
+        ## resource tracker
+        store = shared_frames.shared_frame_store()
+        pool = ProcessPoolExecutor (max_workers=self._station_workers)
+        try:
+            while next_index < len (station_groups) or len (tasks) > 0:
+                # Clean stations of the next groups
+                while next_index < len (station_groups) and len (groups) < self._station_workers:
+                    groups[next_index] = {'results':{}, 'n_writes':len (station_groups[next_index])}
+                    for station_id in station_groups[next_index]:
+                        future = pool.submit (_clean_station_in_worker, station_id,
+                                              self._station_registry.get_meta (station_id),
+                                              self._get_station_files (station_id), settings)
+                        tasks[future] = ('clean', next_index, station_id)
+                    next_index += 1
+
+                # Handle whichever tasks are done
+                done, _ = wait (list (tasks.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, index, station_id = tasks.pop (future)
+                    station_group = station_groups[index]
+                    group = '-'.join ([str (an_id) for an_id in station_group])
+
+                    if kind == 'write':
+                        # Release this frame and its neighbor frame
+                        self._add_worker_records (future.result(), group)
+                        store.release (station_id)
+                        store.release (groups[index]['results'][station_id]['neighbor_id'])
+                        groups[index]['n_writes'] -= 1
+                        if groups[index]['n_writes'] == 0: del groups[index]
+                        continue
+
+                    # A station is cleaned; take over its shared frame
+                    results = future.result()
+                    store.adopt (station_id, results.pop ('handle'))
+                    self._add_worker_records (results.pop ('records'), group)
+                    groups[index]['results'][station_id] = results
+                    if len (groups[index]['results']) < len (station_group): continue
+
+                    # All stations in this group are cleaned. Collect stats in
+                    # group order and count the consumers of each frame.
+                    stats = {key:{subkey:[] for subkey in ['station_id'] + CLEAN_STATS_KEYS}
+                             for key in DATASET_TYPES}
+                    diff_stats = {key:[] for key in ['station_id'] + DIFF_STATS_KEYS}
+                    for an_id in station_group:
+                        group_results = groups[index]['results'][an_id]
+                        self._collect_station_results (stats, diff_stats, an_id, group_results)
+                        store.add_consumers (an_id)
+                        store.add_consumers (group_results['neighbor_id'])
+                    for dtype in DATASET_TYPES:
+                        stats_dfs[dtype][index] = pandas.DataFrame (stats[dtype])
+                    diff_dfs[index] = pandas.DataFrame (diff_stats)
+
+                    # Add neighbor columns and write each station
+                    for an_id in station_group:
+                        neighbor_id = groups[index]['results'][an_id]['neighbor_id']
+                        future = pool.submit (_write_station_in_worker, an_id, store.get_handle (an_id),
+                                              store.get_handle (neighbor_id), settings)
+                        tasks[future] = ('write', index, an_id)
+        finally:
+            # Cancel tasks that are not started (shutdown's cancel_futures
+            # needs python 3.9) and wait for the running ones
+            for future in tasks: future.cancel()
+            pool.shutdown()
+            # Free frames of cleaned stations that are not yet adopted
+            for future, (kind, index, station_id) in tasks.items():
+                if kind == 'clean' and not future.cancelled() and future.exception() is None:
+                    shared_frames.unlink_frame (future.result()['handle'])
+            store.close()
+
+        return stats_dfs, diff_dfs
+
     def clean_stations (self, exclude_nan_verified=False, station_ids=None):
 
         ''' A public function to clean stations. If no station_ids provided, it
@@ -1167,35 +1533,75 @@ class data_cleaner (object):
             message += ' Please check your station ids with info sheet.'
             raise IOError (message.format (station_ids))
 
-        ## Load data as groups to avoid memory demands. Stations are grouped
-        ## by neighbor stations. 
-        stats_df, diff_df = None, None
-        for station_group in station_groups:
-            # Clean this group of stations
-            stats, diff = self._clean_station_group (station_group,
-                                    exclude_nan_verified=exclude_nan_verified)
-            # If this is the first group, just replace dataframe
-            if stats_df is None and diff_df is None:
-                stats_df = stats
-                diff_df = diff
-                continue
-            # Otherwise, append individual dataframe
-            diff_df = diff_df.append (diff, ignore_index=True)
-            for dtype, maindf in stats_df.items():
-                stats_df[dtype] = maindf.append (stats[dtype], ignore_index=True)
-            
-        ## Plot a giant histogram with all 
+        ## If asked to create mid-step files, render plots in the background
+        if self.create_midstep_files:
+            self._plot_pool = plot_pool.plot_pool (max_workers=self._plot_workers,
+                                                   image_format=self._plot_format)
+
+        ## If asked to trace, time each stage of this run
+        self._tracer = stage_tracer.stage_tracer (trace_file=self._trace_file,
+                                                  enabled=self._trace_file is not None)
+
+        ## If asked to keep a run warehouse, this call is a new run
+        if self._warehouse_file is not None:
+            self._warehouse = run_warehouse.run_warehouse (self._warehouse_file)
+            self._warehouse.start_run (self._get_run_config (exclude_nan_verified),
+                                       label=os.path.basename (os.path.normpath (self._proc_path)))
+
+        ## If asked to clean with station workers, they read and write their
+        ## own files. Otherwise, if asked to overlap I/O, start prefetching raw
+        ## files in cleaning order and a writer for processed files
+        if self._pipeline_io and self._station_workers == 0:
+            raw_files = [(station_id, self._station_registry.get_files (station_id)['raw'])
+                         for station_group in station_groups for station_id in station_group
+                         if self._has_complete_set (station_id)]
+            self._prefetcher = io_pipeline.raw_prefetcher (raw_files)
+            self._writer = io_pipeline.csv_writer ()
 
+        ## Load data as groups to avoid memory demands. Stations are grouped
+        ## by neighbor stations. Stats of each group are collected in lists
+        ## and concatenated once at the end.
+        stats_dfs = {dtype:[] for dtype in DATASET_TYPES}
+        diff_dfs = []
+        try:
+            if self._station_workers > 0:
+                # Clean all groups with station worker processes
+                with self._tracer.span ('station_workers'):
+                    stats_dfs, diff_dfs = self._clean_groups_in_workers (station_groups,
+                                                exclude_nan_verified=exclude_nan_verified)
+            else:
+                for station_group in station_groups:
+                    # Clean this group of stations
+                    group = '-'.join ([str (station_id) for station_id in station_group])
+                    with self._tracer.span ('clean_station_group', group=group):
+                        stats, diff = self._clean_station_group (station_group,
+                                                exclude_nan_verified=exclude_nan_verified)
+                    # Collect individual dataframe
+                    diff_dfs.append (diff)
+                    for dtype in DATASET_TYPES:
+                        stats_dfs[dtype].append (stats[dtype])
+        finally:
+            # Stop prefetching and wait for all processed files to be written
+            if self._prefetcher is not None:
+                self._prefetcher.close()
+                self._prefetcher = None
+            if self._writer is not None:
+                writer, self._writer = self._writer, None
+                with self._tracer.span ('wait_for_writer'):
+                    writer.close()
+
+        ## Close the run in warehouse
+        if self._warehouse is not None:
+            self._warehouse.finish_run()
+            self._warehouse.close()
+            self._warehouse = None
 
         ## Store stats_df to private variables. If they already exists, append.
-        self._train_stats_df = stats_df['train'] if self._train_stats_df is None else \
-                               self._train_stats_df.append (stats_df['train'], ignore_index=True)
-        self._validation_stats_df = stats_df['validation'] if self._validation_stats_df is None else \
-                               self._validation_stats_df.append (stats_df['validation'], ignore_index=True)
-        self._test_stats_df = stats_df['test'] if self._test_stats_df is None else \
-                               self._test_stats_df.append (stats_df['test'], ignore_index=True)
-        self._diff_stats_df = diff_df if self._diff_stats_df is None else \
-                               self._diff_stats_df.append (diff_df, ignore_index=True)
+        self._merge_group_stats()
+        self._train_stats_df = pandas.concat ([self._train_stats_df] + stats_dfs['train'], ignore_index=True)
+        self._validation_stats_df = pandas.concat ([self._validation_stats_df] + stats_dfs['validation'], ignore_index=True)
+        self._test_stats_df = pandas.concat ([self._test_stats_df] + stats_dfs['test'], ignore_index=True)
+        self._diff_stats_df = pandas.concat ([self._diff_stats_df] + diff_dfs, ignore_index=True)
 
         ## Make sure there are no duplicated stations
         self._train_stats_df      = self._train_stats_df.drop_duplicates()
@@ -1203,16 +1609,62 @@ class data_cleaner (object):
         self._test_stats_df       = self._test_stats_df.drop_duplicates()
         self._diff_stats_df       = self._diff_stats_df.drop_duplicates()
 
+        ## Write scalers of all cleaned stations for training / inference
+        self._scaler_registry.save (self._proc_path + '/' + SCALER_FILE)
+
         ## If asked to create mid-step files, save and plot stats data!
         if self.create_midstep_files:
             self.save_stats_data()
             self.plot_all_stats ()
+            # Wait for all plots to be rendered
+            self._plot_pool.join()
+            self._plot_pool = None
+
+        ## If asked to trace, write and log the per-stage summary
+        if self._tracer.enabled:
+            summary = self._tracer.summarize()
+            summary.to_csv (self._proc_path + '/' + TRACE_SUMMARY_FILE, index_label='stage')
+            self._tracer.log_summary (summary)
+
+    def _get_run_config (self, exclude_nan_verified):
+
+        ''' A private function to collect the settings of a clean_stations()
+            call for the run warehouse.
+
+            input params
+            ------------
+            exclude_nan_verified (bool): If true, exclude nan verified from 
+                                             spikes counting
+
+            return params
+            -------------
+            config (dict): settings of this run
+        '''
+
+        config = {'raw_path':self._raw_path, 'station_info_csv':self._station_info_csv,
+                  'exclude_nan_verified':exclude_nan_verified,
+                  'regular_grid':self._regular_grid,
+                  'add_gap_features':self._add_gap_features,
+                  'gap_feature_cap':self._gap_feature_cap,
+                  'target_thresh':TARGET_THRESH}
+        ## Only set if used so that config hashes of earlier runs still match
+        if self._constituents_path is not None:
+            config['constituents_path'] = self._constituents_path
+        if self._baseline_window is not None:
+            config['baseline_window'] = str (self._baseline_window)
+            config['baseline_quantile'] = self._baseline_quantile
+        if self._neighbor_table is not None:
+            config['neighbor_table'] = self._neighbor_table
+        return config
 
     def save_stats_data (self):
 
         ''' A public function to store stats csv file to proc_path.
         '''
 
+        ## Merge stats of groups added by add_group_results()
+        self._merge_group_stats()
+
         ## Write training stats
         self._dump_file ('train_stats', 'train_stats', self._train_stats_df)
 
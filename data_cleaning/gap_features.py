@@ -0,0 +1,112 @@
+#!python37
+
+## This script computes gap-distance features from the cleaned PRIMARY_TRUE
+## and TARGET columns. A point is valid if its primary exists and is good
+## (PRIMARY_TRUE = 1 and TARGET = 1). For every row, it gives
+##  * GAP_DIST_PREV: # points back to the previous valid point (0 if valid)
+##  * GAP_DIST_NEXT: # points forward to the next valid point (0 if valid)
+##  * GAP_LENGTH   : length of the gap the point is in (0 if valid)
+##  * GAP_POSITION : 1-based position of the point within its gap (0 if valid)
+##
+## Indices of the previous / next valid points come from cumulative max / min
+## over the row numbers, so a whole station is done in O(n) without loops.
+## All values are capped at max_distance (120 points = 12 hours by default).
+## Without a cap, a gap at the start / end of the series counts as if a valid
+## point sits right outside the series.
+##
+## data_cleaner adds these columns to the processed files when its
+## add_gap_features flag is on (clean_data.py --add_gap_features).
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import gap_features, pandas
+## dataframe = pandas.read_csv ('C:/to/processed/8443970_processed_ver_merged_wl_train.csv')
+## dataframe = gap_features.add_gap_features (dataframe, max_distance=120)
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy
+
+###############################################
+## Define constants
+###############################################
+# Default cap on distances: 12 hours of 6-min points
+MAX_DISTANCE = 120
+
+# Columns that define a valid primary point (all must be 1)
+VALID_COLUMNS = ['PRIMARY_TRUE', 'TARGET']
+
+# Output columns
+GAP_FEATURE_COLUMNS = ['GAP_DIST_PREV', 'GAP_DIST_NEXT', 'GAP_LENGTH', 'GAP_POSITION']
+
+###############################################
+## Define functions
+###############################################
+def get_gap_features (is_valid, max_distance=MAX_DISTANCE):
+
+    ''' A function to compute the gap-distance features from a boolean array.
+
+        input params
+        ------------
+        is_valid (numpy.array): boolean array; True if the point is valid
+        max_distance (int): cap on all features. None for no cap.
+
+        return params
+        -------------
+        features (dict): {column name: int32 array} for GAP_FEATURE_COLUMNS
+    '''
+
+    is_valid = numpy.asarray (is_valid, dtype=bool)
+    npoints = len (is_valid)
+    index = numpy.arange (npoints)
+
+    ## Row of the previous / next valid point; -1 / npoints if none
+    prev_index = numpy.maximum.accumulate (numpy.where (is_valid, index, -1))
+    next_index = numpy.minimum.accumulate (numpy.where (is_valid, index, npoints)[::-1])[::-1]
+
+    dist_prev = index - prev_index
+    dist_next = next_index - index
+    gap_length = numpy.where (is_valid, 0, next_index - prev_index - 1)
+    features = {'GAP_DIST_PREV':dist_prev, 'GAP_DIST_NEXT':dist_next,
+                'GAP_LENGTH':gap_length, 'GAP_POSITION':dist_prev}
+
+    if max_distance is not None:
+        ## Distance to an edge without valid point is unknown i.e. capped
+        features['GAP_DIST_PREV'] = numpy.where (prev_index < 0, max_distance, dist_prev)
+        features['GAP_DIST_NEXT'] = numpy.where (next_index == npoints, max_distance, dist_next)
+        edge_gap = ~is_valid & ((prev_index < 0) | (next_index == npoints))
+        features['GAP_LENGTH'] = numpy.where (edge_gap, max_distance, gap_length)
+        features = {key:numpy.minimum (value, max_distance) for key, value in features.items()}
+
+    return {key:value.astype (numpy.int32) for key, value in features.items()}
+
+def add_gap_features (dataframe, max_distance=MAX_DISTANCE, valid_columns=VALID_COLUMNS):
+
+    ''' A function to add the gap-distance features to a station dataframe.
+        The dataframe must be one station sorted by time.
+
+        input params
+        ------------
+        dataframe (pandas.DataFrame): cleaned station data
+        max_distance (int): cap on all features. None for no cap.
+        valid_columns (list): columns that must be 1 for a valid point
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): station data with gap feature columns
+    '''
+
+    missing = [column for column in valid_columns if not column in dataframe]
+    if len (missing) > 0:
+        raise IOError ('Columns, {0}, are required for gap features.'.format (missing))
+
+    is_valid = numpy.ones (len (dataframe), dtype=bool)
+    for column in valid_columns:
+        is_valid &= dataframe[column].values == 1
+
+    for key, values in get_gap_features (is_valid, max_distance=max_distance).items():
+        dataframe[key] = values
+    return dataframe
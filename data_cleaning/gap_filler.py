@@ -0,0 +1,344 @@
+#!python37
+
+## This script defines a gap_filler class that fills gaps in the primary water
+## level of a cleaned station dataframe. A gap is a point where the primary
+## value is missing (PRIMARY_TRUE = 0) or, if a flag_column is set, flagged
+## bad in that 0/1 QC column (e.g. model predictions). TARGET is not a QC flag
+## to use here: it is 0 wherever VERIFIED is missing, i.e. all real-time data.
+##
+## Following the order of CO-OPS gap filling, each gap point is filled from
+## the first source that is available:
+##  1. backup   : for short gaps, BACKUP + offset, where the offset is the mean
+##                PRIMARY - BACKUP of the valid points around the gap edges
+##  2. neighbor : PREDICTION + NEIGHBOR_PRIMARY_RESIDUAL + offset, where the
+##                offset is the mean PRIMARY_RESIDUAL - NEIGHBOR_PRIMARY_RESIDUAL
+##                around the gap edges. Only good neighbor points are used.
+##  3. prediction: PREDICTION + residual linearly interpolated between the
+##                valid points before and after the gap
+## Sources 2 and 3 need PREDICTION at the gap point. Gap points without any
+## source are left as NaN with FILL_SOURCE 'unfilled'.
+##
+## Gaps are located with run-length encoding (see run_index.py), and all gaps
+## in a station-year are filled at once with array operations i.e. no loop
+## over gaps.
+##
+## Example snippet to use the gap_filler class:
+## +-------------------------------------------------------------
+## import gap_filler, pandas
+##
+## # Cleaned data with neighbor info (from data_cleaner)
+## dataframe = pandas.read_csv ('C:/to/processed/8443970_validation.csv')
+##
+## filler = gap_filler.gap_filler()
+## filler.max_backup_gap = 10       # 1 hour of 6-min points
+## filler.max_neighbor_gap = 240    # 1 day of 6-min points
+## filler.flag_column = 'QC_FLAG'   # optional 0/1 column of bad points
+## dataframe = filler.fill (dataframe)
+##
+## # Filled water level and where each point comes from
+## dataframe[['FILLED', 'FILL_SOURCE']]
+## filler.fill_stats
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, logging
+import run_index
+
+###############################################
+## Define constants
+###############################################
+# Codes in FILL_SOURCE column
+FILL_SOURCES = {'primary':0, 'backup':1, 'neighbor':2, 'prediction':3, 'unfilled':4}
+
+# Maximum gap lengths (in # of 6-min points) for backup and neighbor fills
+MAX_BACKUP_GAP = 10
+MAX_NEIGHBOR_GAP = 240
+
+# Number of points on each side of a gap to estimate offsets
+EDGE_WINDOW = 10
+
+# Default column to define bad primary points; None for missing primary only
+FLAG_COLUMN = None
+
+# Columns required to fill gaps
+REQUIRED_COLUMNS = ['PRIMARY', 'PRIMARY_TRUE', 'BACKUP', 'BACKUP_TRUE', 'PREDICTION']
+NEIGHBOR_COLUMNS = ['NEIGHBOR_PRIMARY_RESIDUAL', 'NEIGHBOR_TARGET']
+
+###############################################
+## Define functions
+###############################################
+def _get_edge_means (values, starts, lengths, window):
+
+    ''' A private function to compute the mean of values within a window on
+        both sides of each gap. Invalid values must be nan. The sums are taken
+        from cumulative sums, so all gaps are done at once.
+
+        input params
+        ------------
+        values (numpy.array): values with nan at invalid points
+        starts (numpy.array): index of the first point in each gap
+        lengths (numpy.array): number of points in each gap
+        window (int): number of points on each side
+
+        return params
+        -------------
+        means (numpy.array): mean per gap; nan if no valid values nearby
+    '''
+
+    is_valid = ~numpy.isnan (values)
+    csum = numpy.r_[0, numpy.cumsum (numpy.where (is_valid, values, 0.))]
+    ccount = numpy.r_[0, numpy.cumsum (is_valid)]
+
+    ends = starts + lengths
+    before = (numpy.maximum (starts - window, 0), starts)
+    after = (ends, numpy.minimum (ends + window, len (values)))
+
+    total = csum[before[1]] - csum[before[0]] + csum[after[1]] - csum[after[0]]
+    count = ccount[before[1]] - ccount[before[0]] + ccount[after[1]] - ccount[after[0]]
+    with numpy.errstate (invalid='ignore', divide='ignore'):
+        return numpy.where (count > 0, total / count, numpy.nan)
+
+def _interpolate_across_gaps (values, is_valid):
+
+    ''' A private function to linearly interpolate values at invalid points
+        from the nearest valid points on both sides. If only one side has a
+        valid point, its value is carried over. If neither side has one, nan.
+
+        input params
+        ------------
+        values (numpy.array): values at all points
+        is_valid (numpy.array): boolean array; True if value is valid
+
+        return params
+        -------------
+        interpolated (numpy.array): interpolated values at all points
+    '''
+
+    npoints = len (values)
+    index = numpy.arange (npoints)
+    prev_index = numpy.maximum.accumulate (numpy.where (is_valid, index, -1))
+    next_index = numpy.minimum.accumulate (numpy.where (is_valid, index, npoints)[::-1])[::-1]
+
+    has_prev, has_next = prev_index >= 0, next_index < npoints
+    prev_value = numpy.where (has_prev, values[numpy.clip (prev_index, 0, npoints-1)], numpy.nan)
+    next_value = numpy.where (has_next, values[numpy.clip (next_index, 0, npoints-1)], numpy.nan)
+
+    with numpy.errstate (invalid='ignore', divide='ignore'):
+        weight = (index - prev_index) / (next_index - prev_index)
+    interpolated = prev_value + weight * (next_value - prev_value)
+    interpolated = numpy.where (has_prev & ~has_next, prev_value, interpolated)
+    interpolated = numpy.where (~has_prev & has_next, next_value, interpolated)
+    return numpy.where (is_valid, values, interpolated)
+
+###############################################
+## Define gap_filler class
+###############################################
+class gap_filler (object):
+
+    ''' This class fills the primary gaps of a cleaned station dataframe from
+        backup, neighbor, and prediction.
+    '''
+
+    def __init__ (self):
+
+        self._max_backup_gap = MAX_BACKUP_GAP
+        self._max_neighbor_gap = MAX_NEIGHBOR_GAP
+        self._edge_window = EDGE_WINDOW
+        self._flag_column = FLAG_COLUMN
+
+        ## Number of filled points per source from the last fill
+        self._fill_stats = None
+
+        ## Logger
+        self._logger = logging.getLogger ('gap_filler')
+
+    # +------------------------------------------------------------
+    # | Getters & setters
+    # +------------------------------------------------------------
+    @property
+    def fill_stats (self): return self._fill_stats
+
+    @property
+    def max_backup_gap (self): return self._max_backup_gap
+    @max_backup_gap.setter
+    def max_backup_gap (self, npoints):
+        self._check_is_non_negative_int (npoints)
+        self._max_backup_gap = npoints
+
+    @property
+    def max_neighbor_gap (self): return self._max_neighbor_gap
+    @max_neighbor_gap.setter
+    def max_neighbor_gap (self, npoints):
+        self._check_is_non_negative_int (npoints)
+        self._max_neighbor_gap = npoints
+
+    @property
+    def edge_window (self): return self._edge_window
+    @edge_window.setter
+    def edge_window (self, npoints):
+        self._check_is_non_negative_int (npoints)
+        if npoints == 0:
+            message = 'Edge window must be at least 1 point.'
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._edge_window = npoints
+
+    @property
+    def flag_column (self): return self._flag_column
+    @flag_column.setter
+    def flag_column (self, column):
+        ## None means only missing primary points are gaps
+        if column is not None and not isinstance (column, str):
+            message = 'Flag column, {0}, must be a string or None.'.format (column)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._flag_column = column
+
+    # +------------------------------------------------------------
+    # | Misc functions
+    # +------------------------------------------------------------
+    def _check_is_non_negative_int (self, value):
+
+        ''' A private function to check if input value is a non-negative int.
+
+            input params
+            ------------
+            value (anything): value to be checked
+        '''
+
+        if not isinstance (value, (int, numpy.integer)) or value < 0:
+            message = 'Input, {0}, is not a non-negative integer.'.format (value)
+            self._logger.fatal (message)
+            raise IOError (message)
+
+    def _check_columns (self, dataframe):
+
+        ''' A private function to check if required columns are available.
+            Returns whether neighbor columns are available.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): cleaned station data
+
+            return params
+            -------------
+            has_neighbor (bool): True if all neighbor columns are available
+        '''
+
+        required = REQUIRED_COLUMNS + ([] if self._flag_column is None else [self._flag_column])
+        missing = [column for column in required if not column in dataframe]
+        if len (missing) > 0:
+            message = 'Required columns, {0}, are missing.'.format (missing)
+            self._logger.fatal (message)
+            raise IOError (message)
+
+        has_neighbor = numpy.all ([column in dataframe for column in NEIGHBOR_COLUMNS])
+        if not has_neighbor:
+            self._logger.info ('No neighbor columns; neighbor fill is skipped.')
+        return has_neighbor
+
+    def _get_gap_mask (self, dataframe):
+
+        ''' A private function to define gap points i.e. missing or bad primary.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): cleaned station data
+
+            return params
+            -------------
+            is_gap (numpy.array): boolean array; True if the point is a gap
+        '''
+
+        is_gap = dataframe.PRIMARY_TRUE.values == 0
+        if self._flag_column is not None:
+            is_gap |= dataframe[self._flag_column].values == 0
+        return is_gap
+
+    # +------------------------------------------------------------
+    # | Fill gaps
+    # +------------------------------------------------------------
+    def fill (self, dataframe):
+
+        ''' A public function to fill the primary gaps. Two columns are added:
+                * FILLED: primary water level with gaps filled
+                * FILL_SOURCE: where the value comes from (see FILL_SOURCES)
+            The dataframe must be one station sorted by time with no missing
+            time stamps in between; otherwise offsets and interpolation span
+            across the missing time stamps.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): cleaned station data
+
+            return params
+            -------------
+            dataframe (pandas.DataFrame): station data with filled columns
+        '''
+
+        has_neighbor = self._check_columns (dataframe)
+
+        primary = dataframe.PRIMARY.values.astype (float)
+        backup = dataframe.BACKUP.values.astype (float)
+        prediction = dataframe.PREDICTION.values.astype (float)
+        has_backup = dataframe.BACKUP_TRUE.values == 1
+        has_prediction = ~numpy.isnan (prediction)
+
+        is_gap = self._get_gap_mask (dataframe)
+        is_valid = ~is_gap
+        filled = numpy.where (is_valid, primary, numpy.nan)
+        source = numpy.full (len (primary), FILL_SOURCES['primary'], dtype=numpy.int8)
+
+        ## Locate gaps and map each gap point to its gap
+        starts, lengths = run_index.get_runs (is_gap)
+        self._logger.info ('Found {0} gaps with {1} points.'.format (len (starts), lengths.sum()))
+        gap_points = numpy.flatnonzero (is_gap)
+        point_lengths = numpy.repeat (lengths, lengths)
+
+        ## 1. Backup + offset for short gaps
+        offsets = _get_edge_means (numpy.where (is_valid & has_backup, primary - backup, numpy.nan),
+                                   starts, lengths, self._edge_window)
+        point_offsets = numpy.repeat (offsets, lengths)
+        use = (point_lengths <= self._max_backup_gap) & has_backup[gap_points] & \
+              ~numpy.isnan (point_offsets)
+        filled[gap_points[use]] = backup[gap_points[use]] + point_offsets[use]
+        source[gap_points[use]] = FILL_SOURCES['backup']
+
+        ## 2. Neighbor residual transfer
+        residual = primary - prediction
+        if has_neighbor:
+            neighbor = dataframe.NEIGHBOR_PRIMARY_RESIDUAL.values.astype (float)
+            neighbor_good = (dataframe.NEIGHBOR_TARGET.values == 1) & ~numpy.isnan (neighbor)
+            offsets = _get_edge_means (numpy.where (is_valid & neighbor_good, residual - neighbor, numpy.nan),
+                                       starts, lengths, self._edge_window)
+            point_offsets = numpy.repeat (offsets, lengths)
+            use = (source[gap_points] == FILL_SOURCES['primary']) & \
+                  (point_lengths <= self._max_neighbor_gap) & \
+                  neighbor_good[gap_points] & has_prediction[gap_points] & \
+                  ~numpy.isnan (point_offsets)
+            filled[gap_points[use]] = prediction[gap_points[use]] + \
+                                      neighbor[gap_points[use]] + point_offsets[use]
+            source[gap_points[use]] = FILL_SOURCES['neighbor']
+
+        ## 3. Prediction + interpolated residual for the rest with predictions
+        interpolated = _interpolate_across_gaps (residual, is_valid)
+        use = (source[gap_points] == FILL_SOURCES['primary']) & has_prediction[gap_points]
+        points = gap_points[use]
+        filled[points] = prediction[points] + numpy.nan_to_num (interpolated[points])
+        source[points] = FILL_SOURCES['prediction']
+
+        ## Gap points without any source stay NaN
+        source[gap_points[source[gap_points] == FILL_SOURCES['primary']]] = FILL_SOURCES['unfilled']
+
+        dataframe['FILLED'] = filled
+        dataframe['FILL_SOURCE'] = source
+
+        ## Collect number of points per source
+        counts = numpy.bincount (source, minlength=len (FILL_SOURCES))
+        self._fill_stats = {key:int (counts[code]) for key, code in FILL_SOURCES.items()}
+        self._fill_stats['n_gaps'] = len (starts)
+        self._logger.info ('Filled points: {0}'.format (self._fill_stats))
+        return dataframe
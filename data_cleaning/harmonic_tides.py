@@ -0,0 +1,432 @@
+#!python37
+
+## This script computes harmonic tide predictions at any timestamps from the
+## harmonic constituents of a station, e.g. when a raw file does not have
+## PRED_WL_VALUE_MSL, or to predict ahead for real-time QC without another
+## download. The predicted water level w.r.t. MSL is
+##     h(t) = Z0 + sum_j f_j A_j cos (w_j (t - t0) + (V0+u)_j - k_j)
+## where A_j, k_j, and w_j are the amplitude, phase, and speed of constituent
+## j, and f_j and (V0+u)_j are its node factor and equilibrium argument for
+## the year of t, with t0 the start of that year in GMT. Without nodal
+## factors, f_j = 1, (V0+u)_j = 0, and t0 is a fixed epoch, i.e. phases are
+## w.r.t. the epoch (e.g. fitted by fit_constituents()).
+##
+## With cos (x + p) = cos x cos p - sin x sin p, the predictions of a block of
+## timestamps are one matrix-vector product
+##     h = Z0 + [cos (t w) | sin (t w)] @ [f A cos (V0+u-k) ; -f A sin (V0+u-k)]
+## The (# timestamps, 2 x # constituents) basis is built chunk_size rows at
+## a time to cap memory. With float32, arguments are first reduced to a
+## fraction of a cycle in float64, so the basis and the product can be in
+## float32 (half the memory, ~1e-6 m difference) for millions of timestamps.
+##
+## Files in a constituents folder:
+##  * <station ID>_harmonic_constituents.csv: NAME, AMPLITUDE (meters), PHASE
+##    (degrees, GMT), and SPEED (degrees per hour). SPEED can be left out for
+##    the 37 NOAA standard constituents in SPEEDS.
+##  * nodal_factors.csv (optional, shared by all stations): NAME, YEAR,
+##    NODE_FACTOR, and EQUILIBRIUM_ARGUMENT (degrees) per constituent per year.
+##
+## To write 6-minute predictions:
+## > python harmonic_tides.py --constituents_csv <file> --out_csv <file>
+##                            --begin_date 2020-01-01 --end_date 2020-12-31
+##                            (--nodal_factors_csv <file>) (--float32)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import harmonic_tides, pandas
+## predictor = harmonic_tides.load_predictor ('C:/to/constituents/', 8443970)
+## times = pandas.date_range ('2020-01-01', '2020-12-31 23:54', freq='6min')
+## prediction = predictor.predict (times)
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, argparse, os
+
+###############################################
+## Define constants
+###############################################
+# File names in a constituents folder
+FILE_PATTERN_CONSTITUENTS = '_harmonic_constituents.csv'
+NODAL_FACTORS_FILE = 'nodal_factors.csv'
+
+# Columns of constituents and nodal factors
+CONSTITUENT_COLUMNS = ['NAME', 'AMPLITUDE', 'PHASE', 'SPEED']
+NODAL_FACTOR_COLUMNS = ['NAME', 'YEAR', 'NODE_FACTOR', 'EQUILIBRIUM_ARGUMENT']
+
+# Speeds (degrees per hour) of the 37 NOAA standard constituents
+SPEEDS = {'M2':28.9841042, 'S2':30.0, 'N2':28.4397295, 'K1':15.0410686,
+          'M4':57.9682084, 'O1':13.9430356, 'M6':86.9523127, 'MK3':44.0251729,
+          'S4':60.0, 'MN4':57.4238337, 'NU2':28.5125831, 'S6':90.0,
+          'MU2':27.9682084, '2N2':27.8953548, 'OO1':16.1391017, 'LAM2':29.4556253,
+          'S1':15.0, 'M1':14.4966939, 'J1':15.5854433, 'MM':0.5443747,
+          'SSA':0.0821373, 'SA':0.0410686, 'MSF':1.0158958, 'MF':1.0980331,
+          'RHO':13.4715145, 'Q1':13.3986609, 'T2':29.9589333, 'R2':30.0410667,
+          '2Q1':12.8542862, 'P1':14.9589314, '2SM2':31.0158958, 'M3':43.4761563,
+          'L2':29.5284789, '2MK3':42.9271398, 'K2':30.0821373, 'M8':115.9364166,
+          'MS4':58.9841042}
+
+# Reference time of phases without nodal factors
+EPOCH = pandas.Timestamp ('1970-01-01')
+
+# Default # timestamps per basis chunk
+CHUNK_SIZE = 65536
+
+# Accepted dtypes of basis and predictions
+VALID_DTYPES = ['float64', 'float32']
+
+###############################################
+## Define functions
+###############################################
+def load_constituents (filename):
+
+    ''' A function to read the harmonic constituents of a station.
+
+        input params
+        ------------
+        filename (str): csv file with NAME, AMPLITUDE, PHASE, (SPEED)
+
+        return params
+        -------------
+        constituents (pandas.DataFrame): NAME, AMPLITUDE, PHASE, SPEED
+    '''
+
+    constituents = pandas.read_csv (filename)
+    missing = [column for column in CONSTITUENT_COLUMNS[:3] if not column in constituents]
+    if len (missing) > 0:
+        raise IOError ('Constituents file, {0}, has no {1}.'.format (filename, missing))
+
+    ## Speeds not given are the standard ones
+    if not 'SPEED' in constituents: constituents['SPEED'] = numpy.nan
+    no_speed = constituents.SPEED.isna()
+    unknown = constituents.NAME[no_speed & ~constituents.NAME.isin (list (SPEEDS.keys()))]
+    if len (unknown) > 0:
+        raise IOError ('Constituent(s), {0}, in {1} have no SPEED.'.format (list (unknown), filename))
+    constituents.loc[no_speed, 'SPEED'] = constituents.NAME[no_speed].map (SPEEDS)
+    return constituents[CONSTITUENT_COLUMNS]
+
+def load_nodal_factors (filename):
+
+    ''' A function to read node factors and equilibrium arguments per year.
+
+        input params
+        ------------
+        filename (str): csv file with NAME, YEAR, NODE_FACTOR, EQUILIBRIUM_ARGUMENT
+
+        return params
+        -------------
+        nodal_factors (pandas.DataFrame): nodal factors per constituent per year
+    '''
+
+    nodal_factors = pandas.read_csv (filename)
+    missing = [column for column in NODAL_FACTOR_COLUMNS if not column in nodal_factors]
+    if len (missing) > 0:
+        raise IOError ('Nodal factors file, {0}, has no {1}.'.format (filename, missing))
+    return nodal_factors[NODAL_FACTOR_COLUMNS]
+
+def load_predictor (constituents_path, station_id, **kwargs):
+
+    ''' A function to create the predictor of a station from a constituents
+        folder.
+
+        input params
+        ------------
+        constituents_path (str): folder with constituents (and nodal factors)
+        station_id (int): station ID
+        kwargs (dict): other harmonic_predictor settings e.g. dtype
+
+        return params
+        -------------
+        predictor (harmonic_predictor): predictor; None if the station has no
+                                        constituents file
+    '''
+
+    filename = '{0}/{1}{2}'.format (constituents_path, station_id, FILE_PATTERN_CONSTITUENTS)
+    if not os.path.exists (filename): return None
+    nodal_file = '{0}/{1}'.format (constituents_path, NODAL_FACTORS_FILE)
+    nodal_factors = load_nodal_factors (nodal_file) if os.path.exists (nodal_file) else None
+    return harmonic_predictor (load_constituents (filename), nodal_factors=nodal_factors, **kwargs)
+
+def get_hours (times, reference):
+
+    ''' A function to get hours since a reference time in float64.
+
+        input params
+        ------------
+        times (numpy.array): datetime64[ns] timestamps
+        reference (pandas.Timestamp): reference time
+
+        return params
+        -------------
+        hours (numpy.array): hours since reference
+    '''
+
+    nanoseconds = times.astype ('datetime64[ns]').astype (numpy.int64) - pandas.Timestamp (reference).value
+    return nanoseconds / 3.6e12
+
+def get_basis (hours, speeds, dtype='float64'):
+
+    ''' A function to build the [cos | sin] basis of timestamps. For float32,
+        arguments are reduced to [0, 2 pi) in float64 before cos / sin.
+
+        input params
+        ------------
+        hours (numpy.array): hours since the reference time
+        speeds (numpy.array): constituent speeds in degrees per hour
+        dtype (str): float64 or float32
+
+        return params
+        -------------
+        basis (numpy.array): (# timestamps, 2 x # constituents) matrix
+    '''
+
+    if dtype == 'float64':
+        arguments = numpy.multiply.outer (hours, numpy.radians (speeds))
+    else:
+        ## Keep the fraction of a cycle; floor is much faster than numpy.mod
+        turns = numpy.multiply.outer (hours, speeds / 360.)
+        turns -= numpy.floor (turns)
+        arguments = (turns * (2 * numpy.pi)).astype (dtype)
+    nconstituents = len (speeds)
+    basis = numpy.empty ((len (hours), 2 * nconstituents), dtype=dtype)
+    numpy.cos (arguments, out=basis[:, :nconstituents])
+    numpy.sin (arguments, out=basis[:, nconstituents:])
+    return basis
+
+def fit_constituents (times, values, names, epoch=EPOCH, chunk_size=CHUNK_SIZE):
+
+    ''' A function to fit amplitudes and phases (w.r.t. epoch, no nodal
+        factors) of constituents to observed water levels by least squares.
+        The normal equations are summed chunk_size rows at a time.
+
+        input params
+        ------------
+        times (array-like): timestamps
+        values (array-like): water levels; NaN values are ignored
+        names (list): constituent names in SPEEDS
+        epoch (pandas.Timestamp): reference time of the phases
+        chunk_size (int): # timestamps per basis chunk
+
+        return params
+        -------------
+        constituents (pandas.DataFrame): NAME, AMPLITUDE, PHASE, SPEED
+        datum_offset (float): fitted mean level Z0
+    '''
+
+    speeds = numpy.array ([SPEEDS[name] for name in names])
+    times = numpy.asarray (pandas.DatetimeIndex (times).values)
+    values = numpy.asarray (values, dtype=float)
+    is_valid = ~numpy.isnan (values) & ~numpy.isnat (times)
+    hours, values = get_hours (times[is_valid], epoch), values[is_valid]
+
+    ## Sum B^T B and B^T y with a column of ones for Z0
+    nterms = 2 * len (speeds) + 1
+    gram, projection = numpy.zeros ((nterms, nterms)), numpy.zeros (nterms)
+    for start in range (0, len (hours), chunk_size):
+        basis = get_basis (hours[start:start+chunk_size], speeds)
+        basis = numpy.hstack ([basis, numpy.ones ((len (basis), 1))])
+        gram += basis.T @ basis
+        projection += basis.T @ values[start:start+chunk_size]
+    coefficients = numpy.linalg.solve (gram, projection)
+
+    ## cos coefficient = A cos k and sin coefficient = A sin k
+    cosines, sines = coefficients[:len (speeds)], coefficients[len (speeds):-1]
+    constituents = pandas.DataFrame ({'NAME':list (names), 'AMPLITUDE':numpy.hypot (cosines, sines),
+                                      'PHASE':numpy.degrees (numpy.arctan2 (sines, cosines)) % 360,
+                                      'SPEED':speeds})
+    return constituents, coefficients[-1]
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='Write 6-minute harmonic tide predictions')
+    parser.add_argument('-c', '--constituents_csv', required=True, type=str,
+                        help='Harmonic constituents of a station')
+    parser.add_argument('-n', '--nodal_factors_csv', default=None, type=str,
+                        help='Node factors and equilibrium arguments per year')
+    parser.add_argument('-b', '--begin_date', required=True, type=str,
+                        help='First day to predict e.g. 2020-01-01')
+    parser.add_argument('-e', '--end_date', required=True, type=str,
+                        help='Last day to predict e.g. 2020-12-31')
+    parser.add_argument('-o', '--out_csv', required=True, type=str,
+                        help='Output csv with DATE_TIME and PRED_WL_VALUE_MSL')
+    parser.add_argument('-f', '--float32', default=False, action='store_true',
+                        help='If turned on, compute in float32.')
+    args = parser.parse_args()
+
+    ## Check if input files exist
+    for filename in [args.constituents_csv, args.nodal_factors_csv]:
+        if filename is not None and not os.path.exists (filename):
+            message = 'Input file, {0}, does not exist!'.format (filename)
+            raise FileNotFoundError (message)
+
+    return args
+
+###############################################
+## Define harmonic_predictor class
+###############################################
+class harmonic_predictor (object):
+
+    ''' This class predicts water levels from harmonic constituents. '''
+
+    def __init__ (self, constituents, nodal_factors=None, datum_offset=0., epoch=EPOCH,
+                  chunk_size=CHUNK_SIZE, dtype='float64'):
+
+        ''' To initialize a harmonic_predictor.
+
+            input params
+            ------------
+            constituents (pandas.DataFrame): NAME, AMPLITUDE, PHASE, SPEED
+            nodal_factors (pandas.DataFrame): NAME, YEAR, NODE_FACTOR, and
+                                              EQUILIBRIUM_ARGUMENT; None to
+                                              use phases w.r.t. epoch
+            datum_offset (float): Z0 w.r.t. MSL in meters
+            epoch (pandas.Timestamp): reference time without nodal factors
+            chunk_size (int): # timestamps per basis chunk
+            dtype (str): float64 or float32
+        '''
+
+        self._constituents = constituents[CONSTITUENT_COLUMNS].reset_index (drop=True)
+        self._speeds = self._constituents.SPEED.values.astype (float)
+        self._nodal_factors = None
+        if nodal_factors is not None:
+            self._nodal_factors = nodal_factors.set_index (['NAME', 'YEAR'])
+        self._datum_offset = float (datum_offset)
+        self._epoch = pandas.Timestamp (epoch)
+
+        ## Logger
+        self._logger = logging.getLogger ('harmonic_predictor')
+
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+
+    # +------------------------------------------------------------
+    # | Getters & setters
+    # +------------------------------------------------------------
+    @property
+    def constituents (self): return self._constituents
+
+    @property
+    def has_nodal_factors (self): return self._nodal_factors is not None
+
+    @property
+    def chunk_size (self): return self._chunk_size
+    @chunk_size.setter
+    def chunk_size (self, nrows):
+        if not isinstance (nrows, int) or nrows < 1:
+            message = 'Chunk size, {0}, must be a positive integer.'.format (nrows)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._chunk_size = nrows
+
+    @property
+    def dtype (self): return self._dtype
+    @dtype.setter
+    def dtype (self, dtype):
+        if not dtype in VALID_DTYPES:
+            message = 'Cannot accept dtype, {0}. Must be one of {1}.'.format (dtype, VALID_DTYPES)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._dtype = dtype
+
+    # +------------------------------------------------------------
+    # | Predict
+    # +------------------------------------------------------------
+    def _get_coefficients (self, year=None):
+
+        ''' A private function to get the [cos ; sin] coefficients for a year.
+
+            input params
+            ------------
+            year (int): year of nodal factors; None without nodal factors
+
+            return params
+            -------------
+            coefficients (numpy.array): 2 x # constituents coefficients
+        '''
+
+        amplitudes = self._constituents.AMPLITUDE.values.astype (float)
+        phases = -numpy.radians (self._constituents.PHASE.values.astype (float))
+        if year is not None:
+            keys = list (zip (self._constituents.NAME, [year] * len (self._constituents)))
+            missing = [name for name, key in zip (self._constituents.NAME, keys)
+                       if not key in self._nodal_factors.index]
+            if len (missing) > 0:
+                raise IOError ('Nodal factors of {0} are not available for {1}.'.format (missing, year))
+            factors = self._nodal_factors.loc[keys]
+            amplitudes = amplitudes * factors.NODE_FACTOR.values
+            phases = phases + numpy.radians (factors.EQUILIBRIUM_ARGUMENT.values)
+        return numpy.concatenate ([amplitudes * numpy.cos (phases), -amplitudes * numpy.sin (phases)])
+
+    def _predict_block (self, hours, coefficients, out):
+
+        ''' A private function to predict timestamps of one reference time,
+            chunk_size rows at a time, into out.
+        '''
+
+        coefficients = coefficients.astype (self._dtype)
+        for start in range (0, len (hours), self._chunk_size):
+            basis = get_basis (hours[start:start+self._chunk_size], self._speeds, dtype=self._dtype)
+            out[start:start+self._chunk_size] = basis @ coefficients + self._datum_offset
+
+    def predict (self, times):
+
+        ''' A public function to predict water levels w.r.t. MSL.
+
+            input params
+            ------------
+            times (array-like): timestamps in GMT
+
+            return params
+            -------------
+            prediction (numpy.array): water levels in dtype; NaN at NaT
+        '''
+
+        times = numpy.asarray (pandas.DatetimeIndex (times).values)
+        prediction = numpy.full (len (times), numpy.nan, dtype=self._dtype)
+        is_valid = ~numpy.isnat (times)
+
+        ## Without nodal factors, all timestamps are w.r.t. epoch
+        if self._nodal_factors is None:
+            indices = numpy.flatnonzero (is_valid)
+            block = numpy.empty (len (indices), dtype=self._dtype)
+            self._predict_block (get_hours (times[indices], self._epoch), self._get_coefficients(), block)
+            prediction[indices] = block
+            return prediction
+
+        ## With nodal factors, each year is w.r.t. its own start
+        years = pandas.DatetimeIndex (times).year.values
+        for year in numpy.unique (years[is_valid]):
+            indices = numpy.flatnonzero (is_valid & (years == year))
+            block = numpy.empty (len (indices), dtype=self._dtype)
+            hours = get_hours (times[indices], pandas.Timestamp (year=int (year), month=1, day=1))
+            self._predict_block (hours, self._get_coefficients (year=int (year)), block)
+            prediction[indices] = block
+        return prediction
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    args = get_parser ()
+
+    nodal_factors = None if args.nodal_factors_csv is None else \
+                    load_nodal_factors (args.nodal_factors_csv)
+    predictor = harmonic_predictor (load_constituents (args.constituents_csv),
+                                    nodal_factors=nodal_factors,
+                                    dtype='float32' if args.float32 else 'float64')
+
+    times = pandas.date_range (args.begin_date, pandas.Timestamp (args.end_date) + pandas.Timedelta ('23:54:00'),
+                               freq='6min')
+    dataframe = pandas.DataFrame ({'DATE_TIME':times, 'PRED_WL_VALUE_MSL':predictor.predict (times)})
+    dataframe.to_csv (args.out_csv, index=False, date_format='%Y-%m-%d %H:%M')
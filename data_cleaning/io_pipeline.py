@@ -0,0 +1,253 @@
+#!python37
+
+## This script defines the I/O stages that run next to the cleaning process,
+## so that reading raw files and writing processed files overlap with cleaning
+## instead of adding to it.
+##  * raw_prefetcher reads the raw csv files of the next stations on an I/O
+##    thread, in cleaning order, at most depth files ahead of the cleaner.
+##  * csv_writer takes finished splits on a bounded queue and writes them on a
+##    writer thread. DataFrame.to_csv holds the GIL while formatting numbers,
+##    so by default (on a machine with more than 1 CPU) the writer thread hands
+##    each split to one writer process and only waits for it; with processes=0
+##    it writes by itself.
+## Both stages keep errors and re-raise them in the main thread: a failed read
+## when its station is asked for, and a failed write when the writer closes.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import io_pipeline
+## files = [(8443970, 'C:/to/raw/8443970_raw_ver_merged_wl.csv'),
+##          (8447930, 'C:/to/raw/8447930_raw_ver_merged_wl.csv')]
+## with io_pipeline.raw_prefetcher (files) as prefetcher, \
+##      io_pipeline.csv_writer () as writer:
+##     for station_id, _ in files:
+##         dataframe = prefetcher.get (station_id)
+##         ...
+##         writer.submit (dataframe, 'C:/to/processed/{0}.csv'.format (station_id))
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import pandas, logging, threading, queue, os
+from concurrent.futures import ProcessPoolExecutor
+
+###############################################
+## Define constants
+###############################################
+# Default # raw files read ahead of the cleaner
+PREFETCH_DEPTH = 1
+
+# Default # finished splits waiting to be written
+MAX_PENDING = 6
+
+# Default # writer processes; 0 to write on the writer thread. A writer
+# process only pays off if there is a spare CPU.
+WRITER_PROCESSES = 1 if (os.cpu_count() or 1) > 1 else 0
+
+###############################################
+## Define functions
+###############################################
+def read_raw_file (filename):
+
+    ''' A function to read a raw csv file as is.
+
+        input params
+        ------------
+        filename (str): raw csv file
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): raw data
+    '''
+
+    return pandas.read_csv (filename, low_memory=False)
+
+def write_csv (dataframe, filename):
+
+    ''' A function to write a processed split without index. It is a module
+        function so that a writer process can run it.
+
+        input params
+        ------------
+        dataframe (pandas.DataFrame): split to write
+        filename (str): output csv file
+    '''
+
+    dataframe.to_csv (filename, index=False)
+
+###############################################
+## Define raw_prefetcher class
+###############################################
+class raw_prefetcher (object):
+
+    ''' This class reads raw files ahead of the cleaner on an I/O thread. '''
+
+    def __init__ (self, files, depth=PREFETCH_DEPTH):
+
+        ''' To initialize a raw_prefetcher and start its I/O thread.
+
+            input params
+            ------------
+            files (list): (station ID, raw file) in the order to be cleaned
+            depth (int): # raw files read ahead of the cleaner
+        '''
+
+        self._queue = queue.Queue (maxsize=max (depth, 1))
+        self._stop = threading.Event()
+        self._thread = threading.Thread (target=self._read_all, args=(list (files),),
+                                         name='raw_prefetcher', daemon=True)
+
+        ## Logger
+        self._logger = logging.getLogger ('raw_prefetcher')
+
+        self._thread.start()
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args):
+        self.close()
+        return False
+
+    def _read_all (self, files):
+
+        ''' A private function run by the I/O thread to read each raw file and
+            put it, or the error from reading it, on the queue.
+        '''
+
+        for station_id, filename in files:
+            if self._stop.is_set(): return
+            try:
+                item = (station_id, read_raw_file (filename), None)
+            except Exception as error:
+                item = (station_id, None, error)
+            ## Wait for a free slot, but give up if the prefetcher is closed
+            while not self._stop.is_set():
+                try:
+                    self._queue.put (item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def get (self, station_id):
+
+        ''' A public function to get the raw data of the next station. Raw
+            files prefetched for stations before it (e.g. skipped) are dropped.
+
+            input params
+            ------------
+            station_id (int): station ID to get
+
+            return params
+            -------------
+            dataframe (pandas.DataFrame): raw data of the station
+        '''
+
+        while True:
+            if not self._thread.is_alive() and self._queue.empty():
+                raise IOError ('Raw data of station {0} was not prefetched.'.format (station_id))
+            try:
+                this_id, dataframe, error = self._queue.get (timeout=0.1)
+            except queue.Empty:
+                continue
+            if this_id != station_id:
+                self._logger.debug ('Dropping prefetched raw data of station {0}.'.format (this_id))
+                continue
+            if error is not None: raise error
+            return dataframe
+
+    def close (self):
+
+        ''' A public function to stop the I/O thread and drop prefetched data. '''
+
+        self._stop.set()
+        self._thread.join()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+###############################################
+## Define csv_writer class
+###############################################
+class csv_writer (object):
+
+    ''' This class writes csv files on a writer thread from a bounded queue. '''
+
+    def __init__ (self, max_pending=MAX_PENDING, processes=WRITER_PROCESSES):
+
+        ''' To initialize a csv_writer and start its writer thread.
+
+            input params
+            ------------
+            max_pending (int): max # splits waiting to be written; submit()
+                               blocks when the queue is full
+            processes (int): # writer processes; 0 to write on the thread
+        '''
+
+        self._queue = queue.Queue (maxsize=max (max_pending, 1))
+        self._pool = ProcessPoolExecutor (max_workers=processes) if processes > 0 else None
+        self._errors = []
+        self._thread = threading.Thread (target=self._write_all, name='csv_writer', daemon=True)
+
+        ## Logger
+        self._logger = logging.getLogger ('csv_writer')
+
+        self._thread.start()
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args):
+        self.close()
+        return False
+
+    def _write_all (self):
+
+        ''' A private function run by the writer thread to write queued splits
+            until it gets None.
+        '''
+
+        while True:
+            item = self._queue.get()
+            if item is None: return
+            dataframe, filename = item
+            try:
+                if self._pool is None:
+                    write_csv (dataframe, filename)
+                else:
+                    self._pool.submit (write_csv, dataframe, filename).result()
+                self._logger.debug ('{0} is written.'.format (filename))
+            except Exception as error:
+                self._logger.warning ('Failed to write {0}: {1}'.format (filename, error))
+                self._errors.append ((filename, error))
+
+    def submit (self, dataframe, filename):
+
+        ''' A public function to queue a split to be written. It blocks while
+            the queue is full.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): split to write; not to be changed after
+            filename (str): output csv file
+        '''
+
+        if not self._thread.is_alive():
+            raise IOError ('csv_writer is closed.')
+        self._queue.put ((dataframe, filename))
+
+    def close (self):
+
+        ''' A public function to write all queued splits and stop the writer.
+            If any write failed, the first error is raised.
+        '''
+
+        if self._thread.is_alive():
+            self._queue.put (None)
+            self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if len (self._errors) > 0:
+            filename, error = self._errors[0]
+            raise IOError ('{0} file(s) failed to be written, e.g. {1}: {2}'.format (len (self._errors),
+                                                                                   filename, error))
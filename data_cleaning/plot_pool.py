@@ -0,0 +1,640 @@
+#!python37
+
+## This script renders the mid-step diagnostic plots of the cleaner in a pool
+## of background processes, so that plotting does not slow down cleaning.
+##
+## The cleaning stages (station and data_cleaner) only build small payloads
+## i.e. histograms and stats dataframes, and hand them to a plot_pool. Each
+## payload is rendered by one of the module-level render_xxx() functions in a
+## worker process. At most max_pending jobs are queued at a time; submit()
+## blocks when the queue is full so memory stays bounded. join() waits for all
+## jobs at the end and logs any failed plots without stopping the cleaning.
+##
+## With image_format='png', cheaper low-resolution PNG thumbnails are written
+## instead of PDFs. With max_workers=0, plots are rendered right away in the
+## current process (same as before). If no pool is given to submit_or_render(),
+## the plot is also rendered right away.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import plot_pool
+## pool = plot_pool.plot_pool (max_workers=2, image_format='png')
+## astation.plot_pool = pool
+## cleaned_df = astation.clean_raw_data ()
+## ...
+## failed = pool.join ()
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, logging, os, threading
+from concurrent.futures import ProcessPoolExecutor
+from scipy.interpolate import interp1d
+
+import matplotlib
+matplotlib.use ('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.gridspec as gridspec
+from matplotlib.offsetbox import AnchoredText
+plt.rc ('text', usetex=False)
+plt.rc ('font', family='sans-serif')
+plt.rc ('font', serif='Computer Modern Roman')
+
+###############################################
+## Define constants
+###############################################
+# Default # worker processes and # jobs allowed in queue
+DEFAULT_WORKERS = 2
+MAX_PENDING = 8
+
+# Accepted image formats and resolution of PNG thumbnails
+IMAGE_FORMATS = ['pdf', 'png']
+THUMBNAIL_DPI = 50
+
+# Dataset types and their colors in histogram
+DATASET_TYPES = ['train', 'validation', 'test']
+DATASET_COLORS = {'train':'#666666', 'validation':'#489cbd', 'test':'#ff4f6b'}
+
+# TARGET threshold in meters between PRIMARY and VERIFIED
+TARGET_THRESH = 0.04
+
+# Number of randomly sampled data in Greg's AI model when training
+N_RANDOM_SAMPLES = 200000
+
+###############################################
+## Define functions
+###############################################
+def _save_figure (h, outfile):
+
+    ''' A function to store a figure as PDF or as PNG thumbnail based on the
+        file extension.
+
+        input params
+        ------------
+        h (matplotlib.Figure): figure to be saved
+        outfile (str): output plot file
+    '''
+
+    if outfile.endswith ('.png'):
+        h.savefig (outfile, dpi=THUMBNAIL_DPI)
+    else:
+        h.savefig (outfile)
+    plt.close ('all')
+
+def _plot_grid_lines (axis):
+
+    ''' A function to plot light grid lines at the major ticks.
+
+        input params
+        ------------
+        axis (matplotlib.Axes): axis on which grid lines are plotted
+    '''
+
+    for ytick in axis.yaxis.get_majorticklocs():
+        axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
+    for xtick in axis.xaxis.get_majorticklocs():
+        axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
+
+def get_diff_statistics (xvalues, yvalues):
+
+    ''' A function to obtain statistics from a histogram with x and yvalues.
+        It builds a cumulative histogram and flips (inverts) it. The mean, min,
+        max, top and bottom 5% are obtained to get a rough shape of the
+        histogram.
+
+        lower: 5%
+        mean: 50%
+        upper: 95%
+
+        input params
+        ------------
+        xvalues (array): the xvalues for fitting a CDF
+        yvalues (array): the yvalues for fitting a CDF
+
+        return params
+        -------------
+        stats (dict): 5%, 50%, 95% from the histogram
+    '''
+
+    cdf = numpy.cumsum (yvalues) / sum (yvalues)
+    bins = xvalues[:-1] + (xvalues[1:] - xvalues[:-1])/2.
+    icdf = interp1d (cdf, bins)
+    lowP = max (0.025, min (icdf.x))
+    highP = min (0.975, max (icdf.x))
+    midP = 0.5
+    if highP < lowP:
+        highP = (max (icdf.x) - lowP)*0.975 + lowP
+        midP = (max (icdf.x) - lowP)*0.5 + lowP
+    lower, mean, upper = icdf(lowP), icdf(midP), icdf(highP)
+    return {'lower':float (lower), 'upper':float (upper), 'mean':float (mean)}
+
+def submit_or_render (pool, render, payload, outfile):
+
+    ''' A function to hand a plot job to a pool, or render it right away if
+        no pool is given.
+
+        input params
+        ------------
+        pool (plot_pool): pool of plot workers; None to render now
+        render (function): one of the render_xxx() functions
+        payload (dict): data needed by render
+        outfile (str): output plot file (.pdf)
+    '''
+
+    if pool is None:
+        render (payload, outfile)
+        return
+    pool.submit (render, payload, outfile)
+
+# +------------------------------------------------------------
+# | Station plots
+# +------------------------------------------------------------
+def _plot_sub_diff (axis, edges, hists):
+
+    ''' A function to plot a sub histogram for all dataset types in hists.
+        There should only be 3 at max. Their histograms are stacked in the
+        order of train, validation, and test.
+
+        input params
+        ------------
+        axis (matplotlib.Axes): axis on which plots are made
+        edges (array): bin edges
+        hists (dict): {dtype: histogram counts}
+    '''
+
+    if len (hists) == 0: return
+
+    ## Plot stacked histogram
+    edges = numpy.array (edges).astype (float)
+    reference = numpy.zeros (len (edges)).astype (float)
+    for dtype in DATASET_TYPES[::-1]:
+        # Next dataset type if not available
+        if not dtype in hists: continue
+        # Stacking the histogram
+        hist = numpy.array (hists[dtype])
+        with numpy.errstate (divide='ignore'):
+            yvalues = reference + numpy.log10 (numpy.r_[hist[0], hist])
+        # Replace any inf / nan to 0
+        yvalues[~numpy.isfinite(yvalues)] = 0
+        # Plot a stack histogram
+        axis.fill_between (edges, reference, yvalues, color=DATASET_COLORS[dtype],
+                           step='pre', label=dtype)
+        # Update reference
+        reference = yvalues
+
+    ##  Plot legend if more than 1 dataset type
+    if len (hists) > 1: axis.legend (loc=1, fontsize=8)
+
+    ##  Format x-axis
+    edges = edges[numpy.isfinite (edges)]
+    axis.set_xlim ([min (edges), max(edges)])
+    axis.tick_params (axis='x', labelsize=8)
+    axis.set_xlabel ('Primary - Verified [meters]', fontsize=8)
+    ##  Format y-axis
+    axis.set_ylim ([numpy.floor (min (yvalues)), numpy.ceil (max (yvalues))])
+    axis.tick_params (axis='y', labelsize=8)
+    axis.set_ylabel ('log10 #', fontsize=8)
+    ##  Plot grid lines
+    _plot_grid_lines (axis)
+
+    ## Set title
+    dtype = 'all sets' if len (hists) > 1 else list (hists.keys())[0]
+    axis.set_title ('From {0}'.format (dtype), fontsize=9)
+
+def render_diff_histogram (payload, outfile):
+
+    ''' A function to plot histograms of differences between primary and
+        verified for all dataset types of a station. All x-axis are the same,
+        based on the range from the full dataset.
+
+        Top left: stacked histogram from all sets
+        Top right: histogram from training set
+        Bottom left: histogram from validation set
+        Bottom right: histogram from testing set
+
+        input params
+        ------------
+        payload (dict): {'station_id':int, 'edges':array, 'hists':{dtype:array}}
+        outfile (str): output plot file
+    '''
+
+    ## Start plotting!
+    h = plt.figure (figsize=(9, 9))
+    gs = gridspec.GridSpec (2, 2, wspace=0.25, hspace=0.2)
+
+    ## Top left: All records from train, valid, and test sets
+    axis = h.add_subplot (gs[0])
+    _plot_sub_diff (axis, payload['edges'], payload['hists'])
+
+    ## Top right, bottom left, bottom right: training, validation, testing set
+    for index, dtype in enumerate (DATASET_TYPES):
+        axis = h.add_subplot (gs[index+1])
+        hists = {key:value for key, value in payload['hists'].items() if key == dtype}
+        _plot_sub_diff (axis, payload['edges'], hists)
+
+    ## Store plot
+    title = 'Histogram of Primary - Verified at {0}'.format (payload['station_id'])
+    plt.suptitle (title, fontsize=15)
+    _save_figure (h, outfile)
+
+# +------------------------------------------------------------
+# | Summary plots from all stations
+# +------------------------------------------------------------
+def render_global_stats (payload, outfile):
+
+    ''' A function to plot global stats.
+            * Top: # records per station
+            # Bottom: % of train/valid/test per station
+
+        input params
+        ------------
+        payload (dict): {'statsframe':dataframe with n_total(_dtype) columns}
+        outfile (str): output plot file
+    '''
+
+    statsframe = payload['statsframe']
+
+    ## Start plotting!
+    h = plt.figure (figsize=(9, 5))
+    gs = gridspec.GridSpec (2, 1, wspace=0.1)
+    gs.update (bottom=0.15)
+
+    ## Top plot: # total records per station
+    axis = h.add_subplot (gs[0])
+    xvalues = numpy.arange (len (statsframe))
+    yvalues = statsframe['n_total'].values / 1000000 # counts in million
+    axis.scatter (xvalues, yvalues, marker='o', color='black', s=20, alpha=0.8)
+
+    ##  Format x-axis
+    axis.set_xlim ([min(xvalues)-1, max(xvalues)+1])
+    axis.set_xticks (xvalues)
+    axis.get_xaxis ().set_ticklabels ([])
+    ##  Format y-axis
+    axis.set_ylim ([0.8, 1.2])
+    axis.tick_params (axis='y', labelsize=8)
+    axis.set_ylabel ('# total [million]', fontsize=8)
+    ##  Plot grid lines
+    _plot_grid_lines (axis)
+
+    ## Bottom plot: # total per set / # total records
+    axis = h.add_subplot (gs[1])
+    for dtype in DATASET_TYPES:
+        color = 'black' if dtype=='train' else 'blue' if dtype=='validation' else 'red'
+        marker = 'o' if dtype=='train' else 'x' if dtype=='validation' else '+'
+        yvalues = statsframe['n_total_' + dtype].values / statsframe['n_total'].values
+        axis.scatter (xvalues, yvalues, marker=marker, color=color, s=20, alpha=0.8, label=dtype)
+
+    ##  Format x-axis
+    axis.set_xlim ([min(xvalues)-1, max(xvalues)+1])
+    axis.set_xticks (xvalues)
+    axis.set_xticklabels (statsframe.index)
+    axis.tick_params (axis='x', labelsize=8, labelrotation=90)
+    ##  Format y-axis
+    axis.set_ylim ([0, 1])
+    axis.tick_params (axis='y', labelsize=8)
+    axis.set_ylabel ('# per set / # total', fontsize=8)
+    ##  Plot grid lines
+    _plot_grid_lines (axis)
+    ##  Plot legend
+    axis.legend (loc=0, fontsize=8)
+
+    ### Store plot
+    plt.suptitle ('Global statistics', fontsize=15)
+    _save_figure (h, outfile)
+
+def _plot_subplot_nan_capped_vs_n_spikes (axis, stats_df, key, dtype, doLegend=False):
+
+    ''' A function to plot sub-plot for nan / capped vs spikes % correlation
+        plot for a given dataset type.
+
+        input params
+        ------------
+        axis (matplotlib.Axes): the axis object to be plotted
+        stats_df (pandas.DataFrame): stats dataframe of a given dataset type
+        key (str): the column, nan/capped primary/backup, to be plotted
+        dtype (str): name of dataset type
+        doLegend (bool): plot legend if true
+    '''
+
+    ## Plot scatter plot: x = log10 (n_spikes), y = % spikes
+    stats_groups = stats_df.groupby (by = 'has_bad_results')
+    for isbad in stats_groups.groups.keys():
+        color = 'red' if isbad else 'green'
+        marker = 'x' if isbad else 'o'
+        label = 'bad stations' if isbad else 'good stations'
+        # Define x and y values to be n_spikes and n_nan_primary
+        this_group = stats_groups.get_group (isbad)
+        with numpy.errstate (divide='ignore'):
+            yvalues = numpy.log10 (this_group[key])
+        xvalues = this_group.n_spikes_percent.values
+        axis.scatter (xvalues, yvalues, marker=marker, color=color,
+                      s=15, alpha=0.8, label=label)
+
+    ##  Format x-axis
+    xmin = 0
+    xmax = this_group.n_spikes_percent.max() + 0.05
+    xticks = numpy.linspace (xmin, xmax, 6)
+    axis.set_xlim ([xmin, xmax])
+    axis.set_xticks (xticks)
+    axis.tick_params (axis='x', labelsize=8)
+    axis.set_xlabel ('# spikes / # total {0}'.format (dtype), fontsize=10)
+    ##  Format y-axis
+    with numpy.errstate (divide='ignore'):
+        yvalues = numpy.log10 (stats_df[key].values.astype (float))
+    yvalues [~numpy.isfinite (yvalues)] = 0
+    ymin = numpy.floor (max (0, min(yvalues)))
+    ymax = numpy.ceil (max(yvalues))
+    yticks = numpy.linspace (ymin, ymax, 6)
+    axis.set_ylim ([ymin, ymax])
+    axis.set_yticks (yticks)
+    axis.tick_params (axis='y', labelsize=8)
+    ylabel = 'Log10 # of '
+    ylabel += 'nan ' if 'nan' in key else 'capped '
+    ylabel += 'primary' if 'primary' in key else 'backup'
+    axis.set_ylabel (ylabel, fontsize=10)
+    ##  Plot grid lines
+    _plot_grid_lines (axis)
+    ##  Plot legend
+    if doLegend: axis.legend (loc=0, fontsize=10)
+
+def render_nan_capped_vs_n_spikes (payload, outfile):
+
+    ''' A function to plot correlation between of # nan & capped values vs
+        spikes % for a given dataset type in log-log scale. The stations are
+        grouped by "good" vs "bad" where bad stations are those labelled as
+        'problematic' from station info sheet.
+
+        Top left    : log10 (# nan primary) vs % spikes
+        Top right   : log10 (# nan backup) vs % spikes
+        Bottom left : log10 (# capped primary) vs % spikes
+        Bottom right: log10 (# capped backup) vs % spikes
+
+        input params
+        ------------
+        payload (dict): {'dtype':str, 'stats_df':stats dataframe of the set}
+        outfile (str): output plot file
+    '''
+
+    ## Move capped max / min into 1 capped column & scale n_spikes w.r.t.
+    ## # records in this set
+    dtype = payload['dtype']
+    stats_df = payload['stats_df'].copy()
+    stats_df['n_capped_primary'] = stats_df.n_capped_primary_min + \
+                                   stats_df.n_capped_primary_max
+    stats_df['n_capped_backup']  = stats_df.n_capped_backup_min + \
+                                   stats_df.n_capped_backup_max
+    reference = N_RANDOM_SAMPLES if dtype=='train' else stats_df.n_total
+    stats_df['n_spikes_percent'] = stats_df.n_spikes / reference
+
+    ## Start plotting!
+    h = plt.figure (figsize=(9, 9))
+    gs = gridspec.GridSpec (2, 2, wspace=0.2, hspace=0.2)
+
+    keys = ['n_nan_primary', 'n_nan_backup', 'n_capped_primary', 'n_capped_backup']
+    for index, key in enumerate (keys):
+        axis = h.add_subplot (gs[index])
+        _plot_subplot_nan_capped_vs_n_spikes (axis, stats_df, key, dtype,
+                                              doLegend=index==0)
+
+    ### Store plot
+    title = 'Nan / capped vs spikes % correlation for {0} set'.format (dtype)
+    plt.suptitle (title, fontsize=15)
+    _save_figure (h, outfile)
+
+def render_diff_stats (payload, outfile):
+
+    ''' A function to plot the 5, 50, 95% of primary - verified per station.
+
+        input params
+        ------------
+        payload (dict): {'diff_stats':dataframe with station_id, lower, mean, upper}
+        outfile (str): output plot file
+    '''
+
+    diff_stats = payload['diff_stats']
+
+    ## Start plotting!
+    h = plt.figure (figsize=(9, 3))
+    gs = gridspec.GridSpec (1, 1)
+    gs.update (bottom=0.23)
+    axis = h.add_subplot (gs[0])
+
+    ## Plot individual statistics
+    xvalues = numpy.arange (len (diff_stats)) + 1
+    yvalues = diff_stats['mean'].values
+    yerrors = numpy.array ([yvalues - diff_stats['lower'],
+                            diff_stats['upper'] - yvalues])
+    axis.errorbar (xvalues, yvalues, yerr=yerrors, marker='o', color='black',
+                   markersize=6, alpha=0.7, linestyle=None, linewidth=0.0,
+                   ecolor='blue', elinewidth=3, capsize=0.0, capthick=0.0)
+
+    ## Plot horizontal line
+    axis.axhline (y=TARGET_THRESH, color='red', alpha=0.7, linestyle='--', linewidth=1)
+    axis.axhline (y=-1*TARGET_THRESH, color='red', alpha=0.7, linestyle='--', linewidth=1)
+
+    ##  Format x-axis
+    axis.set_xlim ([min(xvalues) - 1, max(xvalues) + 1])
+    axis.set_xticks (xvalues)
+    axis.set_xticklabels (diff_stats.station_id)
+    axis.tick_params (axis='x', labelsize=8, labelrotation=90)
+    ##  Format y-axis
+    axis.set_ylim ([-0.1, 0.1])
+    axis.tick_params (axis='y', labelsize=8)
+    axis.set_ylabel ('Primary - Verified\n[meters]', fontsize=10)
+
+    ##  Add title
+    axis.set_title ('Distributions of primary - verified', fontsize=12)
+    ##  Plot grid lines
+    _plot_grid_lines (axis)
+
+    ### Store plot
+    _save_figure (h, outfile)
+
+def _plot_subplot_giant_diff (axis, diff_hist, htype='all'):
+
+    ''' A function to plot a sub plot for the summary histogram. The histogram
+        is indicated by the htype, which must be one of the 3 keys in
+        diff_hist: 'all', 'bad_only_by_thresh', or 'bad_only_by_sensor_id'.
+        By default this histogram covers quite a wide range (+/- 20 or 30
+        meters) with fine binning. With the full range, the 90% interval is
+        extracted. This function then plots the sub-section of the histogram
+        between -0.1 and 0.1 meters.
+
+        input params
+        ------------
+        axis (matplotlib.Axes): axis on which plots are made
+        diff_hist (dict): summed histograms and their 'edges'
+        htype (str): key in diff_hist
+    '''
+
+    ## Determine the 5, 50, 95%
+    yvalues = diff_hist[htype]
+    xvalues = diff_hist['edges']
+    stats = get_diff_statistics (xvalues, yvalues)
+
+    ## Plot the histogram
+    with numpy.errstate (divide='ignore'):
+        yvalues = numpy.log10 (yvalues)
+    yvalues = [yvalues[0]] + list (yvalues)
+    axis.plot (xvalues, yvalues, color='gray', alpha=0.7, linestyle='-',
+               linewidth=1.5, drawstyle='steps-pre')
+
+    ## Plot vertical shaded area between 5 and 95%
+    axis.axvspan (stats['lower'], stats['upper'], color='blue', alpha=0.2)
+
+    #  Print 90% interval
+    text = '50% = {0:.3f} cm\n'.format (stats['mean']*100)
+    text += '90% = [{0:.3f}, {1:.3f}] cm'.format (stats['lower']*100, stats['upper']*100)
+    anchored_text = AnchoredText (text, loc=2, frameon=False)
+    axis.add_artist (anchored_text)
+
+    ##  Format x-axis
+    axis.set_xlim ([-0.1 ,0.1]) ## from -0.1 to 0.1 meters
+    axis.set_xticks (numpy.linspace (-0.1, 0.1, 21)) # 21 xticks
+    axis.tick_params (axis='x', labelsize=5)
+    axis.set_xlabel ('Primary - Verified [meters]', fontsize=10)
+
+    ##  Format y-axis
+    axis.set_ylim ([0, numpy.ceil (max(yvalues))])
+    axis.tick_params (axis='y', labelsize=8)
+    axis.set_ylabel ('log10 #', fontsize=10)
+
+    ##  Add title
+    title = 'All data points' if htype=='all' else htype.replace ('_', ' ')
+    axis.set_title (title, fontsize=12)
+    ##  Plot grid lines
+    _plot_grid_lines (axis)
+
+def render_giant_diff_hist (payload, outfile):
+
+    ''' A function to plot summary histogram of primary - verified. For each
+        histogram, 90% interval is shaded and printed on the plot.
+
+        Right: Histogram with all points
+        Middle: Histogram with only bad points defined by threshold
+        Left: Histogram with only bad points defined by sensor ID
+
+        input params
+        ------------
+        payload (dict): {'diff_hist':summed histograms and their 'edges'}
+        outfile (str): output plot file
+    '''
+
+    ## Start plotting!
+    h = plt.figure (figsize=(17, 5.5))
+    gs = gridspec.GridSpec (1, 3)
+
+    ## Plot the histograms with all data points & bad points (log y-axis)
+    for index, htype in enumerate (['all', 'bad_only_by_thresh', 'bad_only_by_sensor_id']):
+        axis = h.add_subplot (gs[index])
+        _plot_subplot_giant_diff (axis, payload['diff_hist'], htype=htype)
+
+    ### Store plot
+    plt.suptitle ('Distributions of primary - verified from all stations', fontsize=12)
+    _save_figure (h, outfile)
+
+###############################################
+## Define plot_pool class
+###############################################
+class plot_pool (object):
+
+    ''' This class renders plot jobs in a bounded pool of worker processes. '''
+
+    def __init__ (self, max_workers=DEFAULT_WORKERS, max_pending=MAX_PENDING, image_format='pdf'):
+
+        ''' To initialize a new plot_pool. Worker processes are started at the
+            first submit().
+
+            input params
+            ------------
+            max_workers (int): # worker processes; 0 to render right away
+            max_pending (int): max # jobs submitted but not yet done
+            image_format (str): 'pdf' or 'png' (thumbnails)
+        '''
+
+        ## Logger
+        self._logger = logging.getLogger ('plot_pool')
+
+        if not image_format in IMAGE_FORMATS:
+            message = 'Image format, {0}, is not one of {1}.'.format (image_format, IMAGE_FORMATS)
+            self._logger.fatal (message)
+            raise IOError (message)
+
+        self._max_workers = max_workers
+        self._image_format = image_format
+        self._slots = threading.BoundedSemaphore (max_pending)
+        self._executor = None
+        self._jobs = []
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args): self.join()
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def max_workers (self): return self._max_workers
+
+    @property
+    def image_format (self): return self._image_format
+
+    @property
+    def n_pending (self): return len ([job for job in self._jobs if not job[1].done()])
+
+    # +------------------------------------------------------------
+    # | Submit & join
+    # +------------------------------------------------------------
+    def _release (self, future): self._slots.release()
+
+    def submit (self, render, payload, outfile):
+
+        ''' A public function to render a plot in the background. It blocks
+            when max_pending jobs are already queued.
+
+            input params
+            ------------
+            render (function): one of the module-level render_xxx() functions
+            payload (dict): data needed by render
+            outfile (str): output plot file (.pdf); the extension is replaced
+                           by .png if image_format is png
+        '''
+
+        outfile = os.path.splitext (outfile)[0] + '.' + self._image_format
+
+        ## No workers: render now in this process
+        if self._max_workers == 0:
+            render (payload, outfile)
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor (max_workers=self._max_workers)
+        self._slots.acquire()
+        future = self._executor.submit (render, payload, outfile)
+        future.add_done_callback (self._release)
+        self._jobs.append ((outfile, future))
+
+    def join (self):
+
+        ''' A public function to wait for all plot jobs and stop the workers.
+            Failed plots are logged but not raised.
+
+            return params
+            -------------
+            failed (list): output files of the failed plots
+        '''
+
+        failed = []
+        for outfile, future in self._jobs:
+            try:
+                future.result()
+            except Exception as error:
+                self._logger.warn ('Failed to plot {0}: {1}'.format (outfile, error))
+                failed.append (outfile)
+
+        if self._executor is not None: self._executor.shutdown (wait=True)
+        self._logger.info ('{0} plots are rendered.'.format (len (self._jobs) - len (failed)))
+        self._executor, self._jobs = None, []
+        return failed
@@ -0,0 +1,197 @@
+#!python37
+
+## This script defines the QC_PROVENANCE column of the cleaned data. It is a
+## uint16 bitmask per row that records what the cleaner did to that row. One
+## bit per flag in PROVENANCE_BITS (bit 0 first):
+##  * nan_primary, nan_primary_sigma, nan_backup, nan_backup_sigma
+##      value was NaN / missing and replaced by 0.0 (i.e. its _TRUE is 0)
+##  * capped_<column>_min / capped_<column>_max for PRIMARY, BACKUP,
+##    PRIMARY_SIGMA, and BACKUP_SIGMA
+##      value was beyond the accepted range and capped
+##  * offset_applied      : primary offset is added to PRIMARY
+##  * backup_recalibrated : backup B1 is re-calculated from B1 gain / offset
+##  * other_primary_sensor: SENSOR_USED_PRIMARY is the other primary sensor
+##
+## Helpers decode the mask into boolean columns and count every flag per set
+## with one bincount, from which the matching CLEAN_STATS_KEYS are derived.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import qc_provenance, pandas
+## dataframe = pandas.read_csv ('C:/to/processed/8443970_processed_ver_merged_wl_train.csv')
+## # Boolean columns per flag
+## flags = qc_provenance.decode (dataframe.QC_PROVENANCE.values)
+## # Rows with capped primary
+## is_capped = qc_provenance.has_flag (dataframe.QC_PROVENANCE.values,
+##                                     ['capped_primary_min', 'capped_primary_max'])
+## # Counts per flag
+## counts = qc_provenance.count_flags (dataframe.QC_PROVENANCE.values)
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas
+
+###############################################
+## Define constants
+###############################################
+# Flag names in bit order
+PROVENANCE_BITS = ['nan_primary', 'nan_primary_sigma', 'nan_backup', 'nan_backup_sigma',
+                   'capped_primary_min', 'capped_primary_max',
+                   'capped_backup_min', 'capped_backup_max',
+                   'capped_primary_sigma_min', 'capped_primary_sigma_max',
+                   'capped_backup_sigma_min', 'capped_backup_sigma_max',
+                   'offset_applied', 'backup_recalibrated',
+                   'other_primary_sensor']
+PROVENANCE_FLAGS = {name:numpy.uint16 (1 << bit) for bit, name in enumerate (PROVENANCE_BITS)}
+NBITS = len (PROVENANCE_BITS)
+
+# Stats keys in station.CLEAN_STATS_KEYS that are counts of a flag
+PROVENANCE_STATS_KEYS = dict ({name:'n_' + name for name in PROVENANCE_BITS[:12]},
+                              offset_applied='n_primary_offsets_applied',
+                              other_primary_sensor='n_with_other_primary_sensor')
+
+# Dataset types in the cleaned dataframe
+DATASET_TYPES = ['train', 'validation', 'test']
+
+###############################################
+## Define functions
+###############################################
+def _get_mask_value (names):
+
+    ''' A function to combine flag name(s) into one uint16 value.
+
+        input params
+        ------------
+        names (str or list): flag name(s) in PROVENANCE_BITS
+
+        return params
+        -------------
+        value (numpy.uint16): OR of the flags
+    '''
+
+    names = [names] if isinstance (names, str) else names
+    value = numpy.uint16 (0)
+    for name in names:
+        if not name in PROVENANCE_FLAGS:
+            raise IOError ('Provenance flag, {0}, is not registered.'.format (name))
+        value |= PROVENANCE_FLAGS[name]
+    return value
+
+def add_flag (provenance, name, mask):
+
+    ''' A function to set a flag on the rows where mask is True.
+
+        input params
+        ------------
+        provenance (array-like): uint16 provenance per row
+        name (str): flag name in PROVENANCE_BITS
+        mask (array-like): boolean array; True to set the flag
+
+        return params
+        -------------
+        provenance (numpy.array): new uint16 provenance per row
+    '''
+
+    provenance = numpy.asarray (provenance, dtype=numpy.uint16)
+    flag = numpy.where (numpy.asarray (mask, dtype=bool), _get_mask_value (name), 0)
+    return provenance | flag.astype (numpy.uint16)
+
+def has_flag (provenance, names):
+
+    ''' A function to check if any of the flag(s) is set per row.
+
+        input params
+        ------------
+        provenance (array-like): uint16 provenance per row
+        names (str or list): flag name(s) in PROVENANCE_BITS
+
+        return params
+        -------------
+        is_set (numpy.array): True if any of the flags is set
+    '''
+
+    return (numpy.asarray (provenance, dtype=numpy.uint16) & _get_mask_value (names)) > 0
+
+def _get_bits (provenance):
+
+    ''' A function to unpack provenance into a (# rows, NBITS) 0/1 matrix.
+
+        input params
+        ------------
+        provenance (array-like): uint16 provenance per row
+
+        return params
+        -------------
+        bits (numpy.array): uint8 matrix; column i is bit i
+    '''
+
+    provenance = numpy.asarray (provenance, dtype=numpy.uint16)
+    return ((provenance[:, None] >> numpy.arange (NBITS, dtype=numpy.uint16)) & 1).astype (numpy.uint8)
+
+def decode (provenance, names=None):
+
+    ''' A function to decode provenance into one boolean column per flag.
+
+        input params
+        ------------
+        provenance (array-like): uint16 provenance per row
+        names (list): flag names to decode; None for all
+
+        return params
+        -------------
+        flags (pandas.DataFrame): boolean columns named by flags
+    '''
+
+    bits = _get_bits (provenance).astype (bool)
+    flags = pandas.DataFrame (bits, columns=PROVENANCE_BITS)
+    return flags if names is None else flags[names]
+
+def count_flags (provenance, set_types=None):
+
+    ''' A function to count the rows with each flag set, per dataset type if
+        set_types is given. All counts come from one bincount.
+
+        input params
+        ------------
+        provenance (array-like): uint16 provenance per row
+        set_types (array-like): setType per row; None to count all rows
+
+        return params
+        -------------
+        counts (pandas.DataFrame): # rows per flag (columns) per set (rows)
+    '''
+
+    bits = _get_bits (provenance)
+    if set_types is None:
+        sets, codes = numpy.array (['all']), numpy.zeros (len (bits), dtype=int)
+    else:
+        sets = numpy.array (DATASET_TYPES)
+        codes = pandas.Categorical (set_types, categories=DATASET_TYPES).codes
+        if (codes < 0).any ():
+            raise IOError ('Set types must be one of {0}.'.format (DATASET_TYPES))
+
+    indices = codes[:, None] * NBITS + numpy.arange (NBITS)
+    counts = numpy.bincount (indices.ravel(), weights=bits.ravel(), minlength=len (sets) * NBITS)
+    return pandas.DataFrame (counts.reshape (len (sets), NBITS).astype (int),
+                             index=sets, columns=PROVENANCE_BITS)
+
+def get_stats (provenance, set_types):
+
+    ''' A function to derive the flag counts in CLEAN_STATS_KEYS per set.
+
+        input params
+        ------------
+        provenance (array-like): uint16 provenance per row
+        set_types (array-like): setType per row
+
+        return params
+        -------------
+        stats (dict): {set type: {stats key: count}}
+    '''
+
+    counts = count_flags (provenance, set_types=set_types)
+    counts = counts[list (PROVENANCE_STATS_KEYS.keys())].rename (columns=PROVENANCE_STATS_KEYS)
+    return {dtype:counts.loc[dtype].to_dict() for dtype in counts.index}
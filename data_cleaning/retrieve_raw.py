@@ -0,0 +1,715 @@
+#!python37
+
+## This script retrieves raw data from a CO-OPS-style data API straight into
+## the raw folder, in the same format as Armin's raw files, so data_cleaner
+## can use it as raw_path without copying files from the network share. For
+## each station, it writes
+##  * <station ID>_raw_ver_merged_wl.csv: 6-minute primary sensors (e.g. A1,
+##    Y1), backup B1 (raw value, MSL, DCP, sigma), verified (and its sensor
+##    ID), and predictions, merged by DATE_TIME
+##  * <station ID>_offsets.csv: primary sensor offsets
+##  * <station ID>_B1_gain_offsets.csv: B1 gain / offset parameters
+##
+## Requests follow the CO-OPS datagetter convention, i.e. GET <base_url>?
+## product=...&station=...&begin_date=yyyyMMdd HH:mm&end_date=...&datum=...
+## &units=metric&time_zone=gmt&format=json, with JSON records of 't' (time),
+## 'v' (value), and other fields. Products and field names per series are in
+## SERIES and META_SERIES so they can follow the actual API.
+##
+## Everything runs on one asyncio loop:
+##  * http_pool keeps up to max_connections keep-alive HTTP/1.1 connections
+##    per run and re-uses them across requests.
+##  * rate_limiter caps requests per second (token bucket).
+##  * Time series are requested in chunks of chunk_days for all series and
+##    stations concurrently. Failed requests (connection errors, 429, 5xx)
+##    are retried with exponential backoff.
+##  * Each finished chunk is kept as a partial JSON in <out_path>/.partial/;
+##    a rerun after an interruption only requests missing chunks. Once all
+##    chunks of a station are in, its raw files are written (via a temporary
+##    file) and its partial folder removed.
+## Standard library only; stand_in_api.py serves a raw folder through the
+## same API for local tests.
+##
+## To retrieve stations:
+## > python retrieve_raw.py --base_url <API URL> --out_path <raw folder>
+##                          --station_ids 8443970 8418150
+##                          --begin_date 2015-01-01 --end_date 2019-06-30
+##                          (--sensors A1 Y1) (--max_connections 8)
+##                          (--rate 10) (--chunk_days 31)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import retrieve_raw
+## retriever = retrieve_raw.raw_retriever ('https://to/api/datagetter', 'C:/to/raw/')
+## retriever.retrieve_stations ([8443970, 8418150], '2015-01-01', '2019-06-30')
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, argparse, asyncio, urllib.parse, shutil
+import json, time, ssl, os
+
+import station_registry
+
+###############################################
+## Define constants
+###############################################
+# File name patterns in raw folder
+FILE_PATTERNS = station_registry.FILE_PATTERNS
+
+# Partial downloads in out_path
+PARTIAL_FOLDER = '.partial'
+
+# Defaults of the client
+MAX_CONNECTIONS = 8
+MAX_STATIONS = 4
+RATE = 10.
+CHUNK_DAYS = 31
+RETRIES = 4
+RETRY_WAIT = 1.
+TIMEOUT = 60.
+
+# Primary sensors by default
+SENSORS = ['A1', 'Y1']
+
+# Time format of requests and raw files
+REQUEST_TIME_FORMAT = '%Y%m%d %H:%M'
+RAW_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+# 6-minute series: request parameters, JSON key of records, and raw columns
+# per JSON field. {sensor} is replaced by each primary sensor.
+SERIES = {'primary':{'params':{'product':'water_level_raw', 'sensor':'{sensor}', 'datum':'MSL'},
+                     'key':'data', 'fields':{'v':'{sensor}_WL_VALUE_MSL', 's':'{sensor}_WL_SIGMA'}},
+          'backup':{'params':{'product':'water_level_raw', 'sensor':'B1'},
+                    'key':'data', 'fields':{'v':'B1_WL_VALUE', 'msl':'B1_MSL', 'dcp':'B1_DCP',
+                                            's':'B1_WL_SIGMA'}},
+          'verified':{'params':{'product':'water_level', 'datum':'MSL'},
+                      'key':'data', 'fields':{'v':'VER_WL_VALUE_MSL', 'sensor':'VER_WL_SENSOR_ID'}},
+          'prediction':{'params':{'product':'predictions', 'datum':'MSL', 'interval':'6'},
+                        'key':'predictions', 'fields':{'v':'PRED_WL_VALUE_MSL'}}}
+
+# Columns of raw data in the order of Armin's files; {sensor} as above
+RAW_COLUMNS = ['STATION_ID', 'DATE_TIME', '{sensor}_WL_VALUE_MSL', '{sensor}_WL_SIGMA',
+               'B1_WL_VALUE', 'B1_MSL', 'B1_DCP', 'B1_WL_SIGMA', 'VER_WL_VALUE_MSL',
+               'VER_WL_SENSOR_ID', 'PRED_WL_VALUE_MSL']
+
+# Columns that stay text in raw data
+TEXT_COLUMNS = ['VER_WL_SENSOR_ID']
+
+# Metadata of a station, requested once for the full period
+META_SERIES = {'primary_offsets':{'params':{'product':'sensor_offsets'}, 'key':'offsets',
+                                  'columns':['STATION_ID', 'BEGIN_DATE_TIME', 'END_DATE_TIME',
+                                             'SENSOR_ID', 'OFFSET']},
+               'B1_gain_offsets':{'params':{'product':'b1_gain_offsets'}, 'key':'gain_offsets',
+                                  'columns':['STATION_ID', 'B1_DCP', 'PARAMETER_NAME',
+                                             'ACC_PARAM_VAL', 'BEGIN_DATE_TIME', 'END_DATE_TIME']}}
+
+# Common request parameters
+COMMON_PARAMS = {'units':'metric', 'time_zone':'gmt', 'format':'json',
+                 'application':'NOAA-WL-AI'}
+
+# Statuses worth a retry
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+###############################################
+## Define functions
+###############################################
+def get_chunks (begin_date, end_date, chunk_days=CHUNK_DAYS):
+
+    ''' A function to split a date range into chunks of 6-minute records.
+
+        input params
+        ------------
+        begin_date (str): first day
+        end_date (str): last day; its 23:54 is included
+        chunk_days (int): # days per chunk
+
+        return params
+        -------------
+        chunks (list): (begin, end) timestamps per chunk
+    '''
+
+    begin = pandas.Timestamp (begin_date)
+    end = pandas.Timestamp (end_date) + pandas.Timedelta ('23:54:00')
+    chunks = []
+    while begin <= end:
+        chunk_end = min (begin + pandas.Timedelta (days=chunk_days) - pandas.Timedelta ('6min'), end)
+        chunks.append ((begin, chunk_end))
+        begin = chunk_end + pandas.Timedelta ('6min')
+    return chunks
+
+def _format_series (series, sensor):
+
+    ''' A private function to fill in the sensor of a series definition. '''
+
+    params = {key:value.format (sensor=sensor) for key, value in series['params'].items()}
+    fields = {key:value.format (sensor=sensor) for key, value in series['fields'].items()}
+    return params, fields
+
+def get_raw_columns (sensors):
+
+    ''' A function to get the raw columns with all primary sensors.
+
+        input params
+        ------------
+        sensors (list): primary sensors e.g. ['A1', 'Y1']
+
+        return params
+        -------------
+        columns (list): raw columns in order
+    '''
+
+    columns = []
+    for column in RAW_COLUMNS:
+        if '{sensor}' in column:
+            continue
+        columns.append (column)
+        ## Sensor columns go right after DATE_TIME
+        if column == 'DATE_TIME':
+            for sensor in sensors:
+                columns += [value.format (sensor=sensor) for value in RAW_COLUMNS if '{sensor}' in value]
+    return columns
+
+def records_to_frame (records, fields):
+
+    ''' A function to turn JSON records of a series into raw columns.
+
+        input params
+        ------------
+        records (list): JSON records with 't' and fields
+        fields (dict): {JSON field: raw column}
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): DATE_TIME and raw columns
+    '''
+
+    columns = ['DATE_TIME'] + list (fields.values())
+    if len (records) == 0: return pandas.DataFrame (columns=columns)
+    frame = pandas.DataFrame (records)
+    dataframe = pandas.DataFrame ({'DATE_TIME':pandas.to_datetime (frame['t'], format=RAW_TIME_FORMAT)})
+    for field, column in fields.items():
+        values = frame[field] if field in frame else pandas.Series ([numpy.nan] * len (frame))
+        ## Text values are parsed by float() to keep them exact
+        values = values.replace ('', numpy.nan)
+        dataframe[column] = values if column in TEXT_COLUMNS else values.astype (float)
+    return dataframe[columns]
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='Retrieve raw files from a CO-OPS-style API')
+    parser.add_argument('-u', '--base_url', required=True, type=str,
+                        help='URL of the datagetter API')
+    parser.add_argument('-o', '--out_path', required=True, type=str,
+                        help='Raw folder to write files')
+    parser.add_argument('-i', '--station_ids', required=True, type=int, nargs='+',
+                        help='Station IDs to retrieve')
+    parser.add_argument('-b', '--begin_date', required=True, type=str,
+                        help='First day to retrieve e.g. 2015-01-01')
+    parser.add_argument('-e', '--end_date', required=True, type=str,
+                        help='Last day to retrieve e.g. 2019-06-30')
+    parser.add_argument('-s', '--sensors', default=SENSORS, type=str, nargs='+',
+                        help='Primary sensors to retrieve')
+    parser.add_argument('-c', '--max_connections', default=MAX_CONNECTIONS, type=int,
+                        help='Max # HTTP connections')
+    parser.add_argument('-r', '--rate', default=RATE, type=float,
+                        help='Max # requests per second')
+    parser.add_argument('-d', '--chunk_days', default=CHUNK_DAYS, type=int,
+                        help='# days per request')
+    parser.add_argument('-l', '--log_level', default='info', type=str,
+                        help='Log level: info, debug, warn, error')
+    args = parser.parse_args()
+
+    ## Check if out path exists. If not, create it now.
+    if not os.path.exists (args.out_path):
+        os.makedirs (args.out_path)
+
+    ## Check if log level is one of info / debug / warn / error
+    if not args.log_level.lower() in ['debug', 'info', 'warn', 'error']:
+        message = 'Log level must be either debug, info, warn, or error.'
+        raise IOError (message)
+
+    return args
+
+###############################################
+## Define http_pool class
+###############################################
+class http_pool (object):
+
+    ''' This class sends HTTP/1.1 GET requests over a pool of keep-alive
+        connections. It must be created and used on the same asyncio loop.
+    '''
+
+    def __init__ (self, max_connections=MAX_CONNECTIONS, timeout=TIMEOUT):
+
+        ''' To initialize an empty http_pool.
+
+            input params
+            ------------
+            max_connections (int): max # requests in flight, i.e. connections
+            timeout (float): seconds to wait for a response
+        '''
+
+        self._semaphore = asyncio.Semaphore (max_connections)
+        self._timeout = timeout
+        ## Idle connections: {(scheme, host, port): [(reader, writer)]}
+        self._idle = {}
+        self._n_opened = 0
+
+        ## Logger
+        self._logger = logging.getLogger ('http_pool')
+
+    @property
+    def n_opened (self): return self._n_opened
+
+    async def __aenter__ (self): return self
+
+    async def __aexit__ (self, *args):
+        await self.close()
+        return False
+
+    async def _connect (self, key):
+
+        ''' A private function to get an idle connection or open a new one.
+
+            return params
+            -------------
+            reader (asyncio.StreamReader): connection reader
+            writer (asyncio.StreamWriter): connection writer
+            is_reused (bool): If true, the connection was idle in the pool
+        '''
+
+        idle = self._idle.get (key, [])
+        while len (idle) > 0:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing(): return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == 'https' else None
+        reader, writer = await asyncio.wait_for (asyncio.open_connection (host, port, ssl=context),
+                                                 self._timeout)
+        self._n_opened += 1
+        return reader, writer, False
+
+    async def _read_response (self, reader):
+
+        ''' A private function to read status, headers, and body. '''
+
+        status_line = (await reader.readline()).decode ('latin-1').strip()
+        if len (status_line) == 0:
+            raise ConnectionError ('Connection closed without a response.')
+        status = int (status_line.split (' ')[1])
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode ('latin-1')
+            if line in ['\r\n', '\n', '']: break
+            name, _, value = line.partition (':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get ('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int ((await reader.readline()).split (b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly (size)
+                await reader.readline()
+        elif 'content-length' in headers:
+            body = await reader.readexactly (int (headers['content-length']))
+        else:
+            body = await reader.read()
+            headers['connection'] = 'close'
+        return status, headers, body
+
+    async def get (self, url, params=None):
+
+        ''' A public function to send a GET request.
+
+            input params
+            ------------
+            url (str): http(s) URL
+            params (dict): query parameters
+
+            return params
+            -------------
+            status (int): HTTP status code
+            headers (dict): response headers in lower case
+            body (bytes): response body
+        '''
+
+        parts = urllib.parse.urlsplit (url)
+        port = parts.port if parts.port is not None else 443 if parts.scheme == 'https' else 80
+        key = (parts.scheme, parts.hostname, port)
+        query = parts.query if params is None else \
+                '&'.join ([q for q in [parts.query, urllib.parse.urlencode (params)] if len (q) > 0])
+        target = (parts.path or '/') + ('?' + query if len (query) > 0 else '')
+        request = 'GET {0} HTTP/1.1\r\nHost: {1}\r\nAccept: application/json\r\n' \
+                  'Connection: keep-alive\r\n\r\n'.format (target, parts.netloc).encode ('latin-1')
+
+        async with self._semaphore:
+            while True:
+                reader, writer, is_reused = await self._connect (key)
+                try:
+                    writer.write (request)
+                    await writer.drain()
+                    status, headers, body = await asyncio.wait_for (self._read_response (reader),
+                                                                    self._timeout)
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+                    writer.close()
+                    ## An idle connection may have been closed by the server
+                    if is_reused: continue
+                    raise
+                if headers.get ('connection', '').lower() == 'close':
+                    writer.close()
+                else:
+                    self._idle.setdefault (key, []).append ((reader, writer))
+                return status, headers, body
+
+    async def close (self):
+
+        ''' A public function to close all idle connections. '''
+
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle = {}
+
+###############################################
+## Define rate_limiter class
+###############################################
+class rate_limiter (object):
+
+    ''' This class spaces requests with a token bucket. '''
+
+    def __init__ (self, rate=RATE, burst=1):
+
+        ''' To initialize a rate_limiter.
+
+            input params
+            ------------
+            rate (float): max # requests per second; None for no limit
+            burst (int): # requests allowed at once
+        '''
+
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    async def acquire (self):
+
+        ''' A public function to wait for a free slot. '''
+
+        if self._rate is None: return
+        while True:
+            now = time.monotonic()
+            self._tokens = min (self._burst, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep ((1 - self._tokens) / self._rate)
+
+###############################################
+## Define raw_retriever class
+###############################################
+class raw_retriever (object):
+
+    ''' This class retrieves raw files of many stations concurrently. '''
+
+    def __init__ (self, base_url, out_path, sensors=SENSORS, max_connections=MAX_CONNECTIONS,
+                  max_stations=MAX_STATIONS, rate=RATE, chunk_days=CHUNK_DAYS,
+                  retries=RETRIES, retry_wait=RETRY_WAIT, timeout=TIMEOUT):
+
+        ''' To initialize a raw_retriever.
+
+            input params
+            ------------
+            base_url (str): URL of the datagetter API
+            out_path (str): raw folder to write files
+            sensors (list): primary sensors to retrieve
+            max_connections (int): max # HTTP connections
+            max_stations (int): max # stations in flight
+            rate (float): max # requests per second; None for no limit
+            chunk_days (int): # days per time series request
+            retries (int): # retries of a failed request
+            retry_wait (float): seconds before the first retry; doubled each time
+            timeout (float): seconds to wait for a response
+        '''
+
+        self._base_url = base_url
+        self._out_path = out_path
+        self._sensors = list (sensors)
+        self._max_connections = max_connections
+        self._max_stations = max_stations
+        self._rate = rate
+        self._chunk_days = chunk_days
+        self._retries = retries
+        self._retry_wait = retry_wait
+        self._timeout = timeout
+
+        ## Set per run on its loop
+        self._pool = None
+        self._limiter = None
+        self._n_requests = 0
+        self._n_retries = 0
+
+        ## Logger
+        self._logger = logging.getLogger ('raw_retriever')
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def out_path (self): return self._out_path
+
+    @property
+    def n_requests (self): return self._n_requests
+
+    @property
+    def n_retries (self): return self._n_retries
+
+    # +------------------------------------------------------------
+    # | Requests
+    # +------------------------------------------------------------
+    async def fetch_records (self, params, key):
+
+        ''' A public function to request JSON records with retries.
+
+            input params
+            ------------
+            params (dict): request parameters besides COMMON_PARAMS
+            key (str): JSON key of the records
+
+            return params
+            -------------
+            records (list): JSON records; [] if the API has no data
+        '''
+
+        params = dict (COMMON_PARAMS, **params)
+        for attempt in range (self._retries + 1):
+            await self._limiter.acquire()
+            self._n_requests += 1
+            wait = self._retry_wait * 2**attempt
+            try:
+                status, headers, body = await self._pool.get (self._base_url, params)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as error:
+                message = 'Request failed ({0}): {1}'.format (error.__class__.__name__, error)
+            else:
+                if status == 200:
+                    content = json.loads (body.decode ('utf-8'))
+                    if 'error' in content:
+                        error_message = content['error'].get ('message', '')
+                        ## CO-OPS answers 'No data was found' for empty periods
+                        if 'no data' in error_message.lower(): return []
+                        raise IOError ('API error for {0}: {1}'.format (params, error_message))
+                    return content.get (key, [])
+                if not status in RETRY_STATUSES:
+                    raise IOError ('HTTP {0} for {1}: {2}'.format (status, params, body[:200]))
+                message = 'HTTP {0}'.format (status)
+                if 'retry-after' in headers:
+                    try:
+                        wait = max (wait, float (headers['retry-after']))
+                    except ValueError:
+                        pass
+            if attempt == self._retries: break
+            self._n_retries += 1
+            self._logger.debug ('{0}; retry in {1:.1f} s: {2}'.format (message, wait, params))
+            await asyncio.sleep (wait)
+        raise IOError ('{0} after {1} retries: {2}'.format (message, self._retries, params))
+
+    def _get_partial_path (self, station_id):
+        return '{0}/{1}/{2}'.format (self._out_path, PARTIAL_FOLDER, station_id)
+
+    async def _fetch_chunk (self, station_id, name, params, fields, begin, end):
+
+        ''' A private function to get 1 chunk of 1 series, from the partial
+            folder if it was already downloaded.
+
+            return params
+            -------------
+            dataframe (pandas.DataFrame): DATE_TIME and raw columns
+        '''
+
+        partial_file = '{0}/{1}_{2}.json'.format (self._get_partial_path (station_id), name,
+                                                  begin.strftime ('%Y%m%d%H%M'))
+        if os.path.exists (partial_file):
+            with open (partial_file, 'r') as partial:
+                return records_to_frame (json.load (partial), fields)
+
+        params = dict (params, station=station_id,
+                       begin_date=begin.strftime (REQUEST_TIME_FORMAT),
+                       end_date=end.strftime (REQUEST_TIME_FORMAT))
+        records = await self.fetch_records (params, SERIES[name.split ('-')[0]]['key'])
+
+        ## Records are kept as is; writing JSON is cheaper than csv
+        temp_file = partial_file + '.tmp'
+        with open (temp_file, 'w') as partial:
+            partial.write (json.dumps (records))
+        os.replace (temp_file, partial_file)
+        return records_to_frame (records, fields)
+
+    async def _fetch_meta (self, station_id, key, begin_date, end_date):
+
+        ''' A private function to get offsets or B1 gain / offsets of a station
+            as a dataframe with the columns of its raw file.
+        '''
+
+        series = META_SERIES[key]
+        params = dict (series['params'], station=station_id,
+                       begin_date=pandas.Timestamp (begin_date).strftime (REQUEST_TIME_FORMAT),
+                       end_date=(pandas.Timestamp (end_date) + pandas.Timedelta ('23:54:00')).strftime (REQUEST_TIME_FORMAT))
+        records = await self.fetch_records (params, series['key'])
+        dataframe = pandas.DataFrame (records, columns=series['columns'])
+        dataframe['STATION_ID'] = station_id
+        return dataframe
+
+    async def retrieve_station (self, station_id, begin_date, end_date):
+
+        ''' A public function to retrieve all raw files of 1 station. All
+            chunks and series are requested concurrently.
+
+            input params
+            ------------
+            station_id (int): station ID
+            begin_date (str): first day
+            end_date (str): last day
+
+            return params
+            -------------
+            n_records (int): # records in the raw file
+        '''
+
+        os.makedirs (self._get_partial_path (station_id), exist_ok=True)
+
+        ## One request per series (per primary sensor) per chunk
+        requests = []
+        for name, series in SERIES.items():
+            sensors = self._sensors if name == 'primary' else [None]
+            for sensor in sensors:
+                params, fields = _format_series (series, sensor)
+                series_name = name if sensor is None else '{0}-{1}'.format (name, sensor)
+                for begin, end in get_chunks (begin_date, end_date, chunk_days=self._chunk_days):
+                    requests.append ((series_name, self._fetch_chunk (station_id, series_name, params,
+                                                                      fields, begin, end)))
+        metas = {key:self._fetch_meta (station_id, key, begin_date, end_date) for key in META_SERIES}
+
+        results = await asyncio.gather (*[request for _, request in requests], *metas.values())
+        chunks, meta_frames = results[:len (requests)], results[len (requests):]
+
+        ## Merge series by DATE_TIME; a repeated time within a series keeps
+        ## its first record
+        merged = None
+        for series_name in dict.fromkeys ([name for name, _ in requests]):
+            frames = [chunk for (name, _), chunk in zip (requests, chunks) if name == series_name]
+            frame = pandas.concat (frames, ignore_index=True).drop_duplicates ('DATE_TIME')
+            frame = frame.set_index ('DATE_TIME')
+            merged = frame if merged is None else merged.join (frame, how='outer')
+        merged = merged.sort_index().reset_index()
+        merged['STATION_ID'] = station_id
+        merged = merged[get_raw_columns (self._sensors)]
+
+        ## Write raw, offsets, and B1 gain / offsets
+        filebase = '{0}/{1}'.format (self._out_path, station_id)
+        files = [(merged, FILE_PATTERNS['raw'])] + \
+                [(frame, FILE_PATTERNS[key]) for key, frame in zip (metas.keys(), meta_frames)]
+        for dataframe, pattern in files:
+            temp_file = filebase + pattern + '.tmp'
+            dataframe.to_csv (temp_file, index=False, date_format=RAW_TIME_FORMAT)
+            os.replace (temp_file, filebase + pattern)
+        shutil.rmtree (self._get_partial_path (station_id))
+
+        self._logger.info ('Station {0}: {1} records are retrieved.'.format (station_id, len (merged)))
+        return len (merged)
+
+    async def retrieve (self, station_ids, begin_date, end_date):
+
+        ''' A public function to retrieve many stations on this loop, up to
+            max_stations at a time. A failed station does not stop the others.
+
+            input params
+            ------------
+            station_ids (list): station IDs
+            begin_date (str): first day
+            end_date (str): last day
+
+            return params
+            -------------
+            results (dict): {station ID: # records, or the error if failed}
+        '''
+
+        self._limiter = rate_limiter (rate=self._rate)
+        semaphore = asyncio.Semaphore (self._max_stations)
+
+        async def retrieve_one (station_id):
+            async with semaphore:
+                try:
+                    return await self.retrieve_station (station_id, begin_date, end_date)
+                except Exception as error:
+                    self._logger.warn ('Station {0} failed: {1}'.format (station_id, error))
+                    return error
+
+        async with http_pool (max_connections=self._max_connections, timeout=self._timeout) as pool:
+            self._pool = pool
+            start = time.perf_counter()
+            results = await asyncio.gather (*[retrieve_one (station_id) for station_id in station_ids])
+            message = '{0} stations in {1:.1f} s: {2} requests, {3} retries, {4} connections.'
+            self._logger.info (message.format (len (station_ids), time.perf_counter() - start,
+                                               self._n_requests, self._n_retries, pool.n_opened))
+        self._pool = None
+
+        ## Partial folder is left only for stations to be resumed
+        partial_path = '{0}/{1}'.format (self._out_path, PARTIAL_FOLDER)
+        if os.path.exists (partial_path) and len (os.listdir (partial_path)) == 0:
+            os.rmdir (partial_path)
+        return dict (zip (station_ids, results))
+
+    def retrieve_stations (self, station_ids, begin_date, end_date):
+
+        ''' A public function to retrieve many stations on a new asyncio loop.
+
+            input params
+            ------------
+            station_ids (list): station IDs
+            begin_date (str): first day
+            end_date (str): last day
+
+            return params
+            -------------
+            results (dict): {station ID: # records, or the error if failed}
+        '''
+
+        return asyncio.run (self.retrieve (station_ids, begin_date, end_date))
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    args = get_parser ()
+
+    ## Set log level
+    logging.basicConfig (level=getattr (logging, args.log_level.upper()))
+
+    retriever = raw_retriever (args.base_url, args.out_path, sensors=args.sensors,
+                               max_connections=args.max_connections, rate=args.rate,
+                               chunk_days=args.chunk_days)
+    results = retriever.retrieve_stations (args.station_ids, args.begin_date, args.end_date)
+
+    ## Exit with 1 if any station failed
+    failed = [station_id for station_id, result in results.items() if isinstance (result, Exception)]
+    if len (failed) > 0:
+        print ('Failed stations: {0}'.format (failed))
+        raise SystemExit (1)
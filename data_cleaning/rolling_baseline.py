@@ -0,0 +1,205 @@
+#!python37
+
+## This script computes a robust rolling median / quantile baseline of a water
+## level series. It stands in for PRED_WL_VALUE_MSL at stations without tide
+## predictions (e.g. Great Lakes), so that residuals are departures from the
+## slowly varying water level instead of undefined.
+##
+## The window is a time span (e.g. '30D' or '72H'), centered on each record
+## by default or trailing, so irregular records and missing slots are handled
+## as they are. NaN values are skipped; a window with less than min_periods
+## valid values gives NaN.
+##
+## The quantile of each window is kept by two heaps: a max-heap with the low
+## values and a min-heap with the high values, sized so that the tops are the
+## values right around the quantile rank. A value leaving the window is only
+## marked as deleted and dropped when it reaches a heap top (lazy deletion);
+## values are kept with their positions so that equal values never mix up.
+## Each record costs O(log w) for a window of w records, i.e. O(n log w) for
+## the series. Quantiles are linearly interpolated between the two tops, the
+## same as pandas rolling().quantile() and rolling().median().
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import rolling_baseline, pandas
+## dataframe = pandas.read_csv ('C:/to/processed/9063020_processed_ver_merged_wl_train.csv',
+##                              parse_dates=['DATE_TIME'])
+## baseline = rolling_baseline.rolling_quantile (dataframe.DATE_TIME.values,
+##                                               dataframe.PRIMARY.values, '30D')
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, heapq
+
+###############################################
+## Define constants
+###############################################
+# Default window and quantile of the baseline
+WINDOW = '30D'
+QUANTILE = 0.5
+
+###############################################
+## Define functions
+###############################################
+def parse_window (window):
+
+    ''' A function to parse a window in hours or days.
+
+        input params
+        ------------
+        window (str or pandas.Timedelta): e.g. '30D', '72H', '12 hours'
+
+        return params
+        -------------
+        window (pandas.Timedelta): positive window
+    '''
+
+    try:
+        window = pandas.Timedelta (window)
+    except (ValueError, TypeError):
+        raise IOError ('Cannot parse window, {0}, e.g. 30D or 72H.'.format (window))
+    if window <= pandas.Timedelta (0):
+        raise IOError ('Window, {0}, must be positive.'.format (window))
+    return window
+
+def get_window_bounds (times, window, center=True):
+
+    ''' A function to get the [begin, end) positions of the window of each
+        record from sorted times.
+
+        input params
+        ------------
+        times (numpy.array): sorted datetime64 times
+        window (pandas.Timedelta): window span
+        center (bool): If true, (t - w/2, t + w/2]; otherwise (t - w, t]
+
+        return params
+        -------------
+        begins (numpy.array): first position in each window
+        ends (numpy.array): one past the last position in each window
+    '''
+
+    times = numpy.asarray (times, dtype='datetime64[ns]')
+    span = numpy.timedelta64 (window.value, 'ns')
+    if center:
+        half = span // 2
+        return numpy.searchsorted (times, times - half, side='right'), \
+               numpy.searchsorted (times, times + (span - half), side='right')
+    return numpy.searchsorted (times, times - span, side='right'), \
+           numpy.arange (1, len (times) + 1)
+
+def sliding_quantile (values, begins, ends, quantile=QUANTILE, min_periods=1):
+
+    ''' A function to get the quantile of values in each sliding window with a
+        double heap and lazy deletion. Windows must move forward, i.e. begins
+        and ends are non-decreasing.
+
+        input params
+        ------------
+        values (numpy.array): values; NaN values are skipped
+        begins (numpy.array): first position in each window
+        ends (numpy.array): one past the last position in each window
+        quantile (float): quantile between 0 and 1; 0.5 for median
+        min_periods (int): min # valid values in a window
+
+        return params
+        -------------
+        baseline (numpy.array): quantile of each window; NaN if not enough values
+    '''
+
+    values = numpy.asarray (values, dtype=float)
+    is_valid = (~numpy.isnan (values)).tolist()
+    items = values.tolist()
+    baseline = numpy.full (len (begins), numpy.nan)
+    push, pop = heapq.heappush, heapq.heappop
+
+    ## low: max-heap of (-value, -position); high: min-heap of (value, position).
+    ## Positions break ties between equal values, so every value is in exactly
+    ## one known heap. Sizes count only values that are not deleted.
+    low, high, deleted = [], [], set()
+    n_low, n_high = 0, 0
+    head, tail = 0, 0
+
+    for index, (begin, end) in enumerate (zip (begins.tolist(), ends.tolist())):
+        ## Add values entering the window
+        while tail < end:
+            if is_valid[tail]:
+                value = items[tail]
+                if n_low > 0 and (value, tail) > (-low[0][0], -low[0][1]):
+                    push (high, (value, tail))
+                    n_high += 1
+                else:
+                    push (low, (-value, -tail))
+                    n_low += 1
+            tail += 1
+
+        ## Mark values leaving the window as deleted; drop them if at a top
+        while head < begin:
+            if is_valid[head]:
+                deleted.add (head)
+                if n_low > 0 and (items[head], head) <= (-low[0][0], -low[0][1]):
+                    n_low -= 1
+                    while low and -low[0][1] in deleted:
+                        deleted.discard (-pop (low)[1])
+                else:
+                    n_high -= 1
+                    while high and high[0][1] in deleted:
+                        deleted.discard (pop (high)[1])
+            head += 1
+
+        ## Re-balance so that low holds floor (q (m-1)) + 1 values
+        n_valid = n_low + n_high
+        if n_valid == 0: continue
+        rank = quantile * (n_valid - 1)
+        n_target = int (rank) + 1
+        while n_low > n_target:
+            item = pop (low)
+            push (high, (-item[0], -item[1]))
+            n_low -= 1
+            n_high += 1
+            while low and -low[0][1] in deleted:
+                deleted.discard (-pop (low)[1])
+        while n_low < n_target:
+            item = pop (high)
+            push (low, (-item[0], -item[1]))
+            n_low += 1
+            n_high -= 1
+            while high and high[0][1] in deleted:
+                deleted.discard (pop (high)[1])
+
+        ## Interpolate between the top of low and the top of high
+        if n_valid < min_periods: continue
+        lower = -low[0][0]
+        fraction = rank - int (rank)
+        baseline[index] = lower if fraction == 0 else lower + fraction * (high[0][0] - lower)
+
+    return baseline
+
+def rolling_quantile (times, values, window=WINDOW, quantile=QUANTILE, min_periods=1, center=True):
+
+    ''' A function to get the rolling quantile baseline of a time series.
+
+        input params
+        ------------
+        times (array-like): sorted timestamps
+        values (array-like): values; NaN values are skipped
+        window (str or pandas.Timedelta): window span in hours or days
+        quantile (float): quantile between 0 and 1; 0.5 for median
+        min_periods (int): min # valid values in a window
+        center (bool): If true, windows are centered; otherwise trailing
+
+        return params
+        -------------
+        baseline (numpy.array): baseline per record
+    '''
+
+    if not 0 <= quantile <= 1:
+        raise IOError ('Quantile, {0}, must be between 0 and 1.'.format (quantile))
+    times = numpy.asarray (pandas.DatetimeIndex (times).values)
+    if len (times) > 1 and (numpy.diff (times) < numpy.timedelta64 (0)).any():
+        raise IOError ('Times must be sorted.')
+    begins, ends = get_window_bounds (times, parse_window (window), center=center)
+    return sliding_quantile (values, begins, ends, quantile=quantile, min_periods=min_periods)
@@ -0,0 +1,348 @@
+#!python37
+
+## This script defines a run_index class that stores the runs of missing or
+## bad data in a cleaned station dataframe. A run is a block of consecutive
+## rows with the same issue. Each run is stored as a start row, a length, and
+## a type in compact int arrays, so that queries like "all gaps longer than 1
+## hour in validation" or "spike density per month" are answered from the runs
+## without rescanning the whole series.
+##
+## Run types are listed in RUN_TYPES:
+##  * nan_primary   : PRIMARY is missing
+##  * nan_backup    : BACKUP is missing
+##  * spike         : TARGET = 0 with a valid PRIMARY
+##  * capped_primary: PRIMARY is capped at the WL min / max
+##  * capped_backup : BACKUP is capped at the WL min / max
+##  * missing_slot  : 6-minute slot missing in raw file and inserted on grid
+##
+## Runs never cross a setType boundary. The index is not built while
+## cleaning; load_run_index() builds it from the processed files of a station
+## (train, validation, then test rows), so that many queries share one scan.
+## Row numbers are positions in those rows.
+##
+## Example snippet to use the run_index class:
+## +-------------------------------------------------------------
+## import run_index
+## index = run_index.load_run_index ('C:/to/processed/', 8443970)
+##
+## # All missing primary runs longer than 1 hour in validation set
+## gaps = index.get_runs ('nan_primary', min_length=pandas.Timedelta ('1H'),
+##                        set_type='validation')
+## # Spike density per month
+## density = index.get_monthly_density ('spike')
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, os
+import qc_provenance
+
+###############################################
+## Define constants
+###############################################
+# Run types and their codes
+RUN_TYPES = {'nan_primary':0, 'nan_backup':1, 'spike':2, 'capped_primary':3,
+             'capped_backup':4, 'missing_slot':5}
+
+# Dataset types in the cleaned dataframe
+DATASET_TYPES = ['train', 'validation', 'test']
+
+# Time step between records
+TIME_STEP = pandas.Timedelta ('6min')
+
+# Processed file per station & dataset type
+PROCESSED_FILE = '{0}/{1}_processed_ver_merged_wl_{2}.csv'
+
+# Columns of processed files needed for the runs; MISSING_SLOT is only in
+# processed files on the regular 6-minute grid
+PROCESSED_COLUMNS = ['DATE_TIME', 'PRIMARY_TRUE', 'BACKUP_TRUE', 'TARGET',
+                     'QC_PROVENANCE', 'MISSING_SLOT']
+
+###############################################
+## Define functions
+###############################################
+def get_runs (mask, breaks=None):
+
+    ''' A function to run-length encode a boolean array and return the runs of
+        True values. Optionally, runs are split at break points.
+
+        input params
+        ------------
+        mask (numpy.array): boolean array
+        breaks (numpy.array): boolean array; True if a new run must start at
+                              this point e.g. the first row of a new set
+
+        return params
+        -------------
+        starts (numpy.array): index of the first point in each run
+        lengths (numpy.array): number of points in each run
+    '''
+
+    mask = numpy.asarray (mask, dtype=bool)
+    is_start = mask & ~numpy.r_[False, mask[:-1]]
+    if breaks is not None: is_start |= mask & breaks
+    starts = numpy.flatnonzero (is_start)
+
+    ## Each run ends at the next start or at the next False point
+    ends = numpy.flatnonzero (mask & ~numpy.r_[mask[1:], False]) + 1
+    if breaks is not None:
+        ends = numpy.union1d (ends, starts[1:][mask[starts[1:] - 1]])
+    return starts, ends - starts
+
+def load_run_index (proc_path, station_id):
+
+    ''' A function to build the run index of a station from its processed
+        files. Missing primary / backup come from the _TRUE columns, spikes
+        are TARGET = 0 with a valid PRIMARY, capped values from QC_PROVENANCE,
+        and missing slots from MISSING_SLOT if present.
+
+        input params
+        ------------
+        proc_path (str): processed folder
+        station_id (int): station ID
+
+        return params
+        -------------
+        index (run_index): runs over train, validation, then test rows
+    '''
+
+    dataframes = []
+    for dtype in DATASET_TYPES:
+        filename = PROCESSED_FILE.format (proc_path, station_id, dtype)
+        if not os.path.exists (filename): continue
+        dataframe = pandas.read_csv (filename, usecols=lambda column: column in PROCESSED_COLUMNS,
+                                     parse_dates=['DATE_TIME'])
+        dataframe['setType'] = dtype
+        dataframes.append (dataframe)
+    if len (dataframes) == 0:
+        raise FileNotFoundError ('No processed files of station {0} in {1}.'.format (station_id, proc_path))
+    dataframe = pandas.concat (dataframes, ignore_index=True)
+
+    provenance = dataframe.QC_PROVENANCE.values
+    masks = {'nan_primary':dataframe.PRIMARY_TRUE.values == 0,
+             'nan_backup':dataframe.BACKUP_TRUE.values == 0,
+             'spike':(dataframe.TARGET.values == 0) & (dataframe.PRIMARY_TRUE.values == 1),
+             'capped_primary':qc_provenance.has_flag (provenance, ['capped_primary_min', 'capped_primary_max']),
+             'capped_backup':qc_provenance.has_flag (provenance, ['capped_backup_min', 'capped_backup_max'])}
+    if 'MISSING_SLOT' in dataframe:
+        masks['missing_slot'] = dataframe.MISSING_SLOT.values == 1
+    return run_index (dataframe.DATE_TIME.values, dataframe.setType.values, masks)
+
+###############################################
+## Define run_index class
+###############################################
+class run_index (object):
+
+    ''' This class encapsulates the runs of missing or bad data in a cleaned
+        station dataframe.
+    '''
+
+    def __init__ (self, times, set_types, masks):
+
+        ''' To initialize a run index, the times and setType of all rows and a
+            boolean mask per run type are required. The masks are encoded
+            right away and not kept.
+
+            input params
+            ------------
+            times (array-like): DATE_TIME of each row, sorted
+            set_types (array-like): setType of each row
+            masks (dict): {run type: boolean array}
+        '''
+
+        self._times = numpy.asarray (times, dtype='datetime64[ns]')
+        set_codes = pandas.Categorical (set_types, categories=DATASET_TYPES).codes
+        breaks = numpy.r_[True, set_codes[1:] != set_codes[:-1]]
+
+        ## Encode runs of each type and keep them in one set of int arrays
+        starts, lengths, types = [], [], []
+        for run_type, mask in masks.items():
+            if not run_type in RUN_TYPES:
+                raise IOError ('Run type, {0}, is not registered.'.format (run_type))
+            these_starts, these_lengths = get_runs (mask, breaks=breaks)
+            starts.append (these_starts)
+            lengths.append (these_lengths)
+            types.append (numpy.full (len (these_starts), RUN_TYPES[run_type]))
+        self._starts = numpy.concatenate (starts + [[]]).astype (numpy.int32)
+        self._lengths = numpy.concatenate (lengths + [[]]).astype (numpy.int32)
+        self._types = numpy.concatenate (types + [[]]).astype (numpy.int8)
+        self._set_codes = set_codes[self._starts].astype (numpy.int8)
+
+        ## Row boundaries of each month for density queries
+        months = self._times.astype ('datetime64[M]')
+        self._month_starts = numpy.flatnonzero (numpy.r_[True, months[1:] != months[:-1]])
+        self._months = months[self._month_starts]
+
+    def __len__ (self): return len (self._starts)
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def starts (self): return self._starts
+
+    @property
+    def lengths (self): return self._lengths
+
+    @property
+    def types (self): return self._types
+
+    # +------------------------------------------------------------
+    # | Queries
+    # +------------------------------------------------------------
+    def _to_npoints (self, length):
+
+        ''' A private function to convert a run length into # of rows. An int is
+            taken as # of rows; a pandas.Timedelta is converted by TIME_STEP.
+
+            input params
+            ------------
+            length (int or pandas.Timedelta): run length
+
+            return params
+            -------------
+            npoints (int): run length in # of rows
+        '''
+
+        if isinstance (length, pandas.Timedelta):
+            return int (numpy.ceil (length / TIME_STEP))
+        return int (length)
+
+    def _select (self, run_type, set_type=None, min_length=None, max_length=None):
+
+        ''' A private function to select runs of a type with optional set type
+            and length limits.
+
+            input params
+            ------------
+            run_type (str): one of the keys in RUN_TYPES
+            set_type (str): train, validation, or test. None for all sets.
+            min_length (int or pandas.Timedelta): keep runs at least this long
+            max_length (int or pandas.Timedelta): keep runs at most this long
+
+            return params
+            -------------
+            selected (numpy.array): boolean array over runs
+        '''
+
+        if not run_type in RUN_TYPES:
+            raise IOError ('Run type, {0}, is not registered.'.format (run_type))
+        selected = self._types == RUN_TYPES[run_type]
+
+        if set_type is not None:
+            if not set_type in DATASET_TYPES:
+                raise IOError ('Set type, {0}, is not registered.'.format (set_type))
+            selected &= self._set_codes == DATASET_TYPES.index (set_type)
+        if min_length is not None:
+            selected &= self._lengths >= self._to_npoints (min_length)
+        if max_length is not None:
+            selected &= self._lengths <= self._to_npoints (max_length)
+        return selected
+
+    def get_runs (self, run_type, set_type=None, min_length=None, max_length=None):
+
+        ''' A public function to list the runs of a type with optional set type
+            and length limits.
+
+            input params
+            ------------
+            run_type (str): one of the keys in RUN_TYPES
+            set_type (str): train, validation, or test. None for all sets.
+            min_length (int or pandas.Timedelta): keep runs at least this long
+            max_length (int or pandas.Timedelta): keep runs at most this long
+
+            return params
+            -------------
+            runs (pandas.DataFrame): start, length, setType, begin & end times
+        '''
+
+        selected = self._select (run_type, set_type=set_type,
+                                 min_length=min_length, max_length=max_length)
+        starts, lengths = self._starts[selected], self._lengths[selected]
+        return pandas.DataFrame ({'start':starts, 'length':lengths,
+                                  'setType':numpy.array (DATASET_TYPES)[self._set_codes[selected]],
+                                  'begin':self._times[starts],
+                                  'end':self._times[starts + lengths - 1]})
+
+    def get_mask (self, run_type, npoints, set_type=None, min_length=None,
+                  max_length=None):
+
+        ''' A public function to expand the selected runs back into a boolean
+            array over all rows.
+
+            input params
+            ------------
+            run_type (str): one of the keys in RUN_TYPES
+            npoints (int): number of rows in the cleaned dataframe
+            set_type (str): train, validation, or test. None for all sets.
+            min_length (int or pandas.Timedelta): keep runs at least this long
+            max_length (int or pandas.Timedelta): keep runs at most this long
+
+            return params
+            -------------
+            mask (numpy.array): True for rows in the selected runs
+        '''
+
+        selected = self._select (run_type, set_type=set_type,
+                                 min_length=min_length, max_length=max_length)
+        delta = numpy.zeros (npoints + 1, dtype=numpy.int32)
+        numpy.add.at (delta, self._starts[selected], 1)
+        numpy.add.at (delta, self._starts[selected] + self._lengths[selected], -1)
+        return numpy.cumsum (delta[:-1]) > 0
+
+    def get_monthly_density (self, run_type, set_type=None, min_length=None):
+
+        ''' A public function to count the runs and their rows per month. A run
+            that spans two months contributes its rows to both months but is
+            counted once in the month it starts.
+
+            input params
+            ------------
+            run_type (str): one of the keys in RUN_TYPES
+            set_type (str): train, validation, or test. None for all sets.
+            min_length (int or pandas.Timedelta): keep runs at least this long
+
+            return params
+            -------------
+            density (pandas.DataFrame): month, n_runs, n_points, n_total, and
+                                        fraction = n_points / n_total
+        '''
+
+        selected = self._select (run_type, set_type=set_type, min_length=min_length)
+        starts, lengths = self._starts[selected], self._lengths[selected]
+        order = numpy.argsort (starts, kind='stable')
+        starts, lengths = starts[order], lengths[order]
+        ends = starts + lengths
+
+        ## Number of run rows before each month boundary
+        boundaries = numpy.r_[self._month_starts, len (self._times)]
+        cumlength = numpy.r_[0, numpy.cumsum (lengths)]
+        nruns = numpy.searchsorted (starts, boundaries, side='left')
+        overhang = numpy.where (nruns > 0, ends[numpy.maximum (nruns - 1, 0)] - boundaries, 0)
+        covered = cumlength[nruns] - numpy.maximum (overhang, 0)
+
+        n_total = numpy.diff (boundaries)
+        n_points = numpy.diff (covered)
+        return pandas.DataFrame ({'month':self._months,
+                                  'n_runs':numpy.diff (nruns),
+                                  'n_points':n_points, 'n_total':n_total,
+                                  'fraction':n_points / n_total})
+
+    def summarize (self):
+
+        ''' A public function to summarize the runs per type and set.
+
+            return params
+            -------------
+            summary (pandas.DataFrame): n_runs, n_points, max_length per
+                                        run type and set type
+        '''
+
+        names = numpy.array (list (RUN_TYPES.keys()))[numpy.argsort (list (RUN_TYPES.values()))]
+        frame = pandas.DataFrame ({'run_type':names[self._types],
+                                   'setType':numpy.array (DATASET_TYPES)[self._set_codes],
+                                   'length':self._lengths})
+        return frame.groupby (['run_type', 'setType']).length.agg (['count', 'sum', 'max']).rename (
+                    columns={'count':'n_runs', 'sum':'n_points', 'max':'max_length'})
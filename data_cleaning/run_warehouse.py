@@ -0,0 +1,281 @@
+#!python37
+
+## This script defines a run_warehouse class that keeps the cleaning stats of
+## many cleaning runs in one SQLite file. A run is one data_cleaner.clean_
+## stations() call; it is tagged with a run ID, a label (by default the name
+## of the processed folder), and a hash of its configuration, so that runs
+## with the same settings can be found. Tables are
+##  * runs         : run_id, label, config_hash, config (JSON), start / end
+##                   time, and # stations
+##  * station_stats: run_id, station_id, dtype (train / validation / test),
+##                   key (one of CLEAN_STATS_KEYS), value
+##  * diff_stats   : run_id, station_id, key (one of DIFF_STATS_KEYS), value
+## Stats are stored one value per row, so new stats keys need no new columns,
+## and are indexed by key / dtype / station, so comparing a stats key across
+## dozens of runs is one query instead of merging csv files.
+##
+## data_cleaner inserts the stats of each station as soon as it is cleaned,
+## if its warehouse_file is set. compare_sets.py can read runs from it.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import run_warehouse
+## warehouse = run_warehouse.run_warehouse ('C:/to/warehouse.db')
+## runs = warehouse.get_runs ()
+## # n_spikes in train per station (rows) per run (columns)
+## spikes = warehouse.compare_runs ('n_spikes', dtype='train')
+## # All train stats of one run, as in train_stats.csv
+## stats = warehouse.get_stats (runs.run_id.values[-1], 'train')
+## warehouse.close ()
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, sqlite3, hashlib, json, datetime, uuid
+
+###############################################
+## Define constants
+###############################################
+# Table definitions
+SCHEMA = ['''CREATE TABLE IF NOT EXISTS runs (
+                 run_id TEXT PRIMARY KEY, label TEXT, config_hash TEXT, config TEXT,
+                 start_time TEXT, end_time TEXT, n_stations INTEGER)''',
+          '''CREATE TABLE IF NOT EXISTS station_stats (
+                 run_id TEXT, station_id INTEGER, dtype TEXT, key TEXT, value REAL,
+                 PRIMARY KEY (run_id, station_id, dtype, key))''',
+          '''CREATE TABLE IF NOT EXISTS diff_stats (
+                 run_id TEXT, station_id INTEGER, key TEXT, value REAL,
+                 PRIMARY KEY (run_id, station_id, key))''',
+          'CREATE INDEX IF NOT EXISTS station_stats_key ON station_stats (key, dtype, station_id)',
+          'CREATE INDEX IF NOT EXISTS diff_stats_key ON diff_stats (key, station_id)',
+          'CREATE INDEX IF NOT EXISTS runs_config_hash ON runs (config_hash)']
+
+# Format of start / end time
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+###############################################
+## Define functions
+###############################################
+def get_config_hash (config):
+
+    ''' A function to hash a configuration dictionary. The same settings give
+        the same hash regardless of the key order.
+
+        input params
+        ------------
+        config (dict): JSON-able settings of a run
+
+        return params
+        -------------
+        config_hash (str): 12-character sha1 hex digest
+    '''
+
+    text = json.dumps (config, sort_keys=True, default=str)
+    return hashlib.sha1 (text.encode()).hexdigest()[:12]
+
+def _to_value (value):
+
+    ''' A private function to turn a stats value into a float for SQLite. '''
+
+    if value is None: return None
+    value = float (value)
+    return None if numpy.isnan (value) else value
+
+###############################################
+## Define run_warehouse class
+###############################################
+class run_warehouse (object):
+
+    ''' This class reads / writes cleaning stats of runs in a SQLite file. '''
+
+    def __init__ (self, db_file):
+
+        ''' To initialize a run_warehouse on a SQLite file. Tables are created
+            if the file is new.
+
+            input params
+            ------------
+            db_file (str): SQLite file
+        '''
+
+        self._db_file = db_file
+        self._connection = sqlite3.connect (db_file)
+        for statement in SCHEMA: self._connection.execute (statement)
+        self._connection.commit()
+
+        ## Current run
+        self._run_id = None
+        self._n_stations = 0
+
+        ## Logger
+        self._logger = logging.getLogger ('run_warehouse')
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def db_file (self): return self._db_file
+
+    @property
+    def run_id (self): return self._run_id
+
+    # +------------------------------------------------------------
+    # | Write a run
+    # +------------------------------------------------------------
+    def start_run (self, config, label=None):
+
+        ''' A public function to start a new run.
+
+            input params
+            ------------
+            config (dict): JSON-able settings of the run
+            label (str): a readable name of the run e.g. processed folder name
+
+            return params
+            -------------
+            run_id (str): ID of the new run
+        '''
+
+        now = datetime.datetime.now()
+        self._run_id = '{0}_{1}'.format (now.strftime ('%Y%m%d%H%M%S'), uuid.uuid4().hex[:6])
+        self._n_stations = 0
+        label = self._run_id if label is None else label
+        self._connection.execute ('INSERT INTO runs VALUES (?, ?, ?, ?, ?, NULL, 0)',
+                                  (self._run_id, label, get_config_hash (config),
+                                   json.dumps (config, sort_keys=True, default=str),
+                                   now.strftime (TIME_FORMAT)))
+        self._connection.commit()
+        self._logger.info ('Run {0} ({1}) is started.'.format (self._run_id, label))
+        return self._run_id
+
+    def add_station (self, station_id, stats, diff_stats):
+
+        ''' A public function to insert the stats of a cleaned station into
+            the current run.
+
+            input params
+            ------------
+            station_id (int): station ID
+            stats (dict): {dtype: {stats key: value}}
+            diff_stats (dict): {diff stats key: value}
+        '''
+
+        if self._run_id is None:
+            raise IOError ('Please start a run before adding stations.')
+
+        station_id = int (station_id)
+        rows = [(self._run_id, station_id, dtype, key, _to_value (value))
+                for dtype, dtype_stats in stats.items()
+                for key, value in dtype_stats.items()]
+        diff_rows = [(self._run_id, station_id, key, _to_value (value))
+                     for key, value in diff_stats.items()]
+        with self._connection:
+            self._connection.executemany ('INSERT OR REPLACE INTO station_stats VALUES (?, ?, ?, ?, ?)', rows)
+            self._connection.executemany ('INSERT OR REPLACE INTO diff_stats VALUES (?, ?, ?, ?)', diff_rows)
+        self._n_stations += 1
+
+    def finish_run (self):
+
+        ''' A public function to record the end time of the current run. '''
+
+        if self._run_id is None: return
+        with self._connection:
+            self._connection.execute ('UPDATE runs SET end_time = ?, n_stations = ? WHERE run_id = ?',
+                                      (datetime.datetime.now().strftime (TIME_FORMAT),
+                                       self._n_stations, self._run_id))
+        self._logger.info ('Run {0} is finished with {1} stations.'.format (self._run_id, self._n_stations))
+        self._run_id = None
+
+    def close (self):
+
+        ''' A public function to close the SQLite connection. '''
+
+        self._connection.close()
+
+    # +------------------------------------------------------------
+    # | Read runs
+    # +------------------------------------------------------------
+    def get_runs (self, config_hash=None):
+
+        ''' A public function to list runs in the order they started.
+
+            input params
+            ------------
+            config_hash (str): if given, only runs with this config hash
+
+            return params
+            -------------
+            runs (pandas.DataFrame): one row per run
+        '''
+
+        query = 'SELECT * FROM runs'
+        params = ()
+        if config_hash is not None:
+            query += ' WHERE config_hash = ?'
+            params = (config_hash,)
+        return pandas.read_sql_query (query + ' ORDER BY start_time, run_id', self._connection, params=params)
+
+    def get_stats (self, run_id, dtype):
+
+        ''' A public function to get the stats of a run in the same layout as
+            the stats csv files i.e. one row per station and one column per key.
+
+            input params
+            ------------
+            run_id (str): run ID
+            dtype (str): train, validation, test, or diff
+
+            return params
+            -------------
+            stats (pandas.DataFrame): station_id plus one column per stats key
+        '''
+
+        if dtype == 'diff':
+            query = 'SELECT station_id, key, value FROM diff_stats WHERE run_id = ?'
+            params = (run_id,)
+        else:
+            query = 'SELECT station_id, key, value FROM station_stats WHERE run_id = ? AND dtype = ?'
+            params = (run_id, dtype)
+        stats = pandas.read_sql_query (query, self._connection, params=params)
+        stats = stats.pivot (index='station_id', columns='key', values='value')
+        return stats.rename_axis (None, axis=1).reset_index()
+
+    def compare_runs (self, key, dtype='train', run_ids=None):
+
+        ''' A public function to compare one stats key across runs.
+
+            input params
+            ------------
+            key (str): stats key e.g. n_spikes
+            dtype (str): train, validation, test, or diff
+            run_ids (list): runs to compare; None for all runs
+
+            return params
+            -------------
+            values (pandas.DataFrame): value per station (rows) per run (columns)
+                                       in the order runs started; columns are
+                                       run labels, or run IDs if a label is
+                                       used by more than one run
+        '''
+
+        if dtype == 'diff':
+            query = 'SELECT run_id, station_id, value FROM diff_stats WHERE key = ?'
+            params = [key]
+        else:
+            query = 'SELECT run_id, station_id, value FROM station_stats WHERE key = ? AND dtype = ?'
+            params = [key, dtype]
+        if run_ids is not None:
+            query += ' AND run_id IN ({0})'.format (', '.join (['?'] * len (run_ids)))
+            params += list (run_ids)
+        values = pandas.read_sql_query (query, self._connection, params=params)
+        runs = self.get_runs ()
+        if run_ids is not None: runs = runs[runs.run_id.isin (run_ids)]
+        values = values.pivot (index='station_id', columns='run_id', values='value')
+        values = values[[run_id for run_id in runs.run_id if run_id in values.columns]]
+        ## Name columns by labels if they are unique
+        runs = runs[runs.run_id.isin (values.columns)]
+        is_unique = ~runs.label.duplicated (keep=False).values
+        labels = dict (zip (runs.run_id, numpy.where (is_unique, runs.label, runs.run_id)))
+        return values.rename (columns=labels).rename_axis (None, axis=1)
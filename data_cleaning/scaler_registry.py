@@ -0,0 +1,266 @@
+#!python37
+
+## This script defines a scaler_registry class that stores the normalization
+## constants of every station in one small csv file, so that training,
+## evaluation, and inference all scale data the same way.
+##
+## Per station, two scalers are kept:
+##  * gt_range    : GT Range from the station info sheet (Great Diurnal range)
+##  * residual_std: standard deviation of the good PRIMARY_RESIDUAL in the
+##                  training set (TARGET = 1 and PRIMARY_TRUE = 1)
+## They are computed by station.clean_raw_data(), collected by data_cleaner,
+## and written to <proc_path>/scalers.csv.
+##
+## apply() divides the requested columns by their station scaler. It works on
+## single- or multi-station frames (via STATION_ID) and replaces one column at
+## a time, so the frame is never copied as a whole. By default, only the water
+## levels are scaled by GT range, as in the fill notebooks; residuals are kept
+## in meters unless SCALING_WITH_RESIDUALS is used.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import scaler_registry, pandas
+## registry = scaler_registry.scaler_registry ()
+## registry.load ('C:/to/processed/scalers.csv')
+##
+## dataframe = pandas.read_csv ('C:/to/processed/8443970_processed_ver_merged_wl_train.csv')
+## registry.apply (dataframe)
+## ...
+## predictions = registry.unscale (predictions, 8443970)
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, os
+
+###############################################
+## Define constants
+###############################################
+# Columns in registry file
+SCALER_KEYS = ['station_id', 'gt_range', 'residual_std']
+
+# Which columns are scaled by which scaler
+SCALING_GT_ONLY = {'gt_range':['PRIMARY', 'BACKUP', 'PREDICTION', 'VERIFIED',
+                               'NEIGHBOR_PRIMARY', 'NEIGHBOR_PREDICTION']}
+SCALING_WITH_RESIDUALS = dict (SCALING_GT_ONLY,
+                               residual_std=['PRIMARY_RESIDUAL', 'BACKUP_RESIDUAL',
+                                             'VERIFIED_RESIDUAL', 'NEIGHBOR_PRIMARY_RESIDUAL'])
+
+# Key in dataframe.attrs to avoid scaling a frame twice
+SCALED_ATTR = 'scaled_by'
+
+###############################################
+## Define functions
+###############################################
+def get_residual_std (residuals, is_good):
+
+    ''' A function to compute the residual standard deviation from good points.
+
+        input params
+        ------------
+        residuals (array-like): PRIMARY_RESIDUAL
+        is_good (array-like): boolean array; True if the point is good
+
+        return params
+        -------------
+        residual_std (float): standard deviation; nan if no good points
+    '''
+
+    residuals = numpy.asarray (residuals, dtype=float)[numpy.asarray (is_good, dtype=bool)]
+    residuals = residuals[~numpy.isnan (residuals)]
+    return float (residuals.std()) if len (residuals) > 1 else numpy.nan
+
+###############################################
+## Define scaler_registry class
+###############################################
+class scaler_registry (object):
+
+    ''' This class holds the per-station scalers and applies them. '''
+
+    def __init__ (self):
+
+        ## Scalers indexed by station ID
+        self._scalers = pandas.DataFrame (columns=SCALER_KEYS[1:], dtype=float)
+        self._scalers.index.name = SCALER_KEYS[0]
+
+        ## Logger
+        self._logger = logging.getLogger ('scaler_registry')
+
+    def __len__ (self): return len (self._scalers)
+
+    def __contains__ (self, station_id): return int (station_id) in self._scalers.index
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def scalers (self): return self._scalers
+
+    @property
+    def station_ids (self): return self._scalers.index.values
+
+    # +------------------------------------------------------------
+    # | Update / load / save
+    # +------------------------------------------------------------
+    def update (self, station_id, gt_range, residual_std):
+
+        ''' A public function to add or replace the scalers of a station.
+
+            input params
+            ------------
+            station_id (int): station ID
+            gt_range (float): GT range in meters
+            residual_std (float): residual standard deviation in meters
+        '''
+
+        for key, value in zip (SCALER_KEYS[1:], [gt_range, residual_std]):
+            if value is not None and not numpy.isnan (value) and value <= 0:
+                message = 'Station {0} has a non-positive {1}, {2}.'.format (station_id, key, value)
+                self._logger.fatal (message)
+                raise IOError (message)
+        self._scalers.loc[int (station_id)] = [gt_range, residual_std]
+
+    def get (self, station_id):
+
+        ''' A public function to get the scalers of a station.
+
+            input params
+            ------------
+            station_id (int): station ID
+
+            return params
+            -------------
+            scalers (dict): {'gt_range':float, 'residual_std':float}
+        '''
+
+        if not station_id in self:
+            message = 'Station {0} has no scalers in registry.'.format (station_id)
+            self._logger.fatal (message)
+            raise IOError (message)
+        return self._scalers.loc[int (station_id)].to_dict()
+
+    def save (self, filename, merge=True):
+
+        ''' A public function to write the registry as a csv file. If merge
+            and the file exists, stations in the file that are not in this
+            registry are kept e.g. when only a subset of stations is cleaned.
+
+            input params
+            ------------
+            filename (str): output csv file
+            merge (bool): If true, keep other stations in existing file
+        '''
+
+        scalers = self._scalers
+        if merge and os.path.exists (filename):
+            existing = pandas.read_csv (filename, index_col=SCALER_KEYS[0])
+            existing.index = existing.index.astype (int)
+            scalers = pandas.concat ([existing.drop (scalers.index, errors='ignore'), scalers])
+        scalers.sort_index().to_csv (filename)
+        self._logger.info ('Scalers of {0} stations are written to {1}.'.format (len (self), filename))
+
+    def load (self, filename):
+
+        ''' A public function to read a registry csv file. Existing stations
+            are replaced by the ones in the file.
+
+            input params
+            ------------
+            filename (str): registry csv file
+        '''
+
+        if not os.path.exists (filename):
+            message = 'Scaler registry, {0}, does not exist!'.format (filename)
+            self._logger.fatal (message)
+            raise FileNotFoundError (message)
+
+        scalers = pandas.read_csv (filename, index_col=SCALER_KEYS[0])
+        scalers.index = scalers.index.astype (int)
+        self._scalers = pandas.concat ([self._scalers.drop (scalers.index, errors='ignore'),
+                                        scalers[SCALER_KEYS[1:]].astype (float)])
+
+    # +------------------------------------------------------------
+    # | Apply scalers
+    # +------------------------------------------------------------
+    def _get_factors (self, dataframe, station_id, key):
+
+        ''' A private function to get the scaler per row (or one scaler if
+            the frame has one station).
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): station data
+            station_id (int): station ID; None to use STATION_ID column
+            key (str): 'gt_range' or 'residual_std'
+
+            return params
+            -------------
+            factors (float or numpy.array): scaler(s) to divide by
+        '''
+
+        if station_id is not None: return self.get (station_id)[key]
+
+        if not 'STATION_ID' in dataframe:
+            raise IOError ('Please provide station_id or a STATION_ID column.')
+        station_ids = dataframe.STATION_ID.values.astype (int)
+        unique_ids, codes = numpy.unique (station_ids, return_inverse=True)
+        if len (unique_ids) == 1: return self.get (unique_ids[0])[key]
+        return numpy.array ([self.get (sid)[key] for sid in unique_ids])[codes]
+
+    def apply (self, dataframe, station_id=None, scaling=SCALING_GT_ONLY, inverse=False):
+
+        ''' A public function to scale columns in place. Columns that do not
+            exist in the dataframe are skipped.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): station data
+            station_id (int): station ID; None to use STATION_ID column
+            scaling (dict): {scaler key: list of columns}
+            inverse (bool): If true, multiply instead i.e. undo the scaling
+
+            return params
+            -------------
+            dataframe (pandas.DataFrame): the same dataframe, scaled
+        '''
+
+        ## Guard against scaling a frame twice (or unscaling a raw one)
+        is_scaled = dataframe.attrs.get (SCALED_ATTR) is not None
+        if is_scaled != inverse:
+            message = 'Dataframe is already scaled.' if is_scaled else 'Dataframe is not scaled.'
+            self._logger.fatal (message)
+            raise IOError (message)
+
+        for key, columns in scaling.items():
+            factors = self._get_factors (dataframe, station_id, key)
+            if numpy.isnan (factors).any():
+                message = 'Missing {0} scaler; {1} are not scaled.'.format (key, columns)
+                self._logger.warn (message)
+                continue
+            for column in columns:
+                if not column in dataframe: continue
+                values = dataframe[column].values.astype (float)
+                dataframe[column] = values * factors if inverse else values / factors
+
+        dataframe.attrs[SCALED_ATTR] = None if inverse else scaling
+        return dataframe
+
+    def unscale (self, values, station_id, key='gt_range'):
+
+        ''' A public function to convert scaled values (e.g. model outputs)
+            back to meters.
+
+            input params
+            ------------
+            values (array-like): scaled values
+            station_id (int): station ID
+            key (str): 'gt_range' or 'residual_std'
+
+            return params
+            -------------
+            values (numpy.array): values in meters
+        '''
+
+        return numpy.asarray (values, dtype=float) * self.get (station_id)[key]
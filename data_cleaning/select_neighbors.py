@@ -0,0 +1,405 @@
+#!python37
+
+## This script ranks candidate neighbor stations of every station by the
+## cross-correlation of their residuals (VER_WL_VALUE_MSL - PRED_WL_VALUE_MSL)
+## and writes a neighbor table that data_cleaner can use instead of the single
+## neighbor column in the station info sheet.
+##
+## Residuals of all stations are averaged onto a common grid (1 hour by
+## default). For each pair of stations, the normalized cross-correlation is
+## computed at all lags within +/- max_lag from the FFTs of the residuals, of
+## their squares, and of their valid-data masks, so that each lag uses only
+## the period that both stations have (no interpolation over gaps). FFTs of
+## each station are computed once; the pairs are multiplied and inverted in
+## batches. The lag with the highest correlation is refined by a parabola
+## through its neighboring lags and rounded to 6 minutes.
+##
+## LAG_MINUTES in the table is the time by which the neighbor lags the
+## station: the neighbor residual at t + LAG_MINUTES goes with the station
+## residual at t.
+##
+## By default, only data before the end of training period are used so that
+## neighbors are not chosen with validation / testing data.
+##
+## To write a neighbor table:
+## > python select_neighbors.py --raw_path <raw folder>
+##                              --out_file <neighbor table csv>
+##                              (--resolution 1H) (--max_lag 12H)
+##                              (--n_neighbors 5) (--begin 2007-01-01)
+##                              (--end 2016-12-31)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import select_neighbors
+## table = select_neighbors.select_neighbors ('C:/to/raw/')
+## table.to_csv ('C:/to/neighbor_table.csv', index=False)
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, argparse, os
+import scipy.fft
+
+import station_registry
+
+###############################################
+## Define constants
+###############################################
+# Grid of residuals and max lag between stations
+RESOLUTION = '1H'
+MAX_LAG = '12H'
+
+# Min # common grid points of a pair at a lag
+MIN_OVERLAP = 24 * 30
+
+# Max # candidate neighbors per station in the table
+N_NEIGHBORS = 5
+
+# # pairs per FFT batch
+BATCH_SIZE = 32
+
+# Use data before the end of training period by default
+END_DATE = '2016-12-31 23:59'
+
+# Neighbor lags are rounded to the raw data interval
+LAG_STEP_MINUTES = 6
+
+# Columns of neighbor table
+TABLE_COLUMNS = ['STATION_ID', 'RANK', 'NEIGHBOR_ID', 'LAG_MINUTES',
+                 'CORRELATION', 'N_OVERLAP']
+
+# Sentinel of missing values in raw files
+MISSING_VALUE = -99999.999
+
+###############################################
+## Define functions
+###############################################
+def read_residuals (raw_file, begin=None, end=END_DATE):
+
+    ''' A function to read verified residuals from a raw file.
+
+        input params
+        ------------
+        raw_file (str): raw csv file
+        begin (str or pandas.Timestamp): first time to use; None for all
+        end (str or pandas.Timestamp): last time to use; None for all
+
+        return params
+        -------------
+        residuals (pandas.Series): VER_WL_VALUE_MSL - PRED_WL_VALUE_MSL
+                                   indexed by DATE_TIME
+    '''
+
+    dataframe = pandas.read_csv (raw_file, usecols=['DATE_TIME', 'VER_WL_VALUE_MSL', 'PRED_WL_VALUE_MSL'])
+    times = pandas.to_datetime (dataframe.DATE_TIME)
+    residuals = dataframe.VER_WL_VALUE_MSL.values - dataframe.PRED_WL_VALUE_MSL.values
+    residuals[(dataframe.VER_WL_VALUE_MSL.values == MISSING_VALUE) |
+              (dataframe.PRED_WL_VALUE_MSL.values == MISSING_VALUE)] = numpy.nan
+
+    is_kept = numpy.isfinite (residuals)
+    if begin is not None: is_kept &= (times >= pandas.to_datetime (begin)).values
+    if end is not None: is_kept &= (times <= pandas.to_datetime (end)).values
+    return pandas.Series (residuals[is_kept], index=times[is_kept].values, name=os.path.basename (raw_file))
+
+def grid_residuals (residuals, resolution=RESOLUTION):
+
+    ''' A function to average residuals of all stations onto a common grid.
+
+        input params
+        ------------
+        residuals (list): pandas.Series of residuals per station
+        resolution (str or pandas.Timedelta): grid spacing
+
+        return params
+        -------------
+        begin (pandas.Timestamp): time of the first grid point
+        grid (numpy.array): float32 (# stations, # grid points); NaN if no data
+    '''
+
+    step = pandas.Timedelta (resolution).value
+    series = [aseries for aseries in residuals if len (aseries) > 0]
+    if len (series) == 0:
+        return None, numpy.full ((len (residuals), 0), numpy.nan, dtype=numpy.float32)
+    first = min (aseries.index.values.min() for aseries in series).astype ('datetime64[ns]').astype (numpy.int64)
+    last = max (aseries.index.values.max() for aseries in series).astype ('datetime64[ns]').astype (numpy.int64)
+    first -= first % step
+    n_points = int ((last - first) // step) + 1
+
+    grid = numpy.full ((len (residuals), n_points), numpy.nan, dtype=numpy.float32)
+    for index, aseries in enumerate (residuals):
+        if len (aseries) == 0: continue
+        bins = (aseries.index.values.astype ('datetime64[ns]').astype (numpy.int64) - first) // step
+        counts = numpy.bincount (bins, minlength=n_points)
+        sums = numpy.bincount (bins, weights=aseries.values, minlength=n_points)
+        has_data = counts > 0
+        grid[index, has_data] = sums[has_data] / counts[has_data]
+    return pandas.Timestamp (first), grid
+
+def cross_correlate (grid, max_lag, min_overlap=MIN_OVERLAP, batch_size=BATCH_SIZE):
+
+    ''' A function to get the best lag and correlation of all pairs of gridded
+        residuals with FFTs. For each pair, the correlation at a lag only uses
+        the grid points that both series have.
+
+        input params
+        ------------
+        grid (numpy.array): (# stations, # grid points); NaN if no data
+        max_lag (int): max lag in # grid points
+        min_overlap (int): min # common grid points at a lag
+        batch_size (int): # pairs per FFT batch
+
+        return params
+        -------------
+        correlations (numpy.array): (# stations, # stations) best correlation;
+                                    NaN if never enough overlap
+        lags (numpy.array): (# stations, # stations) best lag in # grid points
+                            by which the column station lags the row station
+        overlaps (numpy.array): (# stations, # stations) # common points at
+                                the best lag
+    '''
+
+    n_stations, n_points = grid.shape
+    correlations = numpy.full ((n_stations, n_stations), numpy.nan)
+    lags = numpy.full ((n_stations, n_stations), numpy.nan)
+    overlaps = numpy.zeros ((n_stations, n_stations), dtype=int)
+    if n_stations < 2 or n_points == 0: return correlations, lags, overlaps
+    max_lag = min (max_lag, n_points - 1)
+
+    ## Zero-padded so that lags up to max_lag do not wrap around
+    n_fft = scipy.fft.next_fast_len (n_points + max_lag, real=True)
+
+    ## Remove the mean of each station to keep float32 sums accurate
+    masks = numpy.isfinite (grid)
+    means = numpy.array ([row[mask].mean() if mask.any() else 0. for row, mask in zip (grid, masks)])
+    values = numpy.where (masks, grid - means[:, None].astype (numpy.float32), 0).astype (numpy.float32)
+
+    ## FFTs of values, squared values, and masks of each station
+    spectra = {'x' :scipy.fft.rfft (values, n=n_fft, axis=1, workers=-1),
+               'xx':scipy.fft.rfft (values**2, n=n_fft, axis=1, workers=-1),
+               'm' :scipy.fft.rfft (masks.astype (numpy.float32), n=n_fft, axis=1, workers=-1)}
+
+    pairs = numpy.transpose (numpy.triu_indices (n_stations, k=1))
+    for start in range (0, len (pairs), batch_size):
+        rows, columns = pairs[start:start+batch_size].T
+        lefts = {key:numpy.conj (spectrum[rows]) for key, spectrum in spectra.items()}
+        rights = {key:spectrum[columns] for key, spectrum in spectra.items()}
+
+        ## Sums of a(t) b(t+k) at lags k within max_lag: irfft (conj (A) B)
+        def correlate (a, b):
+            window = scipy.fft.irfft (lefts[a] * rights[b], n=n_fft, axis=1, workers=-1)
+            return numpy.concatenate ([window[:, n_fft-max_lag:], window[:, :max_lag+1]], axis=1).astype (float)
+
+        n_common = numpy.round (correlate ('m', 'm'))
+        sum_xy = correlate ('x', 'x')
+        sum_x, sum_y = correlate ('x', 'm'), correlate ('m', 'x')
+        sum_xx, sum_yy = correlate ('xx', 'm'), correlate ('m', 'xx')
+
+        ## Normalized correlation over the common points at each lag
+        with numpy.errstate (divide='ignore', invalid='ignore'):
+            covariance = sum_xy - sum_x * sum_y / n_common
+            variance = (sum_xx - sum_x**2 / n_common) * (sum_yy - sum_y**2 / n_common)
+            correlation = covariance / numpy.sqrt (variance)
+        correlation[(n_common < max (min_overlap, 2)) | ~(variance > 0)] = numpy.nan
+
+        ## Best lag per pair, refined by a parabola through its neighbors
+        has_any = numpy.isfinite (correlation).any (axis=1)
+        best = numpy.nanargmax (numpy.where (numpy.isfinite (correlation), correlation, -numpy.inf), axis=1)
+        indices = numpy.arange (len (rows))
+        peak = correlation[indices, best]
+        before = correlation[indices, numpy.maximum (best - 1, 0)]
+        after = correlation[indices, numpy.minimum (best + 1, 2 * max_lag)]
+        curvature = before - 2 * peak + after
+        is_inside = (best > 0) & (best < 2 * max_lag) & (curvature < 0) & \
+                    numpy.isfinite (before) & numpy.isfinite (after)
+        with numpy.errstate (divide='ignore', invalid='ignore'):
+            shift = numpy.where (is_inside, 0.5 * (before - after) / curvature, 0.)
+        best_lag = best - max_lag + numpy.clip (shift, -0.5, 0.5)
+
+        rows, columns = rows[has_any], columns[has_any]
+        correlations[rows, columns] = correlations[columns, rows] = peak[has_any]
+        lags[rows, columns], lags[columns, rows] = best_lag[has_any], -best_lag[has_any]
+        overlaps[rows, columns] = overlaps[columns, rows] = n_common[indices, best][has_any]
+
+    return correlations, lags, overlaps
+
+def rank_neighbors (station_ids, correlations, lags, overlaps, resolution=RESOLUTION,
+                    n_neighbors=N_NEIGHBORS, min_correlation=0.):
+
+    ''' A function to rank candidate neighbors of each station by correlation.
+
+        input params
+        ------------
+        station_ids (list): station IDs in the order of the matrices
+        correlations (numpy.array): best correlations from cross_correlate()
+        lags (numpy.array): best lags in # grid points from cross_correlate()
+        overlaps (numpy.array): # common points from cross_correlate()
+        resolution (str or pandas.Timedelta): grid spacing
+        n_neighbors (int): max # neighbors per station
+        min_correlation (float): min correlation of a candidate
+
+        return params
+        -------------
+        table (pandas.DataFrame): neighbor table with TABLE_COLUMNS
+    '''
+
+    step_minutes = pandas.Timedelta (resolution).total_seconds() / 60.
+    rows = []
+    for index, station_id in enumerate (station_ids):
+        candidates = numpy.flatnonzero (numpy.isfinite (correlations[index]) &
+                                        (correlations[index] >= min_correlation))
+        candidates = candidates[numpy.argsort (-correlations[index, candidates], kind='stable')][:n_neighbors]
+        for rank, candidate in enumerate (candidates):
+            lag = int (numpy.round (lags[index, candidate] * step_minutes / LAG_STEP_MINUTES)) * LAG_STEP_MINUTES
+            rows.append ([int (station_id), rank + 1, int (station_ids[candidate]), lag,
+                          round (float (correlations[index, candidate]), 6), int (overlaps[index, candidate])])
+    return pandas.DataFrame (rows, columns=TABLE_COLUMNS)
+
+def select_neighbors (raw_path, station_ids=None, begin=None, end=END_DATE,
+                      resolution=RESOLUTION, max_lag=MAX_LAG, min_overlap=MIN_OVERLAP,
+                      n_neighbors=N_NEIGHBORS, min_correlation=0., batch_size=BATCH_SIZE):
+
+    ''' A function to build the neighbor table of stations in a raw folder.
+
+        input params
+        ------------
+        raw_path (str): Path to Armins unzipped raw files
+        station_ids (list): stations to consider; None for all raw files
+        begin (str or pandas.Timestamp): first time to use; None for all
+        end (str or pandas.Timestamp): last time to use; None for all
+        resolution (str or pandas.Timedelta): grid spacing of residuals
+        max_lag (str or pandas.Timedelta): max lag between stations
+        min_overlap (int): min # common grid points of a pair
+        n_neighbors (int): max # neighbors per station
+        min_correlation (float): min correlation of a candidate
+        batch_size (int): # pairs per FFT batch
+
+        return params
+        -------------
+        table (pandas.DataFrame): neighbor table with TABLE_COLUMNS
+    '''
+
+    logger = logging.getLogger ('select_neighbors')
+
+    ## Find raw files
+    files = {}
+    for filename in sorted (os.listdir (raw_path)):
+        station_id, key = station_registry.parse_file_name (filename)
+        if key != 'raw': continue
+        if station_ids is not None and not station_id in station_ids: continue
+        files[station_id] = os.path.join (raw_path, filename)
+    logger.info ('Found raw files of {0} stations in {1}.'.format (len (files), raw_path))
+
+    ## Read residuals onto a common grid
+    residuals = [read_residuals (filename, begin=begin, end=end) for filename in files.values()]
+    _, grid = grid_residuals (residuals, resolution=resolution)
+    logger.info ('Residuals are on a grid of {0} points every {1}.'.format (grid.shape[1], resolution))
+
+    ## Correlate all pairs and rank them
+    step = pandas.Timedelta (resolution)
+    correlations, lags, overlaps = cross_correlate (grid, int (pandas.Timedelta (max_lag) // step),
+                                                    min_overlap=min_overlap, batch_size=batch_size)
+    table = rank_neighbors (list (files.keys()), correlations, lags, overlaps, resolution=resolution,
+                            n_neighbors=n_neighbors, min_correlation=min_correlation)
+    logger.info ('{0} candidate neighbors are ranked.'.format (len (table)))
+    return table
+
+def load_neighbor_table (filename):
+
+    ''' A function to read a neighbor table.
+
+        input params
+        ------------
+        filename (str): neighbor table csv
+
+        return params
+        -------------
+        table (pandas.DataFrame): neighbor table with TABLE_COLUMNS
+    '''
+
+    table = pandas.read_csv (filename)
+    missing = [column for column in TABLE_COLUMNS if not column in table]
+    if len (missing) > 0:
+        raise IOError ('Neighbor table, {0}, does not have columns, {1}.'.format (filename, missing))
+    return table
+
+def get_best_neighbors (table):
+
+    ''' A function to get the top-ranked neighbor of each station.
+
+        input params
+        ------------
+        table (pandas.DataFrame): neighbor table with TABLE_COLUMNS
+
+        return params
+        -------------
+        neighbors (dict): {station ID: (neighbor ID, lag in minutes)}
+    '''
+
+    best = table.sort_values (by=['STATION_ID', 'RANK']).drop_duplicates (subset='STATION_ID')
+    return {int (station_id):(int (neighbor_id), int (lag))
+            for station_id, neighbor_id, lag in zip (best.STATION_ID, best.NEIGHBOR_ID, best.LAG_MINUTES)}
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='Rank neighbor stations by residual cross-correlation')
+    parser.add_argument('-r', '--raw_path', required=True, type=str,
+                        help='Path to Armins unzipped raw files')
+    parser.add_argument('-o', '--out_file', required=True, type=str,
+                        help='Neighbor table csv to write')
+    parser.add_argument('-b', '--begin', default=None, type=str,
+                        help='First date to use; all data by default')
+    parser.add_argument('-e', '--end', default=END_DATE, type=str,
+                        help='Last date to use; end of training period by default')
+    parser.add_argument('-g', '--resolution', default=RESOLUTION, type=str,
+                        help='Grid spacing of residuals e.g. 1H')
+    parser.add_argument('-m', '--max_lag', default=MAX_LAG, type=str,
+                        help='Max lag between stations e.g. 12H')
+    parser.add_argument('-n', '--n_neighbors', default=N_NEIGHBORS, type=int,
+                        help='Max # neighbors per station')
+    parser.add_argument('-l', '--log_level', default='info', type=str,
+                        help='Log level: info, debug, warn, error')
+    args = parser.parse_args()
+
+    ## Check if raw path exists
+    if not os.path.exists (args.raw_path):
+        message = 'Raw folder, {0}, does not exist!'.format (args.raw_path)
+        raise FileNotFoundError (message)
+
+    ## Check if grid and lag are positive
+    if pandas.Timedelta (args.resolution) <= pandas.Timedelta (0) or \
+       pandas.Timedelta (args.max_lag) < pandas.Timedelta (0):
+        message = 'Resolution must be positive and max lag cannot be negative.'
+        raise IOError (message)
+
+    ## Check if log level is one of info / debug / warn / error
+    if not args.log_level.lower() in ['debug', 'info', 'warn', 'error']:
+        message = 'Log level must be either debug, info, warn, or error.'
+        raise IOError (message)
+
+    return args
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    args = get_parser ()
+
+    ## Set log level
+    logging.basicConfig (level=getattr (logging, args.log_level.upper()))
+
+    table = select_neighbors (args.raw_path, begin=args.begin, end=args.end,
+                              resolution=args.resolution, max_lag=args.max_lag,
+                              n_neighbors=args.n_neighbors)
+    table.to_csv (args.out_file, index=False)
+    print ('Neighbor table of {0} stations is written to {1}.'.format (table.STATION_ID.nunique(), args.out_file))
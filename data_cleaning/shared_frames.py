@@ -0,0 +1,441 @@
+#!python37
+
+## This script defines a shared-memory store for cleaned station dataframes,
+## so that station workers (separate processes) can hand a cleaned dataframe
+## to the worker that adds neighbor columns without pickling it.
+##  * publish_frame() copies the index and columns of a dataframe into one
+##    shared memory segment, once, and returns a small handle (a dictionary
+##    with the segment name and the dtype / offset of each column). Only the
+##    handle is pickled between processes.
+##  * attach_frame() maps a segment by its handle. Columns are numpy views on
+##    the segment i.e. no copies; e.g. NEIGHBOR_xxx columns are read from the
+##    neighbor segment directly.
+##  * shared_frame_store is kept by the process that owns the segments. Each
+##    adopted segment has a # consumers; release() is called when a consumer
+##    is done, and the segment is freed after the last one. close() frees
+##    everything left e.g. when cleaning fails half way.
+##
+## Numeric and boolean columns are stored as is; datetime columns as int64
+## nanoseconds; object columns (e.g. SENSOR_USED_PRIMARY, setType) as int32
+## codes with their categories kept in the handle.
+##
+## On POSIX, segments are tracked by the multiprocessing resource tracker of
+## the owner process, which workers share when they are started after the
+## store. If everything crashes, the tracker frees the segments on exit.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import shared_frames
+## # In a worker: publish a cleaned dataframe and return its handle
+## handle = shared_frames.publish_frame (dataframe)
+##
+## # In the owner: adopt it for 2 consumers
+## store = shared_frames.shared_frame_store ()
+## store.adopt (8443970, handle, n_consumers=2)
+##
+## # In a consumer: read a column without copying
+## with shared_frames.attach_frame (handle) as frame:
+##     primary = frame['PRIMARY']
+##     ...
+## store.release (8443970)
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, os
+
+## shared_memory is only available from python 3.8
+try:
+    from multiprocessing import shared_memory, resource_tracker
+    HAS_SHARED_MEMORY = True
+except ImportError:
+    shared_memory, resource_tracker = None, None
+    HAS_SHARED_MEMORY = False
+
+###############################################
+## Define constants
+###############################################
+# Column offsets in a segment are aligned to this many bytes
+ALIGNMENT = 8
+
+# dtype of codes of object columns
+CODE_DTYPE = 'int32'
+
+###############################################
+## Define functions
+###############################################
+def _check_shared_memory ():
+
+    ''' A private function to make sure shared memory is available. '''
+
+    if not HAS_SHARED_MEMORY:
+        raise IOError ('Shared memory requires python 3.8 or later.')
+
+def _encode_column (series):
+
+    ''' A private function to turn a column into a 1D numpy array that can be
+        copied into a segment.
+
+        input params
+        ------------
+        series (pandas.Series or pandas.Index): column to encode
+
+        return params
+        -------------
+        values (numpy.array): array to copy into the segment
+        kind (str): 'values', 'datetime', or 'codes'
+        categories (list): categories of an object column; None otherwise
+    '''
+
+    if pandas.api.types.is_datetime64_ns_dtype (series.dtype) and \
+       not pandas.api.types.is_datetime64tz_dtype (series.dtype):
+        return numpy.asarray (series).view ('int64'), 'datetime', None
+    if isinstance (series.dtype, numpy.dtype) and series.dtype.kind in 'biuf':
+        return numpy.ascontiguousarray (series), 'values', None
+    codes, categories = pandas.factorize (series, sort=False)
+    return codes.astype (CODE_DTYPE), 'codes', list (categories)
+
+def _decode_column (values, spec):
+
+    ''' A private function to turn a view on a segment back into column values.
+        Numeric and datetime columns remain views; object columns are copied.
+
+        input params
+        ------------
+        values (numpy.array): view on the segment
+        spec (dict): column spec from the handle
+
+        return params
+        -------------
+        values (numpy.array): column values
+    '''
+
+    if spec['kind'] == 'datetime':
+        return values.view ('datetime64[ns]')
+    if spec['kind'] == 'values':
+        return values
+    ## Codes of -1 were NaN / None
+    categories = numpy.empty (len (spec['categories']) + 1, dtype=object)
+    categories[:-1] = spec['categories']
+    categories[-1] = numpy.nan
+    return categories[values]
+
+def publish_frame (dataframe, columns=None):
+
+    ''' A function to copy the index and columns of a dataframe into a new
+        shared memory segment. The caller (or the owner it hands the handle
+        to) must unlink the segment when it is no longer needed.
+
+        input params
+        ------------
+        dataframe (pandas.DataFrame): dataframe to publish
+        columns (list): columns to publish; None for all
+
+        return params
+        -------------
+        handle (dict): picklable description of the segment
+    '''
+
+    _check_shared_memory()
+    columns = list (dataframe.columns) if columns is None else list (columns)
+
+    ## Lay out index and columns one after another
+    arrays, specs, size = [], [], 0
+    items = [(dataframe.index.name, dataframe.index)] + \
+            [(column, dataframe[column]) for column in columns]
+    for name, series in items:
+        values, kind, categories = _encode_column (series)
+        arrays.append (values)
+        specs.append ({'name':name, 'dtype':values.dtype.str, 'kind':kind,
+                       'offset':size, 'categories':categories})
+        size += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+
+    ## Copy everything into the segment
+    segment = shared_memory.SharedMemory (create=True, size=max (size, 1))
+    try:
+        for values, spec in zip (arrays, specs):
+            view = numpy.ndarray (values.shape, dtype=values.dtype,
+                                  buffer=segment.buf, offset=spec['offset'])
+            view[:] = values
+            del view
+    except Exception:
+        segment.close()
+        segment.unlink()
+        raise
+    segment.close()
+
+    return {'name':segment.name, 'size':size, 'nrows':len (dataframe),
+            'index':specs[0], 'columns':specs[1:]}
+
+def attach_frame (handle):
+
+    ''' A function to map a published segment.
+
+        input params
+        ------------
+        handle (dict): handle from publish_frame()
+
+        return params
+        -------------
+        frame (shared_frame): read-only access to index and columns
+    '''
+
+    return shared_frame (handle)
+
+def unlink_frame (handle):
+
+    ''' A function to free a published segment that no store has adopted.
+
+        input params
+        ------------
+        handle (dict): handle from publish_frame()
+    '''
+
+    _check_shared_memory()
+    try:
+        segment = shared_memory.SharedMemory (name=handle['name'])
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
+
+###############################################
+## Define shared_frame class
+###############################################
+class shared_frame (object):
+
+    ''' This class reads the index and columns of a segment without copies. '''
+
+    def __init__ (self, handle):
+
+        ''' To initialize a shared_frame by mapping the segment of a handle.
+
+            input params
+            ------------
+            handle (dict): handle from publish_frame()
+        '''
+
+        _check_shared_memory()
+        self._handle = handle
+        self._segment = shared_memory.SharedMemory (name=handle['name'])
+        self._specs = {spec['name']:spec for spec in handle['columns']}
+        self._index = None
+
+        ## Logger
+        self._logger = logging.getLogger ('shared_frame')
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args):
+        self.close()
+        return False
+
+    def __len__ (self): return self._handle['nrows']
+
+    def __contains__ (self, column): return column in self._specs
+
+    def __getitem__ (self, column):
+
+        ''' To get a column as a pandas series on the frame index. Numeric and
+            datetime columns are views on the segment.
+
+            input params
+            ------------
+            column (str): column name
+
+            return params
+            -------------
+            series (pandas.Series): read-only column
+        '''
+
+        if not column in self._specs:
+            raise KeyError ('Column, {0}, is not in shared frame {1}.'.format (column, self.name))
+        values = _decode_column (self._view (self._specs[column]), self._specs[column])
+        return pandas.Series (values, index=self.index, name=column, copy=False)
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def name (self): return self._handle['name']
+
+    @property
+    def columns (self): return [spec['name'] for spec in self._handle['columns']]
+
+    @property
+    def index (self):
+        if self._index is None:
+            spec = self._handle['index']
+            values = _decode_column (self._view (spec), spec)
+            self._index = pandas.Index (values, name=spec['name'], copy=False)
+        return self._index
+
+    # +------------------------------------------------------------
+    # | Read and close
+    # +------------------------------------------------------------
+    def _view (self, spec):
+
+        ''' A private function to get a read-only numpy view of a column. '''
+
+        if self._segment is None:
+            raise IOError ('Shared frame {0} is closed.'.format (self.name))
+        view = numpy.frombuffer (self._segment.buf, dtype=numpy.dtype (spec['dtype']),
+                                 count=self._handle['nrows'], offset=spec['offset'])
+        view.flags.writeable = False
+        return view
+
+    def to_dataframe (self, columns=None):
+
+        ''' A public function to copy columns into a regular dataframe that
+            stays valid after the frame is closed.
+
+            input params
+            ------------
+            columns (list): columns to copy; None for all
+
+            return params
+            -------------
+            dataframe (pandas.DataFrame): copied index and columns
+        '''
+
+        columns = self.columns if columns is None else list (columns)
+        index = pandas.Index (self.index.values.copy(), name=self.index.name)
+        return pandas.DataFrame ({column:self[column].values.copy() for column in columns},
+                                 index=index, columns=columns)
+
+    def close (self):
+
+        ''' A public function to unmap the segment. Views still held by the
+            caller keep the mapping alive until they are dropped.
+        '''
+
+        if self._segment is None: return
+        self._index = None
+        segment, self._segment = self._segment, None
+        try:
+            segment.close()
+        except BufferError:
+            ## Views on it are still in use; unmapped when they are collected
+            self._logger.debug ('Shared frame {0} is still in use.'.format (self.name))
+
+###############################################
+## Define shared_frame_store class
+###############################################
+class shared_frame_store (object):
+
+    ''' This class owns published segments and frees them after their last
+        consumer.
+    '''
+
+    def __init__ (self):
+
+        ''' To initialize an empty shared_frame_store. On POSIX, the resource
+            tracker is started now so that worker processes started after the
+            store share it.
+        '''
+
+        _check_shared_memory()
+        if os.name == 'posix': resource_tracker.ensure_running()
+
+        ## {key: [segment, handle, # consumers]}
+        self._frames = {}
+
+        ## Logger
+        self._logger = logging.getLogger ('shared_frame_store')
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args):
+        self.close()
+        return False
+
+    def __len__ (self): return len (self._frames)
+
+    def __contains__ (self, key): return key in self._frames
+
+    @property
+    def nbytes (self): return sum ([frame[1]['size'] for frame in self._frames.values()])
+
+    def adopt (self, key, handle, n_consumers=0):
+
+        ''' A public function to take ownership of a published segment.
+
+            input params
+            ------------
+            key (any): key of the segment e.g. station ID
+            handle (dict): handle from publish_frame()
+            n_consumers (int): # release() calls before it is freed
+        '''
+
+        if key in self._frames:
+            raise IOError ('Shared frame key, {0}, is already in the store.'.format (key))
+        segment = shared_memory.SharedMemory (name=handle['name'])
+        self._frames[key] = [segment, handle, n_consumers]
+
+    def publish (self, key, dataframe, columns=None, n_consumers=0):
+
+        ''' A public function to publish a dataframe and adopt its segment.
+
+            input params
+            ------------
+            key (any): key of the segment e.g. station ID
+            dataframe (pandas.DataFrame): dataframe to publish
+            columns (list): columns to publish; None for all
+            n_consumers (int): # release() calls before it is freed
+
+            return params
+            -------------
+            handle (dict): handle to pass to consumers
+        '''
+
+        handle = publish_frame (dataframe, columns=columns)
+        self.adopt (key, handle, n_consumers=n_consumers)
+        return handle
+
+    def get_handle (self, key): return self._frames[key][1]
+
+    def add_consumers (self, key, n_consumers=1):
+
+        ''' A public function to add consumers to an adopted segment.
+
+            input params
+            ------------
+            key (any): key of the segment
+            n_consumers (int): # more release() calls before it is freed
+        '''
+
+        self._frames[key][2] += n_consumers
+
+    def release (self, key):
+
+        ''' A public function to tell the store a consumer is done. After the
+            last consumer, the segment is freed.
+
+            input params
+            ------------
+            key (any): key of the segment
+        '''
+
+        self._frames[key][2] -= 1
+        if self._frames[key][2] <= 0: self._unlink (key)
+
+    def _unlink (self, key):
+
+        ''' A private function to free a segment. '''
+
+        segment, handle, _ = self._frames.pop (key)
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+        self._logger.debug ('Shared frame {0} ({1}) is freed.'.format (key, handle['name']))
+
+    def close (self):
+
+        ''' A public function to free all segments left in the store. '''
+
+        for key in list (self._frames.keys()):
+            self._unlink (key)
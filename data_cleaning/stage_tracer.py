@@ -0,0 +1,304 @@
+#!python37
+
+## This script defines a stage_tracer class that times the cleaning stages.
+## Each stage is wrapped in a span (a context manager) that records
+##  * wall_s  : wall-clock time in seconds
+##  * cpu_s   : CPU time of the thread running the stage in seconds; CPU of
+##              other threads (e.g. io_pipeline reader / writer) is not in it
+##  * rows_in / rows_out: # rows before / after the stage, if given
+##  * rss_mb  : growth of the peak resident memory (MB) during the stage
+## together with the stage name, its parent stage, and the station ID / group.
+##
+## Each finished span is appended as one JSON line to the trace file (if set)
+## and kept in memory for summarize(), a per-stage table sorted by total wall
+## time. load_trace() reads one or more trace files back to aggregate across
+## stations and runs.
+##
+## When disabled, span() returns one shared do-nothing span, so a disabled
+## tracer costs a function call per stage. station and data_cleaner use a
+## disabled tracer by default.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import stage_tracer
+## tracer = stage_tracer.stage_tracer (trace_file='C:/to/processed/trace.jsonl')
+## with tracer.span ('load_raw_data', station_id=8443970) as span:
+##     dataframe = ...
+##     span.rows_out = len (dataframe)
+## summary = tracer.summarize ()
+##
+## # Later, aggregate all runs
+## trace = stage_tracer.load_trace (['run1/trace.jsonl', 'run2/trace.jsonl'])
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, json, time, sys
+
+## resource is not available on Windows; memory is then not recorded
+try:
+    import resource
+except ImportError:
+    resource = None
+
+###############################################
+## Define constants
+###############################################
+# Keys of a span record
+SPAN_KEYS = ['stage', 'parent', 'station_id', 'group', 'start', 'wall_s', 'cpu_s',
+             'rows_in', 'rows_out', 'rss_mb']
+
+# Columns of the summary table
+SUMMARY_KEYS = ['n_spans', 'wall_s', 'wall_s_mean', 'wall_s_max', 'cpu_s',
+                'rows_in', 'rows_out', 'rss_mb_max', 'wall_fraction']
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_TO_MB = 1. / 1024**2 if sys.platform == 'darwin' else 1. / 1024
+
+###############################################
+## Define functions
+###############################################
+def get_peak_rss ():
+
+    ''' A function to get the peak resident memory of this process in MB.
+
+        return params
+        -------------
+        peak_rss (float): peak RSS in MB; None if not available
+    '''
+
+    if resource is None: return None
+    return resource.getrusage (resource.RUSAGE_SELF).ru_maxrss * RSS_TO_MB
+
+def load_trace (filenames):
+
+    ''' A function to read JSON-lines trace file(s) into one dataframe.
+
+        input params
+        ------------
+        filenames (str or list): trace file(s)
+
+        return params
+        -------------
+        trace (pandas.DataFrame): one row per span
+    '''
+
+    filenames = [filenames] if isinstance (filenames, str) else filenames
+    return pandas.concat ([pandas.read_json (filename, lines=True) for filename in filenames],
+                          ignore_index=True)
+
+def summarize_trace (trace):
+
+    ''' A function to aggregate spans per stage, sorted by total wall time.
+
+        input params
+        ------------
+        trace (pandas.DataFrame): one row per span with SPAN_KEYS columns
+
+        return params
+        -------------
+        summary (pandas.DataFrame): SUMMARY_KEYS per stage
+    '''
+
+    if len (trace) == 0: return pandas.DataFrame (columns=SUMMARY_KEYS)
+
+    groups = trace.groupby ('stage')
+    summary = pandas.DataFrame ({'n_spans':groups.size(),
+                                 'wall_s':groups.wall_s.sum(),
+                                 'wall_s_mean':groups.wall_s.mean(),
+                                 'wall_s_max':groups.wall_s.max(),
+                                 'cpu_s':groups.cpu_s.sum(),
+                                 'rows_in':groups.rows_in.sum (min_count=1),
+                                 'rows_out':groups.rows_out.sum (min_count=1),
+                                 'rss_mb_max':groups.rss_mb.max()})
+    ## Fraction of the total wall time of the top-level spans
+    total_wall = trace.wall_s[trace.parent.isna()].sum()
+    summary['wall_fraction'] = summary.wall_s / total_wall if total_wall > 0 else numpy.nan
+    return summary.sort_values ('wall_s', ascending=False)
+
+###############################################
+## Define span classes
+###############################################
+class _null_span (object):
+
+    ''' A do-nothing span returned by a disabled tracer. '''
+
+    __slots__ = ()
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args): return False
+
+    def __setattr__ (self, key, value): pass
+
+NULL_SPAN = _null_span ()
+
+class stage_span (object):
+
+    ''' This class records one stage. Set rows_out inside the with-block. '''
+
+    def __init__ (self, tracer, stage, station_id=None, group=None, rows_in=None):
+
+        self._tracer = tracer
+        self.stage = stage
+        self.station_id = station_id
+        self.group = group
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.parent = None
+
+    def __enter__ (self):
+
+        self.parent = self._tracer._push (self)
+        self._rss = get_peak_rss ()
+        self._start = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__ (self, *args):
+
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        rss = get_peak_rss ()
+        record = {'stage':self.stage, 'parent':self.parent, 'station_id':self.station_id,
+                  'group':self.group, 'start':self._start, 'wall_s':wall, 'cpu_s':cpu,
+                  'rows_in':self.rows_in, 'rows_out':self.rows_out,
+                  'rss_mb':None if rss is None else rss - self._rss}
+        self._tracer._pop (record)
+        return False
+
+###############################################
+## Define stage_tracer class
+###############################################
+class stage_tracer (object):
+
+    ''' This class creates spans and collects their records. '''
+
+    def __init__ (self, trace_file=None, enabled=True):
+
+        ''' To initialize a new stage_tracer.
+
+            input params
+            ------------
+            trace_file (str): JSON-lines file to append span records; None
+                              to keep records in memory only
+            enabled (bool): If false, all spans do nothing
+        '''
+
+        self._trace_file = trace_file
+        self._enabled = enabled
+        self._stack = []
+        self._records = []
+
+        ## Logger
+        self._logger = logging.getLogger ('stage_tracer')
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def enabled (self): return self._enabled
+
+    @property
+    def trace_file (self): return self._trace_file
+
+    @property
+    def records (self): return pandas.DataFrame (self._records, columns=SPAN_KEYS)
+
+    # +------------------------------------------------------------
+    # | Spans
+    # +------------------------------------------------------------
+    def span (self, stage, station_id=None, group=None, rows_in=None):
+
+        ''' A public function to create a span for a stage.
+
+            input params
+            ------------
+            stage (str): name of the stage
+            station_id (int): station ID, if any
+            group (str): station group, if any
+            rows_in (int): # rows entering the stage, if known
+
+            return params
+            -------------
+            aspan (stage_span): context manager; a shared null span if disabled
+        '''
+
+        if not self._enabled: return NULL_SPAN
+        ## Inherit station / group from the enclosing span
+        if len (self._stack) > 0:
+            parent = self._stack[-1]
+            station_id = parent.station_id if station_id is None else station_id
+            group = parent.group if group is None else group
+        return stage_span (self, stage, station_id=station_id, group=group, rows_in=rows_in)
+
+    def _push (self, aspan):
+
+        parent = self._stack[-1].stage if len (self._stack) > 0 else None
+        self._stack.append (aspan)
+        return parent
+
+    def _pop (self, record):
+
+        self._stack.pop()
+        self.add_records ([record])
+
+    def add_records (self, records):
+
+        ''' A public function to add finished span records e.g. those sent
+            back by a station worker process with its own tracer.
+
+            input params
+            ------------
+            records (list): span records as dictionaries with SPAN_KEYS
+        '''
+
+        if not self._enabled or len (records) == 0: return
+        self._records.extend (records)
+        if self._trace_file is None: return
+        with open (self._trace_file, 'a') as f:
+            for record in records:
+                f.write (json.dumps (record, default=str) + '\n')
+
+    def pop_records (self):
+
+        ''' A public function to take the finished span records out of this
+            tracer e.g. to send them from a station worker to add_records().
+
+            return params
+            -------------
+            records (list): span records as dictionaries with SPAN_KEYS
+        '''
+
+        records, self._records = self._records, []
+        return records
+
+    # +------------------------------------------------------------
+    # | Summary
+    # +------------------------------------------------------------
+    def summarize (self):
+
+        ''' A public function to aggregate the spans of this run per stage.
+
+            return params
+            -------------
+            summary (pandas.DataFrame): SUMMARY_KEYS per stage
+        '''
+
+        return summarize_trace (self.records)
+
+    def log_summary (self, summary=None):
+
+        ''' A public function to log the per-stage summary as a table.
+
+            input params
+            ------------
+            summary (pandas.DataFrame): summary to log; None for this run
+        '''
+
+        if not self._enabled: return
+        summary = self.summarize() if summary is None else summary
+        self._logger.info ('Stage timing summary:\n{0}'.format (summary.to_string (float_format='{0:.3f}'.format)))
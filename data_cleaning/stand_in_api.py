@@ -0,0 +1,290 @@
+#!python37
+
+## This script serves a raw folder (e.g. from synthetic_data.py) through the
+## CO-OPS-style API that retrieve_raw.py requests, so that retrieval can be
+## tried locally without the actual API. Products and fields follow SERIES
+## and META_SERIES in retrieve_raw.py. Like the actual API, a time series
+## request is limited to max_days, values are text, and an empty period
+## answers {'error':{'message':'No data was found...'}}.
+##
+## To check retries, fail_rate answers a fraction of requests with HTTP 503
+## and drop_rate closes a fraction of connections without an answer.
+##
+## To serve a raw folder:
+## > python stand_in_api.py --raw_path <raw folder> (--port 8080)
+##                          (--fail_rate 0.1) (--drop_rate 0.05)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import stand_in_api, retrieve_raw
+## server, base_url = stand_in_api.start_server ('C:/to/synthetic/raw/')
+## retriever = retrieve_raw.raw_retriever (base_url, 'C:/to/retrieved/')
+## retriever.retrieve_stations ([9900001], '2016-07-01', '2016-12-31')
+## server.shutdown ()
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import pandas, logging, argparse, threading, random, json, os
+import urllib.parse, http.server
+
+import retrieve_raw
+
+###############################################
+## Define constants
+###############################################
+# Max # days per time series request
+MAX_DAYS = 31
+
+# Path of the API
+API_PATH = '/api/datagetter'
+
+###############################################
+## Define functions
+###############################################
+def start_server (raw_path, host='127.0.0.1', port=0, fail_rate=0., drop_rate=0.,
+                  max_days=MAX_DAYS, seed=None):
+
+    ''' A function to serve a raw folder on a background thread.
+
+        input params
+        ------------
+        raw_path (str): raw folder to serve
+        host (str): host to bind
+        port (int): port to bind; 0 for any free port
+        fail_rate (float): fraction of requests answered with HTTP 503
+        drop_rate (float): fraction of connections closed without an answer
+        max_days (int): max # days per time series request
+        seed (int): seed of failures
+
+        return params
+        -------------
+        server (stand_in_server): running server; call shutdown() to stop
+        base_url (str): URL to pass to retrieve_raw
+    '''
+
+    server = stand_in_server ((host, port), raw_path, fail_rate=fail_rate,
+                              drop_rate=drop_rate, max_days=max_days, seed=seed)
+    thread = threading.Thread (target=server.serve_forever, name='stand_in_api', daemon=True)
+    thread.start()
+    base_url = 'http://{0}:{1}{2}'.format (host, server.server_address[1], API_PATH)
+    return server, base_url
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='Serve a raw folder as a CO-OPS-style API')
+    parser.add_argument('-r', '--raw_path', required=True, type=str,
+                        help='Raw folder to serve')
+    parser.add_argument('-p', '--port', default=8080, type=int,
+                        help='Port to bind')
+    parser.add_argument('-f', '--fail_rate', default=0., type=float,
+                        help='Fraction of requests answered with HTTP 503')
+    parser.add_argument('-d', '--drop_rate', default=0., type=float,
+                        help='Fraction of connections closed without an answer')
+    parser.add_argument('-l', '--log_level', default='info', type=str,
+                        help='Log level: info, debug, warn, error')
+    args = parser.parse_args()
+
+    ## Check if raw path exists
+    if not os.path.exists (args.raw_path):
+        message = 'Raw path, {0}, does not exist.'.format (args.raw_path)
+        raise IOError (message)
+
+    ## Check if log level is one of info / debug / warn / error
+    if not args.log_level.lower() in ['debug', 'info', 'warn', 'error']:
+        message = 'Log level must be either debug, info, warn, or error.'
+        raise IOError (message)
+
+    return args
+
+###############################################
+## Define stand_in_server class
+###############################################
+class stand_in_server (http.server.ThreadingHTTPServer):
+
+    ''' This class answers API requests from the files of a raw folder. '''
+
+    daemon_threads = True
+
+    def __init__ (self, address, raw_path, fail_rate=0., drop_rate=0., max_days=MAX_DAYS, seed=None):
+
+        ''' To initialize a stand_in_server.
+
+            input params
+            ------------
+            address (tuple): (host, port) to bind
+            raw_path (str): raw folder to serve
+            fail_rate (float): fraction of requests answered with HTTP 503
+            drop_rate (float): fraction of connections closed without an answer
+            max_days (int): max # days per time series request
+            seed (int): seed of failures
+        '''
+
+        super().__init__ (address, stand_in_handler)
+        self.raw_path = raw_path
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.max_days = max_days
+        self.n_requests = 0
+        self._random = random.Random (seed)
+        self._lock = threading.Lock()
+        self._files = {}
+
+        ## Logger
+        self._logger = logging.getLogger ('stand_in_server')
+
+    def draw_failure (self):
+
+        ''' A public function to count a request and draw its failure.
+
+            return params
+            -------------
+            failure (str): 'drop', 'fail', or None
+        '''
+
+        with self._lock:
+            self.n_requests += 1
+            draw = self._random.random()
+        if draw < self.drop_rate: return 'drop'
+        if draw < self.drop_rate + self.fail_rate: return 'fail'
+        return None
+
+    def read_file (self, station_id, key):
+
+        ''' A public function to read a raw file of a station once.
+
+            input params
+            ------------
+            station_id (str): station ID
+            key (str): one of FILE_PATTERNS keys
+
+            return params
+            -------------
+            dataframe (pandas.DataFrame): file content; None if no such file
+        '''
+
+        with self._lock:
+            if not (station_id, key) in self._files:
+                filename = '{0}/{1}{2}'.format (self.raw_path, station_id, retrieve_raw.FILE_PATTERNS[key])
+                dataframe = None
+                if os.path.exists (filename):
+                    dataframe = pandas.read_csv (filename, dtype=str, keep_default_na=False)
+                    if key == 'raw':
+                        dataframe['DATE_TIME'] = pandas.to_datetime (dataframe['DATE_TIME'])
+                self._files[(station_id, key)] = dataframe
+            return self._files[(station_id, key)]
+
+###############################################
+## Define stand_in_handler class
+###############################################
+class stand_in_handler (http.server.BaseHTTPRequestHandler):
+
+    ''' This class answers 1 connection with keep-alive. '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message (self, format, *args):
+        self.server._logger.debug (format % args)
+
+    def _send_json (self, content, status=200):
+
+        ''' A private function to send a JSON answer. '''
+
+        body = json.dumps (content).encode ('utf-8')
+        self.send_response (status)
+        self.send_header ('Content-Type', 'application/json')
+        self.send_header ('Content-Length', str (len (body)))
+        self.end_headers()
+        self.wfile.write (body)
+
+    def do_GET (self):
+
+        ''' To answer a GET request. '''
+
+        failure = self.server.draw_failure()
+        if failure == 'drop':
+            self.close_connection = True
+            return
+        if failure == 'fail':
+            self._send_json ({'error':{'message':'Service unavailable'}}, status=503)
+            return
+
+        parts = urllib.parse.urlsplit (self.path)
+        if parts.path != API_PATH:
+            self._send_json ({'error':{'message':'Not found'}}, status=404)
+            return
+        params = dict (urllib.parse.parse_qsl (parts.query))
+        try:
+            content = self._answer (params)
+        except (KeyError, ValueError) as error:
+            content = {'error':{'message':'Bad request: {0}'.format (error)}}
+        self._send_json (content)
+
+    def _answer (self, params):
+
+        ''' A private function to get the JSON content of a request. '''
+
+        station_id = params['station']
+        begin = pandas.to_datetime (params['begin_date'], format=retrieve_raw.REQUEST_TIME_FORMAT)
+        end = pandas.to_datetime (params['end_date'], format=retrieve_raw.REQUEST_TIME_FORMAT)
+        no_data = {'error':{'message':'No data was found. This product may not be offered at this station at the requested time.'}}
+
+        ## Metadata are answered for any period
+        for key, series in retrieve_raw.META_SERIES.items():
+            if params['product'] != series['params']['product']: continue
+            dataframe = self.server.read_file (station_id, key)
+            if dataframe is None: return no_data
+            return {series['key']:dataframe.to_dict (orient='records')}
+
+        if end - begin > pandas.Timedelta (days=self.server.max_days):
+            return {'error':{'message':'The 6-minute data is limited to {0} days.'.format (self.server.max_days)}}
+
+        ## Find the series by its product and sensor; fixed sensors (e.g. B1)
+        ## before the primary sensor template
+        candidates = sorted (retrieve_raw.SERIES.values(),
+                             key=lambda series:'{sensor}' in series['params'].get ('sensor', ''))
+        for series in candidates:
+            if params['product'] != series['params']['product']: continue
+            if 'sensor' in series['params'] and not 'sensor' in params: continue
+            sensor = params.get ('sensor')
+            request_params, fields = retrieve_raw._format_series (series, sensor)
+            if request_params.get ('sensor') != sensor: continue
+            dataframe = self.server.read_file (station_id, 'raw')
+            if dataframe is None or not fields['v'] in dataframe: return no_data
+            dataframe = dataframe[(dataframe['DATE_TIME'] >= begin) & (dataframe['DATE_TIME'] <= end)]
+            dataframe = dataframe[(dataframe[list (fields.values())] != '').any (axis=1)]
+            if len (dataframe) == 0: return no_data
+            records = [{'t':time.strftime (retrieve_raw.RAW_TIME_FORMAT)} for time in dataframe['DATE_TIME']]
+            for field, column in fields.items():
+                for record, value in zip (records, dataframe[column]):
+                    record[field] = value
+            return {series['key']:records}
+        raise ValueError ('unknown product {0}'.format (params['product']))
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    args = get_parser ()
+
+    ## Set log level
+    logging.basicConfig (level=getattr (logging, args.log_level.upper()))
+
+    server = stand_in_server (('0.0.0.0', args.port), args.raw_path, fail_rate=args.fail_rate,
+                              drop_rate=args.drop_rate)
+    print ('Serving {0} at http://localhost:{1}{2}'.format (args.raw_path, args.port, API_PATH))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -55,6 +55,12 @@
 ##
 ## # Define & parse the raw file location
 ## astation.raw_file = 'C:/to/raw/{0}_raw_ver_merged_wl.csv'.format (station_id)
+## # Or, if the raw file is already read e.g. by io_pipeline.raw_prefetcher
+## # astation.raw_dataframe = raw_dataframe
+## # If the raw file has no predictions, compute them from constituents
+## # astation.predictor = harmonic_tides.load_predictor ('C:/to/constituents/', station_id)
+## # Or, without tide predictions (e.g. Great Lakes), use a rolling median baseline
+## # astation.baseline_window = '30D'
 ## 
 ## # Define & parse processed file location for any midstep files
 ## astation.proc_path = 'C:/to/processed/'
@@ -86,16 +92,10 @@
 ## Import libraries
 ###############################################
 import numpy, pandas, logging, os
+import scaler_registry, qc_provenance, plot_pool, stage_tracer, io_pipeline
+import harmonic_tides, rolling_baseline
 from scipy.interpolate import interp1d
 
-import matplotlib
-matplotlib.use ('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-plt.rc ('text', usetex=False)
-plt.rc ('font', family='sans-serif')
-plt.rc ('font', serif='Computer Modern Roman')
-
 ###############################################
 ## Define constants
 ###############################################
@@ -114,7 +114,10 @@ CLEANED_COLUMNS = ['STATION_ID', 'DATE_TIME', 'SENSOR_USED_PRIMARY', 'PRIMARY',
                    'PRIMARY_RESIDUAL', 'BACKUP', 'BACKUP_TRUE', 'BACKUP_SIGMA',
                    'BACKUP_SIGMA_TRUE', 'BACKUP_RESIDUAL', 'PREDICTION',
                    'VERIFIED', 'VERIFIED_RESIDUAL','TARGET', 'OFFSETS_APPLIED', 
-                   'VERIFIED_SENSOR_ID']
+                   'VERIFIED_SENSOR_ID', 'QC_PROVENANCE']
+
+# Column added before QC_PROVENANCE only on the regular 6-minute grid
+GRID_COLUMN = 'MISSING_SLOT'
 
 # Keys for the cleaning summary sheet. Each set has its own summary dictionary.
 CLEAN_STATS_KEYS = ['has_bad_results', 'n_raw', 'has_repeated_raw', 'n_total',
@@ -127,7 +130,8 @@ CLEAN_STATS_KEYS = ['has_bad_results', 'n_raw', 'has_repeated_raw', 'n_total',
                     'n_capped_primary_max', 'n_capped_primary_min',
                     'n_capped_backup_max', 'n_capped_backup_min',
                     'n_capped_primary_sigma_max', 'n_capped_primary_sigma_min',
-                    'n_capped_backup_sigma_max', 'n_capped_backup_sigma_min']
+                    'n_capped_backup_sigma_max', 'n_capped_backup_sigma_min',
+                    'n_off_grid', 'n_missing_slots']
 
 # Keys for statistics dictionary for the difference between primary and verified
 DIFF_STATS_KEYS = ['lower', 'upper', 'min', 'max', 'mean']
@@ -154,6 +158,11 @@ ARRAY_TYPES = [list, tuple, numpy.ndarray]
 GIANT_HIST_NBINS = 50
 GIANT_HIST_RANGE = [-0.1, 0.1]
 
+# Records are on a regular 6-minute cadence. Each record is mapped to an int32
+# tick i.e. number of 6-minute steps since epoch.
+TICK_INTERVAL = pandas.Timedelta (minutes=6)
+TICK_EPOCH = pandas.Timestamp ('1970-01-01')
+
 ###############################################
 ## Define lambda functions
 ###############################################
@@ -161,6 +170,107 @@ get_primaries = lambda df: df[df.SENSOR_USED_PRIMARY + '_WL_VALUE_MSL']
 get_primary_sigmas = lambda df: df[df.SENSOR_USED_PRIMARY + '_WL_SIGMA']
 has_repeated_raw = lambda df: len (df.DATE_TIME.value_counts()[df.DATE_TIME.value_counts()>1]) > 0
 
+###############################################
+## Define functions
+###############################################
+def get_cleaned_columns (regular_grid=False):
+
+    ''' A function to get the final columns of cleaned data. MISSING_SLOT is
+        only included on the regular 6-minute grid, where slots are inserted.
+
+        input params
+        ------------
+        regular_grid (bool): If true, records are on the regular grid
+
+        return params
+        -------------
+        columns (list): CLEANED_COLUMNS, with MISSING_SLOT if on the grid
+    '''
+
+    if not regular_grid: return list (CLEANED_COLUMNS)
+    position = CLEANED_COLUMNS.index ('QC_PROVENANCE')
+    return CLEANED_COLUMNS[:position] + [GRID_COLUMN] + CLEANED_COLUMNS[position:]
+
+def get_ticks (times):
+
+    ''' A function to map timestamps to int32 ticks since epoch. Timestamps
+        between two 6-minute marks are binned to the earlier one and flagged
+        as off-grid.
+
+        input params
+        ------------
+        times (array-like): timestamps
+
+        return params
+        -------------
+        ticks (numpy.array): int32 ticks
+        is_off_grid (numpy.array): True if the timestamp is not on a 6-min mark
+    '''
+
+    nanoseconds = (pandas.to_datetime (times) - TICK_EPOCH).values.astype (numpy.int64)
+    ticks, remainders = numpy.divmod (nanoseconds, TICK_INTERVAL.value)
+    return ticks.astype (numpy.int32), remainders != 0
+
+def get_tick_range (begin, end):
+
+    ''' A function to convert a [begin, end] period into an inclusive range of
+        ticks i.e. the first tick at or after begin and the last tick at or
+        before end.
+
+        input params
+        ------------
+        begin (pandas.Timestamp): begin date-time of the period
+        end (pandas.Timestamp): end date-time of the period
+
+        return params
+        -------------
+        begin_tick (int): first tick in the period
+        end_tick (int): last tick in the period
+    '''
+
+    begin_ns = (pandas.Timestamp (begin) - TICK_EPOCH).value
+    end_ns = (pandas.Timestamp (end) - TICK_EPOCH).value
+    return -(-begin_ns // TICK_INTERVAL.value), end_ns // TICK_INTERVAL.value
+
+def get_tick_slice (ticks, begin, end, times=None):
+
+    ''' A function to get the positional slice of sorted ticks within a
+        [begin, end] period. Records off the 6-minute grid have the tick of
+        the earlier mark, so if their timestamps are given, the rows in the
+        first and last ticks of the period are compared by timestamp instead,
+        as a [begin:end] slice of the timestamps would.
+
+        input params
+        ------------
+        ticks (numpy.array): sorted int32 ticks
+        begin (pandas.Timestamp): begin date-time of the period
+        end (pandas.Timestamp): end date-time of the period
+        times (numpy.array): datetime64 timestamps of the ticks; None if all
+                             ticks are on the grid
+
+        return params
+        -------------
+        aslice (slice): positions of rows within the period
+    '''
+
+    if times is None:
+        begin_tick, end_tick = get_tick_range (begin, end)
+        return slice (numpy.searchsorted (ticks, begin_tick, side='left'),
+                      numpy.searchsorted (ticks, end_tick, side='right'))
+
+    ## Rows from the tick of begin to the tick of end, both floored as records are
+    begin_tick, end_tick = get_ticks ([begin, end])[0]
+    start = numpy.searchsorted (ticks, begin_tick, side='left')
+    first_end = numpy.searchsorted (ticks, begin_tick, side='right')
+    last_begin = numpy.searchsorted (ticks, end_tick, side='left')
+    stop = numpy.searchsorted (ticks, end_tick, side='right')
+
+    ## Within the first and the last tick, compare timestamps
+    begin, end = pandas.Timestamp (begin).to_datetime64(), pandas.Timestamp (end).to_datetime64()
+    start += numpy.searchsorted (times[start:first_end], begin, side='left')
+    stop = last_begin + numpy.searchsorted (times[last_begin:stop], end, side='right')
+    return slice (start, max (start, stop))
+
 ###############################################
 ## Define station class
 ###############################################
@@ -191,14 +301,32 @@ class station (object):
 
         ## Raw file & processed folder locations
         self._raw_file = None
+        self._raw_dataframe = None
         self._proc_path = None
 
         ## Offsets information
         self._primary_offset_dict = None
         self._backup_gain_offset_df = None
 
-        ## Dump mid-step files to processed folder?
+        ## Dump mid-step files to processed folder? If so, plots are rendered
+        ## by plot_pool if available
         self._create_midstep_files = False
+        self._plot_pool = None
+
+        ## Time cleaning stages? Disabled unless a tracer is given
+        self._tracer = stage_tracer.stage_tracer (enabled=False)
+
+        ## Put records on a regular 6-minute grid? Off by default; records are
+        ## kept as is, as the grid adds rows for missing slots
+        self._regular_grid = False
+
+        ## Predict missing PRED_WL_VALUE_MSL from harmonic constituents?
+        self._predictor = None
+
+        ## Stand in a rolling quantile of PRIMARY for PRED_WL_VALUE_MSL when
+        ## there is no prediction at all? Disabled unless a window is given
+        self._baseline_window = None
+        self._baseline_quantile = rolling_baseline.QUANTILE
 
         ## Information during cleaning process
         self._has_repeated_primary_offsets = False
@@ -213,6 +341,9 @@ class station (object):
         self._diff_hist_settings = {'nbins':GIANT_HIST_NBINS,
                                     'range':GIANT_HIST_RANGE}
 
+        ## Normalization constants from the cleaned data
+        self._scalers = {key:None for key in scaler_registry.SCALER_KEYS[1:]}
+
         ## Logger
         self._logger = logging.getLogger ('station {0}'.format (station_id))
 
@@ -269,6 +400,9 @@ class station (object):
     @property
     def diff_hist (self): return self._diff_hist
 
+    @property
+    def scalers (self): return self._scalers
+
     @property
     def create_midstep_files (self): return self._create_midstep_files
     @create_midstep_files.setter
@@ -279,6 +413,70 @@ class station (object):
             raise IOError (message)
         self._create_midstep_files = aBoolean
 
+    @property
+    def plot_pool (self): return self._plot_pool
+    @plot_pool.setter
+    def plot_pool (self, pool):
+        if pool is not None and not isinstance (pool, plot_pool.plot_pool):
+            message = 'Input, {0}, is not a plot_pool.'.format (pool)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._plot_pool = pool
+
+    @property
+    def tracer (self): return self._tracer
+    @tracer.setter
+    def tracer (self, tracer):
+        if not isinstance (tracer, stage_tracer.stage_tracer):
+            message = 'Input, {0}, is not a stage_tracer.'.format (tracer)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._tracer = tracer
+
+    @property
+    def regular_grid (self): return self._regular_grid
+    @regular_grid.setter
+    def regular_grid (self, aBoolean):
+        if not isinstance (aBoolean, bool):
+            message = 'Input, {0}, is not a boolean.'.format (aBoolean)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._regular_grid = aBoolean
+
+    @property
+    def predictor (self): return self._predictor
+    @predictor.setter
+    def predictor (self, predictor):
+        if predictor is not None and not isinstance (predictor, harmonic_tides.harmonic_predictor):
+            message = 'Input, {0}, is not a harmonic_predictor.'.format (predictor)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._predictor = predictor
+
+    @property
+    def baseline_window (self): return self._baseline_window
+    @baseline_window.setter
+    def baseline_window (self, window):
+        if window is None:
+            self._baseline_window = None
+            return
+        try:
+            self._baseline_window = rolling_baseline.parse_window (window)
+        except IOError as error:
+            self._logger.fatal (str (error))
+            raise
+
+    @property
+    def baseline_quantile (self): return self._baseline_quantile
+    @baseline_quantile.setter
+    def baseline_quantile (self, quantile):
+        self._check_is_number (quantile)
+        if not 0 <= quantile <= 1:
+            message = 'Input, {0}, is not between 0 and 1.'.format (quantile)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._baseline_quantile = quantile
+
     @property
     def raw_file (self): return self._raw_file
     @raw_file.setter
@@ -288,6 +486,16 @@ class station (object):
         self._logger.info ('Raw data folder is set to {0}.'.format (apath))
         self._raw_file = apath
 
+    @property
+    def raw_dataframe (self): return self._raw_dataframe
+    @raw_dataframe.setter
+    def raw_dataframe (self, dataframe):
+        if dataframe is not None and not isinstance (dataframe, pandas.DataFrame):
+            message = 'Input, {0}, is not a pandas dataframe.'.format (type (dataframe))
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._raw_dataframe = dataframe
+
     @property
     def proc_path (self): return self._proc_path
     @proc_path.setter
@@ -639,127 +847,54 @@ class station (object):
         return {'lower':float (lower), 'upper':float (upper),
                 'mean':float (mean), 'min':dmin, 'max':dmax}
 
-    def _plot_sub_diff (self, axis, diff_df, reqEdges=None):
+    def _get_diff_histograms (self, diff_df):
 
-        ''' A private function to plot a sub histgram for all dataset types
-            available in input diff_df. There should only be 3 at max. Their
-            histograms are stacked in the order of train, validation, and test.
-            If reqEdges is provided, the x-axis follows the requested bin edges.
-            Otherwise, the bin edges are determined by the min / max values 
-            from the differences. 
+        ''' A private function to build the histograms of differences per
+            dataset type for plotting. All sets share the same bin edges, based
+            on the range from the full dataset.
 
             input params
             ------------
-            axis (matplotlib.Axes): axis on which plots are made
             diff_df (pandas.DataFrame): data with 'delta' and 'setType' columns
-            reqEdges (array): requested bin edges
 
             return params
             -------------
-            edges (array): bin edges used by this histogram
+            edges (array): bin edges; None if no valid differences
+            hists (dict): {dtype: histogram counts} for sets with differences
         '''
 
-        if len (diff_df) == 0: return
-
-        ## Generate histogram by dataset type
-        groups = diff_df.groupby ('setType')
-        if len (groups.groups.keys()) == 0: return
-
-        #  Histogram x-axis based on requested edges if available.
-        params = {'bins':reqEdges}
-        if reqEdges is None:
-            hist_xrange = (diff_df.delta.min(), diff_df.delta.max())
-            params = {'bins':HIST_NBINS, 'range':hist_xrange}
-        hists = groups.apply (numpy.histogram, **params)
-
-        ## Plot stacked histogram
-        reference = numpy.array ([0.] * (HIST_NBINS+1)).astype (float)
-        for dtype in DATASET_TYPES[::-1]:
-            # Next dataset type if not available
-            if not dtype in hists: continue
-            # Get histogram and edges
-            hist, edges = hists.get (dtype)
-            # Stacking the histogram
-            hist = [hist[0]] + list (hist)
-            yvalues = reference + numpy.log10 (hist)
-            # Replace any inf / nan to 0
-            yvalues[~numpy.isfinite(yvalues)] = 0
-            yvalues = yvalues.astype (float)
-            # Determine the color based on dataset type
-            color = '#666666' if dtype=='train' else '#489cbd' if dtype=='validation' else '#ff4f6b'
-            # Plot a stack histogram
-            e = edges.astype (float) if reqEdges is None else reqEdges.astype (float)
-            axis.fill_between (e.astype (float), reference, yvalues, color=color,
-                               step='pre', label=dtype)
-            # Update reference
-            reference = yvalues
-
-        ##  Plot legend if more than 1 dataset type
-        if len (groups) > 1: axis.legend (loc=1, fontsize=8)
-
-        ##  Format x-axis
-        edges = e[numpy.isfinite (e)]
-        axis.set_xlim ([min (edges), max(edges)])
-        axis.tick_params (axis='x', labelsize=8)
-        axis.set_xlabel ('Primary - Verified [meters]', fontsize=8)    
-        ##  Format y-axis
-        axis.set_ylim ([numpy.floor (min (yvalues)), numpy.ceil (max (yvalues))])
-        axis.tick_params (axis='y', labelsize=8)
-        axis.set_ylabel ('log10 #', fontsize=8)
-        ##  Plot grid lines
-        for ytick in axis.yaxis.get_majorticklocs():
-            axis.axhline (y=ytick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-        for xtick in axis.xaxis.get_majorticklocs():
-            axis.axvline (x=xtick, color='gray', alpha=0.3, linestyle=':', linewidth=0.2)
-
-        ## Set title
-        dtype = 'all sets' if len (groups) > 1 else list (groups.groups.keys())[0]
-        axis.set_title ('From {0}'.format (dtype), fontsize=9)
-
-        return edges
+        diff_df = diff_df[~diff_df.delta.isna()]
+        if len (diff_df) == 0: return None, {}
+
+        hist_xrange = (diff_df.delta.min(), diff_df.delta.max())
+        edges = numpy.histogram_bin_edges (diff_df.delta.values, bins=HIST_NBINS, range=hist_xrange)
+        hists = {}
+        for dtype in DATASET_TYPES:
+            deltas = diff_df.delta.values[diff_df.setType.values == dtype]
+            if len (deltas) == 0: continue
+            hists[dtype] = numpy.histogram (deltas, bins=HIST_NBINS, range=hist_xrange)[0]
+        return edges, hists
 
     def plot_diff_histogram (self, diff_df):
 
         ''' A public function to plot histograms of differences between primary
-            and verified for all dataset types. All x-axis are the same, based
-            on the range from the full dataset.
-
-            Top left: stacked histogram from all sets
-            Top right: histogram from training set
-            Bottom left: histogram from validation set
-            Bottom right: histogram from testing set
+            and verified for all dataset types. Histograms are built here and
+            the plot is rendered by plot_pool.render_diff_histogram(), in the
+            background if a plot_pool is set.
 
             input params
             ------------
             diff_df (pandas.DataFrame): data with 'delta' and 'setType' columns
         '''
 
-        ## Start plotting!
-        h = plt.figure (figsize=(9, 9))
-        gs = gridspec.GridSpec (2, 2, wspace=0.25, hspace=0.2)
-
-        ## Top left: All records from train, valid, and test sets
-        axis = h.add_subplot (gs[0])
-        main_edges = self._plot_sub_diff (axis, diff_df)
-
-        ## Top right: From training set
-        axis = h.add_subplot (gs[1])
-        self._plot_sub_diff (axis, diff_df[diff_df.setType=='train'], reqEdges=main_edges)
-
-        ## Bottom left: From validation set
-        axis = h.add_subplot (gs[2])
-        self._plot_sub_diff (axis, diff_df[diff_df.setType=='validation'],
-                             reqEdges=main_edges)
-
-        ## Bottom right: From testing set
-        axis = h.add_subplot (gs[3])
-        self._plot_sub_diff (axis, diff_df[diff_df.setType=='test'], reqEdges=main_edges)
+        edges, hists = self._get_diff_histograms (diff_df)
+        if edges is None:
+            self._logger.warn ('No valid primary - verified to plot.')
+            return
 
-        ## Store plot as PDF
-        title = 'Histogram of Primary - Verified at {0}'.format (self.station_id)
-        plt.suptitle (title, fontsize=15)
-        h.savefig ('{0}/{1}_diff_histogram.pdf'.format (self._proc_path, self.station_id))
-        plt.close ('all')
+        payload = {'station_id':self.station_id, 'edges':edges, 'hists':hists}
+        outfile = '{0}/{1}_diff_histogram.pdf'.format (self._proc_path, self.station_id)
+        plot_pool.submit_or_render (self._plot_pool, plot_pool.render_diff_histogram, payload, outfile)
 
     def _store_giant_hist (self, diff_df):
 
@@ -967,6 +1102,38 @@ class station (object):
             raise IOError ('Use \'yyyy-mm-dd HH:MM to yyyy-mm-dd HH:MM\' format.')
         self.other_primary_type_period = period
 
+    def set_station_meta (self, meta):
+
+        ''' A public function to set all station meta-data from a dictionary
+            that is already parsed by station_registry. Values still go through
+            the setters. Date arrays are copied because the cleaning process
+            may adjust them.
+
+            input params
+            ------------
+            meta (dict): meta-data from station_registry.get_meta()
+        '''
+
+        self.has_bad_results = meta['has_bad_results']
+        self.neighbor_id = meta['neighbor_id']
+        self.gt_range = meta['gt_range']
+        self.wl_range = meta['wl_range']
+        self.train_dates = numpy.array (meta['train_dates']) if len (meta['train_dates']) > 0 else []
+        self.valid_dates = numpy.array (meta['validation_dates']) if len (meta['validation_dates']) > 0 else []
+        self.test_dates  = numpy.array (meta['test_dates']) if len (meta['test_dates']) > 0 else []
+        self.primary_type = meta['primary_type']
+
+        ## Other primary type and its period if any
+        if meta['other_primary_type'] is None: return
+        self.other_primary_type = meta['other_primary_type']
+        period = meta['other_primary_type_period']
+        if isinstance (period, str):
+            message = 'Input, {0}, cannot be read as period when setting ' + \
+                      ' other primary sensor type period.'
+            self._logger.fatal (message.format (period))
+            raise IOError ('Use \'yyyy-mm-dd HH:MM to yyyy-mm-dd HH:MM\' format.')
+        self.other_primary_type_period = numpy.array (period)
+
     # +------------------------------------------------------------
     # | Load primary offset & backup gain/offset data
     # +------------------------------------------------------------
@@ -1268,22 +1435,30 @@ class station (object):
         if self._train_dates is None or self._valid_dates is None or self._test_dates is None:
             raise IOError ('Please set train/valid/test periods before loading data.')
 
-        ## Create a list holder to store the dataset type per row
-        setType = []
+        ## Create an array holder to store the dataset type per row
+        ticks, times = dataframe.TICK.values, dataframe.DATE_TIME.values
+        setType = numpy.full (len (dataframe), None, dtype=object)
 
         ## Loop through each dataset type
         periods = [self._train_dates, self._valid_dates, self._test_dates]
         for dtype, period in zip (DATASET_TYPES, periods):
             # If no period for this set, skip.
             if len (period) == 0: continue
-            # Extract the dataframe slices within this period
-            thisframe = dataframe.loc[period[0]:period[1]]
+            # Extract the row positions within this period
+            aslice = get_tick_slice (ticks, period[0], period[1], times=times)
             # Assign dataset type name
-            setType += [dtype] * len (thisframe)
+            setType[aslice] = dtype
             # Log it
             message = '{0} rows between {1} and {2} in {3}.'
-            self._logger.info (message.format (len (thisframe), period[0], period[1], dtype))
-        
+            self._logger.info (message.format (aslice.stop - aslice.start, period[0], period[1], dtype))
+
+        ## Every row must belong to a set
+        n_unassigned = (setType == None).sum()
+        if n_unassigned > 0:
+            message = '{0} rows are not within train / valid / test periods.'.format (n_unassigned)
+            self._logger.fatal (message)
+            raise IOError (message)
+
         ## Add new column indicating dataset type
         dataframe['setType'] = setType
         return dataframe
@@ -1299,6 +1474,9 @@ class station (object):
                 * Do not use the row if there is any -99999.999 value
                 * Use the first good row as the official data 
 
+            As the rows are dropped by their date-time label, every row of a
+            repeated timestamp is removed, including the official one.
+
             input params
             ------------
             dataframe (pandas.DataFrame): data with duplicated timestamps
@@ -1313,42 +1491,74 @@ class station (object):
         self._validation_stats['has_repeated_raw'] = has_repeated_raw (dataframe[dataframe.setType == 'validation'])
         self._test_stats['has_repeated_raw']  = has_repeated_raw (dataframe[dataframe.setType == 'test'])    
 
-        ## Extract a list of repeated date-times 
-        repeated_times = dataframe.DATE_TIME.value_counts()[dataframe.DATE_TIME.value_counts ()>1].index    
+        ## Rows with a repeated date-time
+        is_repeated = dataframe.DATE_TIME.duplicated (keep=False).values
         ## If no repeated date-times, nothing needs to be done.
-        if len (repeated_times) == 0: return dataframe
-
-        ## Log the repeated times found
-        self._logger.debug ('This station has {0} repeated times at ...'.format (len (repeated_times)))
-
-        ## Loop through each repeated times and decide which one is the official
-        ## one and collect the indices of those that need to be removed
-        remove_row_indices = []
-        for repeated_time in repeated_times:
-            self._logger.debug ('     * {0}'.format (repeated_time))
-            found_good = False
-            subframe = dataframe[dataframe.DATE_TIME == repeated_time]
-            # For a given repeated time, loop through all duplicated rows
-            for index, row in subframe.iterrows():
-                self._logger.debug ('        - row {0}'.format (index))
-                # If this row has any -99999.999 value in any columns,
-                # this row must be removed.
-                any999 = [row[col] == -99999.999 for col in row.index]
-                if numpy.array (any999).any():
-                    self._logger.debug ('          -99999.999 is found!')
-                    remove_row_indices.append (index)
-                    continue
-                ## If all values are valid, use the first found row as official.
-                if not found_good:
-                    self._logger.debug ('          This row is the official data for this timestamp!')
-                    found_good = True
-                    continue
-                ## For any 2nd, 3rd, 4th, etc good rows, they are removed
-                self._logger.debug ('          Good data exists for timestamp - removing this one!')
-                remove_row_indices.append (index)
-
-        ## Return a dataframe with repeated timestamps row dropped
-        return dataframe.drop (axis=0, index=remove_row_indices)
+        if not is_repeated.any(): return dataframe
+        self._logger.debug ('This station has {0} repeated times.'.format (dataframe.DATE_TIME[is_repeated].nunique()))
+
+        ## A repeated time always has a row to remove (one with -99999.999 or a
+        ## 2nd, 3rd, etc good row), and removing it by date-time label removes
+        ## all rows of that time.
+        self._logger.debug ('{0} repeated rows are removed.'.format (is_repeated.sum()))
+        return dataframe[~is_repeated].copy()
+
+    def _regularize_grid (self, dataframe):
+
+        ''' A private function to put the records on a regular 6-minute grid
+            from train begin to test end. Records off the grid (e.g. 00:08)
+            are dropped, and missing 6-minute slots are inserted with NaN
+            values and MISSING_SLOT = 1, so that row positions are ticks since
+            the grid start. Off-grid records and missing slots are counted per
+            set either way; if regular_grid is off, the rows are kept as is.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): data without duplicated timestamps
+
+            output params
+            -------------
+            dataframe (pandas.DataFrame): data with MISSING_SLOT column if on the grid
+        '''
+
+        ## Count records that are not on a 6-minute mark
+        _, is_off_grid = get_ticks (dataframe.DATE_TIME.values)
+        self._set_stats (dataframe[is_off_grid], 'n_off_grid')
+
+        ## Define the full grid from the first to the last set period
+        periods = [period for period in [self._train_dates, self._valid_dates, self._test_dates]
+                   if len (period) > 0]
+        begin_tick, end_tick = get_tick_range (periods[0][0], periods[-1][-1])
+        grid = numpy.arange (begin_tick, end_tick + 1, dtype=numpy.int32)
+        positions = dataframe.TICK.values[~is_off_grid] - begin_tick
+        is_missing = numpy.ones (len (grid), dtype=bool)
+        is_missing[positions] = False
+
+        ## Count missing slots per set
+        for dtype, period in zip (DATASET_TYPES, [self._train_dates, self._valid_dates, self._test_dates]):
+            adict = getattr (self, '_' + dtype + '_stats')
+            adict['n_missing_slots'] = 0 if len (period) == 0 else \
+                int (is_missing[get_tick_slice (grid, period[0], period[1])].sum())
+        message = '{0} records are off the 6-minute grid and {1} slots are missing.'
+        self._logger.info (message.format (is_off_grid.sum(), is_missing.sum()))
+
+        ## If not asked, keep records as is (without MISSING_SLOT)
+        if not self._regular_grid: return dataframe
+
+        ## Place on-grid records at their grid positions
+        dataframe = dataframe[~is_off_grid]
+        dataframe.index = positions
+        dataframe = dataframe.reindex (numpy.arange (len (grid)))
+
+        ## Re-define time, station, and set columns of inserted slots
+        dataframe['TICK'] = grid
+        dataframe['DATE_TIME'] = TICK_EPOCH + grid.astype (numpy.int64) * TICK_INTERVAL
+        dataframe['STATION_ID'] = self._station_id
+        dataframe['MISSING_SLOT'] = is_missing.astype (int)
+        dataframe['QC_PROVENANCE'] = dataframe.QC_PROVENANCE.fillna (0).values.astype (numpy.uint16)
+        dataframe.index = dataframe.DATE_TIME
+        dataframe = self._divide_raw_into_3_sets (dataframe)
+        return dataframe
 
     def _redefine_backup_data_in_raw_file (self, dataframe):
 
@@ -1380,6 +1590,13 @@ class station (object):
         if self._backup_gain_offset_df is None:
             raise IOError ('Please provide backup B1 gain & offset data before loading raw data.')
 
+        ## Work on arrays; periods are positional slices on sorted ticks
+        ticks, times = dataframe.TICK.values, dataframe.DATE_TIME.values
+        backup = dataframe.B1_WL_VALUE.values.astype (float)
+        backup_msl = dataframe.B1_MSL.values.astype (float)
+        backup_dcp = dataframe.B1_DCP.values
+        is_recalibrated = numpy.zeros (len (dataframe), dtype=bool)
+
         ## Loop through each gain / offset rows and re-define backup value.
         ## B1_WL_VALUE is the raw-est backup data from the database. 
         for index, row in enumerate (self._backup_gain_offset_df.itertuples()):
@@ -1391,30 +1608,84 @@ class station (object):
             is_last = index == len (self._backup_gain_offset_df) - 1
             end_date = pandas.to_datetime ('2100-12-31') if is_last else \
                        self._backup_gain_offset_df.iloc[index+1].BEGIN_DATE_TIME - pandas.Timedelta (minutes=1)
-            offset_period = (row.BEGIN_DATE_TIME, end_date)
+            aslice = get_tick_slice (ticks, row.BEGIN_DATE_TIME, end_date, times=times)
             # Backup gain & offsets are only applied to row records with the same DCP
-            same_DCP = dataframe.loc[offset_period[0]:offset_period[1]].B1_DCP == row.B1_DCP
-        
-            # 1. For records within the offset period and with the same DCP
-            #    Their backup B1 is re-calculated with gain and offset
-            subframe = dataframe.loc[offset_period[0]:offset_period[1]][same_DCP]
-            if len (subframe) > 0:
-                # New backup = raw B1 x gain + offset - MSL
-                backup_values = subframe.B1_WL_VALUE * row.GAIN + row.OFFSET - subframe.B1_MSL
-                dataframe.loc[offset_period[0]:offset_period[1], 'B1_WL_VALUE'][same_DCP] = backup_values.values
+            same_DCP = backup_dcp[aslice] == row.B1_DCP
 
+            # 1. For records within the offset period and with the same DCP
+            #    Their backup B1 is re-calculated with gain and offset:
+            #    New backup = raw B1 x gain + offset - MSL
             # 2. For records within the offset period but with different DCP. Their backup
             #    B1 is set to nan. B1 data was likely bad given no valid g/o are available.
-            subframe = dataframe.loc[offset_period[0]:offset_period[1]][~same_DCP]
-            if len (subframe) > 0:
-                dataframe.loc[offset_period[0]:offset_period[1], 'B1_WL_VALUE'][~same_DCP] = numpy.NaN
+            backup[aslice] = numpy.where (same_DCP,
+                                          backup[aslice] * row.GAIN + row.OFFSET - backup_msl[aslice],
+                                          numpy.NaN)
+            is_recalibrated[aslice] = same_DCP
         
         ## Re-define backup B1 value by the new one
-        dataframe['B1_WL_VALUE_MSL'] = dataframe.B1_WL_VALUE
+        dataframe['B1_WL_VALUE_MSL'] = backup
+        dataframe['QC_PROVENANCE'] = qc_provenance.add_flag (dataframe.QC_PROVENANCE.values,
+                                                             'backup_recalibrated', is_recalibrated)
         ## Remove other backup columns
         dataframe = dataframe.drop (axis=1, columns=['B1_WL_VALUE', 'B1_MSL'])
         return dataframe
 
+    def _fill_predictions (self, dataframe):
+
+        ''' A private function to fill PRED_WL_VALUE_MSL from harmonic
+            constituents if the raw file does not have it, or where it is
+            NaN (e.g. inserted 6-minute slots). Without a predictor, the raw
+            file must have PRED_WL_VALUE_MSL unless a baseline window is set,
+            in which case the baseline stands in for it after capping.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): data on the 6-minute grid
+
+            output params
+            -------------
+            dataframe (pandas.DataFrame): data with PRED_WL_VALUE_MSL
+        '''
+
+        has_column = 'PRED_WL_VALUE_MSL' in dataframe
+        if self._predictor is None:
+            if not has_column and self._baseline_window is not None:
+                dataframe['PRED_WL_VALUE_MSL'] = numpy.nan
+                return dataframe
+            if not has_column:
+                message = 'Raw file has no PRED_WL_VALUE_MSL. Please provide harmonic constituents or a baseline window.'
+                self._logger.fatal (message)
+                raise IOError (message)
+            return dataframe
+
+        ## Only predict the records without predictions
+        prediction = dataframe.PRED_WL_VALUE_MSL.values.astype (float) if has_column else \
+                     numpy.full (len (dataframe), numpy.nan)
+        is_missing = numpy.isnan (prediction)
+        if is_missing.any():
+            prediction[is_missing] = self._predictor.predict (dataframe.DATE_TIME.values[is_missing])
+        dataframe['PRED_WL_VALUE_MSL'] = prediction
+        self._logger.info ('{0} predictions are computed from harmonic constituents.'.format (is_missing.sum()))
+        return dataframe
+
+    def _span (self, stage, dataframe=None):
+
+        ''' A private function to create a tracer span for a cleaning stage
+            of this station.
+
+            input params
+            ------------
+            stage (str): name of the stage
+            dataframe (pandas.DataFrame): data entering the stage, if any
+
+            return params
+            -------------
+            aspan (stage_tracer.stage_span): context manager
+        '''
+
+        rows_in = None if dataframe is None else len (dataframe)
+        return self._tracer.span (stage, station_id=self._station_id, rows_in=rows_in)
+
     def _load_raw_data (self):
 
         ''' A private function to load raw data with a few pre-cleaning steps.
@@ -1422,7 +1693,9 @@ class station (object):
                 2. adjust either dataframe or train/test times if needed
                 3. divide the dataframe into 3 sets: train, valid, test
                 4. handle duplicated timestamps in dataframe
-                5. redefine backup B1_WL_VALUE_MSL
+                5. put records on a regular 6-minute grid
+                6. redefine backup B1_WL_VALUE_MSL
+                7. fill PRED_WL_VALUE_MSL from harmonic constituents if needed
 
             return params
             -------------
@@ -1433,21 +1706,36 @@ class station (object):
         if self._raw_file is None:
             raise IOError ('Please provide raw file location first.')
 
-        ## Read the csv file
-        dataframe = pandas.read_csv (self._raw_file, low_memory=False)
+        ## Read the csv file unless it is already read (e.g. prefetched). The
+        ## preloaded raw data is used once and released.
+        with self._span ('read_raw_csv') as span:
+            dataframe = io_pipeline.read_raw_file (self._raw_file) if self._raw_dataframe is None else \
+                        self._raw_dataframe
+            self._raw_dataframe = None
+            span.rows_out = len (dataframe)
         self._logger.info ('Raw file {0} is successfully read.'.format (os.path.basename (self._raw_file)))
         n_raw = len (dataframe)
         self._logger.info ('{0} records are found.'.format (n_raw))
 
         ## Turn dataframe into a time-series dataframe
-        dataframe['DATE_TIME'] = pandas.to_datetime (dataframe.DATE_TIME)
-        dataframe.index = dataframe.DATE_TIME
-        dataframe = dataframe.sort_index()
+        with self._span ('parse_date_time', dataframe):
+            dataframe['DATE_TIME'] = pandas.to_datetime (dataframe.DATE_TIME)
+            dataframe.index = dataframe.DATE_TIME
+            dataframe = dataframe.sort_index()
         self._logger.info ('Dataframe is turned into a time-series dataframe.')
 
         ## Check raw data time with training start and testing end dates
         dataframe = self._check_start_end_dates (dataframe)
 
+        ## Start an empty provenance bitmask per record
+        dataframe['QC_PROVENANCE'] = numpy.zeros (len (dataframe), dtype=numpy.uint16)
+
+        ## Map each record to an int32 6-minute tick for positional slicing
+        dataframe['TICK'], is_off_grid = get_ticks (dataframe.DATE_TIME.values)
+        if is_off_grid.any():
+            message = '{0} records are not on the 6-minute grid.'
+            self._logger.warn (message.format (is_off_grid.sum()))
+
         ## Divide dataframe into 3 sets: train / valid / test based on timestamps
         ## This is Step 6 in WL-AI Station File Requirements
         dataframe = self._divide_raw_into_3_sets (dataframe)
@@ -1460,14 +1748,27 @@ class station (object):
         self._test_stats['has_bad_results'] = self._has_bad_results
 
         ## Handle repeated rows due to duplicated date-times 
-        dataframe = self._handle_duplicated_timestamps_in_raw_file (dataframe)
+        with self._span ('handle_duplicates', dataframe) as span:
+            dataframe = self._handle_duplicated_timestamps_in_raw_file (dataframe)
+            span.rows_out = len (dataframe)
         self._logger.info ('{0} rows remain after removing duplicated timestamps.'.format (len (dataframe)))
 
+        ## Drop off-grid records and insert missing slots
+        with self._span ('regularize_grid', dataframe) as span:
+            dataframe = self._regularize_grid (dataframe)
+            span.rows_out = len (dataframe)
+        self._logger.info ('{0} rows are on the regular 6-minute grid.'.format (len (dataframe)))
+
         ## Massage backup data based on gain & offsets from B1 file
         ## This is Step 7 in WL-AI Station File Requirements
-        dataframe = self._redefine_backup_data_in_raw_file (dataframe)
+        with self._span ('redefine_backup', dataframe):
+            dataframe = self._redefine_backup_data_in_raw_file (dataframe)
         self._logger.info ('Backup data is re-set based on B1 gain & offset.')
 
+        ## Compute predictions that the raw file does not have
+        with self._span ('fill_predictions', dataframe):
+            dataframe = self._fill_predictions (dataframe)
+
         self._logger.info ('{0} records in total are found.'.format (len (dataframe)))
         # Keep track of stats
         self._set_stats (dataframe, 'n_total')          
@@ -1478,8 +1779,9 @@ class station (object):
     # +------------------------------------------------------------
     def _set_primary_sensor_type_stats (self, dataframe):
 
-        ''' A private function to set the counts of primary sensor and other
-            primary sensor per dataset type based on SENSOR_USED_PRIMARY column.
+        ''' A private function to set the counts of primary sensor per dataset
+            type based on SENSOR_USED_PRIMARY column. The counts of other primary
+            sensor are derived from QC_PROVENANCE.
 
             input params
             ------------
@@ -1488,8 +1790,21 @@ class station (object):
 
         self._set_stats (dataframe[dataframe['SENSOR_USED_PRIMARY'] == self._primary_type],
                          'n_with_primary_sensor')
-        self._set_stats (dataframe[dataframe['SENSOR_USED_PRIMARY'] == self._other_primary_type],
-                         'n_with_other_primary_sensor')
+
+    def _set_provenance_stats (self, dataframe):
+
+        ''' A private function to set the stats that are flag counts in
+            QC_PROVENANCE i.e. nan, capped, offsets applied, and other primary
+            sensor counts per dataset type, all from one bincount.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): data with QC_PROVENANCE and setType
+        '''
+
+        stats = qc_provenance.get_stats (dataframe.QC_PROVENANCE.values, dataframe.setType.values)
+        for dtype, counts in stats.items():
+            getattr (self, '_' + dtype + '_stats').update (counts)
 
     def _define_sensor_used (self, dataframe):
 
@@ -1510,7 +1825,8 @@ class station (object):
         ## By default, primary sensor type for all row records are the
         ## primary type 'Primary sensor Type' in the station info sheet.
         self._logger.info ('    * Default primary type is {0}.'.format (self._primary_type))
-        dataframe['SENSOR_USED_PRIMARY'] = [self._primary_type] * len (dataframe)
+        sensor_used = numpy.full (len (dataframe), self._primary_type, dtype=object)
+        dataframe['SENSOR_USED_PRIMARY'] = sensor_used
 
         ## If there is no other primary types (indicated in station info sheet),
         ## nothing else needs to be done. 
@@ -1521,7 +1837,11 @@ class station (object):
         ## When there is another primary type, re-define the primary type
         ## for the records within the time period.
         period = self._other_primary_type_period
-        dataframe.loc[period[0]:period[1], 'SENSOR_USED_PRIMARY'] = self._other_primary_type
+        sensor_used[get_tick_slice (dataframe.TICK.values, period[0], period[1],
+                                    times=dataframe.DATE_TIME.values)] = self._other_primary_type
+        dataframe['SENSOR_USED_PRIMARY'] = sensor_used
+        dataframe['QC_PROVENANCE'] = qc_provenance.add_flag (dataframe.QC_PROVENANCE.values, 'other_primary_sensor',
+                                                             sensor_used == self._other_primary_type)
 
         ## Just log the number of records with this change of primary sensor type
         nChanged = len (dataframe[dataframe.SENSOR_USED_PRIMARY == self._other_primary_type])
@@ -1553,10 +1873,14 @@ class station (object):
         ## Initialize a boolean column indicating if offsets are applied
         dataframe['OFFSETS_APPLIED'] = False
         ## If no offsets available, do nothing to time-series dataframe
-        if len (self._primary_offset_dict) == 0:
-            self._set_stats (dataframe[dataframe['OFFSETS_APPLIED']],
-                             'n_primary_offsets_applied')
-            return dataframe
+        if len (self._primary_offset_dict) == 0: return dataframe
+
+        ## Work on arrays; periods are positional slices on sorted ticks
+        ticks, times = dataframe.TICK.values, dataframe.DATE_TIME.values
+        primary = dataframe.PRIMARY.values.astype (float)
+        offsets_applied = dataframe.OFFSETS_APPLIED.values.copy()
+        ver_sensor_ids = dataframe.VER_WL_SENSOR_ID.values
+        sensor_used = dataframe.SENSOR_USED_PRIMARY.values
 
         ## Loop through each available offset periods
         for period, (sensor_id, offset_value) in self._primary_offset_dict.items():
@@ -1564,24 +1888,28 @@ class station (object):
             # apply offsets if the verified sensor ID from the raw statoin file
             # is the same as the previously defined primary sensor ID. i.e. do
             # not make use of the sensor_id column in offset file.
-            is_sensor = dataframe.loc[period[0]:period[1], 'VER_WL_SENSOR_ID'] == \
-                        dataframe.loc[period[0]:period[1], 'SENSOR_USED_PRIMARY']
+            aslice = get_tick_slice (ticks, period[0], period[1], times=times)
+            rows = aslice.start + numpy.flatnonzero (ver_sensor_ids[aslice] == sensor_used[aslice])
             self._logger.info ('    * +---------------------------------------------------------')
             self._logger.info ('    * | {0} - {1}'.format (period[0], period[1]))
-            self._logger.info ('    * |   {0} records are found with matching sensor ID'.format (len (is_sensor[is_sensor])))
+            self._logger.info ('    * |   {0} records are found with matching sensor ID'.format (len (rows)))
             # If no matching sensor, continue to the next set of offset.
-            if len (is_sensor[is_sensor]) == 0: continue
+            if len (rows) == 0: continue
             # Apply offset for specific rows
-            dataframe.loc[period[0]:period[1], 'PRIMARY'][is_sensor] += offset_value
-            dataframe.loc[period[0]:period[1], 'OFFSETS_APPLIED'][is_sensor] = True
+            primary[rows] += offset_value
+            offsets_applied[rows] = True
             self._logger.info ('    * |   Offset value of {0:.5f} is added to those records'.format (offset_value))
 
+        dataframe['PRIMARY'] = primary
+        dataframe['OFFSETS_APPLIED'] = offsets_applied
+        dataframe['QC_PROVENANCE'] = qc_provenance.add_flag (dataframe.QC_PROVENANCE.values,
+                                                             'offset_applied', offsets_applied)
+
         self._logger.info ('    * +---------------------------------------------------------')
         nApply = len (dataframe[dataframe.OFFSETS_APPLIED])
         self._logger.info ('    * Offsets are applied to a total of {0} records'.format (nApply))
 
         #  Count the number of rows with primary offsets applied
-        self._set_stats (dataframe[dataframe['OFFSETS_APPLIED']], 'n_primary_offsets_applied')
         return dataframe
 
     def _replace_nan (self, dataframe):
@@ -1611,23 +1939,38 @@ class station (object):
                 # Which row has a valid value for the key?
                 # 1 = is valid; 0 = is invalid
                 isValid = (~dataframe[key].isna ()).astype (int)
-                # Add in _TRUE column except RESIDUAL
-                if not 'RESIDUAL' in key: dataframe[key + '_TRUE'] = isValid
+                # Add in _TRUE column & provenance except RESIDUAL
+                if not 'RESIDUAL' in key:
+                    dataframe[key + '_TRUE'] = isValid
+                    dataframe['QC_PROVENANCE'] = qc_provenance.add_flag (dataframe.QC_PROVENANCE.values,
+                                                                         'nan_' + key.lower(), isValid.values == 0)
                 # Print on console if any invalid values are found and replaced
                 nInvalid = len (isValid[~isValid.astype (bool)])
                 if nInvalid > 0:
                     self._logger.info ('    * {0} {1} values are reset to 0.0'.format (nInvalid, key))
                 # Replace the invalid value by 0.0
                 dataframe.loc[~isValid.astype (bool), key] = 0.0
-
-        ## Count the number of nan & missing primary, primary sigma, backup, and
-        ## backup sigma. The nan residuals are reflected from primary and backup.
-        self._set_stats (dataframe[dataframe['PRIMARY_TRUE'] == 0], 'n_nan_primary')
-        self._set_stats (dataframe[dataframe['PRIMARY_SIGMA_TRUE'] == 0], 'n_nan_primary_sigma')
-        self._set_stats (dataframe[dataframe['BACKUP_TRUE'] == 0], 'n_nan_backup')
-        self._set_stats (dataframe[dataframe['BACKUP_SIGMA_TRUE'] == 0], 'n_nan_backup_sigma')
         return dataframe
 
+    def _flag_capped_values (self, dataframe, key, min_value, max_value):
+
+        ''' A private function to set capped_<key>_min / max in QC_PROVENANCE
+            for values beyond the accepted range.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): dataframe before capping
+            key (str): PRIMARY, BACKUP, PRIMARY_SIGMA, or BACKUP_SIGMA
+            min_value (float): accepted min value
+            max_value (float): accepted max value
+        '''
+
+        values = dataframe[key].values
+        provenance = qc_provenance.add_flag (dataframe.QC_PROVENANCE.values,
+                                             'capped_' + key.lower() + '_min', values < min_value)
+        dataframe['QC_PROVENANCE'] = qc_provenance.add_flag (provenance,
+                                                             'capped_' + key.lower() + '_max', values > max_value)
+
     def _cap_values (self, dataframe):
         
         ''' A private function to replace any PRIMARY and BACKUP water level
@@ -1647,36 +1990,62 @@ class station (object):
 
         ## 1. Cap PRIMARY & BACKUP water level
         for key in ['PRIMARY', 'BACKUP']:
-            # Count the number of capped value per set.
-            self._set_stats (dataframe[dataframe[key] < self._wl_range[0]],
-                             'n_capped_' + key.lower() + '_min')
-            self._set_stats (dataframe[dataframe[key] > self._wl_range[1]],
-                             'n_capped_' + key.lower() + '_max')
             # Log info out
             nBeyondMin = len (dataframe[dataframe[key] < self._wl_range[0]])
             nBeyondMax = len (dataframe[dataframe[key] > self._wl_range[1]])
             self._logger.info ('    * {0} records have {1} below min value of {2}'.format (nBeyondMin, key, self._wl_range[0]))
             self._logger.info ('    * {0} records have {1} above max value of {2}'.format (nBeyondMax, key, self._wl_range[1]))
+            # Keep capped rows for provenance
+            self._flag_capped_values (dataframe, key, self._wl_range[0], self._wl_range[1])
             # Apply the capping
             dataframe.loc[dataframe[key] < self._wl_range[0], key] = self._wl_range[0]
             dataframe.loc[dataframe[key] > self._wl_range[1], key] = self._wl_range[1]
 
         ## 2. Cap PRIMARY_SIGMA & BACKUP_SIGMA between 0 and 1
         for key in ['PRIMARY_SIGMA', 'BACKUP_SIGMA']:
-            # Count the number of capped value per set.
-            self._set_stats (dataframe[dataframe[key] < 0], 'n_capped_' + key.lower() + '_min')
-            self._set_stats (dataframe[dataframe[key] > 1], 'n_capped_' + key.lower() + '_max')
             # Log info out            
             nBeyondMin = len (dataframe[dataframe[key] < 0])
             nBeyondMax = len (dataframe[dataframe[key] > 1])
             self._logger.info ('    * {0} records have {1} below min value of 0'.format (nBeyondMin, key))
             self._logger.info ('    * {0} records have {1} above max value of 1'.format (nBeyondMax, key))
+            # Keep capped rows for provenance
+            self._flag_capped_values (dataframe, key, 0, 1)
             # Apply the capping
             dataframe.loc[dataframe[key] < 0, key] = 0                
             dataframe.loc[dataframe[key] > 1, key] = 1
 
         return dataframe
 
+    def _define_baseline (self, dataframe):
+
+        ''' A private function to stand in a rolling quantile of PRIMARY for
+            PRED_WL_VALUE_MSL at a station without any prediction, e.g. Great
+            Lakes. Capped PRIMARY values are left out of the baseline. Nothing
+            is changed if baseline window is not set or if any prediction
+            exists.
+
+            input params
+            ------------
+            dataframe (pandas.DataFrame): dataframe after capping
+
+            return param
+            ------------
+            dataframe (pandas.DataFrame): dataframe with baseline predictions
+        '''
+
+        if self._baseline_window is None: return dataframe
+        if not dataframe.PRED_WL_VALUE_MSL.isna().all(): return dataframe
+
+        primary = dataframe.PRIMARY.values.astype (float)
+        primary[qc_provenance.has_flag (dataframe.QC_PROVENANCE.values,
+                                        ['capped_primary_min', 'capped_primary_max'])] = numpy.nan
+        dataframe['PRED_WL_VALUE_MSL'] = rolling_baseline.rolling_quantile (dataframe.DATE_TIME.values,
+                                            primary, window=self._baseline_window,
+                                            quantile=self._baseline_quantile)
+        self._logger.info ('    * PRED_WL_VALUE_MSL is a rolling {0} quantile of PRIMARY over {1}'.format (
+                           self._baseline_quantile, self._baseline_window))
+        return dataframe
+
     # def _scale_values (self, dataframe):
         
     #     ''' A private function that scales PRIMARY, VERIFIED, BACKUP, and
@@ -1722,49 +2091,62 @@ class station (object):
         self._logger.info ('|  Start Cleaning ')
         self._logger.info ('+-------------------------------')
         ## Read raw data
-        dataframe = self._load_raw_data () 
+        with self._span ('load_raw_data') as span:
+            dataframe = self._load_raw_data () 
+            span.rows_out = len (dataframe)
 
         ## Add SENSOR_USED_PRIMARY column from station list
         #  This is Step 8 in WL-AI Station File Requirements  
-        self._logger.info ('1. Define SENSOR_USED_PRIMARY column')
-        dataframe = self._define_sensor_used (dataframe)
+        with self._span ('define_sensor_used', dataframe) as span:
+            self._logger.info ('1. Define SENSOR_USED_PRIMARY column')
+            dataframe = self._define_sensor_used (dataframe)
 
         ## Define PRIMARY water level based on SENSOR_USED_PRIMARY
         #  This is Step 9 in WL-AI Station File Requirements
-        self._logger.info ('2. Define PRIMARY water level based on SENSOR_USED_PRIMARY')
-        dataframe['PRIMARY'] = dataframe.apply (get_primaries, axis=1)
+        with self._span ('define_primary', dataframe) as span:
+            self._logger.info ('2. Define PRIMARY water level based on SENSOR_USED_PRIMARY')
+            dataframe['PRIMARY'] = dataframe.apply (get_primaries, axis=1)
 
         ## Apply offsets to PRIMARY water level
         #  This is Step 10 in WL-AI Station File Requirements
-        self._logger.info ('3. Apply offset to PRIMARY')
-        dataframe = self._apply_offsets_on_primary (dataframe)
+        with self._span ('apply_offsets', dataframe) as span:
+            self._logger.info ('3. Apply offset to PRIMARY')
+            dataframe = self._apply_offsets_on_primary (dataframe)
 
         ## Add PRIMARY_SIGMA column i.e. A1_WL_SIGMA
         #  This is Step 11 in WL-AI Station File Requirements
-        self._logger.info ('4. Define PRIMARY_SIGMA')
-        dataframe['PRIMARY_SIGMA'] = dataframe.apply (get_primary_sigmas, axis=1)
+        with self._span ('define_primary_sigma', dataframe) as span:
+            self._logger.info ('4. Define PRIMARY_SIGMA')
+            dataframe['PRIMARY_SIGMA'] = dataframe.apply (get_primary_sigmas, axis=1)
 
         ## Add BACKUP & BACKUP_SIGMA 
         #  This is Step 12 in WL-AI Station File Requirements
-        self._logger.info ('5. Define BACKUP & BACKUP_SIGMA')
-        dataframe['BACKUP'] = dataframe.B1_WL_VALUE_MSL
-        dataframe['BACKUP_SIGMA'] = dataframe.B1_WL_SIGMA
+        with self._span ('define_backup', dataframe) as span:
+            self._logger.info ('5. Define BACKUP & BACKUP_SIGMA')
+            dataframe['BACKUP'] = dataframe.B1_WL_VALUE_MSL
+            dataframe['BACKUP_SIGMA'] = dataframe.B1_WL_SIGMA
         
         ## Cap PRIMARY & BACKUP between WL_MIN & WL_MAX and their SIGMAs between 0 and 1.
-        #  _cap_values() automatically counts the number of capped primary, backup, and their sigmas.
+        #  _cap_values() flags the capped primary, backup, and their sigmas in QC_PROVENANCE.
         ## This is Step 13 in WL-AI Station File Requirements
-        self._logger.info ('6. Cap PRIMARY & BACKUP and their SIGMAs')
-        dataframe = self._cap_values (dataframe)  
+        with self._span ('cap_values', dataframe) as span:
+            self._logger.info ('6. Cap PRIMARY & BACKUP and their SIGMAs')
+            dataframe = self._cap_values (dataframe)  
+
+        ## Stand in a rolling baseline for missing predictions if asked
+        with self._span ('define_baseline', dataframe) as span:
+            dataframe = self._define_baseline (dataframe)
 
         ## Add PRIMARY_RESIDUAL i.e. PRIMARY - PRED
         #  This is Step 14 in WL-AI Station File Requirements
-        self._logger.info ('7. Define PRIMARY_RESIDUAL')
-        dataframe['PRIMARY_RESIDUAL'] = dataframe.PRIMARY - dataframe.PRED_WL_VALUE_MSL
+        with self._span ('define_residuals', dataframe) as span:
+            self._logger.info ('7. Define PRIMARY_RESIDUAL')
+            dataframe['PRIMARY_RESIDUAL'] = dataframe.PRIMARY - dataframe.PRED_WL_VALUE_MSL
 
-        ## Add BACKUP_RESIDUAL 
-        #  This is Step 15 in WL-AI Station File Requirements
-        self._logger.info ('8. Define BACKUP_RESIDUAL')
-        dataframe['BACKUP_RESIDUAL'] = dataframe.B1_WL_VALUE_MSL - dataframe.PRED_WL_VALUE_MSL
+            ## Add BACKUP_RESIDUAL 
+            #  This is Step 15 in WL-AI Station File Requirements
+            self._logger.info ('8. Define BACKUP_RESIDUAL')
+            dataframe['BACKUP_RESIDUAL'] = dataframe.B1_WL_VALUE_MSL - dataframe.PRED_WL_VALUE_MSL
 
         # ## Add PRIMARY_SIGMA column i.e. A1_WL_SIGMA & PRIMARY_RESIDUAL i.e. PRIMARY - PRED
         # #  This is Step xx in WL-AI Station File Requirements
@@ -1781,47 +2163,65 @@ class station (object):
 
         ## Add PREDICTION & VERIFIED
         #  This is Step 16 in WL-AI Station File Requirements
-        self._logger.info ('9. Define VERIFIED, VERIFIED_RESIDUAL, VERIFIED_SENSOR_ID & PREDICTION')
-        dataframe['VERIFIED'] = dataframe.VER_WL_VALUE_MSL
-        dataframe['VERIFIED_RESIDUAL'] = dataframe.VER_WL_VALUE_MSL - dataframe.PRED_WL_VALUE_MSL
-        # dataframe['PRESCALED_VERIFIED'] = dataframe.VER_WL_VALUE_MSL
-        dataframe['VERIFIED_SENSOR_ID'] = dataframe.VER_WL_SENSOR_ID
-        dataframe['PREDICTION'] = dataframe.PRED_WL_VALUE_MSL
-
-        ## Count the # records
-        #    .. with invalid verified
-        self._set_stats (dataframe[dataframe.VER_WL_VALUE_MSL.isna()], 'n_nan_verified')        
-        #    .. with valid primary but nan verified
-        is_bad = numpy.logical_and (~dataframe.PRIMARY.isna(), 
-                                    dataframe.VER_WL_VALUE_MSL.isna())
-        self._set_stats (dataframe[is_bad], 'n_nan_verified_valid_primary')
-        #    .. with nan primary and nan verified
-        is_bad = numpy.logical_and (dataframe.PRIMARY.isna(), 
-                                    dataframe.VER_WL_VALUE_MSL.isna())
-        self._set_stats (dataframe[is_bad], 'n_nan_verified_nan_primary')
+        with self._span ('define_verified', dataframe) as span:
+            self._logger.info ('9. Define VERIFIED, VERIFIED_RESIDUAL, VERIFIED_SENSOR_ID & PREDICTION')
+            dataframe['VERIFIED'] = dataframe.VER_WL_VALUE_MSL
+            dataframe['VERIFIED_RESIDUAL'] = dataframe.VER_WL_VALUE_MSL - dataframe.PRED_WL_VALUE_MSL
+            # dataframe['PRESCALED_VERIFIED'] = dataframe.VER_WL_VALUE_MSL
+            dataframe['VERIFIED_SENSOR_ID'] = dataframe.VER_WL_SENSOR_ID
+            dataframe['PREDICTION'] = dataframe.PRED_WL_VALUE_MSL
+
+            ## Count the # records
+            #    .. with invalid verified
+            self._set_stats (dataframe[dataframe.VER_WL_VALUE_MSL.isna()], 'n_nan_verified')        
+            #    .. with valid primary but nan verified
+            is_bad = numpy.logical_and (~dataframe.PRIMARY.isna(), 
+                                        dataframe.VER_WL_VALUE_MSL.isna())
+            self._set_stats (dataframe[is_bad], 'n_nan_verified_valid_primary')
+            #    .. with nan primary and nan verified
+            is_bad = numpy.logical_and (dataframe.PRIMARY.isna(), 
+                                        dataframe.VER_WL_VALUE_MSL.isna())
+            self._set_stats (dataframe[is_bad], 'n_nan_verified_nan_primary')
 
         ## Add TARGET based on target threshold between PRIMARY and VER_WL_VALUE_MSL
         #  This is Step 17 in WL-AI Station File Requirements
-        self._logger.info ('10. Define TARGET with threshold value of {0} meters'.format (TARGET_THRESH))
-        dataframe['TARGET'] = ((dataframe.PRIMARY - dataframe.VER_WL_VALUE_MSL).abs() <= TARGET_THRESH).astype (int)
-        #  Count the number of spikes per set and in total
-        is_spikes = numpy.logical_and (dataframe.TARGET==0,  ~dataframe.PRIMARY.isna())
-        self._logger.info ('   {0} records are identified as target spikes'.format (len (dataframe[is_spikes])))    
-        #  Exclude those with nan VER_WL_VALUE_MSL when counting n_spikes
-        if exclude_nan_verified:
-            is_spikes = numpy.logical_and (is_spikes, ~dataframe.VER_WL_VALUE_MSL.isna())
-            message = '   {0} records are identified as target spikes after excluding nan VER'
-            self._logger.info (message.format (len (dataframe[is_spikes])))    
-        self._set_stats (dataframe[is_spikes], 'n_spikes')
+        with self._span ('define_target', dataframe) as span:
+            self._logger.info ('10. Define TARGET with threshold value of {0} meters'.format (TARGET_THRESH))
+            dataframe['TARGET'] = ((dataframe.PRIMARY - dataframe.VER_WL_VALUE_MSL).abs() <= TARGET_THRESH).astype (int)
+            #  Count the number of spikes per set and in total
+            is_spikes = numpy.logical_and (dataframe.TARGET==0,  ~dataframe.PRIMARY.isna())
+            self._logger.info ('   {0} records are identified as target spikes'.format (len (dataframe[is_spikes])))    
+            #  Exclude those with nan VER_WL_VALUE_MSL when counting n_spikes
+            if exclude_nan_verified:
+                is_spikes = numpy.logical_and (is_spikes, ~dataframe.VER_WL_VALUE_MSL.isna())
+                message = '   {0} records are identified as target spikes after excluding nan VER'
+                self._logger.info (message.format (len (dataframe[is_spikes])))    
+            self._set_stats (dataframe[is_spikes], 'n_spikes')
         
         ## Plot difference between PRIMARY and VERIFIED histogram
-        self._handle_primary_verified_differences (dataframe)
+        with self._span ('primary_verified_differences', dataframe) as span:
+            self._handle_primary_verified_differences (dataframe)
 
         ## For PRIMARY, BACKUP, and their SIGMAs & RESIDUALs, replace all NaNs / missing
         #  entries with 0 and create dummy boolean column with _TRUE suffix in column names
         #  This is Step 18 in WL-AI Station File Requirements
-        self._logger.info ('11. Replace NaNs with 0 and dummy column for PRIMARY, BACKUP and their SIGMA, RESIDUAL')    
-        dataframe = self._replace_nan (dataframe)     
+        with self._span ('replace_nan', dataframe) as span:
+            self._logger.info ('11. Replace NaNs with 0 and dummy column for PRIMARY, BACKUP and their SIGMA, RESIDUAL')    
+            dataframe = self._replace_nan (dataframe)     
+            #  Count nan, capped, offsets applied, and other primary sensor from QC_PROVENANCE
+            self._set_provenance_stats (dataframe)
+
+        ## Define scalers: GT range & std of good training residuals. If no
+        ## good training residuals, use all sets.
+        with self._span ('define_scalers', dataframe) as span:
+            self._logger.info ('12. Define scalers for normalization')
+            is_good = numpy.logical_and (dataframe.PRIMARY_TRUE.values == 1, dataframe.TARGET.values == 1)
+            is_train = dataframe.setType.values == 'train'
+            residual_std = scaler_registry.get_residual_std (dataframe.PRIMARY_RESIDUAL.values, is_good & is_train)
+            if numpy.isnan (residual_std):
+                residual_std = scaler_registry.get_residual_std (dataframe.PRIMARY_RESIDUAL.values, is_good)
+            self._scalers = {'gt_range':self._gt_range, 'residual_std':residual_std}
+            self._logger.info ('   GT range = {0}; residual std = {1}'.format (self._gt_range, residual_std))
 
         # ## Scale PRIMARY, BACKUP, and PREDICTION by GT range
         # ## This is Step 19 in WL-AI Station File Requirements
@@ -1829,4 +2229,4 @@ class station (object):
         # dataframe = self._scale_values (dataframe)
 
         # Keep columns requested in specific order
-        return dataframe[CLEANED_COLUMNS + ['setType']]
+        return dataframe[get_cleaned_columns (self._regular_grid) + ['setType']]
@@ -0,0 +1,293 @@
+#!python37
+
+## This script defines a station_registry class that holds the meta-data of
+## all stations from the station info sheet and the locations of their raw
+## files. It is built once by data_cleaner.load_station_info() so that setting
+## up a station does not filter the info sheet, re-parse date strings, or glob
+## the raw folder again.
+##
+##  * Meta-data is parsed from the info sheet dataframe column by column and
+##    indexed by station ID. Periods are parsed as timestamps up front.
+##  * Raw, primary offset, and B1 gain / offset files are resolved with one
+##    scan of the raw folder. File names are expected as
+##    <station ID><pattern>, e.g. 8443970_raw_ver_merged_wl.csv.
+##
+## Example snippet to use the station_registry class:
+## +-------------------------------------------------------------
+## import station_registry, station
+##
+## # station_frame from data_cleaner._read_station_info()
+## registry = station_registry.station_registry (station_frame)
+## registry.scan_raw_path ('C:/to/raw/')
+##
+## astation = station.station (8443970)
+## astation.set_station_meta (registry.get_meta (8443970))
+## if registry.has_complete_set (8443970):
+##     files = registry.get_files (8443970)
+##     astation.raw_file = files['raw']
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, os
+
+###############################################
+## Define constants
+###############################################
+# File name pattern of Armin's raw files
+FILE_PATTERNS = {'raw':'_raw_ver_merged_wl.csv',
+                 'primary_offsets':'_offsets.csv',
+                 'B1_gain_offsets':'_B1_gain_offsets.csv'}
+
+# Dataset types and their period columns in station info sheet
+DATASET_TYPES = ['train', 'validation', 'test']
+PERIOD_COLUMNS = {'train':'Dates used for training',
+                  'validation':'Dates used for Validation',
+                  'test':'Dates used for testing'}
+
+# Other columns required from the station info sheet
+INFO_COLUMNS = ['Station ID', 'Problem station?', 'Neighbor station number',
+                'GT Range', 'WL Min', 'WL Max', 'Primary sensor Type',
+                'Other primary sensor used?', 'Other primary sensor dates']
+
+###############################################
+## Define functions
+###############################################
+def parse_file_name (filename):
+
+    ''' A function to get the station ID and file type of a raw file name
+        <station ID><pattern>, e.g. 8443970_raw_ver_merged_wl.csv.
+
+        input params
+        ------------
+        filename (str): base name of a file
+
+        return params
+        -------------
+        station_id (int): station ID; None if not a raw file
+        key (str): one of FILE_PATTERNS keys; None if not a raw file
+    '''
+
+    prefix, _, suffix = filename.partition ('_')
+    if not prefix.isdigit(): return None, None
+    for key, pattern in FILE_PATTERNS.items():
+        if '_' + suffix == pattern: return int (prefix), key
+    return None, None
+
+def _parse_periods (period_strings, add_end_of_day=False):
+
+    ''' A private function to parse a column of 'YYYY-mm-dd to YYYY-mm-dd'
+        strings into begin and end timestamps at once. Unreadable periods are
+        NaT.
+
+        input params
+        ------------
+        period_strings (pandas.Series): period strings
+        add_end_of_day (bool): If true, add 23:59 to end dates
+
+        return params
+        -------------
+        begins (pandas.Series): begin timestamps
+        ends (pandas.Series): end timestamps
+    '''
+
+    parts = period_strings.astype (str).str.split ('to', n=1, expand=True)
+    # No period has an end e.g. all NaN; an object column keeps .str working
+    if parts.shape[1] < 2: parts[1] = pandas.Series (None, index=parts.index, dtype=object)
+    begins = pandas.to_datetime (parts[0].str.strip(), errors='coerce')
+    ends = pandas.to_datetime (parts[1].str.strip(), errors='coerce')
+    if add_end_of_day:
+        ends += pandas.offsets.Hour(23) + pandas.offsets.Minute(59)
+    invalid = begins.isna() | ends.isna()
+    return begins.where (~invalid), ends.where (~invalid)
+
+###############################################
+## Define station_registry class
+###############################################
+class station_registry (object):
+
+    ''' This class indexes station meta-data and raw file locations by
+        station ID.
+    '''
+
+    def __init__ (self, station_frame):
+
+        ''' To initialize a registry, the station info dataframe (with period
+            columns already filled by data_cleaner) is required.
+
+            input params
+            ------------
+            station_frame (pandas.DataFrame): station meta-data from info sheet
+        '''
+
+        ## Logger
+        self._logger = logging.getLogger ('station_registry')
+
+        ## Meta-data per station ID
+        self._meta = self._parse_station_frame (station_frame)
+
+        ## File locations per station ID; filled by scan_raw_path()
+        self._raw_path = None
+        self._files = {}
+
+    def __len__ (self): return len (self._meta)
+
+    def __contains__ (self, station_id): return int (station_id) in self._meta
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def station_ids (self): return numpy.array (list (self._meta.keys()))
+
+    @property
+    def raw_path (self): return self._raw_path
+
+    # +------------------------------------------------------------
+    # | Parse meta-data & scan raw folder
+    # +------------------------------------------------------------
+    def _parse_station_frame (self, station_frame):
+
+        ''' A private function to parse the meta-data of all stations once.
+
+            input params
+            ------------
+            station_frame (pandas.DataFrame): station meta-data from info sheet
+
+            return params
+            -------------
+            meta (dict): {station ID: meta-data dictionary}
+        '''
+
+        ## Make sure all required columns are available
+        columns = INFO_COLUMNS + list (PERIOD_COLUMNS.values())
+        missing = [column for column in columns if not column in station_frame]
+        if len (missing) > 0:
+            message = 'Station info sheet does not have columns, {0}.'.format (missing)
+            self._logger.fatal (message)
+            raise IOError (message)
+
+        ## Parse all periods column by column
+        periods = {dtype:_parse_periods (station_frame[column], add_end_of_day=True)
+                   for dtype, column in PERIOD_COLUMNS.items()}
+        other_begins, other_ends = _parse_periods (station_frame['Other primary sensor dates'])
+
+        meta = {}
+        for index in range (len (station_frame)):
+            station_id = int (station_frame['Station ID'].values[index])
+            info = {'has_bad_results':isinstance (station_frame['Problem station?'].values[index], str),
+                    'neighbor_id':int (station_frame['Neighbor station number'].values[index]),
+                    'gt_range':station_frame['GT Range'].values[index],
+                    'wl_range':(station_frame['WL Min'].values[index],
+                                station_frame['WL Max'].values[index]),
+                    'primary_type':str (station_frame['Primary sensor Type'].values[index]).strip(),
+                    'other_primary_type':None, 'other_primary_type_period':None}
+
+            # Periods are [] if they cannot be read
+            for dtype in DATASET_TYPES:
+                begin, end = periods[dtype][0].iloc[index], periods[dtype][1].iloc[index]
+                if pandas.isna (begin):
+                    self._logger.warn ('Cannot read period for {0} set of station {1}.'.format (dtype, station_id))
+                    info[dtype + '_dates'] = []
+                    continue
+                info[dtype + '_dates'] = numpy.array ([begin, end])
+
+            # Other primary sensor type & period. Keep an unreadable period as
+            # is; the station raises when it is set up.
+            other_primary_type = station_frame['Other primary sensor used?'].values[index]
+            if isinstance (other_primary_type, str):
+                info['other_primary_type'] = other_primary_type.strip()
+                begin, end = other_begins.iloc[index], other_ends.iloc[index]
+                info['other_primary_type_period'] = \
+                    station_frame['Other primary sensor dates'].values[index] if pandas.isna (begin) else \
+                    numpy.array ([begin, end])
+
+            meta[station_id] = info
+
+        return meta
+
+    def scan_raw_path (self, raw_path):
+
+        ''' A public function to resolve all raw files in the raw folder with
+            one directory scan.
+
+            input params
+            ------------
+            raw_path (str): Path to Armins unzipped raw files
+        '''
+
+        self._raw_path = raw_path
+        self._files = {}
+
+        with os.scandir (raw_path) as entries:
+            for entry in entries:
+                if not entry.is_file(): continue
+                station_id, key = parse_file_name (entry.name)
+                if station_id is None: continue
+                self._files.setdefault (station_id, {})[key] = entry.path
+
+        message = 'Found raw files of {0} stations in {1}.'
+        self._logger.info (message.format (len (self._files), raw_path))
+
+    # +------------------------------------------------------------
+    # | Lookups
+    # +------------------------------------------------------------
+    def get_meta (self, station_id):
+
+        ''' A public function to get the meta-data of a station.
+
+            input params
+            ------------
+            station_id (int): station ID
+
+            return params
+            -------------
+            meta (dict): meta-data for station.set_station_meta()
+        '''
+
+        station_id = int (station_id)
+        if not station_id in self._meta:
+            message = 'Station {0} is not in station info sheet.'.format (station_id)
+            self._logger.fatal (message)
+            raise IOError (message)
+        return self._meta[station_id]
+
+    def get_files (self, station_id):
+
+        ''' A public function to get the raw file locations of a station.
+
+            input params
+            ------------
+            station_id (int): station ID
+
+            return params
+            -------------
+            files (dict): {'raw', 'primary_offsets', 'B1_gain_offsets': path}
+                          Missing files are not included.
+        '''
+
+        return self._files.get (int (station_id), {})
+
+    def has_complete_set (self, station_id):
+
+        ''' A public function to check if all raw files are available i.e.
+            raw data, primary offsets, and backup gain and offset files.
+
+            input params
+            ------------
+            station_id (int): station ID
+
+            return params
+            -------------
+            Boolean: If true, this station has all files.
+        '''
+
+        files = self.get_files (station_id)
+        for key, pattern in FILE_PATTERNS.items():
+            if not key in files:
+                message = 'Station {0} does not have {0}{1} file.'
+                self._logger.warn (message.format (station_id, pattern))
+                return False
+        return True
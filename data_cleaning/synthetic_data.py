@@ -0,0 +1,399 @@
+#!python37
+
+## This script synthesizes raw files in the same format as Armin's, so that
+## the cleaning process can be run and timed without the real data. For each
+## station, it writes
+##  * <station ID>_raw_ver_merged_wl.csv
+##  * <station ID>_offsets.csv
+##  * <station ID>_B1_gain_offsets.csv
+## to a raw folder, plus a matching station info sheet for all stations.
+##
+## The water level is a sum of the main tidal constituents (M2, S2, N2, K1,
+## O1) with random amplitudes / phases per station; that is the prediction.
+## Verified adds a slow mean sea level drift and a weather surge. Primary A1
+## and other primary Y1 are verified plus sensor noise, with spikes, NaNs,
+## and out-of-range values. Backup B1 is stored raw i.e. before its gain /
+## offset and MSL, with a DCP switch that comes with a calibration change.
+## On top of that, the raw file has
+##  * dropped 6-minute slots and a few off-grid (e.g. 00:08) records
+##  * duplicated timestamps: some repeated rows have -99999.999 sentinels,
+##    others are a second good row with a different primary value
+##  * an other primary sensor period where VER_WL_SENSOR_ID is Y1
+## Primary offsets include a repeated period, as found in a few real files.
+##
+## Stations are paired as neighbors; with an odd # stations, the last one
+## joins the previous pair (or is its own neighbor if it is the only one).
+## Everything is seeded, so the same inputs give the same files.
+##
+## Example snippet:
+## +-------------------------------------------------------------
+## import synthetic_data
+## station_ids = synthetic_data.make_stations ('C:/to/synthetic/', n_stations=10,
+##                                             begin_date='2016-01-01',
+##                                             end_date='2019-06-30')
+## # Then point data_cleaner to C:/to/synthetic/raw/ and
+## # C:/to/synthetic/station_info.csv
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, os, logging
+
+###############################################
+## Define constants
+###############################################
+# File name patterns in raw folder
+FILE_PATTERNS = {'raw':'_raw_ver_merged_wl.csv',
+                 'primary_offsets':'_offsets.csv',
+                 'B1_gain_offsets':'_B1_gain_offsets.csv'}
+STATION_INFO_FILE = 'station_info.csv'
+
+# First synthetic station ID; IDs are not real CO-OPS stations
+FIRST_STATION_ID = 9900001
+
+# Default time range; it covers train / validation / test
+BEGIN_DATE, END_DATE = '2015-01-01', '2019-06-30'
+
+# Tidal constituents: period in hours and typical amplitude in meters
+CONSTITUENTS = {'M2':(12.4206012, 0.50), 'S2':(12.0, 0.12), 'N2':(12.65834751, 0.10),
+                'K1':(23.93447213, 0.15), 'O1':(25.81933871, 0.10)}
+
+# Rates per record
+RATES = {'spike':0.002, 'nan_primary':0.01, 'out_of_range':0.0005,
+         'nan_verified':0.003, 'nan_backup':0.02, 'dropped':0.003,
+         'off_grid':0.0001, 'duplicated_999':0.00005, 'duplicated_good':0.00005}
+
+# Valid water level range in station info sheet
+WL_MIN, WL_MAX = -3, 3
+
+# Other primary sensor period as a fraction of the full time range
+OTHER_SENSOR_PERIOD = (0.6, 0.65)
+
+# Fraction of the full time range when B1 DCP switches from 2 to 3
+DCP_SWITCH = 0.7
+
+###############################################
+## Define functions
+###############################################
+def get_times (begin_date=BEGIN_DATE, end_date=END_DATE):
+
+    ''' A function to get the 6-minute timestamps from begin to end date.
+
+        input params
+        ------------
+        begin_date (str): first day
+        end_date (str): last day; its 23:54 is included
+
+        return params
+        -------------
+        times (pandas.DatetimeIndex): 6-minute timestamps
+    '''
+
+    end_time = pandas.Timestamp (end_date) + pandas.Timedelta ('23:54:00')
+    return pandas.date_range (begin_date, end_time, freq='6min')
+
+def get_tides (times, rng, amplitude_scale=1.):
+
+    ''' A function to sum the tidal constituents with random amplitudes and
+        phases.
+
+        input params
+        ------------
+        times (pandas.DatetimeIndex): timestamps
+        rng (numpy.random.Generator): random number generator of the station
+        amplitude_scale (float): scale of all amplitudes
+
+        return params
+        -------------
+        tides (numpy.array): predicted water level in meters
+    '''
+
+    hours = (times - times[0]).total_seconds().values / 3600.
+    tides = numpy.zeros (len (times))
+    for period, amplitude in CONSTITUENTS.values():
+        amplitude *= amplitude_scale * rng.uniform (0.5, 1.5)
+        phase = rng.uniform (0, 2 * numpy.pi)
+        tides += amplitude * numpy.cos (2 * numpy.pi * hours / period + phase)
+    return tides
+
+def get_surge (n_records, rng, scale=0.1, memory=240):
+
+    ''' A function to get a smooth weather surge as an AR(1) random walk.
+
+        input params
+        ------------
+        n_records (int): # records
+        rng (numpy.random.Generator): random number generator of the station
+        scale (float): standard deviation of the surge in meters
+        memory (int): # records for the surge to decay by 1/e
+
+        return params
+        -------------
+        surge (numpy.array): surge in meters
+    '''
+
+    alpha = numpy.exp (-1. / memory)
+    noise = rng.normal (0, scale * numpy.sqrt (1 - alpha**2), n_records)
+    surge = numpy.empty (n_records)
+    surge[0] = noise[0]
+    for index in range (1, n_records):
+        surge[index] = alpha * surge[index-1] + noise[index]
+    return surge
+
+def make_raw_data (station_id, times, rng, gains, offsets, b1_msl=1.5):
+
+    ''' A function to synthesize the raw data of a station.
+
+        input params
+        ------------
+        station_id (int): station ID
+        times (pandas.DatetimeIndex): 6-minute timestamps
+        rng (numpy.random.Generator): random number generator of the station
+        gains (list): B1 gain before and after DCP switch
+        offsets (list): B1 offset before and after DCP switch
+        b1_msl (float): B1 MSL
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): raw data in Armin's format
+    '''
+
+    n_records = len (times)
+    fractions = numpy.arange (n_records) / n_records
+
+    ## Prediction & verified
+    prediction = get_tides (times, rng)
+    msl_drift = 0.05 * numpy.sin (2 * numpy.pi * fractions * 3)
+    verified = prediction + msl_drift + get_surge (n_records, rng)
+
+    ## Primary A1 and other primary Y1 with spikes, NaNs, and out-of-range values
+    primary = verified + rng.normal (0, 0.003, n_records)
+    other_primary = verified + rng.normal (0, 0.004, n_records)
+    is_spike = rng.random (n_records) < RATES['spike']
+    primary[is_spike] += rng.normal (0, 0.5, is_spike.sum())
+    primary[rng.random (n_records) < RATES['nan_primary']] = numpy.nan
+    primary[rng.random (n_records) < RATES['out_of_range']] = WL_MAX * 3
+    verified[rng.random (n_records) < RATES['nan_verified']] = numpy.nan
+
+    ## Backup B1 stored raw: B1 = (MSL backup + MSL - offset) / gain
+    is_switched = fractions >= DCP_SWITCH
+    backup_dcp = numpy.where (is_switched, 3, 2)
+    gain = numpy.where (is_switched, gains[1], gains[0])
+    offset = numpy.where (is_switched, offsets[1], offsets[0])
+    backup = (verified + rng.normal (0, 0.01, n_records) + b1_msl - offset) / gain
+    backup[rng.random (n_records) < RATES['nan_backup']] = numpy.nan
+
+    ## Verified sensor: A1 mostly; Y1 in the other primary sensor period
+    verified_sensor = numpy.where (rng.random (n_records) < 0.98, 'A1', 'B1').astype (object)
+    is_other = (fractions >= OTHER_SENSOR_PERIOD[0]) & (fractions < OTHER_SENSOR_PERIOD[1])
+    verified_sensor[is_other] = 'Y1'
+
+    return pandas.DataFrame ({'STATION_ID':station_id, 'DATE_TIME':times,
+                              'A1_WL_VALUE_MSL':primary,
+                              'A1_WL_SIGMA':numpy.abs (rng.normal (0.01, 0.01, n_records)),
+                              'Y1_WL_VALUE_MSL':other_primary,
+                              'Y1_WL_SIGMA':numpy.abs (rng.normal (0.01, 0.01, n_records)),
+                              'B1_WL_VALUE':backup, 'B1_MSL':b1_msl, 'B1_DCP':backup_dcp,
+                              'B1_WL_SIGMA':numpy.abs (rng.normal (0.01, 0.02, n_records)),
+                              'VER_WL_VALUE_MSL':verified, 'VER_WL_SENSOR_ID':verified_sensor,
+                              'PRED_WL_VALUE_MSL':prediction})
+
+def add_irregularities (dataframe, rng):
+
+    ''' A function to drop slots, add off-grid records, and add duplicated
+        timestamps with and without -99999.999 sentinels.
+
+        input params
+        ------------
+        dataframe (pandas.DataFrame): raw data on a regular 6-minute grid
+        rng (numpy.random.Generator): random number generator of the station
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): raw data sorted by time
+    '''
+
+    n_records = len (dataframe)
+
+    ## Drop random slots and one 10-hour gap
+    is_dropped = rng.random (n_records) < RATES['dropped']
+    gap_start = rng.integers (0, max (n_records - 100, 1))
+    is_dropped[gap_start:gap_start+100] = True
+
+    ## Off-grid records 2 minutes after a 6-minute mark
+    off_grid = dataframe[rng.random (n_records) < RATES['off_grid']].copy()
+    off_grid['DATE_TIME'] += pandas.Timedelta (minutes=2)
+
+    ## Repeated rows with a sentinel in a random numeric column
+    dup_999 = dataframe[rng.random (n_records) < RATES['duplicated_999']].copy()
+    columns = ['A1_WL_VALUE_MSL', 'A1_WL_SIGMA', 'B1_WL_VALUE', 'VER_WL_VALUE_MSL']
+    for index, column in enumerate (rng.choice (columns, len (dup_999))):
+        dup_999.iloc[index, dup_999.columns.get_loc (column)] = -99999.999
+
+    ## Repeated rows that look good but have a different primary
+    dup_good = dataframe[rng.random (n_records) < RATES['duplicated_good']].copy()
+    dup_good['A1_WL_VALUE_MSL'] += 0.05
+
+    dataframe = pandas.concat ([dataframe[~is_dropped], off_grid, dup_999, dup_good])
+    return dataframe.sort_values ('DATE_TIME', kind='stable')
+
+def make_primary_offsets (station_id, times):
+
+    ''' A function to define primary offsets, including a repeated period.
+
+        input params
+        ------------
+        station_id (int): station ID
+        times (pandas.DatetimeIndex): 6-minute timestamps
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): offsets in Armin's format
+    '''
+
+    n_records = len (times)
+    begins = [times[int (n_records * fraction)] for fraction in [0.05, 0.3, 0.3, 0.8]]
+    ends = [begin + pandas.Timedelta (days=60) for begin in begins]
+    return pandas.DataFrame ({'STATION_ID':station_id,
+                              'BEGIN_DATE_TIME':[begin.strftime ('%Y-%m-%d %H:%M') for begin in begins],
+                              'END_DATE_TIME':[end.strftime ('%Y-%m-%d %H:%M') for end in ends],
+                              'SENSOR_ID':'A1', 'OFFSET':[0.01, -0.02, -0.03, 0.015]})
+
+def make_B1_gain_offsets (station_id, times, gains, offsets):
+
+    ''' A function to define B1 gain / offset: an identity set for DCP 2, a
+        calibration change for DCP 2, and the set for DCP 3 at the switch.
+
+        input params
+        ------------
+        station_id (int): station ID
+        times (pandas.DatetimeIndex): 6-minute timestamps
+        gains (list): B1 gain before and after DCP switch
+        offsets (list): B1 offset before and after DCP switch
+
+        return params
+        -------------
+        dataframe (pandas.DataFrame): B1 gain / offset in Armin's format
+    '''
+
+    before = times[0] - pandas.Timedelta (days=365)
+    switch = times[int (len (times) * DCP_SWITCH)]
+    begins = [begin.strftime ('%Y-%m-%d %H:%M') for begin in [before, times[0], switch]]
+    return pandas.DataFrame ({'STATION_ID':station_id, 'B1_DCP':[2, 2, 2, 2, 3, 3],
+                              'PARAMETER_NAME':['ACC_BACKUP_GAIN', 'ACC_BACKUP_OFFSET'] * 3,
+                              'ACC_PARAM_VAL':[1.0, 0.0, gains[0], offsets[0], gains[1], offsets[1]],
+                              'BEGIN_DATE_TIME':numpy.repeat (begins, 2),
+                              'END_DATE_TIME':'2100-01-01 00:00'})
+
+def make_station (raw_path, station_id, begin_date=BEGIN_DATE, end_date=END_DATE, seed=0):
+
+    ''' A function to write the 3 raw files of a station.
+
+        input params
+        ------------
+        raw_path (str): folder to write raw files
+        station_id (int): station ID
+        begin_date (str): first day of the raw data
+        end_date (str): last day of the raw data
+        seed (int): random seed of this station
+    '''
+
+    rng = numpy.random.default_rng (seed)
+    times = get_times (begin_date, end_date)
+    gains = [rng.uniform (0.98, 1.02), rng.uniform (0.98, 1.02)]
+    offsets = [rng.uniform (-0.3, 0.3), rng.uniform (-0.3, 0.3)]
+
+    filebase = '{0}/{1}'.format (raw_path, station_id)
+    dataframe = add_irregularities (make_raw_data (station_id, times, rng, gains, offsets), rng)
+    dataframe.to_csv (filebase + FILE_PATTERNS['raw'], index=False, date_format='%Y-%m-%d %H:%M')
+    make_primary_offsets (station_id, times).to_csv (filebase + FILE_PATTERNS['primary_offsets'], index=False)
+    make_B1_gain_offsets (station_id, times, gains, offsets).to_csv (filebase + FILE_PATTERNS['B1_gain_offsets'], index=False)
+
+def get_neighbors (station_ids):
+
+    ''' A function to pair stations as neighbors. With an odd # stations, the
+        last one is a neighbor of the previous station, so they are cleaned in
+        one group of 3. A single station is its own neighbor.
+
+        input params
+        ------------
+        station_ids (list): station IDs
+
+        return params
+        -------------
+        neighbor_ids (list): neighbor ID per station
+    '''
+
+    neighbor_ids = []
+    for index, station_id in enumerate (station_ids):
+        partner = index + 1 if index % 2 == 0 else index - 1
+        if partner >= len (station_ids): partner = max (index - 1, 0)
+        neighbor_ids.append (station_ids[partner])
+    return neighbor_ids
+
+def make_station_info (filename, station_ids, begin_date=BEGIN_DATE, end_date=END_DATE):
+
+    ''' A function to write a station info sheet for the synthetic stations.
+        Like the real sheet, the first 3 rows are title, color index, and a
+        blank row.
+
+        input params
+        ------------
+        filename (str): station info csv file
+        station_ids (list): station IDs
+        begin_date (str): first day of the raw data
+        end_date (str): last day of the raw data
+    '''
+
+    times = get_times (begin_date, end_date)
+    other_begin = times[int (len (times) * OTHER_SENSOR_PERIOD[0])]
+    other_end = times[int (len (times) * OTHER_SENSOR_PERIOD[1]) - 1]
+    other_dates = '{0} to {1}'.format (other_begin.strftime ('%Y-%m-%d %H:%M'),
+                                       other_end.strftime ('%Y-%m-%d %H:%M'))
+
+    info = pandas.DataFrame ({'Station ID':station_ids,
+                              'Problem station?':'',
+                              'Neighbor station number':get_neighbors (station_ids),
+                              'GT Range':1.6, 'WL Min':WL_MIN, 'WL Max':WL_MAX,
+                              'Primary sensor Type':'A1',
+                              'Other primary sensor used?':'Y1',
+                              'Other primary sensor dates':other_dates,
+                              'Dates downloaded (or to be downloaded)':'{0} to {1}'.format (begin_date, end_date)})
+    with open (filename, 'w') as f:
+        f.write ('Synthetic WL-AI Station List\ncolor index\n,\n')
+        info.to_csv (f, index=False)
+
+def make_stations (path, n_stations=2, begin_date=BEGIN_DATE, end_date=END_DATE,
+                   first_station_id=FIRST_STATION_ID, seed=0):
+
+    ''' A function to write raw files of n stations in <path>/raw/ and their
+        station info sheet in <path>/station_info.csv.
+
+        input params
+        ------------
+        path (str): folder to write synthetic data
+        n_stations (int): # stations
+        begin_date (str): first day of the raw data
+        end_date (str): last day of the raw data
+        first_station_id (int): ID of the first station
+        seed (int): random seed of the first station
+
+        return params
+        -------------
+        station_ids (list): synthetic station IDs
+    '''
+
+    logger = logging.getLogger ('synthetic_data')
+
+    raw_path = path + '/raw'
+    if not os.path.exists (raw_path): os.makedirs (raw_path)
+
+    station_ids = [first_station_id + index for index in range (n_stations)]
+    for index, station_id in enumerate (station_ids):
+        make_station (raw_path, station_id, begin_date=begin_date, end_date=end_date, seed=seed+index)
+        logger.info ('Station {0} raw files are written to {1}.'.format (station_id, raw_path))
+
+    make_station_info (path + '/' + STATION_INFO_FILE, station_ids, begin_date=begin_date, end_date=end_date)
+    return station_ids
@@ -0,0 +1,535 @@
+#!python37
+
+## This script verifies that two processed folders have the same cleaned data
+## e.g. before and after a change to the cleaning process. Unlike
+## compare_sets.py, which compares the counts in the stats csv files, it
+## compares every processed file
+##     <station ID>_processed_ver_merged_wl_{train,validation,test}.csv
+## plus the stats and scalers csv files found in both folders.
+##
+## Each pair of files is streamed in chunks of lines and rows are aligned on
+## their key, STATION_ID + DATE_TIME for processed files and station_id for
+## stats / scalers files (by row number if a file has neither). As long as
+## both files are in step, the raw bytes of the chunks are hashed; if the
+## hashes agree, the chunk is identical and is never parsed. Otherwise, both
+## chunks are parsed with pandas and merge-joined on the key over the key
+## range covered by both of them; rows after that range are carried to the
+## next chunk, so one extra or missing row does not shift the rest of the
+## file and the byte hashes agree again right after it. Rows with a key in
+## only one file are missing (only in folder 1) or extra (only in folder 2);
+## matched rows are compared column by column: numbers within rtol / atol
+## (numpy.isclose, NaN == NaN) and others as strings. Keys must be in the same
+## sorted order in both files, as they are in time order in processed files.
+## So memory is bounded by the chunk size, and identical folders cost about
+## the time to read them.
+##
+## Each file is reported as one of
+##  * identical  : same bytes
+##  * equivalent : some chunks differ in bytes, but all rows are matched and
+##                 all values are within tolerance
+##  * different  : missing rows, extra rows, rows changed beyond tolerance,
+##                 or different columns
+##  * missing_1 / missing_2 : the file only exists in folder 2 / folder 1
+## The report (one row per file, with # missing / extra / changed rows) and up
+## to max_examples row and value differences per file are written as csv
+## files to out_path. The script exits with 1 if any file is different or
+## missing.
+##
+## > python verify_outputs.py --proc1_path <processed folder 1>
+##                            --proc2_path <processed folder 2>
+##                            (--out_path <Path to store report csv files>)
+##                            (--chunk_size <# rows per chunk>)
+##                            (--rtol <relative tolerance>)
+##                            (--atol <absolute tolerance>)
+##                            (--workers <# processes>)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import verify_outputs
+## report, examples = verify_outputs.compare_folders ('C:/to/processed_old/',
+##                                                    'C:/to/processed_new/')
+## print (report.status.value_counts())
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, logging, argparse, hashlib, itertools, io, os, re, sys
+from concurrent.futures import ProcessPoolExecutor
+
+###############################################
+## Define constants
+###############################################
+# Processed files per station & dataset type
+PROCESSED_PATTERN = re.compile (r'^(\d+)_processed_ver_merged_wl_(train|validation|test)\.csv$')
+
+# Other csv files to compare if present in both folders
+OTHER_FILES = ['train_stats.csv', 'valid_stats.csv', 'test_stats.csv',
+               'diff_stats.csv', 'scalers.csv']
+
+# Key columns to align rows on; the first set in both files is used. Files
+# with neither are aligned by row number.
+KEY_COLUMNS = [['STATION_ID', 'DATE_TIME'], ['station_id']]
+
+# Default # rows per chunk
+CHUNK_SIZE = 100000
+
+# Default tolerances for numbers
+RTOL, ATOL = 1e-7, 1e-9
+
+# Default max # value differences kept per file
+MAX_EXAMPLES = 20
+
+# Columns in the report
+REPORT_KEYS = ['filename', 'station_id', 'dtype', 'status', 'key_columns', 'n_rows_1',
+               'n_rows_2', 'n_chunks', 'n_mismatched_chunks', 'n_missing_rows',
+               'n_extra_rows', 'n_changed_rows', 'different_columns', 'max_abs_diff']
+
+# Columns in the row and value differences; kind is missing (row only in
+# file 1), extra (row only in file 2), or changed (value beyond tolerance)
+EXAMPLE_KEYS = ['filename', 'kind', 'key', 'row_1', 'row_2', 'column', 'value_1', 'value_2']
+
+###############################################
+## Define functions
+###############################################
+def find_files (proc_path):
+
+    ''' A function to find the processed and other csv files in a folder.
+
+        input params
+        ------------
+        proc_path (str): processed folder
+
+        return params
+        -------------
+        files (dict): {file name: (station ID, dtype)}; station ID and dtype
+                      are None for non-processed files
+    '''
+
+    files = {}
+    for filename in sorted (os.listdir (proc_path)):
+        matched = PROCESSED_PATTERN.match (filename)
+        if matched is not None:
+            files[filename] = (int (matched.group (1)), matched.group (2))
+        elif filename in OTHER_FILES:
+            files[filename] = (None, None)
+    return files
+
+def hash_lines (lines):
+
+    ''' A function to hash a list of byte lines.
+
+        input params
+        ------------
+        lines (list): lines in bytes
+
+        return params
+        -------------
+        digest (bytes): blake2b digest of the joined lines
+    '''
+
+    hasher = hashlib.blake2b (digest_size=16)
+    for line in lines: hasher.update (line)
+    return hasher.digest()
+
+def _is_numeric (series):
+
+    return pandas.api.types.is_numeric_dtype (series) and not pandas.api.types.is_bool_dtype (series)
+
+def get_key_columns (columns1, columns2):
+
+    ''' A function to get the key columns to align the rows of two files on.
+
+        input params
+        ------------
+        columns1, columns2 (list): columns of file 1 / 2
+
+        return params
+        -------------
+        key_columns (list): first set in KEY_COLUMNS found in both files;
+                            empty to align by row number
+    '''
+
+    for key_columns in KEY_COLUMNS:
+        if all ([column in columns1 and column in columns2 for column in key_columns]):
+            return key_columns
+    return []
+
+def _get_keys (chunk, key_columns, rows):
+
+    ''' A private function to get the key of each row in a parsed chunk; the
+        row number if there is no key column.
+    '''
+
+    if len (key_columns) == 0:
+        return pandas.DataFrame ({'row':rows})
+    return chunk[key_columns].reset_index (drop=True)
+
+def _count_up_to (keys, last_key):
+
+    ''' A private function to count the leading rows with a key up to (and
+        including) last_key; keys are compared column by column.
+    '''
+
+    is_before = numpy.zeros (len (keys), dtype=bool)
+    is_equal = numpy.ones (len (keys), dtype=bool)
+    for column, value in zip (keys.columns, last_key):
+        values = keys[column].values
+        is_before |= is_equal & (values < value)
+        is_equal &= values == value
+    is_up_to = is_before | is_equal
+    return len (keys) if is_up_to.all() else numpy.argmin (is_up_to)
+
+def _format_keys (keys, indices):
+
+    ''' A private function to format the keys of a few rows as strings. '''
+
+    return [' '.join ([str (value) for value in keys.iloc[index].values]) for index in indices]
+
+def compare_chunks (chunk1, rows1, chunk2, rows2, key_columns, rtol=RTOL, atol=ATOL):
+
+    ''' A function to merge-join two parsed chunks on their key and compare
+        the matched rows. Repeated keys are matched in order of appearance.
+        Only the columns in both chunks are compared.
+
+        input params
+        ------------
+        chunk1, chunk2 (pandas.DataFrame): rows of file 1 / 2 in the same key
+                                           range
+        rows1, rows2 (numpy.array): row number of each row in file 1 / 2
+        key_columns (list): columns to align rows on; empty for row number
+        rtol (float): relative tolerance for numbers
+        atol (float): absolute tolerance for numbers
+
+        return params
+        -------------
+        counts (dict): {'n_missing_rows', 'n_extra_rows', 'n_changed_rows'}
+        differences (pandas.DataFrame): one row per missing / extra row and
+                                        per changed value with EXAMPLE_KEYS
+                                        except filename
+        max_abs_diff (dict): {column: max absolute difference} of numbers
+    '''
+
+    ## Align rows on key + occurrence of the key
+    keys1, keys2 = _get_keys (chunk1, key_columns, rows1), _get_keys (chunk2, key_columns, rows2)
+    index1, index2 = [pandas.MultiIndex.from_frame (keys.assign (
+                          occurrence=keys.groupby (list (keys.columns), dropna=False).cumcount()))
+                      for keys in [keys1, keys2]]
+    in_2, in_1 = index1.isin (index2), index2.isin (index1)
+    matched2 = pandas.Series (numpy.arange (len (index2)), index=index2).reindex (index1[in_2]).values
+    matched1 = numpy.where (in_2)[0]
+
+    differences, max_abs_diff = [], {}
+    for kind, keys, indices, rows, row_key in [('missing', keys1, numpy.where (~in_2)[0], rows1, 'row_1'),
+                                               ('extra', keys2, numpy.where (~in_1)[0], rows2, 'row_2')]:
+        if len (indices) == 0: continue
+        differences.append (pandas.DataFrame ({'kind':kind, 'key':_format_keys (keys, indices),
+                                               row_key:rows[indices]}))
+
+    ## Compare values of the matched rows
+    is_changed = numpy.zeros (len (matched1), dtype=bool)
+    columns = [column for column in chunk1.columns
+               if column in chunk2.columns and not column in key_columns]
+    for column in columns:
+        values1 = chunk1[column].iloc[matched1].reset_index (drop=True)
+        values2 = chunk2[column].iloc[matched2].reset_index (drop=True)
+        if _is_numeric (values1) and _is_numeric (values2):
+            values1 = values1.values.astype (float)
+            values2 = values2.values.astype (float)
+            is_close = numpy.isclose (values1, values2, rtol=rtol, atol=atol, equal_nan=True)
+            abs_diff = numpy.abs (values1 - values2)
+            if numpy.isfinite (abs_diff).any():
+                max_abs_diff[column] = numpy.nanmax (abs_diff)
+        else:
+            is_close = ((values1.astype (str).values == values2.astype (str).values) |
+                        (values1.isna().values & values2.isna().values))
+            values1, values2 = values1.values, values2.values
+        if is_close.all(): continue
+        indices = numpy.where (~is_close)[0]
+        is_changed[indices] = True
+        differences.append (pandas.DataFrame ({'kind':'changed', 'key':_format_keys (keys1, matched1[indices]),
+                                               'row_1':rows1[matched1[indices]], 'row_2':rows2[matched2[indices]],
+                                               'column':column, 'value_1':values1[indices],
+                                               'value_2':values2[indices]}))
+
+    counts = {'n_missing_rows':(~in_2).sum(), 'n_extra_rows':(~in_1).sum(),
+              'n_changed_rows':is_changed.sum()}
+    differences = pandas.concat (differences, ignore_index=True) if len (differences) > 0 else \
+                  pandas.DataFrame (columns=EXAMPLE_KEYS[1:])
+    return counts, differences.reindex (columns=EXAMPLE_KEYS[1:]), max_abs_diff
+
+class _chunk_reader (object):
+
+    ''' A private class to stream the lines of a csv file for compare_files().
+        Lines after the compared key range are pushed back and come first in
+        the next chunk.
+    '''
+
+    def __init__ (self, afile):
+
+        self._file = afile
+        self.header = afile.readline()
+        self.columns = self.header.decode().strip().split (',')
+        self.lines = []       # lines of the current chunk
+        self.first_row = 0    # row number of the first line in the chunk
+        self.n_rows = 0       # # rows read so far
+        self.is_eof = False
+
+    def read (self, chunk_size):
+
+        ''' Top up the current chunk to chunk_size lines. '''
+
+        n_lines = chunk_size - len (self.lines)
+        if n_lines <= 0 or self.is_eof: return
+        lines = list (itertools.islice (self._file, n_lines))
+        self.is_eof = len (lines) < n_lines
+        self.n_rows += len (lines)
+        self.lines += lines
+
+    def parse (self):
+
+        ''' Parse the current chunk. '''
+
+        chunk = pandas.read_csv (io.BytesIO (self.header + b''.join (self.lines)), low_memory=False)
+        return chunk, self.first_row + numpy.arange (len (chunk))
+
+    def consume (self, n_lines):
+
+        ''' Drop the first n_lines of the current chunk. '''
+
+        self.lines = self.lines[n_lines:]
+        self.first_row += n_lines
+
+def compare_files (file1, file2, chunk_size=CHUNK_SIZE, rtol=RTOL, atol=ATOL,
+                   max_examples=MAX_EXAMPLES):
+
+    ''' A function to stream two csv files in chunks and compare them. Chunks
+        with the same hash are skipped; the others are merge-joined on the key
+        by compare_chunks() up to the last key that both chunks have reached.
+
+        input params
+        ------------
+        file1, file2 (str): csv files to compare
+        chunk_size (int): # rows per chunk
+        rtol (float): relative tolerance for numbers
+        atol (float): absolute tolerance for numbers
+        max_examples (int): max # row and value differences to keep
+
+        return params
+        -------------
+        report (dict): REPORT_KEYS except filename, station_id, and dtype
+        examples (pandas.DataFrame): up to max_examples row and value
+                                     differences
+    '''
+
+    report = {'n_chunks':0, 'n_mismatched_chunks':0, 'n_missing_rows':0,
+              'n_extra_rows':0, 'n_changed_rows':0}
+    columns_diff, max_abs_diff, examples = set(), {}, []
+
+    with open (file1, 'rb') as f1, open (file2, 'rb') as f2:
+        reader1, reader2 = _chunk_reader (f1), _chunk_reader (f2)
+
+        ## Compare the header i.e. columns
+        columns_diff |= set (reader1.columns).symmetric_difference (reader2.columns)
+        if reader1.columns != reader2.columns and len (columns_diff) == 0:
+            columns_diff.add ('column order')
+        key_columns = get_key_columns (reader1.columns, reader2.columns)
+        report['key_columns'] = ';'.join (key_columns)
+
+        ## Stream both files chunk by chunk
+        while True:
+            reader1.read (chunk_size)
+            reader2.read (chunk_size)
+            if len (reader1.lines) == 0 and len (reader2.lines) == 0: break
+            report['n_chunks'] += 1
+            # Identical bytes with the same header i.e. nothing to check
+            if reader1.header == reader2.header and \
+               hash_lines (reader1.lines) == hash_lines (reader2.lines):
+                reader1.consume (len (reader1.lines))
+                reader2.consume (len (reader2.lines))
+                continue
+
+            # Compare rows up to the last key reached by both files; a file
+            # at its end has no more keys to wait for
+            report['n_mismatched_chunks'] += 1
+            (chunk1, rows1), (chunk2, rows2) = reader1.parse(), reader2.parse()
+            keys1, keys2 = _get_keys (chunk1, key_columns, rows1), _get_keys (chunk2, key_columns, rows2)
+            last_keys = [tuple (keys.iloc[-1].values) for reader, keys in [(reader1, keys1), (reader2, keys2)]
+                         if not reader.is_eof and len (keys) > 0]
+            n_compared = [len (keys) if len (last_keys) == 0 else
+                          _count_up_to (keys, min (last_keys))
+                          for keys in [keys1, keys2]]
+            # Keys out of order: compare what is in hand rather than loop
+            if sum (n_compared) == 0: n_compared = [len (keys1), len (keys2)]
+            counts, differences, chunk_max = compare_chunks (chunk1.iloc[:n_compared[0]], rows1[:n_compared[0]],
+                                                             chunk2.iloc[:n_compared[1]], rows2[:n_compared[1]],
+                                                             key_columns, rtol=rtol, atol=atol)
+            reader1.consume (n_compared[0])
+            reader2.consume (n_compared[1])
+
+            for key, count in counts.items(): report[key] += count
+            columns_diff |= set (differences.column.dropna().unique())
+            for column, value in chunk_max.items():
+                max_abs_diff[column] = max (value, max_abs_diff.get (column, 0.))
+            n_kept = sum ([len (example) for example in examples])
+            if n_kept < max_examples:
+                examples.append (differences.iloc[:max_examples - n_kept])
+
+        report['n_rows_1'], report['n_rows_2'] = reader1.n_rows, reader2.n_rows
+
+    ## Status of this file
+    is_identical = report['n_mismatched_chunks'] == 0 and len (columns_diff) == 0
+    is_different = report['n_missing_rows'] + report['n_extra_rows'] + report['n_changed_rows'] > 0 or \
+                   len (columns_diff) > 0
+    report['status'] = 'identical' if is_identical else 'different' if is_different else 'equivalent'
+    report['different_columns'] = ';'.join (sorted (columns_diff))
+    report['max_abs_diff'] = max (max_abs_diff.values()) if len (max_abs_diff) > 0 else 0.
+
+    examples = pandas.concat (examples, ignore_index=True) if len (examples) > 0 else \
+               pandas.DataFrame (columns=EXAMPLE_KEYS[1:])
+    return report, examples
+
+def _compare_a_file (args):
+
+    ''' A private function to compare one file in both folders; used by the
+        process pool.
+    '''
+
+    filename, proc1_path, proc2_path, kwargs = args
+    report, examples = compare_files (proc1_path + '/' + filename, proc2_path + '/' + filename, **kwargs)
+    examples.insert (0, 'filename', filename)
+    return report, examples
+
+def compare_folders (proc1_path, proc2_path, chunk_size=CHUNK_SIZE, rtol=RTOL, atol=ATOL,
+                     max_examples=MAX_EXAMPLES, workers=0):
+
+    ''' A function to compare all processed (and stats) files of two folders.
+
+        input params
+        ------------
+        proc1_path, proc2_path (str): processed folders to compare
+        chunk_size (int): # rows per chunk
+        rtol (float): relative tolerance for numbers
+        atol (float): absolute tolerance for numbers
+        max_examples (int): max # row and value differences to keep per file
+        workers (int): # processes to compare files in parallel; 0 to
+                       compare in this process
+
+        return params
+        -------------
+        report (pandas.DataFrame): REPORT_KEYS per file
+        examples (pandas.DataFrame): EXAMPLE_KEYS of row and value differences
+    '''
+
+    logger = logging.getLogger ('verify_outputs')
+
+    files1, files2 = find_files (proc1_path), find_files (proc2_path)
+    filenames = sorted (set (files1.keys()) | set (files2.keys()))
+    kwargs = {'chunk_size':chunk_size, 'rtol':rtol, 'atol':atol, 'max_examples':max_examples}
+
+    ## Files in both folders are compared; the others are missing
+    common = [filename for filename in filenames if filename in files1 and filename in files2]
+    tasks = [(filename, proc1_path, proc2_path, kwargs) for filename in common]
+    if workers > 0:
+        with ProcessPoolExecutor (max_workers=workers) as pool:
+            compared = list (pool.map (_compare_a_file, tasks))
+    else:
+        compared = [_compare_a_file (task) for task in tasks]
+    compared = dict (zip (common, compared))
+
+    reports, examples = [], []
+    for filename in filenames:
+        station_id, dtype = files1[filename] if filename in files1 else files2[filename]
+        if filename in compared:
+            report, example = compared[filename]
+            examples.append (example)
+        else:
+            report = {'status':'missing_2' if filename in files1 else 'missing_1'}
+        report.update ({'filename':filename, 'station_id':station_id, 'dtype':dtype})
+        reports.append (report)
+        logger.info ('{0}: {1}'.format (filename, report['status']))
+
+    report = pandas.DataFrame (reports, columns=REPORT_KEYS)
+    for key in ['station_id', 'n_rows_1', 'n_rows_2', 'n_chunks', 'n_mismatched_chunks',
+                'n_missing_rows', 'n_extra_rows', 'n_changed_rows']:
+        report[key] = report[key].astype ('Int64')
+    examples = pandas.concat (examples, ignore_index=True) if len (examples) > 0 else \
+               pandas.DataFrame (columns=EXAMPLE_KEYS)
+    for key in ['row_1', 'row_2']:
+        examples[key] = examples[key].astype ('Int64')
+    return report, examples
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line. Both processed
+        folders must exist. If output path does not exist, it is created.
+
+        return params
+        -------------
+        proc1_path (str): processed folder 1
+        proc2_path (str): processed folder 2
+        out_path (str): Path to store report csv files
+        chunk_size (int): # rows per chunk
+        rtol (float): relative tolerance for numbers
+        atol (float): absolute tolerance for numbers
+        workers (int): # processes to compare files in parallel
+    '''
+
+    ## Define parser to get arguments
+    parser = argparse.ArgumentParser (description='')
+    parser.add_argument('-a', '--proc1_path', type=str, required=True,
+                        help='Path to processed files of set 1')
+    parser.add_argument('-b', '--proc2_path', type=str, required=True,
+                        help='Path to processed files of set 2')
+    parser.add_argument('-o', '--out_path', default='.', type=str,
+                        help='Path where report csv files are stored')
+    parser.add_argument('-n', '--chunk_size', default=CHUNK_SIZE, type=int,
+                        help='# rows per chunk')
+    parser.add_argument('-r', '--rtol', default=RTOL, type=float,
+                        help='Relative tolerance for numbers')
+    parser.add_argument('-t', '--atol', default=ATOL, type=float,
+                        help='Absolute tolerance for numbers')
+    parser.add_argument('-w', '--workers', default=0, type=int,
+                        help='# processes to compare files in parallel; 0 for none')
+    args = parser.parse_args()
+
+    ## 1. Both processed folders must exist
+    for apath in [args.proc1_path, args.proc2_path]:
+        if not os.path.exists (apath):
+            message = 'Path, {0}, does not exist!'.format (apath)
+            raise FileNotFoundError (message)
+
+    ## 2. Check if output path exists. If not, create it now.
+    if not os.path.exists (args.out_path):
+        os.makedirs (args.out_path)
+
+    ## 3. Chunk size must be positive and # workers must not be negative
+    if args.chunk_size < 1 or args.workers < 0:
+        message = 'Chunk size must be positive and # workers cannot be negative.'
+        raise IOError (message)
+
+    return args.proc1_path, args.proc2_path, args.out_path, args.chunk_size, \
+           args.rtol, args.atol, args.workers
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    proc1_path, proc2_path, out_path, chunk_size, rtol, atol, workers = get_parser ()
+    logging.basicConfig (level=logging.INFO)
+
+    ## Compare all files
+    report, examples = compare_folders (proc1_path, proc2_path, chunk_size=chunk_size,
+                                        rtol=rtol, atol=atol, workers=workers)
+    report.to_csv (out_path + '/verify_report.csv', index=False)
+    examples.to_csv (out_path + '/verify_differences.csv', index=False)
+
+    ## Print the summary and exit with 1 if any file is different or missing
+    print (report.status.value_counts().to_string())
+    is_failed = ~report.status.isin (['identical', 'equivalent'])
+    if is_failed.any():
+        print (report[is_failed][['filename', 'status', 'n_missing_rows', 'n_extra_rows',
+                                  'n_changed_rows', 'different_columns']].to_string (index=False))
+        sys.exit (1)
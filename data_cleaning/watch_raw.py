@@ -0,0 +1,458 @@
+#!python37
+
+## This script defines a raw_watcher that keeps the processed files up to
+## date as raw data arrive, instead of re-running clean_data.py by hand.
+## It polls the raw folder for new or grown raw / offset / B1 gain & offset
+## files and
+##  * batches changes per station. A station is ready once none of its files
+##    has changed for debounce seconds, so a bulk upload or a file still being
+##    copied is picked up once, after it settles.
+##  * cleans only the ready stations (and their neighbors, which are needed
+##    for the neighbor columns), at most max_stations per batch and at most
+##    one batch per min_batch_interval seconds.
+##  * scores the cleaned stations with an optional scorer function, e.g. the
+##    QC model inference, given as scorer (station_id, proc_path).
+##  * publishes per batch, as a JSON line in proc_path/watch_metrics.jsonl
+##    and in the log: # stations, queue depth (stations still waiting),
+##    throughput (stations per hour), and latency per station from the last
+##    raw record time and from the first detected change to when its flags
+##    are available (processed, and scored if there is a scorer). Raw
+##    DATE_TIME is taken as UTC for the record latency.
+##
+## To watch a raw folder:
+## > python watch_raw.py --raw_path <raw file location>
+##                       --proc_path <where you want to store cleaned data>
+##                       --station_info_csv <location of station info csv>
+##                       (--poll_interval 30) (--debounce 60)
+##                       (--min_batch_interval 300) (--max_stations 20)
+##                       (--scorer <module:function>) (--process_existing)
+##
+## Example snippet in python:
+## +-------------------------------------------------------------
+## import watch_raw
+## watcher = watch_raw.raw_watcher ('C:/to/raw/', 'C:/to/processed/',
+##                                  'C:/to/station_info.csv', debounce=60)
+## watcher.run ()
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import pandas, logging, argparse, importlib, json, time, os
+
+import data_cleaner, station_registry
+
+###############################################
+## Define constants
+###############################################
+# Default polling, debounce, and rate limits in seconds
+POLL_INTERVAL = 30
+DEBOUNCE = 60
+MIN_BATCH_INTERVAL = 300
+MAX_STATIONS = 20
+
+# Metrics of each batch in proc_path
+METRICS_FILE = 'watch_metrics.jsonl'
+
+# # bytes read from the end of a raw file to find its last record
+TAIL_BYTES = 4096
+
+###############################################
+## Define functions
+###############################################
+def scan_raw_files (raw_path):
+
+    ''' A function to get the size and modification time of all raw files.
+
+        input params
+        ------------
+        raw_path (str): Path to Armins unzipped raw files
+
+        return params
+        -------------
+        signatures (dict): {station ID: {file key: (path, size, mtime in ns)}}
+    '''
+
+    signatures = {}
+    with os.scandir (raw_path) as entries:
+        for entry in entries:
+            if not entry.is_file(): continue
+            station_id, key = station_registry.parse_file_name (entry.name)
+            if station_id is None: continue
+            stat = entry.stat()
+            signatures.setdefault (station_id, {})[key] = (entry.path, stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+def get_last_record_time (filename, nbytes=TAIL_BYTES):
+
+    ''' A function to read the DATE_TIME of the last record of a raw file
+        from its tail, without reading the whole file.
+
+        input params
+        ------------
+        filename (str): raw csv file
+        nbytes (int): # bytes to read from the end
+
+        return params
+        -------------
+        last_time (pandas.Timestamp): time of the last record; None if unknown
+    '''
+
+    try:
+        with open (filename, 'rb') as f:
+            f.seek (0, os.SEEK_END)
+            f.seek (max (f.tell() - nbytes, 0))
+            lines = f.read().decode (errors='ignore').strip().splitlines()
+    except OSError:
+        return None
+    if len (lines) == 0: return None
+    ## DATE_TIME is the 2nd column of Armin's raw files
+    fields = lines[-1].split (',')
+    if len (fields) < 2: return None
+    last_time = pandas.to_datetime (fields[1], errors='coerce')
+    return None if pandas.isnull (last_time) else last_time
+
+def load_scorer (name):
+
+    ''' A function to import a scorer given as <module>:<function>.
+
+        input params
+        ------------
+        name (str): e.g. my_model:score_station
+
+        return params
+        -------------
+        scorer (function): scorer (station_id, proc_path)
+    '''
+
+    module, _, function = name.partition (':')
+    if len (function) == 0:
+        raise IOError ('Scorer, {0}, must be given as <module>:<function>.'.format (name))
+    return getattr (importlib.import_module (module), function)
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='Clean stations as their raw files change')
+    parser.add_argument('-r', '--raw_path', required=True, type=str,
+                        help='Path to Armins unzipped raw files')
+    parser.add_argument('-p', '--proc_path', required=True, type=str,
+                        help='Path to store processed, cleaned files')
+    parser.add_argument('-s', '--station_info_csv', required=True, type=str,
+                        help='Location of station info sheet')
+    parser.add_argument('-i', '--poll_interval', default=POLL_INTERVAL, type=float,
+                        help='Seconds between scans of the raw folder')
+    parser.add_argument('-d', '--debounce', default=DEBOUNCE, type=float,
+                        help='Seconds a station must stay unchanged before cleaning')
+    parser.add_argument('-b', '--min_batch_interval', default=MIN_BATCH_INTERVAL, type=float,
+                        help='Min seconds between the starts of two batches')
+    parser.add_argument('-n', '--max_stations', default=MAX_STATIONS, type=int,
+                        help='Max # changed stations per batch')
+    parser.add_argument('-c', '--scorer', default=None, type=str,
+                        help='QC scorer as <module>:<function> (station_id, proc_path)')
+    parser.add_argument('-e', '--process_existing', default=False, action='store_true',
+                        help='If turned on, clean all existing stations first.')
+    parser.add_argument('-g', '--add_gap_features', default=False, action='store_true',
+                        help='If turned on, add gap-distance features to processed files.')
+    parser.add_argument('-l', '--log_level', default='info', type=str,
+                        help='Log level: info, debug, warn, error')
+    args = parser.parse_args()
+
+    ## Check if raw path and station info sheet exist
+    for key in ['raw_path', 'station_info_csv']:
+        if not os.path.exists (getattr (args, key)):
+            raise FileNotFoundError ('{0}, {1}, does not exist!'.format (key, getattr (args, key)))
+
+    ## Check if proc path exists. If not, create it now.
+    if not os.path.exists (args.proc_path):
+        os.mkdir (args.proc_path)
+
+    ## Check if log level is one of info / debug / warn / error
+    if not args.log_level.lower() in ['debug', 'info', 'warn', 'error']:
+        message = 'Log level must be either debug, info, warn, or error.'
+        raise IOError (message)
+
+    return args
+
+###############################################
+## Define raw_watcher class
+###############################################
+class raw_watcher (object):
+
+    ''' This class cleans stations whose raw files changed. '''
+
+    def __init__ (self, raw_path, proc_path, station_info_csv, cleaner_settings=None,
+                  scorer=None, poll_interval=POLL_INTERVAL, debounce=DEBOUNCE,
+                  min_batch_interval=MIN_BATCH_INTERVAL, max_stations=MAX_STATIONS,
+                  metrics_file=None):
+
+        ''' To initialize a raw_watcher.
+
+            input params
+            ------------
+            raw_path (str): Path to Armins unzipped raw files
+            proc_path (str): Path to store processed, cleaned files
+            station_info_csv (str): Location of station info sheet
+            cleaner_settings (dict): data_cleaner properties to set, e.g.
+                                     {'add_gap_features':True}
+            scorer (function): scorer (station_id, proc_path) run after a
+                               station is cleaned; None for no scoring
+            poll_interval (float): seconds between scans of the raw folder
+            debounce (float): seconds a station must stay unchanged
+            min_batch_interval (float): min seconds between batch starts
+            max_stations (int): max # changed stations per batch
+            metrics_file (str): JSON-lines file of batch metrics; None for
+                                proc_path/watch_metrics.jsonl
+        '''
+
+        self._raw_path = raw_path
+        self._proc_path = proc_path
+        self._station_info_csv = station_info_csv
+        self._cleaner_settings = {} if cleaner_settings is None else cleaner_settings
+        self._scorer = scorer
+        self._poll_interval = poll_interval
+        self._debounce = debounce
+        self._min_batch_interval = min_batch_interval
+        self._max_stations = max_stations
+        self._metrics_file = proc_path + '/' + METRICS_FILE if metrics_file is None else metrics_file
+
+        ## File signatures from the last scan; None before the first scan
+        self._signatures = None
+        ## Changed stations waiting: {station ID: {'first_seen', 'last_change'}}
+        self._pending = {}
+        ## Start time of the last batch and totals since start
+        self._last_batch = None
+        self._start = time.time()
+        self._n_cleaned = 0
+        self._n_failed = 0
+
+        ## Logger
+        self._logger = logging.getLogger ('raw_watcher')
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def pending (self): return dict (self._pending)
+
+    @property
+    def queue_depth (self): return len (self._pending)
+
+    @property
+    def metrics_file (self): return self._metrics_file
+
+    # +------------------------------------------------------------
+    # | Watch
+    # +------------------------------------------------------------
+    def poll (self, now=None, process_existing=False):
+
+        ''' A public function to scan the raw folder and mark stations with new
+            or changed files as pending. The first scan only records the files,
+            unless process_existing.
+
+            input params
+            ------------
+            now (float): current time in seconds; None for time.time()
+            process_existing (bool): If true, files found by the first scan
+                                     are pending too
+
+            return params
+            -------------
+            changed (list): station IDs with changes found by this scan
+        '''
+
+        now = time.time() if now is None else now
+        signatures = scan_raw_files (self._raw_path)
+        previous, self._signatures = self._signatures, signatures
+        if previous is None and not process_existing: return []
+        previous = {} if previous is None else previous
+
+        changed = [station_id for station_id, files in signatures.items()
+                   if files != previous.get (station_id)]
+        for station_id in changed:
+            state = self._pending.setdefault (station_id, {'first_seen':now})
+            state['last_change'] = now
+        if len (changed) > 0:
+            self._logger.info ('Changes found in {0} stations; {1} pending.'.format (len (changed),
+                                                                                  len (self._pending)))
+        return changed
+
+    def get_ready_stations (self, now=None):
+
+        ''' A public function to list pending stations whose files have not
+            changed for debounce seconds, oldest first, up to max_stations.
+
+            input params
+            ------------
+            now (float): current time in seconds; None for time.time()
+
+            return params
+            -------------
+            station_ids (list): stations ready to be cleaned
+        '''
+
+        now = time.time() if now is None else now
+        ready = [(state['first_seen'], station_id) for station_id, state in self._pending.items()
+                 if now - state['last_change'] >= self._debounce]
+        return [station_id for _, station_id in sorted (ready)[:self._max_stations]]
+
+    def _get_cleaner (self):
+
+        ''' A private function to set up a new data_cleaner for a batch, so
+            that stats and station info are fresh each time.
+        '''
+
+        cleaner = data_cleaner.data_cleaner()
+        cleaner.raw_path = self._raw_path
+        cleaner.proc_path = self._proc_path
+        cleaner.station_info_csv = self._station_info_csv
+        for key, value in self._cleaner_settings.items():
+            setattr (cleaner, key, value)
+        cleaner.load_station_info()
+        return cleaner
+
+    def run_batch (self, now=None):
+
+        ''' A public function to clean (and score) the ready stations, if the
+            rate limit allows a batch now.
+
+            input params
+            ------------
+            now (float): current time in seconds; None for time.time()
+
+            return params
+            -------------
+            metrics (dict): metrics of this batch; None if no batch ran
+        '''
+
+        now = time.time() if now is None else now
+        if self._last_batch is not None and now - self._last_batch < self._min_batch_interval:
+            return None
+        station_ids = self.get_ready_stations (now=now)
+        if len (station_ids) == 0: return None
+        self._last_batch = now
+
+        ## Last record time of each raw file, before cleaning
+        record_times = {}
+        for station_id in station_ids:
+            raw = self._signatures.get (station_id, {}).get ('raw')
+            record_times[station_id] = None if raw is None else get_last_record_time (raw[0])
+
+        ## Clean the stations (and their neighbors) in one go; skip stations
+        ## that are not in the station info sheet or miss files
+        start = time.time()
+        cleaner = self._get_cleaner()
+        known = [station_id for station_id in station_ids
+                 if station_id in cleaner.station_registry and
+                 cleaner.station_registry.has_complete_set (station_id)]
+        for station_id in set (station_ids) - set (known):
+            self._logger.warn ('Station {0} is not in the info sheet or misses files; skipped.'.format (station_id))
+            self._pending.pop (station_id)
+
+        is_failed = False
+        if len (known) > 0:
+            try:
+                cleaner.clean_stations (station_ids=known)
+                if self._scorer is not None:
+                    for station_id in known:
+                        self._scorer (station_id, self._proc_path)
+            except Exception as error:
+                ## Keep them pending; they are retried after another debounce
+                self._logger.warn ('Batch of {0} failed: {1}'.format (known, error))
+                is_failed = True
+        flag_time = time.time()
+
+        ## Latency per station and totals
+        latencies = {}
+        for station_id in known:
+            state = self._pending.pop (station_id)
+            if is_failed:
+                state['last_change'] = flag_time
+                self._pending[station_id] = state
+                continue
+            record_time = record_times[station_id]
+            record_latency = None if record_time is None else \
+                             flag_time - record_time.tz_localize (None).timestamp()
+            latencies[station_id] = {'detect_to_flag_s':flag_time - state['first_seen'],
+                                     'record_to_flag_s':record_latency}
+        if is_failed:
+            self._n_failed += len (known)
+        else:
+            self._n_cleaned += len (known)
+
+        wall = flag_time - start
+        metrics = {'time':flag_time, 'n_stations':len (known), 'failed':is_failed,
+                   'wall_s':wall, 'queue_depth':len (self._pending),
+                   'stations_per_hour':len (known) / wall * 3600 if wall > 0 else None,
+                   'total_cleaned':self._n_cleaned, 'total_failed':self._n_failed,
+                   'total_stations_per_hour':self._n_cleaned / (flag_time - self._start) * 3600,
+                   'latency':latencies}
+        self._publish (metrics)
+        return metrics
+
+    def _publish (self, metrics):
+
+        ''' A private function to append batch metrics to the metrics file and
+            log them.
+        '''
+
+        with open (self._metrics_file, 'a') as f:
+            f.write (json.dumps (metrics, default=str) + '\n')
+
+        message = 'Batch of {0} stations in {1:.1f} s; queue depth {2}; {3} stations cleaned so far.'
+        self._logger.info (message.format (metrics['n_stations'], metrics['wall_s'],
+                                           metrics['queue_depth'], metrics['total_cleaned']))
+        for station_id, latency in metrics['latency'].items():
+            record_latency = latency['record_to_flag_s']
+            self._logger.info ('Station {0}: {1:.1f} s from detection, {2} from last record.'.format (
+                               station_id, latency['detect_to_flag_s'],
+                               'unknown' if record_latency is None else '{0:.1f} s'.format (record_latency)))
+
+    def run (self, process_existing=False, max_polls=None):
+
+        ''' A public function to poll and clean until stopped (Ctrl-C) or
+            max_polls scans.
+
+            input params
+            ------------
+            process_existing (bool): If true, clean all existing stations first
+            max_polls (int): stop after this many scans; None to run forever
+        '''
+
+        n_polls = 0
+        self._logger.info ('Watching {0} every {1} s.'.format (self._raw_path, self._poll_interval))
+        try:
+            while max_polls is None or n_polls < max_polls:
+                self.poll (process_existing=process_existing)
+                self.run_batch ()
+                n_polls += 1
+                if max_polls is None or n_polls < max_polls:
+                    time.sleep (self._poll_interval)
+        except KeyboardInterrupt:
+            self._logger.info ('Stopped with {0} stations pending.'.format (len (self._pending)))
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    args = get_parser ()
+
+    ## Set log level
+    logging.basicConfig (level=getattr (logging, args.log_level.upper()))
+
+    scorer = None if args.scorer is None else load_scorer (args.scorer)
+    watcher = raw_watcher (args.raw_path, args.proc_path, args.station_info_csv,
+                           cleaner_settings={'add_gap_features':args.add_gap_features},
+                           scorer=scorer, poll_interval=args.poll_interval,
+                           debounce=args.debounce, min_batch_interval=args.min_batch_interval,
+                           max_stations=args.max_stations)
+    watcher.run (process_existing=args.process_existing)
@@ -0,0 +1,683 @@
+#!python37
+
+## This script defines a file-based work queue to spread station groups over
+## many nodes that share a file system, without a broker service. A queue is
+## a folder with
+##  * config.json : settings of the run e.g. raw_path, proc_path, and cleaner
+##                  settings, shared by all tasks
+##  * pending/    : one JSON file per task waiting to be claimed
+##  * claimed/    : tasks being worked on, as <task ID>@<worker ID>.json
+##  * done/       : one pickled result per finished task
+##  * failed/     : tasks that failed max_attempts times, with their errors
+##
+## A worker claims a task by renaming its pending file into claimed/. A
+## rename is atomic, so only one worker gets a task. While a task runs, the
+## worker touches its claimed file every heartbeat_interval seconds. A claim
+## whose file is not touched for stale_after seconds (e.g. the node died) is
+## renamed back to pending/ by any worker and retried, up to max_attempts
+## times in total. Workers exit when no task is pending or claimed.
+##
+## Task kinds are looked up in TASK_KINDS. A 'clean' task cleans 1 station
+## group via data_cleaner.clean_station_group() and writes its processed
+## files; its result holds the stats, histograms, and scalers of the group.
+## Once all tasks are done, reduce_queue() adds the results in group order
+## with data_cleaner.add_group_results(), as clean_stations() does, and
+## writes the stats csv files and scalers.csv to proc_path.
+##
+## Heartbeats compare file modification times with the local clock; keep
+## stale_after well above heartbeat_interval plus any clock skew between nodes.
+##
+## To clean stations on many nodes:
+## > python work_queue.py create --queue_path <shared queue folder>
+##                               --raw_path <raw file location>
+##                               --proc_path <where you want to store cleaned data>
+##                               --station_info_csv <location of station info csv>
+##                               (--add_gap_features) (--regular_grid)
+##                               (--neighbor_table <neighbor table csv>)
+## > python work_queue.py work --queue_path <shared queue folder>   # on each node
+## > python work_queue.py status --queue_path <shared queue folder>
+## > python work_queue.py reduce --queue_path <shared queue folder>
+##
+## Example snippet to test locally with 4 worker processes:
+## +-------------------------------------------------------------
+## import work_queue, multiprocessing
+## work_queue.create_clean_queue ('/tmp/queue', {'raw_path':..., 'proc_path':...,
+##                                               'station_info_csv':...})
+## workers = [multiprocessing.Process (target=work_queue.run_worker, args=('/tmp/queue',))
+##            for _ in range (4)]
+## for worker in workers: worker.start()
+## for worker in workers: worker.join()
+## cleaner = work_queue.reduce_queue ('/tmp/queue')
+## +-------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import logging, argparse, threading, socket, json, time, os, traceback
+import _pickle as pickle
+
+import data_cleaner, gap_features
+
+###############################################
+## Define constants
+###############################################
+# Sub-folders of a queue
+QUEUE_FOLDERS = ['pending', 'claimed', 'done', 'failed']
+CONFIG_FILE = 'config.json'
+
+# Default heartbeat, staleness, and polling in seconds
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 300
+POLL_INTERVAL = 5
+
+# Default # attempts per task before it is failed
+MAX_ATTEMPTS = 3
+
+# Default cleaner settings of a clean queue
+CLEAN_CONFIG = {'raw_path':None, 'proc_path':None, 'station_info_csv':None,
+                'exclude_nan_verified':False, 'create_midstep_files':False,
+                'regular_grid':False, 'add_gap_features':False,
+                'gap_feature_cap':gap_features.MAX_DISTANCE, 'neighbor_table':None}
+
+###############################################
+## Define functions
+###############################################
+def get_worker_id ():
+
+    ''' A function to name this worker by host and process ID.
+
+        return params
+        -------------
+        worker_id (str): <host>-<pid>
+    '''
+
+    return '{0}-{1}'.format (socket.gethostname().replace ('@', '_'), os.getpid())
+
+def _write_json (filename, content):
+
+    ''' A private function to write a JSON file via a temporary file so that
+        readers never see a partial file.
+    '''
+
+    temp_file = '{0}.{1}.tmp'.format (filename, os.getpid())
+    with open (temp_file, 'w') as f:
+        json.dump (content, f, indent=1, default=str)
+    os.replace (temp_file, filename)
+
+def _read_json (filename):
+
+    with open (filename, 'r') as f:
+        return json.load (f)
+
+def _run_clean_task (config, payload, cache):
+
+    ''' A private function to clean 1 station group. The cleaner (with its
+        loaded station info) is kept in the worker cache across tasks.
+
+        input params
+        ------------
+        config (dict): queue config with cleaner settings
+        payload (dict): {'station_group': list of station IDs}
+        cache (dict): objects kept by this worker across tasks
+
+        return params
+        -------------
+        results (dict): from data_cleaner.clean_station_group()
+    '''
+
+    if not 'cleaner' in cache:
+        cleaner = data_cleaner.data_cleaner()
+        cleaner.raw_path = config['raw_path']
+        cleaner.proc_path = config['proc_path']
+        cleaner.station_info_csv = config['station_info_csv']
+        cleaner.create_midstep_files = config['create_midstep_files']
+        cleaner.regular_grid = config['regular_grid']
+        cleaner.add_gap_features = config['add_gap_features']
+        cleaner.gap_feature_cap = config['gap_feature_cap']
+        cleaner.neighbor_table = config.get ('neighbor_table')
+        cleaner.load_station_info()
+        cache['cleaner'] = cleaner
+
+    return cache['cleaner'].clean_station_group (payload['station_group'],
+                                                 exclude_nan_verified=config['exclude_nan_verified'])
+
+# Functions that run a task of each kind: function (config, payload, cache)
+TASK_KINDS = {'clean':_run_clean_task}
+
+def create_clean_queue (queue_path, config, station_ids=None):
+
+    ''' A function to create a queue with 1 clean task per station group.
+
+        input params
+        ------------
+        queue_path (str): shared queue folder; it is created if needed
+        config (dict): cleaner settings; see CLEAN_CONFIG
+        station_ids (list): stations (and their neighbors) to clean; None
+                            for all stations in the station info sheet
+
+        return params
+        -------------
+        queue (work_queue): the new queue
+    '''
+
+    config = dict (CLEAN_CONFIG, **config)
+
+    ## Group stations the same way clean_stations() does
+    cleaner = data_cleaner.data_cleaner()
+    cleaner.raw_path = config['raw_path']
+    cleaner.station_info_csv = config['station_info_csv']
+    cleaner.neighbor_table = config.get ('neighbor_table')
+    cleaner.load_station_info()
+    station_groups = cleaner.station_groups if station_ids is None else \
+                     [group for group in cleaner.station_groups
+                      if len (set (group).intersection (station_ids)) > 0]
+
+    queue = work_queue (queue_path, config=config)
+    for station_group in station_groups:
+        queue.submit ('clean', {'station_group':[int (station_id) for station_id in station_group]})
+    return queue
+
+def run_worker (queue_path, worker_id=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                stale_after=STALE_AFTER, poll_interval=POLL_INTERVAL,
+                max_attempts=MAX_ATTEMPTS, max_tasks=None):
+
+    ''' A function to run a worker until no task is pending or claimed.
+
+        input params
+        ------------
+        queue_path (str): shared queue folder
+        worker_id (str): name of this worker; None for <host>-<pid>
+        heartbeat_interval (float): seconds between heartbeats
+        stale_after (float): seconds without heartbeat before a claim is stale
+        poll_interval (float): seconds to wait when only claimed tasks are left
+        max_attempts (int): # attempts per task before it is failed
+        max_tasks (int): stop after this many tasks; None for no limit
+
+        return params
+        -------------
+        n_tasks (int): # tasks run by this worker
+    '''
+
+    queue = work_queue (queue_path, heartbeat_interval=heartbeat_interval,
+                        stale_after=stale_after, max_attempts=max_attempts)
+    worker_id = get_worker_id () if worker_id is None else worker_id
+    logger = logging.getLogger ('work_queue')
+
+    cache, n_tasks = {}, 0
+    while max_tasks is None or n_tasks < max_tasks:
+        # Give stale claims of dead workers back to the queue
+        queue.requeue_stale ()
+        task = queue.claim (worker_id)
+        if task is None:
+            if queue.count ('pending') + queue.count ('claimed') == 0: break
+            time.sleep (poll_interval)
+            continue
+        queue.run (task, cache)
+        n_tasks += 1
+
+    logger.info ('Worker {0} ran {1} tasks.'.format (worker_id, n_tasks))
+    return n_tasks
+
+def reduce_queue (queue_path, save=True):
+
+    ''' A function to merge the results of a finished clean queue into one
+        data_cleaner, in group order, and write its stats and scalers.
+
+        input params
+        ------------
+        queue_path (str): shared queue folder
+        save (bool): If true, write stats csv files and scalers.csv (and the
+                     stats plots if create_midstep_files) to proc_path
+
+        return params
+        -------------
+        cleaner (data_cleaner): cleaner with stats of all groups
+    '''
+
+    queue = work_queue (queue_path)
+    config = queue.config
+    n_open = queue.count ('pending') + queue.count ('claimed')
+    if n_open > 0:
+        raise IOError ('{0} tasks in {1} are not finished yet.'.format (n_open, queue_path))
+    if queue.count ('failed') > 0:
+        raise IOError ('{0} tasks in {1} failed: {2}'.format (queue.count ('failed'), queue_path,
+                                                              queue.list_tasks ('failed')))
+
+    cleaner = data_cleaner.data_cleaner()
+    cleaner.proc_path = config['proc_path']
+    cleaner.create_midstep_files = config['create_midstep_files']
+    for task_id in queue.list_tasks ('done'):
+        cleaner.add_group_results (queue.get_result (task_id))
+
+    if save:
+        cleaner.save_stats_data()
+        cleaner.scaler_registry.save (config['proc_path'] + '/' + data_cleaner.SCALER_FILE)
+        if cleaner.create_midstep_files: cleaner.plot_all_stats()
+    return cleaner
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='File-based work queue of station groups')
+    parser.add_argument('action', choices=['create', 'work', 'status', 'reduce'],
+                        help='create a clean queue, run a worker, show status, or reduce results')
+    parser.add_argument('-q', '--queue_path', required=True, type=str,
+                        help='Shared queue folder')
+    parser.add_argument('-r', '--raw_path', default=None, type=str,
+                        help='Path to Armins unzipped raw files (create)')
+    parser.add_argument('-p', '--proc_path', default=None, type=str,
+                        help='Path to store processed, cleaned files (create)')
+    parser.add_argument('-s', '--station_info_csv', default=None, type=str,
+                        help='Location of station info sheet (create)')
+    parser.add_argument('-m', '--do_midstep_files', default=False, action='store_true',
+                        help='If turned on, create all mid-step files (create).')
+    parser.add_argument('-g', '--add_gap_features', default=False, action='store_true',
+                        help='If turned on, add gap-distance features (create).')
+    parser.add_argument('-G', '--regular_grid', default=False, action='store_true',
+                        help='If turned on, put records on a regular 6-minute grid; missing slots are added as rows (create).')
+    parser.add_argument('-i', '--station_ids', default=None, type=int, nargs='+',
+                        help='Stations (and their neighbors) to clean; default all (create)')
+    parser.add_argument('-t', '--neighbor_table', default=None, type=str,
+                        help='Neighbor table from select_neighbors.py (create)')
+    parser.add_argument('-b', '--heartbeat_interval', default=HEARTBEAT_INTERVAL, type=float,
+                        help='Seconds between heartbeats (work)')
+    parser.add_argument('-a', '--stale_after', default=STALE_AFTER, type=float,
+                        help='Seconds without heartbeat before a claim is retried (work)')
+    parser.add_argument('-n', '--max_attempts', default=MAX_ATTEMPTS, type=int,
+                        help='# attempts per task before it is failed (work)')
+    parser.add_argument('-l', '--log_level', default='info', type=str,
+                        help='Log level: info, debug, warn, error')
+    args = parser.parse_args()
+
+    ## A new queue needs the cleaner inputs
+    if args.action == 'create':
+        for key in ['raw_path', 'proc_path', 'station_info_csv']:
+            if getattr (args, key) is None:
+                raise IOError ('Please provide --{0} to create a queue.'.format (key))
+        if not os.path.exists (args.proc_path): os.mkdir (args.proc_path)
+
+    ## Stale claims must outlive a few heartbeats
+    if args.stale_after <= args.heartbeat_interval:
+        raise IOError ('stale_after must be longer than heartbeat_interval.')
+
+    ## Check if log level is one of info / debug / warn / error
+    if not args.log_level.lower() in ['debug', 'info', 'warn', 'error']:
+        message = 'Log level must be either debug, info, warn, or error.'
+        raise IOError (message)
+
+    return args
+
+###############################################
+## Define heartbeat class
+###############################################
+class heartbeat (object):
+
+    ''' This class touches a claimed file on a thread while its task runs. '''
+
+    def __init__ (self, filename, interval=HEARTBEAT_INTERVAL):
+
+        ''' To initialize and start a heartbeat.
+
+            input params
+            ------------
+            filename (str): claimed file to touch
+            interval (float): seconds between touches
+        '''
+
+        self._filename = filename
+        self._interval = interval
+        self._stop = threading.Event()
+        self._is_lost = False
+        self._thread = threading.Thread (target=self._beat, name='heartbeat', daemon=True)
+
+        ## Logger
+        self._logger = logging.getLogger ('heartbeat')
+
+        self._thread.start()
+
+    def __enter__ (self): return self
+
+    def __exit__ (self, *args):
+        self.stop()
+        return False
+
+    @property
+    def is_lost (self): return self._is_lost
+
+    def _beat (self):
+
+        ''' A private function run by the heartbeat thread. '''
+
+        while not self._stop.wait (self._interval):
+            try:
+                os.utime (self._filename)
+            except FileNotFoundError:
+                ## Another worker took it as stale; this run is kept anyway
+                self._logger.warn ('Claim {0} is lost.'.format (self._filename))
+                self._is_lost = True
+                return
+
+    def stop (self):
+
+        ''' A public function to stop the heartbeat thread. '''
+
+        self._stop.set()
+        self._thread.join()
+
+###############################################
+## Define work_queue class
+###############################################
+class work_queue (object):
+
+    ''' This class claims, runs, and collects tasks in a shared queue folder. '''
+
+    def __init__ (self, queue_path, config=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                  stale_after=STALE_AFTER, max_attempts=MAX_ATTEMPTS):
+
+        ''' To initialize a work_queue on a folder. Sub-folders are created if
+            they do not exist.
+
+            input params
+            ------------
+            queue_path (str): shared queue folder
+            config (dict): settings to write as config.json; None to read it
+            heartbeat_interval (float): seconds between heartbeats
+            stale_after (float): seconds without heartbeat before a claim is stale
+            max_attempts (int): # attempts per task before it is failed
+        '''
+
+        self._queue_path = queue_path
+        self._heartbeat_interval = heartbeat_interval
+        self._stale_after = stale_after
+        self._max_attempts = max_attempts
+
+        ## Logger
+        self._logger = logging.getLogger ('work_queue')
+
+        for folder in QUEUE_FOLDERS:
+            os.makedirs (self._get_folder (folder), exist_ok=True)
+        config_file = self._queue_path + '/' + CONFIG_FILE
+        if config is not None:
+            _write_json (config_file, config)
+        if not os.path.exists (config_file):
+            message = 'Queue, {0}, has no {1}.'.format (queue_path, CONFIG_FILE)
+            self._logger.fatal (message)
+            raise IOError (message)
+        self._config = _read_json (config_file)
+
+    # +------------------------------------------------------------
+    # | Getters
+    # +------------------------------------------------------------
+    @property
+    def queue_path (self): return self._queue_path
+
+    @property
+    def config (self): return self._config
+
+    # +------------------------------------------------------------
+    # | Files and folders
+    # +------------------------------------------------------------
+    def _get_folder (self, folder): return self._queue_path + '/' + folder
+
+    def _get_pending_file (self, task_id):
+        return '{0}/{1}.json'.format (self._get_folder ('pending'), task_id)
+
+    def _get_claimed_file (self, task_id, worker_id):
+        return '{0}/{1}@{2}.json'.format (self._get_folder ('claimed'), task_id, worker_id)
+
+    def _get_result_file (self, task_id):
+        return '{0}/{1}.pkl'.format (self._get_folder ('done'), task_id)
+
+    def _get_failed_file (self, task_id):
+        return '{0}/{1}.json'.format (self._get_folder ('failed'), task_id)
+
+    def list_tasks (self, folder):
+
+        ''' A public function to list task IDs in a sub-folder, in task order.
+
+            input params
+            ------------
+            folder (str): pending, claimed, done, or failed
+
+            return params
+            -------------
+            task_ids (list): sorted task IDs
+        '''
+
+        names = [name for name in os.listdir (self._get_folder (folder))
+                 if not name.endswith ('.tmp')]
+        return sorted ([os.path.splitext (name)[0].split ('@')[0] for name in names])
+
+    def count (self, folder): return len (self.list_tasks (folder))
+
+    def status (self):
+
+        ''' A public function to count tasks per sub-folder.
+
+            return params
+            -------------
+            counts (dict): {folder: # tasks}
+        '''
+
+        return {folder:self.count (folder) for folder in QUEUE_FOLDERS}
+
+    # +------------------------------------------------------------
+    # | Submit, claim, and finish tasks
+    # +------------------------------------------------------------
+    def submit (self, kind, payload):
+
+        ''' A public function to add a pending task. Task IDs start with a
+            running number, so tasks are claimed and reduced in submit order.
+
+            input params
+            ------------
+            kind (str): one of TASK_KINDS
+            payload (dict): JSON-able inputs of the task
+
+            return params
+            -------------
+            task_id (str): ID of the new task
+        '''
+
+        if not kind in TASK_KINDS:
+            message = 'Task kind, {0}, is not one of {1}.'.format (kind, list (TASK_KINDS.keys()))
+            self._logger.fatal (message)
+            raise IOError (message)
+
+        n_tasks = sum ([self.count (folder) for folder in QUEUE_FOLDERS])
+        task_id = '{0:06d}_{1}'.format (n_tasks, kind)
+        _write_json (self._get_pending_file (task_id),
+                     {'task_id':task_id, 'kind':kind, 'payload':payload,
+                      'attempts':0, 'errors':[]})
+        return task_id
+
+    def claim (self, worker_id):
+
+        ''' A public function to claim the first pending task by renaming it
+            into claimed/. Tasks already done (e.g. by a worker whose claim
+            was taken as stale) are dropped, and tasks out of attempts failed.
+
+            input params
+            ------------
+            worker_id (str): name of the claiming worker
+
+            return params
+            -------------
+            task (dict): the claimed task with its claimed_file; None if no
+                         task is pending
+        '''
+
+        for task_id in self.list_tasks ('pending'):
+            claimed_file = self._get_claimed_file (task_id, worker_id)
+            try:
+                os.rename (self._get_pending_file (task_id), claimed_file)
+                ## A rename keeps the mtime of the pending file; touch it so
+                ## that requeue_stale() does not take a fresh claim as stale
+                os.utime (claimed_file)
+            except FileNotFoundError:
+                ## Another worker got it first
+                continue
+            task = _read_json (claimed_file)
+            if os.path.exists (self._get_result_file (task_id)):
+                os.remove (claimed_file)
+                continue
+            task['attempts'] += 1
+            if task['attempts'] > self._max_attempts:
+                self._fail (task, claimed_file)
+                continue
+            task['worker_id'] = worker_id
+            _write_json (claimed_file, task)
+            task['claimed_file'] = claimed_file
+            self._logger.info ('Worker {0} claimed {1} (attempt {2}).'.format (worker_id, task_id,
+                                                                               task['attempts']))
+            return task
+        return None
+
+    def run (self, task, cache=None):
+
+        ''' A public function to run a claimed task with heartbeats, and store
+            its result or its error.
+
+            input params
+            ------------
+            task (dict): from claim()
+            cache (dict): objects kept by this worker across tasks
+
+            return params
+            -------------
+            is_done (bool): If true, the task is done
+        '''
+
+        cache = {} if cache is None else cache
+        claimed_file = task.pop ('claimed_file')
+        try:
+            with heartbeat (claimed_file, interval=self._heartbeat_interval):
+                result = TASK_KINDS[task['kind']] (self._config, task['payload'], cache)
+        except Exception:
+            error = traceback.format_exc()
+            self._logger.warn ('Task {0} failed:\n{1}'.format (task['task_id'], error))
+            task['errors'].append (error)
+            self._retry (task, claimed_file)
+            return False
+
+        ## Write the result before dropping the claim
+        result_file = self._get_result_file (task['task_id'])
+        temp_file = '{0}.{1}.tmp'.format (result_file, os.getpid())
+        with open (temp_file, 'wb') as f:
+            pickle.dump (result, f)
+        os.replace (temp_file, result_file)
+        try:
+            os.remove (claimed_file)
+        except FileNotFoundError:
+            pass
+        self._logger.info ('Task {0} is done.'.format (task['task_id']))
+        return True
+
+    def _retry (self, task, claimed_file):
+
+        ''' A private function to put a failed task back to pending, or fail it
+            if it is out of attempts.
+        '''
+
+        if task['attempts'] >= self._max_attempts:
+            self._fail (task, claimed_file)
+            return
+        _write_json (claimed_file, task)
+        try:
+            os.rename (claimed_file, self._get_pending_file (task['task_id']))
+        except FileNotFoundError:
+            ## It was taken as stale and is pending already
+            pass
+
+    def _fail (self, task, claimed_file):
+
+        ''' A private function to move a task to failed/. '''
+
+        _write_json (self._get_failed_file (task['task_id']), task)
+        try:
+            os.remove (claimed_file)
+        except FileNotFoundError:
+            pass
+        self._logger.warn ('Task {0} failed after {1} attempts.'.format (task['task_id'],
+                                                                        task['attempts']))
+
+    def requeue_stale (self):
+
+        ''' A public function to put claims without a recent heartbeat back to
+            pending. The rename is atomic, so only one worker requeues a claim.
+
+            return params
+            -------------
+            task_ids (list): requeued task IDs
+        '''
+
+        task_ids = []
+        now = time.time()
+        folder = self._get_folder ('claimed')
+        for name in os.listdir (folder):
+            if name.endswith ('.tmp'): continue
+            claimed_file = folder + '/' + name
+            try:
+                is_stale = now - os.path.getmtime (claimed_file) > self._stale_after
+            except FileNotFoundError:
+                continue
+            if not is_stale: continue
+            task_id = os.path.splitext (name)[0].split ('@')[0]
+            try:
+                os.rename (claimed_file, self._get_pending_file (task_id))
+            except FileNotFoundError:
+                continue
+            self._logger.warn ('Stale claim {0} is put back to pending.'.format (name))
+            task_ids.append (task_id)
+        return task_ids
+
+    def get_result (self, task_id):
+
+        ''' A public function to load the result of a done task.
+
+            input params
+            ------------
+            task_id (str): task ID
+
+            return params
+            -------------
+            result (any): what the task returned
+        '''
+
+        with open (self._get_result_file (task_id), 'rb') as f:
+            return pickle.load (f)
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    ## Get user arguments
+    args = get_parser ()
+
+    ## Set log level
+    logging.basicConfig (level=getattr (logging, args.log_level.upper()))
+
+    if args.action == 'create':
+        config = {'raw_path':args.raw_path, 'proc_path':args.proc_path,
+                  'station_info_csv':args.station_info_csv,
+                  'create_midstep_files':args.do_midstep_files,
+                  'add_gap_features':args.add_gap_features,
+                  'regular_grid':args.regular_grid,
+                  'neighbor_table':args.neighbor_table}
+        queue = create_clean_queue (args.queue_path, config, station_ids=args.station_ids)
+        print (queue.status())
+    elif args.action == 'work':
+        run_worker (args.queue_path, heartbeat_interval=args.heartbeat_interval,
+                    stale_after=args.stale_after, max_attempts=args.max_attempts)
+    elif args.action == 'status':
+        print (work_queue (args.queue_path).status())
+    else:
+        reduce_queue (args.queue_path)
@@ -0,0 +1,233 @@
+"""
+This is a module to build the model features from a cleaned station dataframe using a declarative feature list.
+Each feature is a small dict, e.g.
+    {'op': 'column', 'column': 'PRIMARY'}                                       - the column as is
+    {'op': 'diff', 'column': 'PRIMARY'}                                         - first difference
+    {'op': 'rolling_mean', 'column': 'PRIMARY_RESIDUAL', 'window': 10, 'mask': 'PRIMARY_TRUE'}
+    {'op': 'rolling_std' / 'rolling_min' / 'rolling_max', ...}                  - same keys as rolling_mean
+    {'op': 'minus', 'column': 'PRIMARY', 'other': 'BACKUP', 'mask': ['PRIMARY_TRUE', 'BACKUP_TRUE']}
+    {'op': 'neighbor_diff'}                                                     - PRIMARY_RESIDUAL - NEIGHBOR_PRIMARY_RESIDUAL
+    {'op': 'lag', 'column': 'PRIMARY_RESIDUAL', 'lag': 1}
+An optional 'name' sets the output column name.
+
+All source columns are read once, the cumulative sums are built once per (column, mask) and shared by every rolling
+mean / std, and min / max use scipy's O(n) 1D filters, so the whole list is computed in one pass per station with
+NumPy arrays, no pandas rolling or copies of the frame. Rolling windows are trailing (the window ends at the point),
+so the same features are available at inference time. Points where the mask is 0 or the value is NaN / inf are
+left out of the window statistics, and windows with no valid point give 0.
+
+The output is a float32 (N, features) matrix aligned to the cleaned dataframe index. Save the feature list with
+saveFeatureList next to the model and load it at inference so that both use identical features.
+
+Example:
+    features, names = buildFeatures(cleaned, QC_FEATURES)
+    model.fit(features, cleaned['TARGET'].values, ...)
+    saveFeatureList(QC_FEATURES, 'model_best_features.json')
+
+    featureList = loadFeatureList('model_best_features.json')
+    predictions = model.predict(buildFeatures(newData, featureList)[0])
+"""
+import json
+import numpy as np
+import pandas as pd
+from scipy.ndimage import minimum_filter1d, maximum_filter1d
+
+
+# The 8 point-wise QC model columns plus a few rolling / lagged residual features
+QC_FEATURES = [{'op': 'column', 'column': name} for name in
+               ['PRIMARY', 'PRIMARY_TRUE', 'PRIMARY_SIGMA', 'PRIMARY_SIGMA_TRUE', 'PRIMARY_RESIDUAL',
+                'BACKUP', 'BACKUP_TRUE', 'PREDICTION']] + \
+              [{'op': 'diff', 'column': 'PRIMARY', 'mask': 'PRIMARY_TRUE'},
+               {'op': 'rolling_mean', 'column': 'PRIMARY_RESIDUAL', 'window': 10, 'mask': 'PRIMARY_TRUE'},
+               {'op': 'rolling_std', 'column': 'PRIMARY_RESIDUAL', 'window': 10, 'mask': 'PRIMARY_TRUE'},
+               {'op': 'rolling_min', 'column': 'PRIMARY_RESIDUAL', 'window': 10, 'mask': 'PRIMARY_TRUE'},
+               {'op': 'rolling_max', 'column': 'PRIMARY_RESIDUAL', 'window': 10, 'mask': 'PRIMARY_TRUE'},
+               {'op': 'minus', 'column': 'PRIMARY', 'other': 'BACKUP', 'mask': ['PRIMARY_TRUE', 'BACKUP_TRUE']},
+               {'op': 'lag', 'column': 'PRIMARY_RESIDUAL', 'lag': 1}]
+
+ROLLING_OPS = ['rolling_mean', 'rolling_std', 'rolling_min', 'rolling_max']
+ALL_OPS = ['column', 'diff', 'minus', 'neighbor_diff', 'lag'] + ROLLING_OPS
+
+
+# Function to get the output column name of a feature
+def featureName(feature):
+
+    if 'name' in feature:
+        return feature['name']
+
+    op = feature['op']
+    if op == 'column':
+        return feature['column']
+    if op == 'neighbor_diff':
+        return 'NEIGHBOR_RESIDUAL_DIFF'
+    if op == 'minus':
+        return feature['column'] + '_MINUS_' + feature['other']
+    if op == 'lag':
+        return feature['column'] + '_LAG' + str(feature['lag'])
+    if op == 'diff':
+        return feature['column'] + '_DIFF'
+
+    return feature['column'] + '_' + op.upper() + str(feature['window'])
+
+
+# Function to check the feature list and collect all the source columns needed
+def requiredColumns(featureList):
+
+    columns = []
+    for feature in featureList:
+        op = feature.get('op')
+        if op not in ALL_OPS:
+            raise ValueError('Unknown feature op ' + str(op) + '; use one of ' + str(ALL_OPS))
+        if op in ROLLING_OPS and int(feature.get('window', 0)) < 1:
+            raise ValueError('Rolling feature ' + featureName(feature) + ' needs a window of at least 1')
+
+        names = ['PRIMARY_RESIDUAL', 'NEIGHBOR_PRIMARY_RESIDUAL'] if op == 'neighbor_diff' else [feature['column']]
+        if op == 'minus':
+            names.append(feature['other'])
+        mask = feature.get('mask')
+        names += [] if mask is None else [mask] if isinstance(mask, str) else list(mask)
+        columns += [name for name in names if name not in columns]
+
+    return columns
+
+
+# Function to compute the rolling statistics of one (column, mask) pair for all requested windows
+def _rollingStats(values, valid, requests, cache):
+
+    # Where requests is a list of (op, window) and cache holds the cumulative sums shared across windows
+    # Returns {(op, window): array}
+
+    n = len(values)
+    index = np.arange(n)
+    out = {}
+
+    # A NaN or inf value would poison the cumulative sums for every later point, so treat it as invalid
+    valid = valid & np.isfinite(values)
+
+    if 'csum' not in cache:
+        masked = np.where(valid, values, 0.)
+        cache['csum'] = np.concatenate([[0.], np.cumsum(masked)])
+        cache['csum2'] = np.concatenate([[0.], np.cumsum(masked * masked)])
+        cache['ccount'] = np.concatenate([[0], np.cumsum(valid)])
+
+    for op, window in requests:
+        begin = np.maximum(index - window + 1, 0)
+        end = index + 1
+        count = cache['ccount'][end] - cache['ccount'][begin]
+        safeCount = np.maximum(count, 1)
+
+        if op in ['rolling_mean', 'rolling_std']:
+            mean = (cache['csum'][end] - cache['csum'][begin]) / safeCount
+            if op == 'rolling_mean':
+                out[(op, window)] = np.where(count > 0, mean, 0.)
+                continue
+            meanSq = (cache['csum2'][end] - cache['csum2'][begin]) / safeCount
+            out[(op, window)] = np.where(count > 0, np.sqrt(np.maximum(meanSq - mean * mean, 0.)), 0.)
+            continue
+
+        # Trailing window: the filter is centred at i - window//2 by default, shift it to end at i
+        origin = (window - 1) // 2
+        if op == 'rolling_min':
+            filtered = minimum_filter1d(np.where(valid, values, np.inf), window, mode='nearest', origin=origin)
+        else:
+            filtered = maximum_filter1d(np.where(valid, values, -np.inf), window, mode='nearest', origin=origin)
+        # The first window-1 points see the padded edge; the edge value is inside their window anyway
+        out[(op, window)] = np.where(count > 0, filtered, 0.)
+
+    return out
+
+
+# Function to compute all features in the list in one pass and return the float32 matrix and the feature names
+def buildFeatures(df, featureList):
+
+    # Where df is the cleaned dataframe of one station, sorted by time
+    # featureList is the declarative list of features (see QC_FEATURES)
+
+    columns = requiredColumns(featureList)
+    missing = [name for name in columns if name not in df]
+    if len(missing) > 0:
+        raise KeyError('Columns ' + str(missing) + ' are required by the feature list')
+
+    # Read every source column once
+    arrays = {name: df[name].values.astype(np.float64) for name in columns}
+    n = len(df)
+    ones = np.ones(n, dtype=bool)
+
+    def getMask(feature):
+        mask = feature.get('mask')
+        if mask is None:
+            return ones, None
+        names = [mask] if isinstance(mask, str) else list(mask)
+        valid = ones.copy()
+        for name in names:
+            valid &= arrays[name] == 1
+        return valid, tuple(names)
+
+    # Group the rolling requests by (column, mask) so each pair builds its cumulative sums once
+    rollingGroups = {}
+    for feature in featureList:
+        if feature['op'] in ROLLING_OPS:
+            valid, maskKey = getMask(feature)
+            key = (feature['column'], maskKey)
+            rollingGroups.setdefault(key, {'valid': valid, 'requests': []})
+            rollingGroups[key]['requests'].append((feature['op'], int(feature['window'])))
+    rolling = {}
+    for (column, maskKey), group in rollingGroups.items():
+        stats = _rollingStats(arrays[column], group['valid'], group['requests'], {})
+        rolling.update({(column, maskKey) + request: value for request, value in stats.items()})
+
+    matrix = np.empty((n, len(featureList)), dtype=np.float32)
+    for position, feature in enumerate(featureList):
+        op = feature['op']
+        valid, maskKey = getMask(feature)
+
+        if op in ROLLING_OPS:
+            values = rolling[(feature['column'], maskKey, op, int(feature['window']))]
+        elif op == 'column':
+            values = np.where(valid, arrays[feature['column']], 0.)
+        elif op == 'diff':
+            column = arrays[feature['column']]
+            values = np.concatenate([[0.], np.diff(column)])
+            values = np.where(valid & np.concatenate([[False], valid[:-1]]), values, 0.)
+        elif op == 'minus':
+            values = np.where(valid, arrays[feature['column']] - arrays[feature['other']], 0.)
+        elif op == 'neighbor_diff':
+            values = arrays['PRIMARY_RESIDUAL'] - arrays['NEIGHBOR_PRIMARY_RESIDUAL']
+            values = np.where(valid & ~np.isnan(values), values, 0.)
+        else:
+            lag = int(feature['lag'])
+            column = np.where(valid, arrays[feature['column']], 0.)
+            values = np.zeros(n)
+            if 0 < lag < n:
+                values[lag:] = column[:-lag]
+            elif lag == 0:
+                values = column
+
+        matrix[:, position] = values
+
+    return matrix, [featureName(feature) for feature in featureList]
+
+
+# Function to return the features as a float32 dataframe on the cleaned index
+def buildFeatureFrame(df, featureList):
+
+    matrix, names = buildFeatures(df, featureList)
+
+    return pd.DataFrame(matrix, index=df.index, columns=names)
+
+
+# Functions to store / load the feature list next to the trained model so inference uses the same features
+def saveFeatureList(featureList, filename):
+
+    requiredColumns(featureList)
+    with open(filename, 'w') as outfile:
+        json.dump(featureList, outfile, indent=1)
+
+
+def loadFeatureList(filename):
+
+    with open(filename) as infile:
+        featureList = json.load(infile)
+    requiredColumns(featureList)
+
+    return featureList
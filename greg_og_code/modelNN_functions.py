@@ -12,6 +12,20 @@ from sklearn.metrics import confusion_matrix
 import itertools
 import datetime
 
+# The shared QC metrics live in the statistical folder of this repo; put it on
+# PYTHONPATH to use them
+try:
+    import qc_metrics
+except ImportError:
+    qc_metrics = None
+
+# The scaler registry of the data cleaner is only needed to scale by scalers.csv;
+# put the data_cleaning folder of this repo on PYTHONPATH to use it
+try:
+    import scaler_registry
+except ImportError:
+    scaler_registry = None
+
 # A function to assess the bad and good data points (0 or 1) for the training, testing and total data sets
 def assessTrainTestData(trainOrTestData):
     
@@ -86,30 +100,23 @@ def pandasToMat(modelOut, predictFeatures, outfileName):
     return
 
 # Function to calculate the Brier Skill Score
+# The calculation lives in statistical/qc_metrics.py so that the notebooks and
+# the spike detector share the same metrics
 def BSS(targClim, modPred, observed):
     
-    #print(type(modPred))
-    #print(type(observed))
-    bs=np.mean((modPred-observed)**2)
-
-    #Calculate the BSS
-    climate=np.mean(targClim)
-
-    climForecast=np.ones(np.shape(observed)) * climate
-
-    bsClimate=np.mean((climForecast-observed)**2)
-
-    bssOut=1-(bs/bsClimate)
-    
-    return bssOut
+    if qc_metrics is None:
+        raise ImportError('qc_metrics is not found; add the statistical folder of this repo to PYTHONPATH')
+    return qc_metrics.get_brier_skill_score(targClim, modPred, observed)
 
 # Function to load the cleaned datafile for a station
-def loadCleanedData(stationNum, fileType, dataDirectory):
+def loadCleanedData(stationNum, fileType, dataDirectory, scalerFile=None):
 
     # Where stationNum is the wl station number to load
     # filetype is 'test','train' or 'validation'
     # dataDirectory is the directory where the test, train, validation sub-directories are located
     # ex: dataDirectory ='/jupyter/userhomes/dusek/waterlevelAI/data'
+    # scalerFile is the scalers.csv written by the data cleaner; if given, water levels are scaled by the station GT
+    # range in place, instead of dividing a copy by a hard-coded range in the notebook
     
     filenameIn = dataDirectory + '/' + fileType + '/' + stationNum + '_processed_ver_merged_wl_' + fileType + '.csv'
     
@@ -120,6 +127,13 @@ def loadCleanedData(stationNum, fileType, dataDirectory):
                                 'NEIGHBOR_PRIMARY','NEIGHBOR_PREDICTION','NEIGHBOR_PRIMARY_RESIDUAL','NEIGHBOR_TARGET']
                         )
     dataIn.index.name ='time'
+
+    if scalerFile is not None:
+        if scaler_registry is None:
+            raise ImportError('scaler_registry is not found; add the data_cleaning folder of this repo to PYTHONPATH')
+        registry = scaler_registry.scaler_registry()
+        registry.load(scalerFile)
+        registry.apply(dataIn, station_id=int(stationNum))
     
     return dataIn   
 
@@ -0,0 +1,116 @@
+"""
+This is a module to build sliding-window sequences for the GRU fill model without copying the data per window.
+makeVectors in fill_model-GTnorm_GRU.ipynb turns every window into a python list inside a pandas Series, which blows
+up memory for a multi-year station. Here the feature columns are copied once into a (N, features) float32 array and
+the windows are a read-only strided view over it, shape (N - win + 1, win, features). Only one batch at a time is
+copied, which is also where the centre point of the primary (and related) columns is masked with 0.
+
+Example:
+    featureNames = ['PRIMARY', 'BACKUP', 'PREDICTION', 'PRIMARY_RESIDUAL', 'NEIGHBOR_PRIMARY_RESIDUAL',
+                    'PRIMARY_TRUE', 'BACKUP_TRUE', 'NEIGHBOR_TARGET']
+    windows, centreIndex = makeWindows(cleanedScaled, featureNames, 9)
+    targets = centreValues(cleanedScaled, 'VERIFIED', 9)
+    maskColumns = maskColumnIndex(featureNames, ['PRIMARY', 'PRIMARY_TRUE', 'PRIMARY_RESIDUAL'])
+
+    batches = windowBatches(windows, targets, batchSize=256, maskColumns=maskColumns, shuffle=True, loop=True)
+    model.fit(batches, steps_per_epoch=stepsPerEpoch(windows, 256), epochs=20)
+    modelPrediction = predictWindows(model, windows, batchSize=4096, maskColumns=maskColumns)
+"""
+import numpy as np
+import pandas as pd
+
+
+# Function to build the read-only (N - win + 1, win, features) view over the feature columns
+def makeWindows(df, columnNames, win, dtype=np.float32):
+
+    # Where df is the cleaned (and scaled) dataframe of one station, sorted by time with no missing time stamps
+    # columnNames are the feature columns, in the order of the last axis
+    # win is the window size (odd, so that the window has a centre point)
+    # Returns the windows and the index (time) of the centre point of each window
+
+    if win < 1 or win % 2 == 0:
+        raise ValueError('Window size must be a positive odd number, got ' + str(win))
+
+    # The only copy: all feature columns in one contiguous array
+    values = np.ascontiguousarray(df.loc[:, columnNames].values, dtype=dtype)
+    numWindows = max(values.shape[0] - win + 1, 0)
+
+    rowStride, columnStride = values.strides
+    windows = np.lib.stride_tricks.as_strided(values, shape=(numWindows, win, values.shape[1]),
+                                              strides=(rowStride, rowStride, columnStride), writeable=False)
+
+    half = win // 2
+    centreIndex = df.index[half:half + numWindows]
+
+    return windows, centreIndex
+
+
+# Function to get the values of a column at the centre point of each window e.g. the VERIFIED target
+def centreValues(df, columnName, win, dtype=np.float32):
+
+    half = win // 2
+    numWindows = max(len(df) - win + 1, 0)
+
+    return df[columnName].values[half:half + numWindows].astype(dtype)
+
+
+# Function to convert the names of the columns to mask into their positions along the feature axis
+def maskColumnIndex(columnNames, maskNames):
+
+    return [list(columnNames).index(name) for name in maskNames]
+
+
+# Function to copy one batch of windows and set the centre point of the masked columns to 0
+def getBatch(windows, rows, maskColumns=None):
+
+    # Where rows is a slice or an array of window numbers
+    # maskColumns is a list of positions along the feature axis (see maskColumnIndex)
+
+    batch = windows[rows].copy()
+    if maskColumns:
+        batch[:, windows.shape[1] // 2, maskColumns] = 0
+
+    return batch
+
+
+# Function to get the number of batches to cover all windows once
+def stepsPerEpoch(windows, batchSize):
+
+    return int(np.ceil(windows.shape[0] / batchSize))
+
+
+# Generator of batches for model.fit / model.predict - only one batch is materialised at a time
+def windowBatches(windows, targets=None, batchSize=256, maskColumns=None, shuffle=False, seed=None, loop=False):
+
+    # Where targets is the array of the centre values (see centreValues); None to yield features only
+    # shuffle draws the windows in a random order each pass
+    # loop keeps yielding pass after pass, as keras expects when steps_per_epoch is given
+
+    rng = np.random.default_rng(seed)
+    numWindows = windows.shape[0]
+
+    while True:
+        order = rng.permutation(numWindows) if shuffle else None
+        for start in range(0, numWindows, batchSize):
+            rows = slice(start, start + batchSize) if order is None else np.sort(order[start:start + batchSize])
+            batch = getBatch(windows, rows, maskColumns)
+            yield batch if targets is None else (batch, targets[rows])
+        if not loop:
+            return
+
+
+# Function to run the model over all windows in batches and return the predictions as a 1D array
+def predictWindows(model, windows, batchSize=4096, maskColumns=None):
+
+    predictions = [np.asarray(model.predict(batch, verbose=0)).reshape(len(batch), -1)[:, 0]
+                   for batch in windowBatches(windows, batchSize=batchSize, maskColumns=maskColumns)]
+    if len(predictions) == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    return np.concatenate(predictions)
+
+
+# Function to put the predictions back on the time index of the cleaned dataframe
+def predictionsToSeries(predictions, centreIndex, name='modelPrediction'):
+
+    return pd.Series(predictions, index=centreIndex, name=name)
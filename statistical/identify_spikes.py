@@ -18,6 +18,8 @@ import pandas, numpy, scipy
 from copy import deepcopy
 from scipy.interpolate import interp1d
 
+import qc_metrics
+
 import matplotlib
 matplotlib.use ('Agg')
 import matplotlib.pyplot as plt
@@ -534,46 +536,13 @@ if __name__ == "__main__":
     ### Summary of model performance
     #########################################################
     ## Confusion Matrix
-    #  Define arrays of boolean for is/not true spikes vs is/not predicted spikes
-    istrue_notpred  = numpy.logical_and (data.true_is_spike, ~data.pred_is_spike)
-    nottrue_ispred  = numpy.logical_and (~data.true_is_spike, data.pred_is_spike)
-    nottrue_notpred = numpy.logical_and (~data.true_is_spike, ~data.pred_is_spike)
-    istrue_ispred   = numpy.logical_and(data.true_is_spike, data.pred_is_spike)
-    #  Find the number of entries for all 4 catogaries
-    n_predno_trueno   = len (nottrue_notpred[nottrue_notpred])
-    n_predyes_trueno  = len (nottrue_ispred[nottrue_ispred])
-    n_predno_trueyes  = len (istrue_notpred[istrue_notpred])
-    n_predyes_trueyes = len (istrue_ispred[istrue_ispred])
+    #  Count true / predicted spikes in all 4 catogaries with one bincount
+    confusion_matrix = qc_metrics.get_confusion_matrix (data.true_is_spike, data.pred_is_spike)
     #  Print them out as a confusion matrix
-    print ('Confusion Matrix')
-    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
-    print ('| {0:8} | {1:8} | {2:8} |'.format(' '*8, 'pred no ', 'pred yes'))
-    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
-    print ('| {0:8} | {1:8} | {2:8} |'.format('true no ', n_predno_trueno, n_predyes_trueno))
-    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
-    print ('| {0:8} | {1:8} | {2:8} |'.format('true yes', n_predno_trueyes, n_predyes_trueyes))
-    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
-    print ('')
+    qc_metrics.print_confusion_matrix (confusion_matrix)
 
     ## Common measurement of model performance
-    #  Calculate total number of different catogaries
-    total = n_predno_trueno + n_predno_trueyes + n_predyes_trueno + n_predyes_trueyes
-    total_trueyes = n_predno_trueyes + n_predyes_trueyes
-    total_trueno  = n_predno_trueno  + n_predyes_trueno
-    total_predyes = n_predyes_trueyes + n_predyes_trueno
-    #  Caclulate different measurement
-    accuracy = (n_predno_trueno + n_predyes_trueyes) / total
-    precision = n_predyes_trueyes / total_predyes
-    sensitivity = n_predyes_trueyes / total_trueyes
-    error_rate = (n_predyes_trueno + n_predno_trueyes) / total
-    true_negative_rate = n_predno_trueno / total_trueno
-    false_positive_rate = n_predyes_trueno / total_trueno
-    prevalence = (n_predno_trueyes + n_predyes_trueyes) / total
+    scores = qc_metrics.get_scores (confusion_matrix)
     #  Print them all out
-    print ('{0:20}: {1:.5f}'.format('accuracy', accuracy))
-    print ('{0:20}: {1:.5f}'.format('precision', precision))
-    print ('{0:20}: {1:.5f}'.format('sensitivity', sensitivity))
-    print ('{0:20}: {1:.5f}'.format('error rate', error_rate))
-    print ('{0:20}: {1:.5f}'.format('true negative rate', true_negative_rate))
-    print ('{0:20}: {1:.5f}'.format('false positive rate', false_positive_rate))
-    print ('{0:20}: {1:.5f}'.format('prevalence', prevalence))
+    for key in qc_metrics.SCORE_KEYS:
+        print ('{0:20}: {1:.5f}'.format(key.replace ('_', ' '), scores[key]))
@@ -0,0 +1,378 @@
+#!python37
+
+## This script defines the evaluation metrics shared by the spike detector
+## (identify_spikes.py), the QC model notebooks, and modelNN_functions.BSS.
+##
+## All counting is done with integer codes and numpy.bincount instead of
+## filtering dataframes with boolean masks. A confusion matrix for every
+## (station, setType) group is therefore one bincount, and a threshold sweep
+## over all cutoffs of all groups is one sort followed by binary searches on
+## cumulative counts.
+##
+## Convention: "positive" is whatever the truth array marks as True / 1. A
+## record is predicted positive when its score is >= threshold. For the QC
+## model, TARGET == 1 (good) is the positive class and the model output is
+## the probability of being good. For the spike detector, a spike is the
+## positive class. The confusion matrix follows the layout printed by
+## identify_spikes.py and sklearn.metrics.confusion_matrix:
+##
+##                 pred no   pred yes
+##      true no  [[  tn   ,    fp   ],
+##      true yes  [  fn   ,    tp   ]]
+##
+## Example snippet to evaluate a processed validation set per station:
+## +------------------------------------------------------------------
+## import qc_metrics
+## cm = qc_metrics.get_confusion_matrix (data.TARGET, data.score >= 0.2)
+## scores = qc_metrics.get_scores (cm)
+## grouped = qc_metrics.evaluate_groups (data, 'TARGET', 'score', 0.2,
+##                                       group_columns=['STATION_ID', 'setType'])
+## sweep = qc_metrics.sweep_thresholds (data.TARGET, data.score,
+##                                      numpy.linspace (0, 1, 101),
+##                                      groups=data.STATION_ID)
+## +------------------------------------------------------------------
+#############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas
+
+###############################################
+## Define constants
+###############################################
+# Column names of the flattened confusion matrix
+CONFUSION_KEYS = ['tn', 'fp', 'fn', 'tp']
+
+# Scores reported by get_scores(); same definitions as in identify_spikes.py
+SCORE_KEYS = ['accuracy', 'precision', 'sensitivity', 'error_rate',
+              'true_negative_rate', 'false_positive_rate', 'prevalence']
+
+###############################################
+## Define functions
+###############################################
+def _as_bool_array (values):
+
+    ''' A private function to turn an array-like of booleans / 0-1 integers
+        into a numpy boolean array. NaN entries are treated as False.
+
+        input params
+        ------------
+        values (array-like): booleans or 0 / 1 integers
+
+        return params
+        -------------
+        values (numpy.array): boolean array
+    '''
+
+    values = numpy.asarray (values)
+    if values.dtype == bool: return values
+    if values.dtype.kind == 'f': values = numpy.nan_to_num (values)
+    return values.astype (bool)
+
+def _safe_divide (numerator, denominator):
+
+    ''' A private function to divide two arrays (or numbers) with NaN returned
+        where the denominator is 0 instead of a ZeroDivisionError / warning.
+    '''
+
+    numerator = numpy.asarray (numerator, dtype=float)
+    denominator = numpy.asarray (denominator, dtype=float)
+    ratio = numpy.full (numpy.broadcast (numerator, denominator).shape, numpy.nan)
+    valid = denominator > 0
+    numpy.divide (numerator, denominator, out=ratio, where=valid)
+    return ratio if ratio.ndim > 0 else float (ratio)
+
+def get_confusion_matrix (truth, predicted):
+
+    ''' A public function to build a 2x2 confusion matrix in one bincount.
+        Rows are truth (no, yes) and columns are prediction (no, yes).
+
+        input params
+        ------------
+        truth (array-like): True / 1 for positive records
+        predicted (array-like): True / 1 for records predicted positive
+
+        return params
+        -------------
+        confusion_matrix (numpy.array): 2x2 int array [[tn, fp], [fn, tp]]
+    '''
+
+    truth, predicted = _as_bool_array (truth), _as_bool_array (predicted)
+    if not len (truth) == len (predicted):
+        raise IOError ('Truth and predicted arrays must have the same length.')
+
+    codes = 2 * truth.astype (numpy.int64) + predicted.astype (numpy.int64)
+    return numpy.bincount (codes, minlength=4).reshape (2, 2)
+
+def get_scores (confusion_matrix):
+
+    ''' A public function to derive the common model performance measures
+        from a confusion matrix. Accepts a single 2x2 matrix or a stack of
+        matrices with shape (..., 2, 2); in the latter case each value in the
+        returned dictionary is an array. Undefined ratios are NaN.
+
+        input params
+        ------------
+        confusion_matrix (numpy.array): [[tn, fp], [fn, tp]] or a stack
+
+        return params
+        -------------
+        scores (dict): accuracy, precision, sensitivity, error_rate,
+                       true_negative_rate, false_positive_rate, prevalence
+    '''
+
+    cm = numpy.asarray (confusion_matrix)
+    tn, fp = cm[..., 0, 0], cm[..., 0, 1]
+    fn, tp = cm[..., 1, 0], cm[..., 1, 1]
+
+    total = tn + fp + fn + tp
+    total_trueyes = fn + tp
+    total_trueno  = tn + fp
+    total_predyes = tp + fp
+
+    return {'accuracy'           : _safe_divide (tn + tp, total),
+            'precision'          : _safe_divide (tp, total_predyes),
+            'sensitivity'        : _safe_divide (tp, total_trueyes),
+            'error_rate'         : _safe_divide (fp + fn, total),
+            'true_negative_rate' : _safe_divide (tn, total_trueno),
+            'false_positive_rate': _safe_divide (fp, total_trueno),
+            'prevalence'         : _safe_divide (total_trueyes, total)}
+
+def get_brier_skill_score (climatology, predicted, observed):
+
+    ''' A public function to calculate the Brier Skill Score of a set of
+        probabilistic predictions w.r.t. a climatological forecast, which is
+        the mean of the climatology array.
+
+            BS  = mean ((predicted - observed)^2)
+            BSc = mean ((mean (climatology) - observed)^2)
+            BSS = 1 - BS / BSc
+
+        input params
+        ------------
+        climatology (array-like): outcomes from which the climate rate is taken
+        predicted (array-like): predicted probabilities
+        observed (array-like): observed outcomes (0 / 1)
+
+        return params
+        -------------
+        bss (float): Brier Skill Score
+    '''
+
+    predicted = numpy.asarray (predicted, dtype=float).ravel()
+    observed  = numpy.asarray (observed, dtype=float).ravel()
+    climate   = numpy.mean (climatology)
+
+    brier_score = numpy.mean ((predicted - observed)**2)
+    brier_score_climate = numpy.mean ((climate - observed)**2)
+    return 1 - brier_score / brier_score_climate
+
+def get_bad_point_metrics (truth, scores, threshold):
+
+    ''' A public function to calculate the per-epoch metrics reported by the
+        QC notebook's ValidationMetricsCallback from one array of predicted
+        probabilities. TARGET = 0 is a bad point and a record is predicted
+        good when its score is >= threshold.
+
+        input params
+        ------------
+        truth (array-like): TARGET values (1 = good, 0 = bad)
+        scores (array-like): predicted probability of being good
+        threshold (float): binarization threshold
+
+        return params
+        -------------
+        metrics (dict): accuracy, accuracy on bad points, and # good points
+                        predicted as bad (false negatives in the notebook)
+    '''
+
+    cm = get_confusion_matrix (truth, numpy.asarray (scores).ravel() >= threshold)
+    tn, fp, fn, tp = cm.ravel()
+    return {'Accuracy': _safe_divide (tn + tp, cm.sum()),
+            'Accuracy_Bad_Points': _safe_divide (tn, tn + fp),
+            'False_Negatives': int (fn)}
+
+def _factorize_groups (groups, n_records):
+
+    ''' A private function to convert group labels into integer codes. The
+        groups can be None (one group), one array of labels, or a list of
+        arrays (e.g. station ID and setType) combined into one key.
+
+        input params
+        ------------
+        groups (None, array-like, or list of array-like): group labels
+        n_records (int): expected length of each label array
+
+        return params
+        -------------
+        codes (numpy.array): group code per record
+        keys (pandas.DataFrame): one row of labels per group code
+    '''
+
+    if groups is None:
+        return numpy.zeros (n_records, dtype=numpy.int64), pandas.DataFrame (index=[0])
+
+    if isinstance (groups, pandas.DataFrame):
+        frame = groups.reset_index (drop=True)
+    elif isinstance (groups, (list, tuple)) and len (groups) > 0 and \
+         numpy.ndim (groups[0]) == 1:
+        frame = pandas.DataFrame ({'group_{0}'.format (index): numpy.asarray (group)
+                                   for index, group in enumerate (groups)})
+    else:
+        name = getattr (groups, 'name', None) or 'group'
+        frame = pandas.DataFrame ({name: numpy.asarray (groups)})
+
+    if not len (frame) == n_records:
+        raise IOError ('Group labels must have the same length as the records.')
+
+    ## One sort over all label columns gives a code per unique combination
+    codes, uniques = pandas.MultiIndex.from_frame (frame).factorize ()
+    keys = pandas.DataFrame (list (uniques), columns=frame.columns)
+    return codes.astype (numpy.int64), keys
+
+def evaluate_groups (dataframe, truth_column, score_column, threshold,
+                     group_columns=['STATION_ID', 'setType']):
+
+    ''' A public function to compute the confusion matrix and scores for all
+        groups (by default per station and dataset type) at one threshold.
+        All groups are counted in a single bincount.
+
+        input params
+        ------------
+        dataframe (pandas.DataFrame): records with truth, score, group columns
+        truth_column (str): column with the truth (True / 1 is positive)
+        score_column (str): column with the score or a 0 / 1 prediction
+        threshold (float): a record is predicted positive if score >= threshold
+        group_columns (list): columns defining the groups
+
+        return params
+        -------------
+        metrics (pandas.DataFrame): one row per group with tn, fp, fn, tp,
+                                    n_total, and all SCORE_KEYS
+    '''
+
+    truth = _as_bool_array (dataframe[truth_column].values)
+    predicted = dataframe[score_column].values >= threshold
+    codes, keys = _factorize_groups (dataframe[group_columns] if group_columns else None,
+                                     len (dataframe))
+
+    ## group code * 4 + truth * 2 + predicted -> one bin per confusion cell
+    cells = codes * 4 + 2 * truth.astype (numpy.int64) + predicted.astype (numpy.int64)
+    counts = numpy.bincount (cells, minlength=4 * len (keys)).reshape (-1, 2, 2)
+
+    metrics = keys.copy ()
+    for index, key in enumerate (CONFUSION_KEYS):
+        metrics[key] = counts.reshape (-1, 4)[:, index]
+    metrics['n_total'] = counts.reshape (-1, 4).sum (axis=1)
+    for key, values in get_scores (counts).items():
+        metrics[key] = values
+    return metrics
+
+def sweep_thresholds (truth, scores, thresholds=None, groups=None):
+
+    ''' A public function to compute confusion matrices for many thresholds
+        (and optionally many groups) with a single sort. Records are sorted by
+        (group, score) once; the number of records predicted positive at a
+        threshold is then the number of sorted scores >= threshold within the
+        group, found by one binary search for all (group, threshold) pairs, and
+        the true positives among them come from the cumulative sum of the
+        sorted truth.
+
+        If thresholds is None, every unique score is used as a cutoff i.e.
+        the full ROC / PR curve. As in evaluate_groups(), a NaN score (or
+        threshold) is never predicted positive, and NaN is not a cutoff.
+
+        input params
+        ------------
+        truth (array-like): True / 1 for positive records
+        scores (array-like): score per record; positive if score >= threshold
+        thresholds (array-like): cutoffs to evaluate; None for all unique scores
+        groups (None, array-like, list of array-like or pandas.DataFrame):
+                group labels e.g. [station_ids, set_types]
+
+        return params
+        -------------
+        sweep (pandas.DataFrame): one row per (group, threshold) with tn, fp,
+                                  fn, tp, and all SCORE_KEYS
+    '''
+
+    truth = _as_bool_array (truth)
+    scores = numpy.asarray (scores, dtype=float).ravel()
+    if not len (truth) == len (scores):
+        raise IOError ('Truth and score arrays must have the same length.')
+
+    codes, keys = _factorize_groups (groups, len (scores))
+    n_groups = len (keys)
+
+    ## Dense rank of every score and cutoff; a (group, score) pair then is a
+    ## single integer key, so that all groups are searched at once. NaN has
+    ## rank 0, below every score, so NaN scores are never >= a cutoff.
+    cutoffs = None if thresholds is None else numpy.asarray (thresholds, dtype=float).ravel()
+    values = scores if cutoffs is None else numpy.concatenate ([scores, cutoffs])
+    is_nan = numpy.isnan (values)
+    uniques, inverse = numpy.unique (values[~is_nan], return_inverse=True)
+    ranks = numpy.zeros (len (values), dtype=numpy.int64)
+    ranks[~is_nan] = inverse + 1
+    n_ranks = len (uniques) + 1
+    record_keys = codes * n_ranks + ranks[:len (scores)]
+
+    ## The only sort of records: by group, then by score
+    order = numpy.argsort (record_keys, kind='stable')
+    sorted_keys = record_keys[order]
+    cum_truth = numpy.concatenate ([[0], numpy.cumsum (truth[order], dtype=numpy.int64)])
+    bounds = numpy.searchsorted (sorted_keys, numpy.arange (n_groups + 1) * n_ranks)
+
+    if cutoffs is None:
+        # Each unique non-NaN score of a group is a cutoff, at its first
+        # sorted record
+        positions = numpy.flatnonzero (numpy.diff (sorted_keys, prepend=-1) != 0)
+        positions = positions[sorted_keys[positions] % n_ranks > 0]
+        cutoff_codes = sorted_keys[positions] // n_ranks
+        cutoff_values = uniques[sorted_keys[positions] % n_ranks - 1]
+    else:
+        # Each cutoff for each group; records at and after the position of
+        # its key are predicted positive
+        cutoff_codes = numpy.repeat (numpy.arange (n_groups), len (cutoffs))
+        cutoff_values = numpy.tile (cutoffs, n_groups)
+        cutoff_keys = cutoff_codes * n_ranks + numpy.tile (ranks[len (scores):], n_groups)
+        positions = numpy.searchsorted (sorted_keys, cutoff_keys, side='left')
+
+    begin, end = bounds[cutoff_codes], bounds[cutoff_codes+1]
+    # Nothing is >= a NaN threshold
+    positions = numpy.where (numpy.isnan (cutoff_values), end, positions)
+    n_pos_true = cum_truth[end] - cum_truth[begin]
+    n_records = end - begin
+    tp = cum_truth[end] - cum_truth[positions]
+    fp = (end - positions) - tp
+    fn = n_pos_true - tp
+    tn = (n_records - n_pos_true) - fp
+
+    sweep = pandas.DataFrame ({'threshold':cutoff_values, 'tn':tn, 'fp':fp, 'fn':fn, 'tp':tp})
+    for position, column in enumerate (keys.columns):
+        sweep.insert (position, column, keys[column].values[cutoff_codes])
+    counts = sweep[CONFUSION_KEYS].values.reshape (-1, 2, 2)
+    for key, values in get_scores (counts).items():
+        sweep[key] = values
+    return sweep
+
+def print_confusion_matrix (confusion_matrix):
+
+    ''' A public function to print a confusion matrix on console in the same
+        layout as identify_spikes.py.
+
+        input params
+        ------------
+        confusion_matrix (numpy.array): [[tn, fp], [fn, tp]]
+    '''
+
+    (tn, fp), (fn, tp) = numpy.asarray (confusion_matrix)
+    print ('Confusion Matrix')
+    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
+    print ('| {0:8} | {1:8} | {2:8} |'.format(' '*8, 'pred no ', 'pred yes'))
+    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
+    print ('| {0:8} | {1:8} | {2:8} |'.format('true no ', tn, fp))
+    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
+    print ('| {0:8} | {1:8} | {2:8} |'.format('true yes', fn, tp))
+    print ('+-{0:8}-+-{0:8}-+-{0:8}-+'.format('-'*8))
+    print ('')
@@ -0,0 +1,315 @@
+#!python37
+
+## This script selects the binarization threshold applied to the QC model
+## output (probability of a record being good) per station or globally.
+##
+## The QC notebook hard-codes one threshold (0.2) for all stations. Instead,
+## this script reads the stored validation predictions, builds the full ROC /
+## PR curve for each station in one sorted pass (see qc_metrics.py), and picks
+## the lowest threshold whose number of missed bad points (TARGET = 0 but
+## predicted good) stays within a user constraint. The lowest such threshold
+## flags the fewest good points as bad. The result is a threshold table that
+## the inference path loads via load_threshold_table() / apply_thresholds().
+##
+## Prediction csv files are expected to have the station ID, the truth
+## (TARGET), and the predicted probability. By default, the column names
+## follow the validation prediction csv written by the QC notebook:
+##    STATION_ID, True_Target, Prediction_Score
+##
+## > python select_thresholds.py --predictions <val_pred_1.csv> (<val_pred_2.csv> ...)
+##                               --out_file <path/to/thresholds.csv>
+##                               --max_missed_bad <max # missed bad points>
+##                               (--min_bad_accuracy <fraction of bad points caught>)
+##                               (--mode station/global)
+##
+## Example snippet to binarize predictions at inference time:
+## +------------------------------------------------------------------
+## import select_thresholds
+## table = select_thresholds.load_threshold_table ('thresholds.csv')
+## is_good = select_thresholds.apply_thresholds (data.STATION_ID,
+##                                               model.predict (X).ravel(), table)
+## +------------------------------------------------------------------
+###############################################################################
+
+###############################################
+## Import libraries
+###############################################
+import numpy, pandas, argparse, os, logging
+
+import qc_metrics
+
+###############################################
+## Define constants
+###############################################
+# Default column names from the QC notebook prediction csv
+STATION_COLUMN = 'STATION_ID'
+TRUTH_COLUMN = 'True_Target'
+SCORE_COLUMN = 'Prediction_Score'
+
+# Station ID used for the threshold that applies to all other stations
+DEFAULT_KEY = 'default'
+
+# Threshold used by the QC notebook; fallback when a table has no default
+NOTEBOOK_THRESHOLD = 0.2
+
+# Columns in the output threshold table
+THRESHOLD_TABLE_KEYS = ['station_id', 'threshold', 'n_good', 'n_bad',
+                        'n_missed_bad', 'n_flagged_good', 'bad_accuracy',
+                        'good_accuracy']
+
+###############################################
+## Define functions
+###############################################
+def load_predictions (filenames, station_column=STATION_COLUMN,
+                      truth_column=TRUTH_COLUMN, score_column=SCORE_COLUMN):
+
+    ''' A function to read one or more prediction csv files. Only the station,
+        truth, and score columns are read. Rows without a station ID or a
+        score (e.g. the summary rows in the notebook output) are dropped.
+
+        input params
+        ------------
+        filenames (list of str): prediction csv files
+        station_column (str): column with station ID
+        truth_column (str): column with the truth (1 = good, 0 = bad)
+        score_column (str): column with the predicted probability of good
+
+        return params
+        -------------
+        predictions (pandas.DataFrame): station_id, truth, score columns
+    '''
+
+    frames = []
+    for filename in filenames:
+        if not os.path.exists (filename):
+            raise FileNotFoundError ('Prediction file, {0}, does not exist!'.format (filename))
+        frame = pandas.read_csv (filename, usecols=[station_column, truth_column, score_column])
+        frame.columns = ['station_id' if col==station_column else
+                         'truth' if col==truth_column else 'score'
+                         for col in frame.columns]
+        frames.append (frame.dropna ())
+
+    predictions = pandas.concat (frames, ignore_index=True)
+    predictions['station_id'] = predictions.station_id.astype (numpy.int64)
+    predictions['truth'] = predictions.truth.astype (numpy.int64)
+    return predictions
+
+def get_curves (predictions, by_station=True):
+
+    ''' A function to build the full ROC / PR curve i.e. the confusion matrix
+        at every unique score, per station (or for all stations together).
+        Good (truth = 1) is the positive class, so
+            * n_missed_bad   = bad points predicted good  (fp)
+            * n_flagged_good = good points predicted bad  (fn)
+
+        input params
+        ------------
+        predictions (pandas.DataFrame): station_id, truth, score columns
+        by_station (bool): If true, one curve per station; else one curve
+
+        return params
+        -------------
+        curves (pandas.DataFrame): one row per (station, threshold)
+    '''
+
+    groups = predictions.station_id.rename ('station_id') if by_station else None
+    curves = qc_metrics.sweep_thresholds (predictions.truth.values,
+                                          predictions.score.values,
+                                          thresholds=None, groups=groups)
+    curves['n_missed_bad'] = curves.fp
+    curves['n_flagged_good'] = curves.fn
+    curves['n_bad'] = curves.tn + curves.fp
+    curves['n_good'] = curves.tp + curves.fn
+    if not by_station: curves.insert (0, 'station_id', DEFAULT_KEY)
+    return curves
+
+def _select_from_curve (curve, max_missed_bad, min_bad_accuracy):
+
+    ''' A private function to pick the threshold of one curve. A cutoff is
+        accepted if it misses at most max_missed_bad bad points and catches
+        at least min_bad_accuracy of them. Among accepted cutoffs, the lowest
+        one is chosen because it flags the fewest good points as bad. If no
+        cutoff is accepted, the threshold is set just above the highest score
+        i.e. every point is flagged bad.
+
+        input params
+        ------------
+        curve (pandas.DataFrame): rows of one station from get_curves()
+        max_missed_bad (int): maximum # bad points predicted good
+        min_bad_accuracy (float): minimum fraction of bad points caught
+
+        return params
+        -------------
+        row (dict): one row of the threshold table
+    '''
+
+    n_bad, n_good = int (curve.n_bad.values[0]), int (curve.n_good.values[0])
+    n_missed_bad = curve.n_missed_bad.values
+    n_caught = n_bad - n_missed_bad
+
+    accepted = n_missed_bad <= max_missed_bad
+    if min_bad_accuracy is not None and n_bad > 0:
+        accepted = numpy.logical_and (accepted, n_caught >= min_bad_accuracy * n_bad)
+
+    if accepted.any():
+        # Curves are sorted by threshold; the first accepted is the lowest
+        index = numpy.argmax (accepted)
+        threshold = float (curve.threshold.values[index])
+        missed, flagged = int (n_missed_bad[index]), int (curve.n_flagged_good.values[index])
+    else:
+        threshold = float (numpy.nextafter (curve.threshold.max(), numpy.inf))
+        missed, flagged = 0, n_good
+
+    return {'station_id':curve.station_id.values[0], 'threshold':threshold,
+            'n_good':n_good, 'n_bad':n_bad, 'n_missed_bad':missed,
+            'n_flagged_good':flagged,
+            'bad_accuracy' : numpy.nan if n_bad==0  else (n_bad - missed) / n_bad,
+            'good_accuracy': numpy.nan if n_good==0 else (n_good - flagged) / n_good}
+
+def select_thresholds (predictions, max_missed_bad=0, min_bad_accuracy=None,
+                       mode='station'):
+
+    ''' A function to select thresholds under the constraints. In 'station'
+        mode, each station gets its own threshold and a 'default' row (global
+        threshold) is added for stations not in the table. In 'global' mode,
+        only the 'default' row is returned, where the constraint applies to
+        the total over all stations.
+
+        input params
+        ------------
+        predictions (pandas.DataFrame): station_id, truth, score columns
+        max_missed_bad (int): maximum # bad points predicted good
+        min_bad_accuracy (float): minimum fraction of bad points caught
+        mode (str): 'station' or 'global'
+
+        return params
+        -------------
+        table (pandas.DataFrame): threshold table with THRESHOLD_TABLE_KEYS
+    '''
+
+    if not mode in ['station', 'global']:
+        raise IOError ('Mode must be either station or global.')
+
+    ## Global threshold from one curve over all stations
+    rows = [_select_from_curve (get_curves (predictions, by_station=False),
+                                max_missed_bad, min_bad_accuracy)]
+
+    ## Per-station thresholds from one sorted pass over all stations
+    if mode == 'station':
+        curves = get_curves (predictions, by_station=True)
+        bounds = numpy.flatnonzero (numpy.diff (curves.station_id.values)) + 1
+        for begin, end in zip (numpy.r_[0, bounds], numpy.r_[bounds, len (curves)]):
+            rows.append (_select_from_curve (curves.iloc[begin:end],
+                                             max_missed_bad, min_bad_accuracy))
+
+    return pandas.DataFrame (rows, columns=THRESHOLD_TABLE_KEYS)
+
+def write_threshold_table (table, filename):
+
+    ''' A function to write the threshold table as a csv file.
+
+        input params
+        ------------
+        table (pandas.DataFrame): threshold table from select_thresholds()
+        filename (str): output csv file
+    '''
+
+    table.to_csv (filename, index=False)
+
+def load_threshold_table (filename):
+
+    ''' A function to load a threshold table written by this script into a
+        dictionary {station ID (int): threshold}. The global threshold is
+        stored under the key 'default'.
+
+        input params
+        ------------
+        filename (str): threshold table csv file
+
+        return params
+        -------------
+        thresholds (dict): {station ID: threshold, 'default': threshold}
+    '''
+
+    if not os.path.exists (filename):
+        raise FileNotFoundError ('Threshold table, {0}, does not exist!'.format (filename))
+
+    table = pandas.read_csv (filename, dtype={'station_id':str})
+    thresholds = {}
+    for station_id, threshold in zip (table.station_id.values, table.threshold.values):
+        key = station_id.strip()
+        thresholds[key if key==DEFAULT_KEY else int (key)] = float (threshold)
+    return thresholds
+
+def apply_thresholds (station_ids, scores, thresholds):
+
+    ''' A function to binarize predicted probabilities with the threshold of
+        each record's station. Stations not in the table use the 'default'
+        threshold, or the notebook threshold if the table has no default.
+
+        input params
+        ------------
+        station_ids (array-like): station ID per record
+        scores (array-like): predicted probability of being good per record
+        thresholds (dict): output of load_threshold_table()
+
+        return params
+        -------------
+        is_good (numpy.array): 1 if score >= the station threshold, else 0
+    '''
+
+    default = thresholds.get (DEFAULT_KEY, NOTEBOOK_THRESHOLD)
+    per_record = pandas.Series (numpy.asarray (station_ids)).astype (numpy.int64)
+    per_record = per_record.map (thresholds).fillna (default).values
+    return (numpy.asarray (scores, dtype=float).ravel() >= per_record).astype (int)
+
+def get_parser ():
+
+    ''' A function to handle user inputs via command line.
+
+        return params
+        -------------
+        args (argparse.Namespace): parsed arguments
+    '''
+
+    parser = argparse.ArgumentParser (description='')
+    parser.add_argument('-p', '--predictions', nargs='+', required=True, type=str,
+                        help='Prediction csv files e.g. validation predictions')
+    parser.add_argument('-o', '--out_file', default='thresholds.csv', type=str,
+                        help='Output threshold table csv')
+    parser.add_argument('-n', '--max_missed_bad', default=0, type=int,
+                        help='Maximum # bad points predicted good')
+    parser.add_argument('-a', '--min_bad_accuracy', default=None, type=float,
+                        help='Minimum fraction of bad points caught')
+    parser.add_argument('-m', '--mode', default='station', type=str,
+                        help='station: per-station thresholds; global: one threshold')
+    parser.add_argument('--station_column', default=STATION_COLUMN, type=str)
+    parser.add_argument('--truth_column', default=TRUTH_COLUMN, type=str)
+    parser.add_argument('--score_column', default=SCORE_COLUMN, type=str)
+    args = parser.parse_args()
+
+    ## Make sure output folder exists
+    out_path = os.path.dirname (os.path.abspath (args.out_file))
+    if not os.path.exists (out_path):
+        raise FileNotFoundError ('Output folder, {0}, does not exist!'.format (out_path))
+
+    return args
+
+###############################################
+## Script begins here!
+###############################################
+if __name__ == '__main__':
+
+    logging.basicConfig (level=logging.INFO)
+    args = get_parser ()
+
+    ## Load stored predictions
+    predictions = load_predictions (args.predictions, station_column=args.station_column,
+                                    truth_column=args.truth_column,
+                                    score_column=args.score_column)
+
+    ## Select and write thresholds
+    table = select_thresholds (predictions, max_missed_bad=args.max_missed_bad,
+                               min_bad_accuracy=args.min_bad_accuracy, mode=args.mode)
+    write_threshold_table (table, args.out_file)
+    print (table.to_string (index=False))